@@ -5,12 +5,10 @@ import os
 from werkzeug.utils import secure_filename
 from app.views.twelvelabs_routes import twelvelabs_bp
 from app import create_app
+from app.utils.logging_utils import debug_fields
 import dotenv
 
 dotenv.load_dotenv()
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Application Configuration
@@ -67,8 +65,7 @@ def vertex_chat():
         return handle_options_request()
     
     logger.info("Request received at /vertex/chat")
-    logger.info(f"Request method: {request.method}")
-    logger.info(f"Request headers: {dict(request.headers)}")
+    debug_fields(logger, "vertex_chat_request", method=request.method, headers=lambda: dict(request.headers))
     
     try:
         # Get text from form data
@@ -3,16 +3,22 @@ from flask_cors import CORS
 import os
 import logging
 from app.config import Config
+from app.utils.logging_utils import configure_logging, init_request_sampling
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging (LOG_LEVEL / LOG_LEVELS / LOG_DEBUG / LOG_FORMAT)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 def create_app(config_class=Config):
     """Application factory function"""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    configure_logging(app.config)
+    init_request_sampling(app)
+    
+    # jsonify also serializes NumPy scores and vectors (hot paths use serialization.json_response)
+    from app.utils.serialization import NumpyJSONEncoder
+    app.json_encoder = NumpyJSONEncoder
     
     # Configure CORS - we'll use only one method for consistency
     # Option 1: Use Flask-CORS extension (recommended for most cases)
@@ -43,10 +49,16 @@ def create_app(config_class=Config):
     with app.app_context():
         logger.info("Preloading AI models...")
         # Import here to avoid circular imports
-        from app.services.vertex_service import initialize_vertex_ai
-        initialize_vertex_ai()
+        from app.services import vertex_service
+        # Importing the module already initializes it; only retry if that failed
+        if vertex_service.model is None:
+            vertex_service.model = vertex_service.initialize_vertex_ai()
         logger.info("AI models preloaded")
     
+    # Image-availability index: one directory scan now, then kept current by a watcher
+    from app.services.image_index import get_image_index
+    get_image_index()
+    
     # Register blueprints
     from app.views.test_routes import test_bp
     from app.views.titan_routes import titan_bp
@@ -54,6 +66,9 @@ def create_app(config_class=Config):
     from app.views.azure_routes import azure_bp
     from app.views.cohere_routes import cohere_bp
     from app.views.voyage_routes import voyage_bp
+    from app.views.status_routes import status_bp
+    from app.views.thumbnail_routes import thumbnail_bp
+    from app.views.similar_routes import similar_bp
     
     app.register_blueprint(test_bp)
     app.register_blueprint(titan_bp)
@@ -61,14 +76,46 @@ def create_app(config_class=Config):
     app.register_blueprint(azure_bp, url_prefix='/azure')
     app.register_blueprint(cohere_bp)
     app.register_blueprint(voyage_bp)
+    app.register_blueprint(status_bp)
+    app.register_blueprint(thumbnail_bp)
+    app.register_blueprint(similar_bp)
     
     # Register error handlers
     from app.utils.helpers import handle_404_error, handle_413_error
     app.register_error_handler(404, handle_404_error)
     app.register_error_handler(413, handle_413_error)
     
+    # Response format per Accept (JSON, msgpack, raw float32 vectors) and
+    # br/gzip compression per Accept-Encoding
+    from app.utils.content_negotiation import init_content_negotiation
+    init_content_negotiation(app)
+    
+    # Opt-in per-request profiling (no-op unless PROFILING_ENABLED)
+    from app.utils.profiling import init_profiling
+    init_profiling(app)
+    
     logger.info(f"Registering blueprint: twelvelabs_bp with prefix: /twelvelabs")
-    logger.info(f"Registered routes: {[str(rule) for rule in app.url_map.iter_rules()]}")
+    logger.debug("Registered routes: %s", [str(rule) for rule in app.url_map.iter_rules()])
     
     logger.info("Application initialized successfully")
-    return app 
\ No newline at end of file
+    return app 
+
+
+def create_shard_app(config_class=Config):
+    """
+    Shard server: serves one partition of the corpora to a coordinator
+
+    Only the shard protocol is registered (no provider SDKs or search
+    routes). The partition is SHARD_INDEX of SHARD_COUNT; see
+    app/services/shard_service.py and scripts/shard_server.py.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    configure_logging(app.config)
+    
+    from app.views.shard_routes import shard_bp
+    app.register_blueprint(shard_bp)
+    
+    from app.services.shard_service import SHARD_INDEX, SHARD_COUNT
+    logger.info(f"Shard server initialized: shard {SHARD_INDEX} of {SHARD_COUNT}")
+    return app
@@ -6,4 +6,20 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB limit
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     DEBUG = os.environ.get('FLASK_DEBUG', 'True') == 'True'
-    PORT = int(os.environ.get('FLASK_PORT', 5000)) 
\ No newline at end of file
+    PORT = int(os.environ.get('FLASK_PORT', 5000))
+    
+    # Only settings read through app.config belong here. Provider, search and
+    # serving settings are environment variables read by the module that uses
+    # them (see the constants at the top of each module)
+    
+    # Logging (see app/utils/logging_utils.py)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+    LOG_DEBUG = os.environ.get('LOG_DEBUG', 'False') == 'True'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+    LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0))
+    
+    # On-demand request profiling (see app/utils/profiling.py)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
\ No newline at end of file
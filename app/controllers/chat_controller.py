@@ -2,6 +2,7 @@ import logging
 from flask import request, jsonify
 from app.services.file_service import save_uploaded_file
 from app.utils.helpers import handle_options_request
+from app.utils.logging_utils import debug_fields
 
 logger = logging.getLogger(__name__)
 
@@ -12,8 +13,7 @@ def handle_chat_request():
         return handle_options_request()
     
     logger.info("Request received at /vertex/chat")
-    logger.info(f"Request method: {request.method}")
-    logger.info(f"Request headers: {dict(request.headers)}")
+    debug_fields(logger, "chat_request", method=request.method, headers=lambda: dict(request.headers))
     
     try:
         # Get text from form data
@@ -4,6 +4,7 @@ from flask import request, jsonify
 from app.services.twelvelabs_service import search_multimodal, get_embedding_for_text, get_embedding_for_image
 from app.services.file_service import save_uploaded_file
 from app.utils.helpers import handle_options_request
+from app.utils.serialization import json_response, encode_vector, get_vector_encoding
 
 logger = logging.getLogger(__name__)
 
@@ -151,6 +152,11 @@ def handle_twelvelabs_embedding():
     try:
         # Get embedding type
         embedding_type = request.form.get('type', 'text')
+        # json (default), or compact base64 float32 / float16
+        try:
+            vector_encoding = get_vector_encoding(request)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e), "embedding": None}), 400
         
         if embedding_type == 'text':
             # Get text
@@ -165,12 +171,12 @@ def handle_twelvelabs_embedding():
             # Generate embedding
             embedding = get_embedding_for_text(text)
             
-            return jsonify({
+            return json_response({
                 "success": True,
                 "message": "Text embedding generated successfully",
-                "embedding": embedding,
+                "embedding": encode_vector(embedding, vector_encoding),
                 "embedding_type": "text"
-            })
+            }, vector=embedding)
             
         elif embedding_type == 'image':
             # Get image
@@ -188,13 +194,13 @@ def handle_twelvelabs_embedding():
             # Generate embedding
             embedding = get_embedding_for_image(image_path)
             
-            return jsonify({
+            return json_response({
                 "success": True,
                 "message": "Image embedding generated successfully",
-                "embedding": embedding,
+                "embedding": encode_vector(embedding, vector_encoding),
                 "embedding_type": "image",
                 "image_path": image_path
-            })
+            }, vector=embedding)
             
         else:
             return jsonify({
@@ -1,8 +1,10 @@
 import logging
-from flask import request, jsonify, make_response
+import numpy as np
+from flask import request, make_response
 from app.services.file_service import save_uploaded_file
 from app.utils.helpers import handle_options_request
 from app.services.vertex_service import get_vertex_embeddings
+from app.utils.serialization import json_response, encode_vector, get_vector_encoding
 
 logger = logging.getLogger(__name__)
 
@@ -36,8 +38,18 @@ def handle_vertex_request():
         if not text:
             return create_cors_response({'error': 'No text provided'}, 400)
             
+        try:
+            # json (default), or compact base64 float32 / float16
+            vector_encoding = get_vector_encoding(request)
+        except ValueError as e:
+            return create_cors_response({'error': str(e)}, 400)
+            
         # Get embeddings from Vertex AI
         embeddings = get_vertex_embeddings(image_path, text)
+        if embeddings:
+            embeddings = {name: encode_vector(vector, vector_encoding)
+                          if isinstance(vector, (list, np.ndarray)) else vector
+                          for name, vector in embeddings.items()}
         
         # Create response
         response_data = {
@@ -55,6 +67,6 @@ def handle_vertex_request():
 
 def create_cors_response(data, status_code=200):
     """Create a response with CORS headers"""
-    response = jsonify(data)
+    response = json_response(data)
     response.status_code = status_code
     return response 
\ No newline at end of file
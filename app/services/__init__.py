@@ -1 +1,36 @@
-# Services package 
\ No newline at end of file
+# Services package
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Service modules whose module-level clients hold sockets, gRPC channels or
+# thread pools that must not be shared across a fork
+PROVIDER_CLIENT_MODULES = [
+    'app.services.titan_service',
+    'app.services.vertex_service',
+    'app.services.twelvelabs_service',
+    'app.services.cohere_service',
+    'app.services.voyage_service',
+]
+
+
+def reset_provider_clients():
+    """
+    Re-create provider clients after fork (gunicorn post_fork hook)
+
+    Only modules already imported by the master are reset, so workers do not
+    pull in SDKs the app never loaded. The Azure service and the S3 helper use
+    plain ``requests``/per-call boto3 clients and need no reset.
+    """
+    from app.services.async_providers import reset_executor
+    reset_executor()
+
+    for module_name in PROVIDER_CLIENT_MODULES:
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        try:
+            module.reset_client()
+        except Exception as e:
+            logger.error(f"Error re-creating client in {module_name}: {str(e)}", exc_info=True)
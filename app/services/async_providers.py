@@ -0,0 +1,230 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.profiling import current_session, profile_call, record_timing
+
+logger = logging.getLogger(__name__)
+
+# Shared pool for blocking provider SDK calls. Flask async views run each
+# request in its own event loop, so a process-wide executor (instead of each
+# loop's default one) keeps thread count bounded and connections pooled.
+#
+# The provider SDKs (boto3, vertexai, cohere, ...) have no async clients, so
+# every in-flight provider call holds one thread of this pool while it waits.
+# At most ASYNC_PROVIDER_THREADS calls run at once per process, i.e.
+# ASYNC_PROVIDER_THREADS x GUNICORN_WORKERS for the deployment; further calls
+# queue. Each request also holds its serving thread (GUNICORN_THREADS or
+# ASGI_THREADS) until its fan-out finishes, so size this pool to about
+# request threads x providers per request.
+ASYNC_PROVIDER_THREADS = int(os.environ.get('ASYNC_PROVIDER_THREADS', 64))
+
+_executor = ThreadPoolExecutor(max_workers=ASYNC_PROVIDER_THREADS, thread_name_prefix='provider')
+
+
+def reset_executor():
+    """Replace the provider executor; its threads do not survive a fork"""
+    global _executor
+    _executor = ThreadPoolExecutor(max_workers=ASYNC_PROVIDER_THREADS, thread_name_prefix='provider')
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Await a blocking callable on the shared provider executor
+
+    The call runs in a copy of the caller's context (like asyncio.to_thread),
+    so a profiled request's executor work is profiled too.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, context.run, profile_call, functools.partial(fn, *args, **kwargs))
+
+
+async def _timed(name, call):
+    started = time.perf_counter()
+    try:
+        return await call
+    finally:
+        record_timing(f"gather.{name}", time.perf_counter() - started)
+
+
+async def gather_named(**calls):
+    """
+    Run several awaitables concurrently and return their results by name
+
+    Failures are returned as exception instances instead of being raised, so
+    one failed provider call does not cancel the others.
+
+    Args:
+        calls: name -> awaitable (None entries are skipped)
+
+    Returns:
+        dict: name -> result or exception
+    """
+    names = [name for name, call in calls.items() if call is not None]
+    awaitables = [calls[name] for name in names]
+    if current_session() is not None:
+        # Wall-clock time of each call for the profiled request's Server-Timing
+        awaitables = [_timed(name, call) for name, call in zip(names, awaitables)]
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    return dict(zip(names, results))
+
+
+def usable_results(results, required=()):
+    """
+    Failure policy of the multimodal search fan-outs
+
+    A failed query embedding is logged and left out, so the search runs on
+    the queries that did succeed. If a `required` one failed, or none
+    succeeded, the first error is raised and the route reports it.
+
+    Args:
+        results: gather_named output, name -> result or exception
+        required: Names the search cannot run without
+
+    Returns:
+        dict: name -> result, successful calls only
+    """
+    usable = {name: result for name, result in results.items() if not isinstance(result, Exception)}
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            if name in required or not usable:
+                logger.error(f"Failed to generate {name} embedding: {str(result)}")
+                raise result
+            logger.warning(f"Failed to generate {name} embedding, searching without it: {str(result)}")
+    return usable
+
+
+async def known_image_embedding(corpus_name, image):
+    """(stored embedding, corpus path) if the query image is a catalog image, else None"""
+    from app.services.phash_index import lookup_embedding
+    try:
+        return await run_blocking(lookup_embedding, corpus_name, image)
+    except Exception as e:
+        logger.warning(f"Perceptual hash lookup failed, calling the provider: {str(e)}")
+        return None
+
+
+# Titan (Bedrock)
+
+async def titan_embedding(text=None, image_path=None):
+    """
+    Titan's {'embedding', 'embedding_type'} for the input, as returned to clients
+
+    No perceptual-hash shortcut here: /titan/embedding returns the embedding
+    itself, and a stored (normalized) corpus row must not stand in for it.
+    """
+    from app.services.titan_service import get_titan_embedding
+    return await run_blocking(get_titan_embedding, text=text, image_path=image_path)
+
+
+async def titan_text_embedding(text):
+    from app.services.titan_service import get_titan_text_embedding
+    return await run_blocking(get_titan_text_embedding, text)
+
+
+# Twelve Labs
+
+async def twelvelabs_text_embedding(text):
+    from app.services.twelvelabs_service import get_embedding_for_text
+    return await run_blocking(get_embedding_for_text, text)
+
+
+async def twelvelabs_image_embedding(image_path):
+    from app.services.twelvelabs_service import get_embedding_for_image
+    known = await known_image_embedding('twelve_labs', image_path)
+    if known is not None:
+        return known[0]
+    return await run_blocking(get_embedding_for_image, image_path)
+
+
+# Cohere
+
+async def cohere_text_embedding(text):
+    from app.services.cohere_service import get_text_embedding
+    return await run_blocking(get_text_embedding, text)
+
+
+async def cohere_image_embedding(image_path):
+    from app.services.cohere_service import get_cohere_embedding
+    known = await known_image_embedding('cohere', image_path)
+    if known is not None:
+        return known[0]
+    return await run_blocking(get_cohere_embedding, image_path)
+
+
+# Voyage
+
+async def voyage_embedding(text=None, img=None):
+    from app.services.voyage_service import get_voyage_embedding
+    if img is not None and not text:
+        known = await known_image_embedding('voyage', img)
+        if known is not None:
+            return known[0]
+    return await run_blocking(get_voyage_embedding, text=text, img=img)
+
+
+# Azure Vision + S3
+
+async def azure_vectorize_text(azure_service, text):
+    return await run_blocking(azure_service.vectorize_text, text)
+
+
+async def azure_vectorize_image(azure_service, image_url):
+    return await run_blocking(azure_service.vectorize_image, image_url)
+
+
+async def upload_to_s3(file_path, bucket_name=None, object_name=None):
+    from app.utils import s3_helper
+    return await run_blocking(s3_helper.upload_file_to_s3, file_path, bucket_name, object_name)
+
+
+async def azure_upload_and_vectorize_image(azure_service, file_path):
+    """
+    Upload a query image to S3 and vectorize it; returns (s3_url, embedding)
+
+    A catalog image is neither uploaded nor vectorized: its stored vector
+    and catalog URL are returned instead.
+    """
+    known = await known_image_embedding('azure', file_path)
+    if known is not None:
+        return known[1], known[0]
+    s3_url = await upload_to_s3(file_path)
+    if not s3_url:
+        logger.error("Failed to upload image to S3")
+        return None, None
+    logger.info(f"Image uploaded to S3: {s3_url}")
+    return s3_url, await azure_vectorize_image(azure_service, s3_url)
+
+
+# Search fan-out
+
+async def twelvelabs_search_multimodal(query_text=None, query_image_path=None, top_k=7, image_weight=0.5,
+                                       image_weights=None, filters=None, collapse_duplicates=False):
+    """
+    twelvelabs_service.search_multimodal with both query embeddings fetched concurrently
+
+    Either embedding is enough; a failed one is left out (see usable_results).
+    """
+    from app.services.twelvelabs_service import search_multimodal
+
+    results = usable_results(await gather_named(
+        text=twelvelabs_text_embedding(query_text) if query_text else None,
+        image=twelvelabs_image_embedding(query_image_path) if query_image_path else None,
+    ))
+
+    return await run_blocking(
+        search_multimodal,
+        query_text=query_text if 'text' in results else None,
+        query_image_path=query_image_path if 'image' in results else None,
+        top_k=top_k,
+        image_weight=image_weight,
+        image_weights=image_weights,
+        filters=filters,
+        collapse_duplicates=collapse_duplicates,
+        text_embedding=results.get('text'),
+        image_embedding=results.get('image')
+    )
@@ -4,9 +4,19 @@ import numpy as np
 import requests
 import logging
 from typing import Dict, List, Optional, Tuple, Union
+from app.utils.fake_providers import get_stub_client
+from app.utils import rate_limiter
+from app.utils.circuit_breaker import circuit_breaker
+from app.utils.single_flight import single_flight
+from app.services.vector_search import collapsed_top_k, top_k_indices
 
 logger = logging.getLogger(__name__)
 
+def _circuit_open_result(error):
+    """Vectorize result while the Azure circuit is open (same as any other failure)"""
+    logger.error(str(error))
+    return None
+
 class AzureService:
     def __init__(self):
         self.vision_key = os.environ.get("AZURE_VISION_KEY")
@@ -14,6 +24,14 @@ class AzureService:
         self.api_version = "2024-02-01"
         self.model_version = "2023-04-15"
         
+        # HTTP client - a local stand-in when PROVIDER_BACKEND=stub
+        self.http = get_stub_client('azure')
+        if self.http is not None:
+            self.vision_key = self.vision_key or "stub"
+            self.vision_endpoint = self.vision_endpoint or "http://azure.stub"
+        else:
+            self.http = requests
+        
         if not self.vision_key or not self.vision_endpoint:
             logger.error("Azure Vision API credentials not found in environment variables")
             raise ValueError("Azure Vision API credentials not configured")
@@ -28,25 +46,7 @@ class AzureService:
             
         logger.info(f"Vectorizing text: {text[:50]}...")
         url = f"{self.vision_endpoint}/computervision/retrieval:vectorizeText?api-version={self.api_version}&model-version={self.model_version}"
-        headers = {"Content-Type": "application/json", "Ocp-Apim-Subscription-Key": self.vision_key}
-        data = {"text": text.strip()}
-        
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(url, headers=headers, json=data)
-                response.raise_for_status()
-                result = response.json()
-                logger.info("Text vectorization successful")
-                return result.get("vector")
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    logger.warning(f"Text vectorization attempt {attempt+1} failed, retrying in {wait_time}s: {str(e)}")
-                    time.sleep(wait_time)
-                else:
-                    logger.error(f"Failed to vectorize text after {max_retries} attempts: {str(e)}")
-                    return None
+        return self._vectorize(url, {"text": text.strip()}, "Text")
 
     def vectorize_image(self, image_url: str) -> Optional[List[float]]:
         """Generate vector embedding for image using Azure Vision API"""
@@ -54,28 +54,44 @@ class AzureService:
             logger.error(f"Invalid image URL: {image_url}")
             return None
             
+        logger.info(f"Vectorizing image URL: {image_url}")
         url = f"{self.vision_endpoint}/computervision/retrieval:vectorizeImage?api-version={self.api_version}&model-version={self.model_version}"
+        return self._vectorize(url, {"url": image_url}, "Image")
+
+    def _vectorize(self, url: str, payload: Dict, kind: str) -> Optional[List[float]]:
+        """_request_vector, or None if the local rate limit would wait too long"""
+        try:
+            return self._request_vector(url, payload, kind)
+        except rate_limiter.RateLimitExceeded as e:
+            logger.error(f"{kind} vectorization not attempted: {str(e)}")
+            return None
+
+    @single_flight('azure', '2023-04-15')
+    @circuit_breaker('azure', is_failure=lambda result: result is None, fallback=_circuit_open_result)
+    def _request_vector(self, url: str, payload: Dict, kind: str) -> Optional[List[float]]:
+        """POST to a vectorize endpoint with retries; returns the vector or None"""
         headers = {"Content-Type": "application/json", "Ocp-Apim-Subscription-Key": self.vision_key}
-        payload = {"url": image_url}
         
         max_retries = 5
         for attempt in range(max_retries):
             try:
-                logger.info(f"Vectorizing image URL: {image_url}")
-                response = requests.post(url, headers=headers, json=payload)
+                rate_limiter.acquire('azure', self.vision_key)
+                response = self.http.post(url, headers=headers, json=payload)
                 response.raise_for_status()
                 result = response.json()
-                logger.info("Image vectorization successful")
+                logger.info(f"{kind} vectorization successful")
                 return result.get("vector")
-            except requests.exceptions.RequestException as e:
+            except rate_limiter.RateLimitExceeded:
+                # Not a provider failure: re-raised past the circuit breaker
+                raise
+            except Exception as e:
+                error_details = e.response.text if getattr(e, 'response', None) is not None and hasattr(e.response, 'text') else str(e)
                 if attempt < max_retries - 1:
                     wait_time = 2 ** attempt
-                    error_details = e.response.text if hasattr(e, 'response') and hasattr(e.response, 'text') else str(e)
-                    logger.warning(f"Image vectorization attempt {attempt+1} failed, retrying in {wait_time}s: {error_details}")
+                    logger.warning(f"{kind} vectorization attempt {attempt+1} failed, retrying in {wait_time}s: {error_details}")
                     time.sleep(wait_time)
                 else:
-                    error_details = e.response.text if hasattr(e, 'response') and hasattr(e.response, 'text') else str(e)
-                    logger.error(f"Failed to vectorize image after {max_retries} attempts: {error_details}")
+                    logger.error(f"Failed to vectorize {kind.lower()} after {max_retries} attempts: {error_details}")
                     return None
 
     def normalize_vector(self, vector: List[float]) -> Optional[np.ndarray]:
@@ -120,10 +136,12 @@ class AzureService:
 
     def find_similar_images(self, 
                            combined_embedding: np.ndarray, 
-                           reference_embeddings: List[np.ndarray], 
+                           reference_embeddings: Union[List[np.ndarray], np.ndarray], 
                            reference_urls: List[str], 
-                           top_k: int = 10) -> Tuple[List[str], List[float]]:
-        """Find top-k similar images based on embedding similarity"""
+                           top_k: int = 10,
+                           mask: Optional[np.ndarray] = None,
+                           cluster_ids: Optional[np.ndarray] = None) -> Tuple[List[str], List[float]]:
+        """Find top-k similar images based on embedding similarity (embeddings may be a 2-D matrix; mask pre-filters rows, cluster_ids collapses duplicates)"""
         if combined_embedding is None:
             logger.error("Cannot find similar images: combined embedding is None")
             return [], []
@@ -133,11 +151,20 @@ class AzureService:
             return [], []
             
         logger.info(f"Finding top {top_k} similar images from {len(reference_embeddings)} reference images")
-        similarities = [self.cosine_similarity(combined_embedding, emb) for emb in reference_embeddings]
-        top_indices = np.argsort(similarities)[-top_k:][::-1]  # Get indices of top k similarities
+        reference_matrix = np.asarray(reference_embeddings, dtype=np.float32)
+        rows = np.flatnonzero(mask) if mask is not None else None
+        if rows is not None:
+            reference_matrix = reference_matrix[rows]
+        row_norms = np.linalg.norm(reference_matrix, axis=1)
+        row_norms[row_norms == 0] = 1.0
+        similarities = (reference_matrix @ self.normalize_vector(combined_embedding).astype(np.float32)) / row_norms
+        if cluster_ids is None:
+            top_indices = top_k_indices(similarities, top_k)  # Get indices of top k similarities
+        else:
+            top_indices = collapsed_top_k(similarities, top_k, cluster_ids, rows)
         
-        result_urls = [reference_urls[i] for i in top_indices]
-        result_similarities = [similarities[i] for i in top_indices]
+        result_urls = [reference_urls[i if rows is None else rows[i]] for i in top_indices]
+        result_similarities = similarities[top_indices]
         
         logger.info(f"Found {len(result_urls)} similar images")
         return result_urls, result_similarities 
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
 import io
 import base64
+import logging
 import queue
 import threading
 from time import time, sleep
@@ -8,30 +9,50 @@ import numpy as np
 from PIL import Image
 import cohere
 from dotenv import load_dotenv
+from app.utils.fake_providers import get_stub_client
+from app.utils import rate_limiter
+from app.utils.circuit_breaker import circuit_breaker
+from app.utils.single_flight import single_flight
+from app.utils.logging_utils import debug_fields
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Cohere client
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
-co = cohere.ClientV2(COHERE_API_KEY)
+co = get_stub_client('cohere') or cohere.ClientV2(COHERE_API_KEY)
+
+def reset_client():
+    """Re-create the Cohere client, e.g. in a freshly forked worker"""
+    global co
+    co = get_stub_client('cohere') or cohere.ClientV2(COHERE_API_KEY)
+
+def describe_image(file_path):
+    """Short format/mode/size description of an image file, for diagnostics"""
+    try:
+        with Image.open(file_path) as img:
+            return f"format={img.format}, mode={img.mode}, size={img.size}"
+    except Exception as e:
+        return f"unreadable ({str(e)})"
 
 def image_to_base64(file_path):
     """Convert image to base64 data URI following Cohere's requirements."""
     try:
         # Open the image file directly with PIL
         img = Image.open(file_path)
-        print(f"Original image: format={img.format}, mode={img.mode}, size={img.size}")
+        logger.debug("Original image: format=%s, mode=%s, size=%s", img.format, img.mode, img.size)
         
         # Convert to RGB if needed
         if img.mode not in ('RGB'):
             img = img.convert('RGB')
-            print(f"Converted image to RGB mode")
+            logger.debug("Converted image to RGB mode")
         
         # Resize if needed
         if max(img.size) > 1024:
             img.thumbnail((1024, 1024))
-            print(f"Resized image to {img.size}")
+            logger.debug("Resized image to %s", img.size)
         
         # Save as JPEG (Cohere documentation specifically mentions JPEG)
         output_buffer = io.BytesIO()
@@ -44,11 +65,11 @@ def image_to_base64(file_path):
         
         # Format exactly as Cohere expects
         data_uri = f"data:image/jpeg;base64,{base64_str}"
-        print(f"Created base64 data URI with length: {len(data_uri)}")
+        logger.debug("Created base64 data URI with length: %d", len(data_uri))
         
         return data_uri
     except Exception as e:
-        print(f"Error processing image {file_path}: {str(e)}")
+        logger.error(f"Error processing image {file_path}: {str(e)}")
         raise Exception(f"Failed to process image: {str(e)}")
 
 def run_embedding_request(images=None, texts=None, result_queue=None):
@@ -70,95 +91,73 @@ def run_embedding_request(images=None, texts=None, result_queue=None):
             result_queue.put(("error", str(e)))
         raise e
 
-def get_cohere_embedding(image_path):
-    """Generate embedding for an image using Cohere API."""
+def _image_payloads(image_path):
+    """
+    Image inputs to try in order: JPEG bytes, then a base64 data URI
+    
+    Decoding happens here, before the circuit breaker, so an unreadable
+    upload is reported as such rather than counted as a Cohere failure.
+    """
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+    
+    payloads = []
     try:
-        # Check if file exists
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image file not found: {image_path}")
-        
-        # Try direct file upload approach first
-        try:
-            print(f"Trying direct file upload approach with {image_path}")
-            
-            # Read the file as binary
-            with open(image_path, 'rb') as f:
-                file_bytes = f.read()
-            
-            # Get file info
-            file_size = len(file_bytes)
-            print(f"File size: {file_size} bytes")
-            
-            # Create a temporary file with a known good extension
-            temp_path = image_path
+        # Convert to a known good format
+        logger.debug("Converting %s to JPEG", image_path)
+        with Image.open(image_path) as img:
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            output_buffer = io.BytesIO()
+            img.save(output_buffer, format='JPEG', quality=95)
+        payloads.append(output_buffer.getvalue())
+        logger.debug("Converted image size: %d bytes", len(payloads[0]))
+    except Exception as e:
+        logger.warning(f"Direct file approach failed, falling back to base64 approach: {str(e)}")
+    payloads.append(image_to_base64(image_path))
+    return payloads
 
-            print(f"Converting image to {temp_path}")
-            
-            # Convert to a known good format
-            with Image.open(image_path) as img:
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                img.save(temp_path, format='JPEG', quality=95)
-            
-            print(f"Saved converted image to {temp_path}")
-            
-            # Read the converted file
-            with open(temp_path, 'rb') as f:
-                converted_bytes = f.read()
-            
-            # Generate embedding with the converted file
-            response = co.embed(
-                texts=None,
-                images=[converted_bytes],
-                model="embed-english-v3.0",
-                input_type="image",
-                embedding_types=["float"]
-            )
-            
-            # Clean up temp file
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-                
-            # Extract embedding
-            embedding = np.array(response.embeddings.float_[0])
-            return embedding
-            
-        except Exception as direct_error:
-            print(f"Direct file approach failed: {str(direct_error)}")
-            print("Falling back to base64 approach...")
-            
-            # Fall back to base64 approach
-            base64_uri = image_to_base64(image_path)
-            
+@circuit_breaker('cohere')
+def _embed_image_payloads(payloads):
+    """Embedding from the first payload Cohere accepts; the only part of a call the breaker sees"""
+    for index, payload in enumerate(payloads):
+        try:
+            rate_limiter.acquire('cohere', COHERE_API_KEY)
             response = co.embed(
                 texts=None,
-                images=[base64_uri],
+                images=[payload],
                 model="embed-english-v3.0",
                 input_type="image",
                 embedding_types=["float"]
             )
-            
-            # Extract embedding
-            embedding = np.array(response.embeddings.float_[0])
-            return embedding
-            
+            return np.array(response.embeddings.float_[0])
+        except rate_limiter.RateLimitExceeded:
+            raise
+        except Exception as e:
+            if index == len(payloads) - 1:
+                raise
+            logger.warning(f"Direct file approach failed, falling back to base64 approach: {str(e)}")
+
+@single_flight('cohere', 'embed-english-v3.0', file_args=('image_path',))
+def get_cohere_embedding(image_path):
+    """Generate embedding for an image using Cohere API."""
+    try:
+        return _embed_image_payloads(_image_payloads(image_path))
     except Exception as e:
-        print(f"Error generating Cohere embedding: {str(e)}")
-        # Try to provide more details about the image
-        try:
-            with Image.open(image_path) as img:
-                print(f"Image details: format={img.format}, mode={img.mode}, size={img.size}")
-        except Exception as img_error:
-            print(f"Could not get image details: {str(img_error)}")
+        logger.error(f"Error generating Cohere embedding: {str(e)}")
+        # Image details are only read back from disk when debug logging is on
+        debug_fields(logger, "cohere_failed_image", path=image_path, details=lambda: describe_image(image_path))
         
         raise Exception(f"API failed: {str(e)}")
 
+@single_flight('cohere', 'embed-english-v3.0')
+@circuit_breaker('cohere')
 def get_text_embedding(text, max_retries=3, request_timeout=10):
     """Generate text embedding with timeout and retry."""
     for attempt in range(max_retries):
-        print(f"Attempting text embedding API call (Attempt {attempt + 1}/{max_retries})...")
+        logger.debug("Attempting text embedding API call (Attempt %d/%d)", attempt + 1, max_retries)
+        # Wait for a token before starting the timed request
+        rate_limiter.acquire('cohere', COHERE_API_KEY)
         result_queue = queue.Queue()
         thread = threading.Thread(target=run_embedding_request, args=(None, [text], result_queue))
         
@@ -166,9 +165,9 @@ def get_text_embedding(text, max_retries=3, request_timeout=10):
         thread.join(timeout=request_timeout)
         
         if thread.is_alive():
-            print(f"Request took longer than {request_timeout} seconds.")
+            logger.warning(f"Cohere request took longer than {request_timeout} seconds")
             if attempt < max_retries - 1:
-                print(f"Retrying in 10 seconds...")
+                logger.info("Retrying in 1 second...")
                 sleep(1)
                 continue
             else:
@@ -176,14 +175,14 @@ def get_text_embedding(text, max_retries=3, request_timeout=10):
         
         status, result = result_queue.get()
         if status == "success":
-            print("Text embedding API call succeeded.")
+            logger.debug("Text embedding API call succeeded")
             return result
         else:
-            print(f"API error: {result}")
+            logger.warning(f"Cohere API error: {result}")
             if "rate limit" in str(result).lower() or "429" in str(result):
                 if attempt < max_retries - 1:
                     wait_time = 5 * (2 ** attempt)
-                    print(f"Rate Limit Error: Retrying in {wait_time} seconds...")
+                    logger.warning(f"Rate Limit Error: Retrying in {wait_time} seconds...")
                     sleep(wait_time)
                 else:
                     raise Exception(f"Failed after {max_retries} retries due to rate limit: {result}")
@@ -226,13 +225,13 @@ def search_images(query_text, stored_embeddings, image_paths=None, top_k=7, quer
         stored_embeddings = stored_embeddings["embeddings"]
     
     # Generate text embedding for the query
-    print(f"Generating text embedding for query: {query_text[:50]}...")
+    logger.debug("Generating text embedding for query: %s...", query_text[:50])
     query_text_embedding = get_text_embedding(query_text)
     
     # Generate image embedding for the query if image path is provided
     query_image_embedding = None
     if query_image_path and os.path.exists(query_image_path):
-        print(f"Generating image embedding for query image: {query_image_path}")
+        logger.debug("Generating image embedding for query image: %s", query_image_path)
         query_image_embedding = get_cohere_embedding(query_image_path)
     
     # Compute similarities
@@ -0,0 +1,440 @@
+import os
+import json
+import glob
+import mmap
+import time
+import pickle
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Candidate files per corpus, resolved against the working directory; the
+# first one that exists is loaded. Each can be overridden with an env var.
+CORPUS_PATHS = {
+    'titan': [
+        os.environ.get('TITAN_EMBEDDINGS_FILE', 'static/json/titan.json'),
+    ],
+    'twelve_labs': [
+        os.environ.get('TWELVELABS_EMBEDDINGS_FILE', 'static/json/twelve_labs_embeddings.json'),
+    ],
+    'azure': [
+        os.environ.get('AZURE_EMBEDDINGS_FILE', 'static/json/azure_embeddings_s3_images.pkl'),
+        os.path.join('static', 'json', 'azure_embeddings_s3_images.pkl'),
+    ],
+    'cohere': [
+        os.environ.get('COHERE_EMBEDDINGS_FILE', 'static/json/cohere_embeddings_selected_images.json'),
+        os.path.join('app', 'static', 'json', 'cohere_embeddings_selected_images.json'),
+    ],
+    'voyage': [
+        os.environ.get('VOYAGE_EMBEDDINGS_FILE', 'static/json/emb_selected_images.pkl'),
+        os.path.join('app', 'static', 'json', 'emb_selected_images.pkl'),
+    ],
+    # Not searched by any route yet; kept consistent by scripts/corpus_maintenance.py
+    'vertex': [
+        os.environ.get('VERTEX_EMBEDDINGS_FILE', 'static/json/vertex.json'),
+    ],
+}
+
+# Corpora the search routes read (preloaded before workers fork)
+SERVED_CORPORA = ('titan', 'twelve_labs', 'azure', 'cohere', 'voyage')
+
+# Serve corpora from memory-mapped float32 matrices (<name>.npy plus
+# <name>.keys.json in CORPUS_MMAP_DIR) instead of holding them in RAM. The
+# files are written on first load of the source and reused while the source
+# is unchanged; without a source file the exported pair is served as is.
+CORPUS_MMAP = os.environ.get('CORPUS_MMAP', 'False') == 'True'
+CORPUS_MMAP_DIR = os.environ.get('CORPUS_MMAP_DIR', os.path.join('instance', 'corpora'))
+
+# Publish each corpus once as a float32 segment in shared memory (tmpfs) that
+# every worker maps read-only, instead of each process holding a private
+# copy. The first process to see a source change rebuilds the segment (under
+# a file lock) and swaps the manifest; the others attach to the result.
+CORPUS_SHARED = os.environ.get('CORPUS_SHARED', 'False') == 'True'
+CORPUS_SHARED_DIR = os.environ.get('CORPUS_SHARED_DIR', os.path.join('/dev/shm', 'muse-corpora'))
+
+
+class Corpus:
+    """
+    One provider's precomputed embeddings, ready for scoring
+
+    Attributes:
+        name: Corpus name (key of CORPUS_PATHS)
+        source_path: File the corpus was loaded from
+        mtime: Modification time of source_path when loaded
+        keys: Row keys as stored in the file (image ids, paths or URLs)
+        paths: Image path or URL per row
+        matrix: float32 array (rows, dimension) with L2-normalized rows, so
+            cosine similarity against a normalized query is a dot product
+    """
+
+    def __init__(self, name, source_path, mtime, keys, paths, matrix):
+        self.name = name
+        self.source_path = source_path
+        self.mtime = mtime
+        self.keys = keys
+        self.paths = paths
+        self.matrix = matrix
+
+    @property
+    def streaming(self):
+        """True if the matrix is memory-mapped and should be scanned in chunks"""
+        return isinstance(self.matrix, np.memmap)
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def cosine_similarities(self, query_embedding):
+        """Cosine similarity of one query vector against every row"""
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        return self.matrix @ query
+
+
+def _extract_rows(data):
+    """
+    Pull (keys, paths, embeddings) out of any of the on-disk corpus layouts
+
+    Supported layouts:
+        {"embeddings": [...], "image_paths": [...]}           cohere / voyage / vertex
+        {"embeddings": [...], "image_urls": [...]}            azure
+        {"emb": [...], "paths": [...]}                        voyage (legacy)
+        [{"embedding": [...], "image_path": "..."}, ...]      cohere (list)
+        {"<id>": {"path": "...", "embedding": [...]}, ...}    titan
+        {"<path>": [...], ...}                                twelve labs
+    """
+    if isinstance(data, dict):
+        if 'embeddings' in data and ('image_paths' in data or 'image_urls' in data):
+            paths = list(data.get('image_paths') or data.get('image_urls'))
+            return paths, paths, list(data['embeddings'])
+        if 'emb' in data and 'paths' in data:
+            paths = list(data['paths'])
+            return paths, paths, list(data['emb'])
+
+        keys, paths, embeddings = [], [], []
+        for key, value in data.items():
+            if isinstance(value, dict) and 'embedding' in value:
+                keys.append(key)
+                paths.append(value.get('path', key))
+                embeddings.append(value['embedding'])
+            elif isinstance(value, (list, tuple, np.ndarray)):
+                keys.append(key)
+                paths.append(key)
+                embeddings.append(value)
+            else:
+                logger.warning(f"Skipping entry with unexpected format: {key}")
+        return keys, paths, embeddings
+
+    if isinstance(data, list):
+        keys, paths, embeddings = [], [], []
+        for item in data:
+            if isinstance(item, dict) and 'embedding' in item and 'image_path' in item:
+                keys.append(item['image_path'])
+                paths.append(item['image_path'])
+                embeddings.append(item['embedding'])
+        return keys, paths, embeddings
+
+    raise ValueError(f"Unsupported corpus structure: {type(data).__name__}")
+
+
+def _to_matrix(keys, paths, embeddings):
+    """Stack embeddings into a normalized float32 matrix, dropping rows of the wrong length"""
+    count = min(len(paths), len(embeddings))
+    keys, paths, embeddings = keys[:count], paths[:count], embeddings[:count]
+
+    try:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            raise ValueError(f"expected a 2-D matrix, got shape {matrix.shape}")
+    except ValueError as e:
+        # Inhomogeneous rows: keep the ones matching the first embedding's length
+        logger.warning(f"Filtering corpus rows with inconsistent dimensions: {str(e)}")
+        expected = len(embeddings[0]) if embeddings else 0
+        keep = [i for i, emb in enumerate(embeddings) if len(emb) == expected]
+        keys = [keys[i] for i in keep]
+        paths = [paths[i] for i in keep]
+        matrix = np.asarray([embeddings[i] for i in keep], dtype=np.float32).reshape(len(keep), expected)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return keys, paths, np.ascontiguousarray(matrix)
+
+
+def _resolve_path(name):
+    for path in CORPUS_PATHS.get(name, []):
+        if path and os.path.exists(path):
+            return path
+    if CORPUS_MMAP and os.path.exists(_mmap_paths(name)[0]):
+        return _mmap_paths(name)[0]
+    return None
+
+
+def _mmap_paths(name):
+    return (os.path.join(CORPUS_MMAP_DIR, f"{name}.npy"),
+            os.path.join(CORPUS_MMAP_DIR, f"{name}.keys.json"))
+
+
+def export_mmap(corpus):
+    """Write a corpus as <name>.npy plus <name>.keys.json for memory-mapped serving"""
+    matrix_path, keys_path = _mmap_paths(corpus.name)
+    os.makedirs(CORPUS_MMAP_DIR, exist_ok=True)
+    # Per-process temporary names: several local shard servers may export at once
+    suffix = f".{os.getpid()}.tmp"
+    with open(f"{matrix_path}{suffix}", 'wb') as f:
+        np.save(f, np.ascontiguousarray(corpus.matrix, dtype=np.float32))
+    with open(f"{keys_path}{suffix}", 'w') as f:
+        json.dump({'source_path': corpus.source_path, 'source_mtime': corpus.mtime,
+                   'keys': list(corpus.keys), 'paths': list(corpus.paths)}, f)
+    # Keys last: a reader that sees them current also sees the matching matrix
+    os.replace(f"{matrix_path}{suffix}", matrix_path)
+    os.replace(f"{keys_path}{suffix}", keys_path)
+    logger.info(f"Exported corpus '{corpus.name}' for memory mapping to {matrix_path}")
+    return matrix_path
+
+
+def _load_mmap(name, source_path=None, source_mtime=None):
+    """Memory-mapped Corpus from the exported pair; None if missing or stale against the source"""
+    matrix_path, keys_path = _mmap_paths(name)
+    try:
+        with open(keys_path, 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if source_path is not None and (meta.get('source_path') != source_path or meta.get('source_mtime') != source_mtime):
+        return None
+    matrix = np.load(matrix_path, mmap_mode='r')
+    mmap_obj = getattr(matrix, '_mmap', None)
+    if mmap_obj is not None and hasattr(mmap_obj, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        # Searches scan front to back: read ahead and drop pages behind
+        mmap_obj.madvise(mmap.MADV_SEQUENTIAL)
+    logger.info(f"Memory-mapped corpus '{name}' from {matrix_path}: {matrix.shape[0]} embeddings, dimension {matrix.shape[1]}")
+    return Corpus(name, source_path or matrix_path, source_mtime or os.path.getmtime(matrix_path),
+                  meta['keys'], meta['paths'], matrix)
+
+
+def _shared_paths(name):
+    """(manifest, lock file) of a corpus' shared segment"""
+    return (os.path.join(CORPUS_SHARED_DIR, f"{name}.json"),
+            os.path.join(CORPUS_SHARED_DIR, f"{name}.lock"))
+
+
+def publish_shared(corpus):
+    """
+    Write a corpus to a new shared segment and point the manifest at it
+
+    Every publish gets a fresh segment file, so the manifest swap is atomic:
+    readers see the old segment or the new one, never a partial write.
+    Superseded segments are unlinked; workers still mapping one keep it
+    until they reload.
+    """
+    manifest_path, _ = _shared_paths(corpus.name)
+    os.makedirs(CORPUS_SHARED_DIR, exist_ok=True)
+    segment = os.path.join(CORPUS_SHARED_DIR, f"{corpus.name}-{time.time_ns()}.npy")
+    with open(f"{segment}.tmp", 'wb') as f:
+        np.save(f, np.ascontiguousarray(corpus.matrix, dtype=np.float32))
+    os.replace(f"{segment}.tmp", segment)
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump({'segment': segment, 'source_path': corpus.source_path, 'source_mtime': corpus.mtime,
+                   'keys': list(corpus.keys), 'paths': list(corpus.paths)}, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    for old in glob.glob(os.path.join(CORPUS_SHARED_DIR, f"{glob.escape(corpus.name)}-*.npy")):
+        if old != segment:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    logger.info(f"Published corpus '{corpus.name}' to shared segment {segment}")
+    return segment
+
+
+def _attach_shared(name, source_path, source_mtime):
+    """Read-only Corpus over the published segment; None if missing or stale against the source"""
+    manifest_path, _ = _shared_paths(name)
+    for _ in range(2):
+        try:
+            with open(manifest_path, 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('source_path') != source_path or meta.get('source_mtime') != source_mtime:
+            return None
+        try:
+            matrix = np.load(meta['segment'], mmap_mode='r')
+        except FileNotFoundError:
+            # Superseded between reading the manifest and opening it: re-read
+            continue
+        logger.info(f"Attached corpus '{name}' from shared segment {meta['segment']}: "
+                    f"{matrix.shape[0]} embeddings, dimension {matrix.shape[1]}")
+        return Corpus(name, source_path, source_mtime, meta['keys'], meta['paths'], matrix)
+    return None
+
+
+def _load_shared(name, path, mtime):
+    """Attach to the shared segment, publishing it first if this process is the first to need it"""
+    corpus = _attach_shared(name, path, mtime)
+    if corpus is not None:
+        return corpus
+    import fcntl
+    os.makedirs(CORPUS_SHARED_DIR, exist_ok=True)
+    with open(_shared_paths(name)[1], 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Another process may have published while this one waited
+            corpus = _attach_shared(name, path, mtime)
+            if corpus is not None:
+                return corpus
+            corpus = _read_source(name, path, mtime)
+            if corpus is None:
+                return None
+            publish_shared(corpus)
+            del corpus
+            return _attach_shared(name, path, mtime)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_source(name, path, mtime):
+    """Parse a corpus source file (JSON or pickle) into an in-memory Corpus"""
+    if path.endswith('.pkl'):
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    else:
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+    keys, paths, embeddings = _extract_rows(data)
+    del data
+    if not embeddings:
+        logger.error(f"No embeddings found in {path}")
+        return None
+
+    keys, paths, matrix = _to_matrix(keys, paths, embeddings)
+    logger.info(f"Loaded corpus '{name}' from {path}: {matrix.shape[0]} embeddings, dimension {matrix.shape[1]}")
+    return Corpus(name, path, mtime, keys, paths, matrix)
+
+
+def load_corpus(name, path=None):
+    """
+    Read a corpus file from disk into a Corpus
+
+    Args:
+        name: Corpus name (key of CORPUS_PATHS)
+        path: Explicit file to load instead of the configured candidates
+
+    Returns:
+        Corpus or None if no file was found or it could not be parsed
+    """
+    path = path or _resolve_path(name)
+    if path is None:
+        logger.error(f"Embeddings file for corpus '{name}' not found. Tried: {CORPUS_PATHS.get(name)}")
+        return None
+
+    try:
+        mtime = os.path.getmtime(path)
+        if path.endswith('.npy'):
+            return _load_mmap(name)
+        if CORPUS_SHARED:
+            return _load_shared(name, path, mtime)
+        if CORPUS_MMAP:
+            corpus = _load_mmap(name, path, mtime)
+            if corpus is not None:
+                return corpus
+
+        corpus = _read_source(name, path, mtime)
+        if corpus is not None and CORPUS_MMAP:
+            export_mmap(corpus)
+            del corpus
+            return _load_mmap(name, path, mtime)
+        return corpus
+
+    except Exception as e:
+        logger.error(f"Error loading corpus '{name}' from {path}: {str(e)}", exc_info=True)
+        return None
+
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+
+def get_corpus(name):
+    """
+    Cached corpus by name, reloaded when its file changes on disk
+
+    Returns:
+        Corpus or None if it is not available
+    """
+    path = _resolve_path(name)
+    cached = _corpora.get(name)
+    if path is None:
+        return cached
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return cached
+    if cached is not None and cached.source_path == path and cached.mtime == mtime:
+        return cached
+
+    with _corpora_lock:
+        cached = _corpora.get(name)
+        if cached is not None and cached.source_path == path and cached.mtime == mtime:
+            return cached
+        corpus = load_corpus(name, path)
+        if corpus is not None:
+            _corpora[name] = corpus
+        return corpus or cached
+
+
+def preload_corpora(names=None):
+    """
+    Load corpora up front, e.g. in the gunicorn master before workers fork
+
+    Their metadata filter indexes are built too, so the first filtered
+    search does not pay for them.
+
+    Args:
+        names: Corpus names to load (default: SERVED_CORPORA)
+
+    Returns:
+        dict: name -> number of rows loaded (missing corpora are skipped)
+    """
+    from app.services.metadata_index import get_metadata_index
+
+    loaded = {}
+    for name in names or SERVED_CORPORA:
+        corpus = get_corpus(name)
+        if corpus is not None:
+            loaded[name] = len(corpus)
+            get_metadata_index(corpus)
+    logger.info(f"Preloaded corpora: {loaded}")
+    return loaded
+
+
+def corpora_snapshot():
+    """Rows, dimension and backing storage of every corpus loaded in this process"""
+    corpora = {}
+    for name, corpus in list(_corpora.items()):
+        backing = getattr(corpus.matrix, 'filename', None)
+        if backing is None:
+            storage = 'private'
+        elif os.path.abspath(backing).startswith(os.path.abspath(CORPUS_SHARED_DIR)):
+            storage = 'shared'
+        else:
+            storage = 'mmap'
+        corpora[name] = {'rows': len(corpus), 'dimension': corpus.dimension, 'storage': storage,
+                         'file': backing or corpus.source_path, 'source_mtime': corpus.mtime}
+    return {'pid': os.getpid(), 'shared': CORPUS_SHARED, 'mmap': CORPUS_MMAP, 'corpora': corpora}
+
+
+def clear_corpora():
+    """Drop every cached corpus (tests and benchmarks that rewrite corpus files)"""
+    with _corpora_lock:
+        _corpora.clear()
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity at or above which two images count as near-duplicates
+DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', 0.95))
+# Rows per side of a similarity tile; a tile holds TILE_ROWS**2 float32 per worker
+DUPLICATE_TILE_ROWS = int(os.environ.get('DUPLICATE_TILE_ROWS', 2048))
+# Where scripts/find_duplicates.py writes <corpus>_duplicates.json
+DUPLICATE_CLUSTERS_DIR = os.environ.get('DUPLICATE_CLUSTERS_DIR', os.path.join('static', 'json'))
+
+# Cluster id of rows with no duplicate
+NO_CLUSTER = -1
+
+
+def _tile_pairs(matrix, start_a, start_b, tile_rows, threshold):
+    """Row pairs (a < b) within one tile whose similarity reaches threshold"""
+    block = matrix[start_a:start_a + tile_rows] @ matrix[start_b:start_b + tile_rows].T
+    if start_a == start_b:
+        # Diagonal tile: only the upper triangle, without self-pairs (-inf
+        # rather than 0, which a low threshold would still match)
+        block[np.tril_indices_from(block)] = -np.inf
+    rows, cols = np.nonzero(block >= threshold)
+    return rows + start_a, cols + start_b
+
+
+def duplicate_pairs(matrix, threshold=DUPLICATE_THRESHOLD, tile_rows=DUPLICATE_TILE_ROWS, workers=None):
+    """
+    All row pairs of an L2-normalized matrix with cosine >= threshold
+
+    The n x n similarity matrix is never materialized: it is computed one
+    (tile_rows x tile_rows) block of the upper triangle at a time, on a
+    thread pool (the matrix products release the GIL). Set
+    OPENBLAS_NUM_THREADS/MKL_NUM_THREADS=1 when using many workers so BLAS
+    threads do not oversubscribe the cores.
+
+    Returns:
+        (a, b): int64 arrays of row numbers, a < b
+
+    Raises:
+        ValueError: If threshold is not in (0, 1]; at or below 0 most of
+            the n^2/2 pairs would match
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Duplicate threshold must be in (0, 1], got {threshold}")
+    count = matrix.shape[0]
+    starts = range(0, count, tile_rows)
+    tiles = [(a, b) for a in starts for b in starts if b >= a]
+    pairs_a, pairs_b = [], []
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for rows, cols in pool.map(lambda tile: _tile_pairs(matrix, tile[0], tile[1], tile_rows, threshold), tiles):
+            pairs_a.append(rows)
+            pairs_b.append(cols)
+    if not pairs_a:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(pairs_a).astype(np.int64), np.concatenate(pairs_b).astype(np.int64)
+
+
+def cluster_pairs(count, pairs_a, pairs_b):
+    """
+    Connected components of the duplicate graph
+
+    Returns:
+        int array (count,): cluster id per row (the cluster's lowest row
+        number), NO_CLUSTER for rows without duplicates
+    """
+    parent = np.arange(count)
+
+    def find(row):
+        root = row
+        while parent[root] != root:
+            root = parent[root]
+        while parent[row] != root:
+            parent[row], row = root, parent[row]
+        return root
+
+    for a, b in zip(pairs_a.tolist(), pairs_b.tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    cluster_ids = np.array([find(row) for row in range(count)], dtype=np.int64)
+    sizes = np.bincount(cluster_ids, minlength=count)
+    cluster_ids[sizes[cluster_ids] < 2] = NO_CLUSTER
+    return cluster_ids
+
+
+def find_duplicate_clusters(corpus, threshold=DUPLICATE_THRESHOLD, tile_rows=DUPLICATE_TILE_ROWS, workers=None):
+    """
+    Near-duplicate clusters of a corpus
+
+    Returns:
+        (cluster_ids, pair_count): cluster id column aligned with the corpus
+        rows (see cluster_pairs) and the number of duplicate pairs found
+    """
+    started = time.perf_counter()
+    pairs_a, pairs_b = duplicate_pairs(corpus.matrix, threshold, tile_rows, workers)
+    cluster_ids = cluster_pairs(len(corpus), pairs_a, pairs_b)
+    logger.info(f"Duplicate scan of '{corpus.name}': {len(pairs_a)} pairs >= {threshold} "
+                f"in {time.perf_counter() - started:.1f}s")
+    return cluster_ids, len(pairs_a)
+
+
+def clusters_path(corpus_name):
+    return os.path.join(DUPLICATE_CLUSTERS_DIR, f"{corpus_name}_duplicates.json")
+
+
+def save_clusters(corpus, cluster_ids, threshold, path=None):
+    """
+    Write a corpus' duplicate clusters as lists of row keys
+
+    Keys rather than row numbers, so the file stays valid when rows are
+    added or reordered (new rows simply have no cluster).
+    """
+    members = {}
+    for row in np.flatnonzero(cluster_ids != NO_CLUSTER):
+        members.setdefault(int(cluster_ids[row]), []).append(str(corpus.keys[row]))
+    path = path or clusters_path(corpus.name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'corpus': corpus.name,
+            'threshold': threshold,
+            'rows': len(corpus),
+            'clusters': sorted(members.values(), key=len, reverse=True),
+        }, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+_cluster_ids = {}
+_cluster_ids_lock = threading.Lock()
+
+
+def get_cluster_ids(corpus):
+    """
+    Precomputed cluster id column for a corpus, or None if it has no clusters file
+
+    Cached until the corpus or the clusters file is reloaded.
+    """
+    path = clusters_path(corpus.name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _cluster_ids.get(corpus.name)
+    if cached is not None and cached[0] is corpus and cached[1] == mtime:
+        return cached[2]
+
+    with _cluster_ids_lock:
+        try:
+            with open(path, 'r') as f:
+                clusters = json.load(f)['clusters']
+        except Exception as e:
+            logger.error(f"Error loading duplicate clusters from {path}: {str(e)}", exc_info=True)
+            return None
+        rows_by_key = {str(key): row for row, key in enumerate(corpus.keys)}
+        cluster_ids = np.full(len(corpus), NO_CLUSTER, dtype=np.int64)
+        for cluster_id, keys in enumerate(clusters):
+            rows = [rows_by_key[key] for key in keys if key in rows_by_key]
+            if len(rows) > 1:
+                cluster_ids[rows] = cluster_id
+        _cluster_ids[corpus.name] = (corpus, mtime, cluster_ids)
+        logger.info(f"Loaded {len(clusters)} duplicate clusters for '{corpus.name}'")
+        return cluster_ids
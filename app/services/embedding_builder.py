@@ -0,0 +1,89 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Provider modules are imported on first use, so building for one provider
+# does not initialize every client.
+
+
+def _titan(path):
+    from app.services.titan_service import get_titan_embedding
+    return get_titan_embedding(image_path=path)['embedding']
+
+
+def _twelve_labs(path):
+    from app.services.twelvelabs_service import get_embedding_for_image
+    return get_embedding_for_image(path)
+
+
+def _cohere(path):
+    from app.services.cohere_service import get_cohere_embedding
+    return get_cohere_embedding(path)
+
+
+def _voyage(path):
+    from app.services.voyage_service import get_voyage_embedding, image_to_pil
+    return get_voyage_embedding(img=image_to_pil(path))
+
+
+def _vertex(path):
+    from app.services.vertex_service import get_vertex_embeddings
+    result = get_vertex_embeddings(path, None)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return result['image_embedding']
+
+
+def _azure(url):
+    from app.services.azure_service import AzureService
+    embedding = AzureService().vectorize_image(url)
+    if embedding is None:
+        raise RuntimeError(f"Azure returned no embedding for {url}")
+    return embedding
+
+
+# Corpus name -> function(image path or URL) -> embedding
+IMAGE_EMBEDDERS = {
+    'titan': _titan,
+    'twelve_labs': _twelve_labs,
+    'cohere': _cohere,
+    'voyage': _voyage,
+    'vertex': _vertex,
+    'azure': _azure,
+}
+
+
+def embed_images(provider, paths, workers=4):
+    """
+    Embed many images with one provider, `workers` requests at a time
+
+    Calls go through the provider functions, so the rate limiter, circuit
+    breaker and single-flight coalescing apply as for live traffic.
+
+    Args:
+        provider: Corpus/provider name (key of IMAGE_EMBEDDERS)
+        paths: Image paths (URLs for azure)
+        workers: Concurrent requests
+
+    Returns:
+        (embeddings, failures): path -> embedding, path -> error message
+    """
+    embed = IMAGE_EMBEDDERS[provider]
+    embeddings, failures = {}, {}
+
+    def run(path):
+        try:
+            return path, embed(path), None
+        except Exception as e:
+            return path, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, embedding, error in pool.map(run, paths):
+            if error is None and embedding is not None:
+                # Plain floats: corpus files are written with json (Vertex returns float32 arrays)
+                embeddings[path] = [float(value) for value in embedding]
+            else:
+                failures[path] = error or 'no embedding returned'
+    logger.info(f"Embedded {len(embeddings)}/{len(paths)} images with {provider} ({len(failures)} failed)")
+    return embeddings, failures
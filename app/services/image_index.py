@@ -0,0 +1,275 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the originals behind /static/all_images
+IMAGE_DIR = os.environ.get('IMAGE_DIR', os.path.join('app', 'static', 'all_images'))
+# 'flag' marks results whose file is missing; 'skip' leaves those rows out of the ranking
+IMAGE_INDEX_MISSING = os.environ.get('IMAGE_INDEX_MISSING', 'flag').lower()
+IMAGE_INDEX_WATCH = os.environ.get('IMAGE_INDEX_WATCH', 'True') == 'True'
+# Polling interval of the fallback watcher (used when watchdog is not installed)
+IMAGE_INDEX_POLL_SECONDS = float(os.environ.get('IMAGE_INDEX_POLL_SECONDS', 5))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # optional; the poller below is used instead
+    Observer = None
+    FileSystemEventHandler = object
+
+
+def is_local_path(path):
+    """True for a local image path, False for a URL or an empty value"""
+    return bool(path) and '://' not in str(path)
+
+
+class _WatchdogHandler(FileSystemEventHandler):
+    def __init__(self, index):
+        self.index = index
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.index.update(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.index.update(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.index.update(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.index.update(event.src_path)
+            self.index.update(event.dest_path)
+
+
+class ImageIndex:
+    """
+    Which image files exist, by file name, kept current by a watcher
+
+    Built once with a single directory scan; afterwards lookups are set/dict
+    hits instead of filesystem calls. A watchdog observer (or, without
+    watchdog, a poller that rescans when the directory mtime changes)
+    applies additions and deletions. Per-corpus availability arrays are
+    cached against the index generation, so a search pays for them once.
+    """
+
+    def __init__(self, image_dir):
+        self.image_dir = image_dir
+        self.files = {}
+        self.generation = 0
+        self.scanned_at = None
+        self._dir_mtime = None
+        self._lock = threading.Lock()
+        self._availability = {}
+        self._watcher_pid = None
+        self._observer = None
+        self.refresh()
+
+    def refresh(self):
+        """Rescan the directory"""
+        files = {}
+        try:
+            dir_mtime = os.stat(self.image_dir).st_mtime_ns
+            with os.scandir(self.image_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        stat = entry.stat()
+                        files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            dir_mtime = None
+            logger.warning(f"Image directory not found: {self.image_dir}")
+        with self._lock:
+            self.files = files
+            self._dir_mtime = dir_mtime
+            self.generation += 1
+            self.scanned_at = time.time()
+        logger.info(f"Image index for {self.image_dir}: {len(files)} files")
+
+    def update(self, path):
+        """Apply one watcher event for `path`"""
+        name = os.path.basename(path)
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            return
+        try:
+            stat = os.stat(os.path.join(self.image_dir, name))
+            entry = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            entry = None
+        with self._lock:
+            if entry is None:
+                changed = self.files.pop(name, None) is not None
+            else:
+                changed = self.files.get(name) != entry
+                self.files[name] = entry
+            if changed:
+                self.generation += 1
+
+    def exists(self, image_path):
+        """True if the image's file name is in the directory (None for URLs)"""
+        if not is_local_path(image_path):
+            return None
+        return os.path.basename(str(image_path)) in self.files
+
+    def stat(self, image_path):
+        """(mtime_ns, size) of an image, or None if it is missing"""
+        return self.files.get(os.path.basename(str(image_path)))
+
+    def availability(self, corpus):
+        """
+        Boolean array: does each corpus row's image exist
+
+        Returns None for corpora of remote URLs. Cached until the corpus is
+        reloaded or the index changes.
+        """
+        cached = self._availability.get(corpus.name)
+        if cached is not None and cached[0] is corpus and cached[1] == self.generation:
+            return cached[2]
+        if not corpus.paths or not is_local_path(corpus.paths[0]):
+            available = None
+        else:
+            files = self.files
+            available = np.fromiter((os.path.basename(path) in files for path in corpus.paths),
+                                    dtype=bool, count=len(corpus.paths))
+        self._availability[corpus.name] = (corpus, self.generation, available)
+        return available
+
+    # Watcher
+
+    def _poll(self):
+        while True:
+            time.sleep(IMAGE_INDEX_POLL_SECONDS)
+            try:
+                dir_mtime = os.stat(self.image_dir).st_mtime_ns
+            except OSError:
+                dir_mtime = None
+            if dir_mtime != self._dir_mtime:
+                self.refresh()
+
+    def start_watcher(self):
+        """Start watching in this process (threads do not survive a fork; safe to call again)"""
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        if Observer is not None and os.path.isdir(self.image_dir):
+            self._observer = Observer()
+            self._observer.schedule(_WatchdogHandler(self), self.image_dir, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+            logger.info(f"Watching {self.image_dir} with watchdog")
+        else:
+            threading.Thread(target=self._poll, name='image-index-poller', daemon=True).start()
+            logger.info(f"Polling {self.image_dir} every {IMAGE_INDEX_POLL_SECONDS}s for changes")
+
+    def snapshot(self):
+        return {
+            'image_dir': self.image_dir,
+            'files': len(self.files),
+            'generation': self.generation,
+            'scanned_at': self.scanned_at,
+            'watcher': 'watchdog' if self._observer is not None else ('poll' if self._watcher_pid else None),
+            'missing_mode': IMAGE_INDEX_MISSING,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_image_index():
+    """Process-wide ImageIndex over IMAGE_DIR, with its watcher running in this process"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ImageIndex(IMAGE_DIR)
+    if IMAGE_INDEX_WATCH:
+        _index.start_watcher()
+    return _index
+
+
+def availability_mask(corpus):
+    """Row mask that drops missing images when IMAGE_INDEX_MISSING is 'skip', else None"""
+    if IMAGE_INDEX_MISSING != 'skip':
+        return None
+    return get_image_index().availability(corpus)
+
+
+def image_available(image_path):
+    """True/False for local images, None for remote URLs"""
+    return get_image_index().exists(image_path)
+
+
+def _verify_chunk(image_dir, names):
+    """Names in a slice of the directory whose image data does not verify"""
+    from PIL import Image
+    corrupt = []
+    for name in names:
+        try:
+            with Image.open(os.path.join(image_dir, name)) as image:
+                image.verify()
+        except Exception:
+            corrupt.append(name)
+    return corrupt
+
+
+def consistency_report(corpora, workers=8, verify=False, sample=20):
+    """
+    Cross-check corpora against the image directory
+
+    Args:
+        corpora: Corpus objects to check
+        workers: Threads for the per-file checks (I/O bound)
+        verify: Also open every image to detect corrupt files
+        sample: How many names to list per category
+
+    Returns:
+        dict with per-corpus missing counts, orphaned files (in the directory
+        but in no corpus) and, with verify, corrupt files
+    """
+    index = get_image_index()
+    files = set(index.files)
+    referenced = set()
+    report = {'image_dir': index.image_dir, 'files': len(files), 'corpora': {}}
+
+    for corpus in corpora:
+        available = index.availability(corpus)
+        if available is None:
+            report['corpora'][corpus.name] = {'rows': len(corpus), 'remote': True}
+            continue
+        names = [os.path.basename(path) for path in corpus.paths]
+        referenced.update(names)
+        missing = [names[i] for i in np.flatnonzero(~available)]
+        report['corpora'][corpus.name] = {
+            'rows': len(corpus),
+            'missing': len(missing),
+            'missing_sample': missing[:sample],
+        }
+
+    orphaned = sorted(files - referenced)
+    report['orphaned'] = len(orphaned)
+    report['orphaned_sample'] = orphaned[:sample]
+
+    if verify:
+        names = sorted(files)
+        chunk = max(1, len(names) // (workers * 4) + 1)
+        corrupt = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_verify_chunk, index.image_dir, names[i:i + chunk])
+                       for i in range(0, len(names), chunk)]
+            for future in futures:
+                corrupt.extend(future.result())
+        report['corrupt'] = len(corrupt)
+        report['corrupt_sample'] = sorted(corrupt)[:sample]
+
+    return report
@@ -0,0 +1,257 @@
+import os
+import json
+import logging
+import threading
+import datetime
+from urllib.parse import urlparse
+import numpy as np
+from app.services.image_index import availability_mask, get_image_index
+
+logger = logging.getLogger(__name__)
+
+# Sidecar attributes per image: {"<path, URL or file name>": {"tags": [...], "date": "2024-05-01", ...}}.
+# A per-corpus file (<name>_metadata.json next to the shared one) is read
+# first; entries in the shared file apply to every corpus.
+IMAGE_METADATA_FILE = os.environ.get('IMAGE_METADATA_FILE', 'static/json/image_metadata.json')
+
+# Filter keys that are not bitmap columns
+RANGE_FILTERS = ('date_from', 'date_to')
+PREFIX_FILTER = 'prefix'
+
+
+class FilterError(ValueError):
+    """Invalid search filters (unknown column, bad date or prefix, not a JSON object)"""
+
+
+def _sidecar_paths(corpus_name):
+    directory, filename = os.path.split(IMAGE_METADATA_FILE)
+    return [os.path.join(directory, f"{corpus_name}_metadata.json"), IMAGE_METADATA_FILE]
+
+
+def _load_sidecars(corpus_name):
+    attributes = {}
+    mtimes = []
+    # Shared file first so per-corpus entries override it
+    for path in reversed(_sidecar_paths(corpus_name)):
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            for key, values in data.items():
+                attributes.setdefault(key, {}).update(values)
+            mtimes.append((path, os.path.getmtime(path)))
+        except Exception as e:
+            logger.error(f"Error loading image metadata from {path}: {str(e)}", exc_info=True)
+    return attributes, tuple(mtimes)
+
+
+def _parse_date(value):
+    """YYYYMMDD int from an ISO date/datetime string or a timestamp; -1 if unknown"""
+    if value in (None, ''):
+        return -1
+    try:
+        if isinstance(value, (int, float)):
+            day = datetime.date.fromtimestamp(value)
+        else:
+            day = datetime.date.fromisoformat(str(value)[:10])
+        return day.year * 10000 + day.month * 100 + day.day
+    except (ValueError, OSError, OverflowError):
+        return -1
+
+
+def _file_mtime(path):
+    """Image file mtime from the image index (one directory scan, not a stat per row)"""
+    stat = get_image_index().stat(path)
+    return stat[0] / 1e9 if stat is not None else None
+
+
+def _storage_key(path):
+    """Object key of a URL (S3 or HTTP), or the path itself"""
+    parsed = urlparse(path)
+    if parsed.scheme in ('http', 'https', 's3'):
+        return parsed.path.lstrip('/')
+    return path
+
+
+class MetadataIndex:
+    """
+    Metadata columns and bitmap indexes for one corpus
+
+    Each (column, value) pair has a packed bitmap (np.packbits) with one bit
+    per corpus row; a filter ANDs the bitmaps of its keys, ORing the values
+    given for one key, and unpacks the result into a boolean mask that the
+    scoring step applies before ranking.
+
+    Columns:
+        folder      directory part of the path (or of the URL's object key)
+        extension   lower-case file extension without the dot
+        host        URL host (S3 bucket endpoint) for URL corpora
+        <attr>      any sidecar attribute; list values (e.g. tags) set one bit per item
+    Range/prefix filters (not bitmaps):
+        prefix      path, URL or object-key prefix
+        date_from / date_to   inclusive ISO dates against the sidecar 'date',
+                    falling back to the image file's mtime (from the image index)
+    """
+
+    def __init__(self, corpus, attributes=None, sidecar_mtimes=()):
+        self.corpus = corpus
+        self.sidecar_mtimes = sidecar_mtimes
+        self.size = len(corpus)
+        attributes = attributes or {}
+
+        self.paths = np.array(corpus.paths, dtype=str)
+        self.keys = np.array([_storage_key(path) for path in corpus.paths], dtype=str)
+        self.dates = np.full(self.size, -1, dtype=np.int32)
+
+        members = {}
+
+        def add(column, value, row):
+            if value in (None, ''):
+                return
+            members.setdefault(column, {}).setdefault(str(value).lower(), []).append(row)
+
+        for row, (path, key) in enumerate(zip(corpus.paths, corpus.keys)):
+            storage_key = _storage_key(path)
+            add('folder', os.path.dirname(storage_key), row)
+            add('extension', os.path.splitext(storage_key)[1].lstrip('.'), row)
+            if storage_key != path:
+                add('host', urlparse(path).netloc, row)
+
+            attrs = (attributes.get(path) or attributes.get(key)
+                     or attributes.get(os.path.basename(storage_key)) or {})
+            for column, value in attrs.items():
+                if column == 'date':
+                    continue
+                for item in (value if isinstance(value, (list, tuple)) else [value]):
+                    add(column, item, row)
+
+            date = _parse_date(attrs.get('date'))
+            if date < 0 and storage_key == path:
+                date = _parse_date(_file_mtime(path))
+            self.dates[row] = date
+
+        self.bitmaps = {}
+        for column, values in members.items():
+            self.bitmaps[column] = {}
+            for value, rows in values.items():
+                bits = np.zeros(self.size, dtype=bool)
+                bits[rows] = True
+                self.bitmaps[column][value] = np.packbits(bits)
+
+    def columns(self):
+        """Column name -> number of distinct values"""
+        return {column: len(values) for column, values in self.bitmaps.items()}
+
+    def _column_bitmap(self, column, values):
+        if column not in self.bitmaps:
+            raise FilterError(f"Unknown filter '{column}' for corpus '{self.corpus.name}'")
+        combined = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for value in (values if isinstance(values, (list, tuple)) else [values]):
+            bitmap = self.bitmaps[column].get(str(value).lower())
+            if bitmap is not None:
+                np.bitwise_or(combined, bitmap, out=combined)
+        return combined
+
+    def mask(self, filters):
+        """
+        Boolean mask of the rows matching every filter
+
+        Args:
+            filters: dict column -> value or list of values (OR within a key,
+                AND across keys); 'prefix', 'date_from' and 'date_to' as described above
+
+        Returns:
+            np.ndarray of bool, or None if filters is empty
+
+        Raises:
+            FilterError: For unknown columns, non-string prefixes or unparseable dates
+        """
+        if not filters:
+            return None
+
+        packed = None
+        for column, values in filters.items():
+            if column in RANGE_FILTERS or column == PREFIX_FILTER:
+                continue
+            bitmap = self._column_bitmap(column, values)
+            packed = bitmap if packed is None else np.bitwise_and(packed, bitmap)
+
+        if packed is not None:
+            mask = np.unpackbits(packed, count=self.size).astype(bool)
+        else:
+            mask = np.ones(self.size, dtype=bool)
+
+        prefixes = filters.get(PREFIX_FILTER)
+        if prefixes:
+            prefixes = prefixes if isinstance(prefixes, (list, tuple)) else [prefixes]
+            matched = np.zeros(self.size, dtype=bool)
+            for prefix in prefixes:
+                if not isinstance(prefix, str):
+                    raise FilterError(f"Invalid prefix: {prefix!r} (expected a string)")
+                matched |= np.char.startswith(self.paths, prefix) | np.char.startswith(self.keys, prefix)
+            mask &= matched
+
+        for name, compare in (('date_from', np.greater_equal), ('date_to', np.less_equal)):
+            if filters.get(name):
+                bound = _parse_date(filters[name])
+                if bound < 0:
+                    raise FilterError(f"Invalid {name}: {filters[name]}")
+                mask &= (self.dates >= 0) & compare(self.dates, bound)
+
+        return mask
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_metadata_index(corpus):
+    """Cached MetadataIndex for a corpus, rebuilt when the corpus or a sidecar file changes"""
+    cached = _indexes.get(corpus.name)
+    sidecar_mtimes = tuple(
+        (path, os.path.getmtime(path)) for path in reversed(_sidecar_paths(corpus.name)) if os.path.exists(path)
+    )
+    if cached is not None and cached.corpus is corpus and cached.sidecar_mtimes == sidecar_mtimes:
+        return cached
+
+    with _indexes_lock:
+        cached = _indexes.get(corpus.name)
+        if cached is not None and cached.corpus is corpus and cached.sidecar_mtimes == sidecar_mtimes:
+            return cached
+        attributes, sidecar_mtimes = _load_sidecars(corpus.name)
+        index = MetadataIndex(corpus, attributes, sidecar_mtimes)
+        _indexes[corpus.name] = index
+        logger.info(f"Built metadata index for '{corpus.name}': {index.columns()}")
+        return index
+
+
+def filter_mask(corpus, filters):
+    """
+    Row mask for a search: `filters`, and with IMAGE_INDEX_MISSING=skip, rows
+    whose image file exists (None when nothing is excluded)
+    """
+    mask = get_metadata_index(corpus).mask(filters) if filters else None
+    available = availability_mask(corpus)
+    if available is not None:
+        mask = available if mask is None else mask & available
+    return mask
+
+
+def parse_filters(value):
+    """
+    Filters from a request: a dict (JSON body) or a JSON string (form field)
+
+    Raises:
+        FilterError: If the value is not a JSON object
+    """
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError as e:
+            raise FilterError(f"filters must be a JSON object: {str(e)}")
+    if not isinstance(value, dict):
+        raise FilterError("filters must be a JSON object")
+    return value or None
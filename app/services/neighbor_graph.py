@@ -0,0 +1,233 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Neighbours stored per corpus row
+NEIGHBOR_GRAPH_K = int(os.environ.get('NEIGHBOR_GRAPH_K', 50))
+# Where scripts/build_neighbor_graph.py writes <corpus>_neighbors.npz
+NEIGHBOR_GRAPH_DIR = os.environ.get('NEIGHBOR_GRAPH_DIR', os.path.join('instance', 'neighbors'))
+# Rows per side of a scoring tile (a tile holds TILE_ROWS**2 float32 per worker)
+NEIGHBOR_TILE_ROWS = int(os.environ.get('NEIGHBOR_TILE_ROWS', 1024))
+
+
+def row_fingerprints(matrix):
+    """Short hash of every row, to tell which rows changed between corpus builds"""
+    return np.array([hashlib.blake2b(row.tobytes(), digest_size=8).hexdigest() for row in matrix])
+
+
+def _merge_top_k(best_rows, best_scores, rows, scores, k):
+    """Per query row, the k best of two (rows, scores) candidate sets"""
+    rows = np.concatenate([best_rows, rows], axis=1)
+    scores = np.concatenate([best_scores, scores], axis=1)
+    if scores.shape[1] > k:
+        keep = np.argpartition(scores, -k, axis=1)[:, -k:]
+        rows = np.take_along_axis(rows, keep, axis=1)
+        scores = np.take_along_axis(scores, keep, axis=1)
+    return rows, scores
+
+
+def _tile_neighbors(matrix, queries, candidates, k, tile_rows):
+    """
+    k nearest candidate rows for each query row, excluding the row itself
+
+    Candidates are scored tile_rows at a time so memory stays at
+    len(queries) * tile_rows scores however large the corpus is.
+    """
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    query_matrix = matrix[queries]
+    for start in range(0, len(candidates), tile_rows):
+        columns = candidates[start:start + tile_rows]
+        scores = query_matrix @ matrix[columns].T
+        scores[queries[:, None] == columns[None, :]] = -np.inf
+        rows = np.broadcast_to(columns, scores.shape)
+        best_rows, best_scores = _merge_top_k(best_rows, best_scores, rows, scores, k)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def compute_neighbors(matrix, queries, k, candidates=None, tile_rows=NEIGHBOR_TILE_ROWS, workers=None):
+    """
+    Top-k neighbours of `queries` among `candidates` (default: all rows)
+
+    Query tiles are scored in parallel on a thread pool; the matrix
+    products release the GIL.
+
+    Returns:
+        (rows, scores): (len(queries), k) arrays, best first; slots without
+        a neighbour (fewer than k candidates) have row -1 and score -inf
+    """
+    queries = np.asarray(queries, dtype=np.int64)
+    candidates = np.arange(matrix.shape[0]) if candidates is None else np.asarray(candidates, dtype=np.int64)
+    k = min(k, len(candidates))
+    if len(queries) == 0 or k == 0:
+        return np.empty((len(queries), k), dtype=np.int64), np.empty((len(queries), k), dtype=np.float32)
+    tiles = [queries[start:start + tile_rows] for start in range(0, len(queries), tile_rows)]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        parts = list(pool.map(lambda tile: _tile_neighbors(matrix, tile, candidates, k, tile_rows), tiles))
+    rows, scores = np.concatenate([rows for rows, _ in parts]), np.concatenate([scores for _, scores in parts])
+    rows[np.isneginf(scores)] = -1
+    return rows, scores
+
+
+class NeighborGraph:
+    """
+    Precomputed k nearest neighbours of every row of one corpus
+
+    Self-contained (keys, paths and neighbour lists), so answering "more
+    like this" for an item needs neither the corpus nor a provider call.
+    """
+
+    def __init__(self, name, keys, paths, fingerprints, rows, scores, mtime=None):
+        self.name = name
+        self.keys = keys
+        self.paths = paths
+        self.fingerprints = fingerprints
+        self.rows = rows
+        self.scores = scores
+        self.mtime = mtime
+        self._lookup = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def k(self):
+        return self.rows.shape[1]
+
+    def find(self, image_id):
+        """Row of an item by corpus key, path or file name; None if unknown"""
+        if self._lookup is None:
+            lookup = {}
+            for row, path in enumerate(self.paths):
+                lookup.setdefault(os.path.basename(str(path)), row)
+                lookup.setdefault(str(path), row)
+            for row, key in enumerate(self.keys):
+                lookup[str(key)] = row
+            self._lookup = lookup
+        return self._lookup.get(str(image_id))
+
+    def neighbors(self, row, k=None):
+        """(keys, paths, scores) of a row's neighbours, best first"""
+        rows = self.rows[row, :k]
+        rows = rows[rows >= 0]
+        return ([self.keys[i] for i in rows], [self.paths[i] for i in rows],
+                self.scores[row, :len(rows)].astype(np.float32))
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, name=self.name, keys=np.asarray(self.keys, dtype=str),
+                 paths=np.asarray(self.paths, dtype=str), fingerprints=self.fingerprints,
+                 rows=self.rows, scores=self.scores)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(str(data['name']), data['keys'].tolist(), data['paths'].tolist(), data['fingerprints'],
+                       data['rows'], data['scores'], os.path.getmtime(path))
+
+
+def graph_path(corpus_name):
+    return os.path.join(NEIGHBOR_GRAPH_DIR, f"{corpus_name}_neighbors.npz")
+
+
+def build_graph(corpus, k=NEIGHBOR_GRAPH_K, tile_rows=NEIGHBOR_TILE_ROWS, workers=None):
+    """Neighbour graph of a whole corpus"""
+    started = time.perf_counter()
+    rows, scores = compute_neighbors(corpus.matrix, np.arange(len(corpus)), k, None, tile_rows, workers)
+    logger.info(f"Built neighbour graph for '{corpus.name}' ({len(corpus)} rows, k={rows.shape[1]}) "
+                f"in {time.perf_counter() - started:.1f}s")
+    return NeighborGraph(corpus.name, list(corpus.keys), list(corpus.paths), row_fingerprints(corpus.matrix),
+                         rows, scores.astype(np.float16))
+
+
+def refresh_graph(graph, corpus, k=NEIGHBOR_GRAPH_K, tile_rows=NEIGHBOR_TILE_ROWS, workers=None):
+    """
+    Bring a graph up to date with a changed corpus, recomputing as little as possible
+
+    Rows whose vector is new or changed, and rows that lost a neighbour
+    (removed or changed), get a full recomputation. Every other row keeps
+    its list and only has to be compared against the changed rows, since
+    nothing else can have entered its top k.
+
+    Returns:
+        (graph, stats)
+    """
+    if graph is None or graph.k != min(k, len(corpus)):
+        graph = build_graph(corpus, k, tile_rows, workers)
+        return graph, {'rows': len(corpus), 'recomputed': len(corpus), 'full': True}
+
+    started = time.perf_counter()
+    fingerprints = row_fingerprints(corpus.matrix)
+    old_rows = {(key, fingerprint): row for row, (key, fingerprint) in enumerate(zip(graph.keys, graph.fingerprints))}
+    # New row of each old row whose key and vector are unchanged (-1 otherwise)
+    old_to_new = np.full(len(graph), -1, dtype=np.int64)
+    unchanged = np.zeros(len(corpus), dtype=bool)
+    for row, (key, fingerprint) in enumerate(zip(corpus.keys, fingerprints)):
+        old = old_rows.get((key, fingerprint))
+        if old is not None:
+            old_to_new[old] = row
+            unchanged[row] = True
+
+    rows = np.full((len(corpus), graph.k), -1, dtype=np.int64)
+    scores = np.full((len(corpus), graph.k), -np.inf, dtype=np.float32)
+    kept_old = np.flatnonzero(old_to_new >= 0)
+    old_neighbors = graph.rows[kept_old]
+    rows[old_to_new[kept_old]] = np.where(old_neighbors >= 0, old_to_new[old_neighbors], -1)
+    scores[old_to_new[kept_old]] = graph.scores[kept_old]
+
+    changed = np.flatnonzero(~unchanged)
+    dirty = ~unchanged | (unchanged & (rows < 0).any(axis=1))
+    clean = np.flatnonzero(~dirty)
+    dirty = np.flatnonzero(dirty)
+
+    if len(dirty):
+        rows[dirty], scores[dirty] = compute_neighbors(corpus.matrix, dirty, graph.k, None, tile_rows, workers)
+    if len(clean) and len(changed):
+        new_rows, new_scores = compute_neighbors(corpus.matrix, clean, graph.k, changed, tile_rows, workers)
+        merged_rows, merged_scores = _merge_top_k(rows[clean], scores[clean], new_rows, new_scores, graph.k)
+        order = np.argsort(-merged_scores, axis=1)
+        rows[clean] = np.take_along_axis(merged_rows, order, axis=1)
+        scores[clean] = np.take_along_axis(merged_scores, order, axis=1)
+
+    stats = {'rows': len(corpus), 'changed': int(len(changed)), 'recomputed': int(len(dirty)),
+             'merged': int(len(clean)) if len(changed) else 0, 'full': False,
+             'seconds': round(time.perf_counter() - started, 2)}
+    logger.info(f"Refreshed neighbour graph for '{corpus.name}': {stats}")
+    return NeighborGraph(corpus.name, list(corpus.keys), list(corpus.paths), fingerprints,
+                         rows, scores.astype(np.float16)), stats
+
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def get_neighbor_graph(corpus_name):
+    """Cached neighbour graph of a corpus, reloaded when its file changes; None if not built"""
+    path = graph_path(corpus_name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _graphs.get(corpus_name)
+    if cached is not None and cached.mtime == mtime:
+        return cached
+    with _graphs_lock:
+        cached = _graphs.get(corpus_name)
+        if cached is not None and cached.mtime == mtime:
+            return cached
+        try:
+            graph = NeighborGraph.load(path)
+        except Exception as e:
+            logger.error(f"Error loading neighbour graph from {path}: {str(e)}", exc_info=True)
+            return cached
+        _graphs[corpus_name] = graph
+        logger.info(f"Loaded neighbour graph for '{corpus_name}': {len(graph)} rows, k={graph.k}")
+        return graph
@@ -0,0 +1,217 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from app.services.image_index import IMAGE_DIR, IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+PHASH_ENABLED = os.environ.get('PHASH_ENABLED', 'True') == 'True'
+# Hashes of the catalog images, written by scripts/build_phash_index.py
+PHASH_INDEX_FILE = os.environ.get('PHASH_INDEX_FILE', os.path.join('instance', 'phash_index.npz'))
+# Largest Hamming distance (of 64 bits) at which an upload counts as a catalog image
+PHASH_MAX_DISTANCE = int(os.environ.get('PHASH_MAX_DISTANCE', 4))
+
+HASH_SIZE = 8
+
+
+def dhash(image, size=HASH_SIZE):
+    """
+    64-bit difference hash of a PIL image
+
+    Grayscale, shrink to (size+1) x size, and set one bit per pixel that is
+    brighter than its left neighbour: robust to re-encoding, resizing and
+    small colour changes, which is what re-uploads of catalog images go
+    through.
+    """
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(image).convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = np.packbits((pixels[:, 1:] > pixels[:, :-1]).reshape(-1))
+    return int(bits.view('>u8')[0])
+
+
+def hash_file(path):
+    """dhash of an image file (None if it cannot be decoded)"""
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            return dhash(image)
+    except Exception as e:
+        logger.warning(f"Could not hash {path}: {str(e)}")
+        return None
+
+
+def _hash_chunk(image_dir, names):
+    return [hash_file(os.path.join(image_dir, name)) for name in names]
+
+
+def hamming_distances(hashes, value):
+    """Bit differences between every stored hash and one value"""
+    diff = hashes ^ np.uint64(value)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(diff)
+    return np.unpackbits(diff.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+class PerceptualHashIndex:
+    """
+    dHash of every image in the catalog directory, by file name
+
+    `stats` records, per file, (mtime_ns, size) at hashing time so a rebuild
+    only hashes files that changed.
+    """
+
+    def __init__(self, names, hashes, stats, mtime=None):
+        self.names = list(names)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.stats = np.asarray(stats, dtype=np.int64).reshape(-1, 2)
+        self.mtime = mtime
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, value, max_distance=PHASH_MAX_DISTANCE):
+        """(file name, distance) of the closest catalog image within max_distance, else None"""
+        if not len(self.names):
+            return None
+        distances = hamming_distances(self.hashes, value)
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance:
+            return None
+        return self.names[best], int(distances[best])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, names=np.asarray(self.names, dtype=str), hashes=self.hashes, stats=self.stats)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['names'].tolist(), data['hashes'], data['stats'], os.path.getmtime(path))
+
+
+def build_index(image_dir=IMAGE_DIR, previous=None, workers=None):
+    """
+    Hash the catalog with a process pool, reusing `previous` for unchanged files
+
+    Returns:
+        (index, stats)
+    """
+    started = time.perf_counter()
+    files = {}
+    with os.scandir(image_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                stat = entry.stat()
+                files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+    known = {}
+    if previous is not None:
+        known = {name: (tuple(stat), value)
+                 for name, stat, value in zip(previous.names, previous.stats.tolist(), previous.hashes.tolist())}
+    hashes = {name: known[name][1] for name, stat in files.items() if name in known and known[name][0] == stat}
+    todo = sorted(name for name in files if name not in hashes)
+
+    if todo:
+        chunk = max(1, len(todo) // ((workers or os.cpu_count() or 1) * 4) + 1)
+        chunks = [todo[i:i + chunk] for i in range(0, len(todo), chunk)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for names, values in zip(chunks, pool.map(_hash_chunk, [image_dir] * len(chunks), chunks)):
+                hashes.update((name, value) for name, value in zip(names, values) if value is not None)
+
+    names = sorted(hashes)
+    index = PerceptualHashIndex(names, [hashes[name] for name in names], [files[name] for name in names])
+    stats = {'files': len(files), 'hashed': len(todo), 'reused': len(files) - len(todo),
+             'failed': len(files) - len(names), 'seconds': round(time.perf_counter() - started, 2)}
+    return index, stats
+
+
+_index = None
+_index_lock = threading.Lock()
+_rows_by_name = {}
+_lookups = {'hits': 0, 'misses': 0}
+_lookups_lock = threading.Lock()
+
+
+def get_phash_index():
+    """Process-wide hash index, reloaded when its file changes; None if not built or disabled"""
+    global _index
+    if not PHASH_ENABLED:
+        return None
+    try:
+        mtime = os.path.getmtime(PHASH_INDEX_FILE)
+    except OSError:
+        return None
+    if _index is not None and _index.mtime == mtime:
+        return _index
+    with _index_lock:
+        if _index is None or _index.mtime != mtime:
+            try:
+                _index = PerceptualHashIndex.load(PHASH_INDEX_FILE)
+                logger.info(f"Loaded perceptual hash index: {len(_index)} images")
+            except Exception as e:
+                logger.error(f"Error loading perceptual hash index from {PHASH_INDEX_FILE}: {str(e)}", exc_info=True)
+        return _index
+
+
+def _corpus_row(corpus, name):
+    """Corpus row whose image has file name `name` (cached per corpus load)"""
+    cached = _rows_by_name.get(corpus.name)
+    if cached is None or cached[0] is not corpus:
+        rows = {}
+        for row, path in enumerate(corpus.paths):
+            rows.setdefault(os.path.basename(str(path).split('?')[0]), row)
+        cached = (corpus, rows)
+        _rows_by_name[corpus.name] = cached
+    return cached[1].get(name)
+
+
+def lookup_embedding(corpus_name, image):
+    """
+    Stored embedding of a catalog image that looks like `image`
+
+    Args:
+        corpus_name: Corpus to take the vector from
+        image: Query image path or PIL image
+
+    Returns:
+        (embedding, corpus path) or None if the image is not in the catalog
+        (the embedding is the corpus row, L2-normalized: use it as a search
+        query, never return it as the image's embedding)
+    """
+    index = get_phash_index()
+    if index is None or image is None:
+        return None
+    from app.services.corpus_service import get_corpus
+
+    value = hash_file(image) if isinstance(image, (str, os.PathLike)) else dhash(image)
+    match = index.match(value) if value is not None else None
+    corpus = get_corpus(corpus_name) if match else None
+    row = _corpus_row(corpus, match[0]) if corpus is not None else None
+    if row is None:
+        with _lookups_lock:
+            _lookups['misses'] += 1
+        return None
+
+    with _lookups_lock:
+        _lookups['hits'] += 1
+    logger.info(f"Query image matches catalog image {match[0]} (distance {match[1]}); reusing stored {corpus_name} embedding")
+    return corpus.matrix[row].tolist(), corpus.paths[row]
+
+
+def snapshot():
+    index = get_phash_index()
+    with _lookups_lock:
+        lookups = dict(_lookups)
+    return {
+        'enabled': PHASH_ENABLED,
+        'file': PHASH_INDEX_FILE,
+        'images': len(index) if index is not None else None,
+        'max_distance': PHASH_MAX_DISTANCE,
+        **lookups,
+    }
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Corpora searched in two stages: a shortlist from reduced vectors, then
+# exact full-dimension rescoring of the shortlist only
+TWO_STAGE_CORPORA = [name.strip() for name in os.environ.get('TWO_STAGE_CORPORA', '').split(',') if name.strip()]
+# Candidates kept from the reduced pass (at least twice the results asked for)
+TWO_STAGE_SHORTLIST = int(os.environ.get('TWO_STAGE_SHORTLIST', 500))
+# Where scripts/two_stage_search.py writes <corpus>_reduced.npz
+REDUCED_INDEX_DIR = os.environ.get('REDUCED_INDEX_DIR', os.path.join('instance', 'reduced'))
+# Rows sampled to fit the PCA basis
+PCA_SAMPLE_ROWS = int(os.environ.get('PCA_SAMPLE_ROWS', 20000))
+
+
+class Projection:
+    """
+    Map full vectors to a reduced space whose dot products rank like cosine
+
+    `pca`: subtract the corpus mean and project onto the top principal
+    components. The mean's contribution to q.x is the same for every row, so
+    ranking by the reduced product only loses the residual outside the
+    subspace. `truncate`: keep the leading dimensions, for Matryoshka-style
+    embeddings whose prefixes are themselves embeddings.
+    """
+
+    def __init__(self, method, dimension, mean=None, components=None):
+        self.method = method
+        self.dimension = dimension
+        self.mean = mean
+        self.components = components
+
+    def rows(self, matrix, chunk_rows=65536):
+        """Reduced corpus rows, projected a chunk at a time (the matrix may be memory-mapped)"""
+        reduced = np.empty((matrix.shape[0], self.dimension), dtype=np.float32)
+        for start in range(0, matrix.shape[0], chunk_rows):
+            chunk = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+            if self.method == 'truncate':
+                chunk = chunk[:, :self.dimension]
+                norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                reduced[start:start + chunk_rows] = chunk / norms
+            else:
+                reduced[start:start + chunk_rows] = (chunk - self.mean) @ self.components
+        return reduced
+
+    def query(self, vector):
+        """Reduced query: a (dimension,) vector or a (dimension, n) matrix of queries"""
+        if self.method == 'truncate':
+            return np.asarray(vector[:self.dimension], dtype=np.float32)
+        return np.asarray(self.components.T @ vector, dtype=np.float32)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, method=self.method, dimension=self.dimension,
+                 mean=self.mean if self.mean is not None else np.empty(0, dtype=np.float32),
+                 components=self.components if self.components is not None else np.empty((0, 0), dtype=np.float32))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            method = str(data['method'])
+            if method == 'truncate':
+                return cls(method, int(data['dimension']))
+            return cls(method, int(data['dimension']), data['mean'], data['components'])
+
+
+def train_pca(matrix, dimension, sample_rows=PCA_SAMPLE_ROWS, seed=0):
+    """PCA Projection fitted on (a sample of) a corpus matrix"""
+    rng = np.random.default_rng(seed)
+    sample = matrix if len(matrix) <= sample_rows else matrix[rng.choice(len(matrix), sample_rows, replace=False)]
+    mean = sample.mean(axis=0)
+    _, singular_values, vt = np.linalg.svd(sample - mean, full_matrices=False)
+    dimension = min(dimension, vt.shape[0])
+    explained = float((singular_values[:dimension] ** 2).sum() / (singular_values ** 2).sum())
+    logger.info(f"PCA to {dimension} dimensions keeps {explained:.1%} of the variance")
+    return Projection('pca', dimension, mean.astype(np.float32), np.ascontiguousarray(vt[:dimension].T, dtype=np.float32))
+
+
+def projection_path(corpus_name):
+    return os.path.join(REDUCED_INDEX_DIR, f"{corpus_name}_reduced.npz")
+
+
+class ReducedIndex:
+    """A corpus' reduced matrix, built from its Projection on first use"""
+
+    def __init__(self, corpus, projection, mtime=None):
+        self.corpus = corpus
+        self.projection = projection
+        self.mtime = mtime
+        started = time.perf_counter()
+        self.matrix = projection.rows(corpus.matrix)
+        logger.info(f"Reduced corpus '{corpus.name}' to {projection.dimension} dimensions "
+                    f"({projection.method}) in {time.perf_counter() - started:.2f}s")
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_reduced_index(corpus):
+    """ReducedIndex for a two-stage corpus, or None (not enabled or no projection file)"""
+    if corpus.name not in TWO_STAGE_CORPORA:
+        return None
+    path = projection_path(corpus.name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _indexes.get(corpus.name)
+    if cached is not None and cached.corpus is corpus and cached.mtime == mtime:
+        return cached
+    with _indexes_lock:
+        cached = _indexes.get(corpus.name)
+        if cached is not None and cached.corpus is corpus and cached.mtime == mtime:
+            return cached
+        try:
+            index = ReducedIndex(corpus, Projection.load(path), mtime)
+        except Exception as e:
+            logger.error(f"Error loading reduced index from {path}: {str(e)}", exc_info=True)
+            return None
+        _indexes[corpus.name] = index
+        return index
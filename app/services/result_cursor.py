@@ -0,0 +1,326 @@
+import io
+import os
+import time
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from app.services.corpus_service import get_corpus
+from app.services.dedup_service import get_cluster_ids
+from app.services.vector_search import first_per_cluster, fuse_queries, score_corpus, top_k_indices, unit_vector
+from app.utils.sqlite_store import LocalConnections
+
+logger = logging.getLogger(__name__)
+
+# How long a result set stays pageable, and how many are kept
+SEARCH_CURSOR_TTL = float(os.environ.get('SEARCH_CURSOR_TTL', 300))
+SEARCH_CURSOR_MAX_ENTRIES = int(os.environ.get('SEARCH_CURSOR_MAX_ENTRIES', 1000))
+# Candidates ranked up front; deeper pages extend the list from the cached query
+SEARCH_CURSOR_DEPTH = int(os.environ.get('SEARCH_CURSOR_DEPTH', 200))
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', 100))
+# 'sqlite' (shared by every worker process on the host, default) or 'memory'
+# (per process: only for a single worker, other workers answer 410)
+SEARCH_CURSOR_BACKEND = os.environ.get('SEARCH_CURSOR_BACKEND', 'sqlite').lower()
+SEARCH_CURSOR_DB = os.environ.get('SEARCH_CURSOR_DB', 'instance/search_cursors.sqlite3')
+
+
+class CursorExpired(Exception):
+    """The cursor is unknown, expired, or its corpus has been reloaded since"""
+
+
+class ResultSet:
+    """
+    Ranked candidates of one search, kept so later pages need no re-embedding
+
+    Holds the fused query (and the per-query unit vectors for component
+    scores), the filter mask, and the candidate rows ranked so far. Only
+    `depth` rows are partially sorted; a page past them re-ranks at twice
+    the depth from the cached query rather than from a new provider call.
+    With `cluster_ids`, only the best row of each duplicate cluster is kept.
+
+    to_bytes/from_bytes carry everything but the corpus, so a result set
+    ranked by one worker process can be paged by another.
+    """
+
+    def __init__(self, corpus, weighted_queries, mask, depth, cluster_ids=None):
+        self.corpus = corpus
+        self.fused = fuse_queries(weighted_queries)
+        self.components = {name: unit_vector(vector)
+                           for name, (vector, weight) in weighted_queries.items() if vector is not None}
+        self.mask = mask
+        self.cluster_ids = cluster_ids
+        self.total = len(corpus) if mask is None else int(np.count_nonzero(mask))
+        self.exhausted = self.fused is None
+        self.created = time.time()
+        self._lock = threading.Lock()
+        self.rows = np.empty(0, dtype=np.int64)
+        self.scores = np.empty(0, dtype=np.float32)
+        if self.fused is not None:
+            self._rank(depth)
+
+    def _rank(self, depth):
+        scores, rows = score_corpus(self.corpus, self.fused, self.mask, depth)
+        top = top_k_indices(scores, depth)
+        self.exhausted = depth >= self.total
+        if self.cluster_ids is not None:
+            top = top[first_per_cluster(top if rows is None else rows[top], self.cluster_ids)]
+        self.rows = top if rows is None else rows[top]
+        self.scores = scores[top]
+
+    def page(self, offset, size):
+        """(rows, scores, components, next_offset or None, re-ranked) for one page"""
+        end = offset + size
+        ranked = False
+        with self._lock:
+            depth = len(self.rows)
+            while end > len(self.rows) and not self.exhausted:
+                # Collapsing can leave fewer rows than ranked; keep doubling
+                depth = max(end, 2 * depth)
+                self._rank(depth)
+                ranked = True
+            rows, scores = self.rows[offset:end], self.scores[offset:end]
+        selected = self.corpus.matrix[rows]
+        components = {name: selected @ query for name, query in self.components.items()}
+        next_offset = end if end < len(self.rows) or not self.exhausted else None
+        return rows, scores, components, next_offset, ranked
+
+    def to_bytes(self):
+        """The result set without its corpus, as an .npz blob (no pickles)"""
+        arrays = {'rows': self.rows, 'scores': self.scores,
+                  'state': np.array([self.total, self.exhausted, self.cluster_ids is not None], dtype=np.int64)}
+        if self.fused is not None:
+            arrays['fused'] = self.fused
+        if self.mask is not None:
+            arrays['mask'] = np.packbits(self.mask)
+        for name, query in self.components.items():
+            arrays[f"component_{name}"] = query
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, corpus, blob, created):
+        """A result set saved by to_bytes, re-attached to the corpus it was ranked on"""
+        data = np.load(io.BytesIO(blob), allow_pickle=False)
+        result_set = cls.__new__(cls)
+        result_set.corpus = corpus
+        result_set.fused = data['fused'] if 'fused' in data.files else None
+        result_set.components = {name[len('component_'):]: data[name]
+                                 for name in data.files if name.startswith('component_')}
+        result_set.mask = (np.unpackbits(data['mask'], count=len(corpus)).astype(bool)
+                           if 'mask' in data.files else None)
+        total, exhausted, collapsed = (int(value) for value in data['state'])
+        result_set.total = total
+        result_set.exhausted = bool(exhausted)
+        # The cluster column itself is the corpus's, loaded again here
+        result_set.cluster_ids = get_cluster_ids(corpus) if collapsed else None
+        result_set.created = created
+        result_set._lock = threading.Lock()
+        result_set.rows = data['rows']
+        result_set.scores = data['scores']
+        return result_set
+
+
+class CursorCache:
+    """LRU of ResultSets with a TTL, keyed by an opaque random id (per process)"""
+
+    def __init__(self, max_entries=1000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, result_set):
+        result_id = secrets.token_urlsafe(12)
+        with self._lock:
+            self._entries[result_id] = result_set
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result_id
+
+    def get(self, result_id, corpus):
+        """The result set, or None if unknown, expired or ranked on another load of the corpus"""
+        with self._lock:
+            result_set = self._entries.get(result_id)
+            if result_set is None:
+                return None
+            if time.time() - result_set.created > self.ttl:
+                del self._entries[result_id]
+                return None
+            self._entries.move_to_end(result_id)
+        if corpus is not None and result_set.corpus is not corpus:
+            return None
+        return result_set
+
+    def update(self, result_id, result_set):
+        # Entries are the live objects; nothing to write back
+        pass
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCursorCache:
+    """
+    Result sets in a local SQLite file, shared by every worker process on the host
+
+    A cursor minted by one gunicorn worker can be resumed by any other. Rows
+    are checked against the corpus source file and mtime, so a cursor from
+    before a corpus reload is rejected rather than paged over different rows.
+    """
+
+    def __init__(self, path, max_entries=1000, ttl=300.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._connections = LocalConnections(path)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS cursors (id TEXT PRIMARY KEY, corpus TEXT NOT NULL, "
+            "source_path TEXT NOT NULL, source_mtime REAL NOT NULL, state BLOB NOT NULL, "
+            "created REAL NOT NULL, used REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        return self._connections.get()
+
+    def put(self, result_set):
+        result_id = secrets.token_urlsafe(12)
+        corpus = result_set.corpus
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO cursors VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (result_id, corpus.name, corpus.source_path, corpus.mtime,
+                          result_set.to_bytes(), result_set.created, now))
+            conn.execute("DELETE FROM cursors WHERE created < ?", (now - self.ttl,))
+            conn.execute("DELETE FROM cursors WHERE id NOT IN (SELECT id FROM cursors ORDER BY used DESC LIMIT ?)",
+                         (self.max_entries,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result_id
+
+    def get(self, result_id, corpus):
+        """The result set, or None if unknown, expired or ranked on another load of the corpus"""
+        conn = self._connect()
+        row = conn.execute("SELECT corpus, source_path, source_mtime, state, created FROM cursors WHERE id = ?",
+                           (result_id,)).fetchone()
+        if row is None:
+            return None
+        name, source_path, source_mtime, state, created = row
+        if time.time() - created > self.ttl:
+            conn.execute("DELETE FROM cursors WHERE id = ?", (result_id,))
+            return None
+        if corpus is None:
+            corpus = get_corpus(name)
+        if corpus is None or (name, source_path, source_mtime) != (corpus.name, corpus.source_path, corpus.mtime):
+            return None
+        conn.execute("UPDATE cursors SET used = ? WHERE id = ?", (time.time(), result_id))
+        return ResultSet.from_bytes(corpus, state, created)
+
+    def update(self, result_id, result_set):
+        """Save a deeper ranking so later pages (in any process) start from it"""
+        self._connect().execute("UPDATE cursors SET state = ? WHERE id = ?", (result_set.to_bytes(), result_id))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM cursors").fetchone()[0]
+
+
+_cursor_cache = None
+_cursor_cache_lock = threading.Lock()
+
+
+def get_cursor_cache():
+    """
+    Process-wide cursor cache
+
+    Settings:
+        SEARCH_CURSOR_BACKEND      'sqlite' (shared across workers, default) or 'memory' (per process)
+        SEARCH_CURSOR_DB           SQLite file for the sqlite backend
+        SEARCH_CURSOR_TTL          seconds a result set stays pageable
+        SEARCH_CURSOR_MAX_ENTRIES  result sets kept, least recently used dropped first
+    """
+    global _cursor_cache
+    if _cursor_cache is None:
+        with _cursor_cache_lock:
+            if _cursor_cache is None:
+                if SEARCH_CURSOR_BACKEND == 'sqlite':
+                    _cursor_cache = SQLiteCursorCache(SEARCH_CURSOR_DB, SEARCH_CURSOR_MAX_ENTRIES, SEARCH_CURSOR_TTL)
+                else:
+                    _cursor_cache = CursorCache(SEARCH_CURSOR_MAX_ENTRIES, SEARCH_CURSOR_TTL)
+    return _cursor_cache
+
+
+def parse_page_size(value, default=10):
+    """Page size from a request parameter, clamped to 1..SEARCH_MAX_PAGE_SIZE"""
+    try:
+        size = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        size = default
+    return min(max(size, 1), SEARCH_MAX_PAGE_SIZE)
+
+
+def _encode(result_id, offset):
+    return f"{result_id}.{offset}"
+
+
+def _decode(cursor):
+    result_id, _, offset = str(cursor).rpartition('.')
+    try:
+        return result_id, max(0, int(offset))
+    except ValueError:
+        raise CursorExpired(f"Malformed cursor: {cursor}")
+
+
+def paged_search(corpus, weighted_queries, page_size, mask=None, cluster_ids=None):
+    """
+    First page of a search, plus a cursor for the next one
+
+    Args:
+        corpus: corpus_service.Corpus
+        weighted_queries: dict name -> (embedding, weight), as for vector_search.fused_search
+        page_size: Results per page
+        mask: Optional boolean row mask
+        cluster_ids: Optional duplicate cluster column (collapse duplicates)
+
+    Returns:
+        (indices, scores, components, next_cursor); next_cursor is None on the last page
+    """
+    result_set = ResultSet(corpus, weighted_queries, mask, max(page_size, SEARCH_CURSOR_DEPTH), cluster_ids)
+    rows, scores, components, next_offset, _ = result_set.page(0, page_size)
+    next_cursor = None
+    if next_offset is not None:
+        next_cursor = _encode(get_cursor_cache().put(result_set), next_offset)
+    return rows, scores, components, next_cursor
+
+
+def resume_search(cursor, page_size, corpus=None):
+    """
+    Page of a cached search at `cursor`
+
+    Args:
+        cursor: next_cursor returned by paged_search or a previous page
+        page_size: Results per page
+        corpus: The current corpus (looked up by name if not given); the
+            cursor is rejected if it was ranked against an older load of it
+
+    Returns:
+        (corpus, indices, scores, components, next_cursor)
+
+    Raises:
+        CursorExpired: If the result set is gone, expired or stale
+    """
+    result_id, offset = _decode(cursor)
+    cache = get_cursor_cache()
+    result_set = cache.get(result_id, corpus)
+    if result_set is None:
+        raise CursorExpired("Cursor has expired or the corpus was reloaded since; run the search again")
+
+    rows, scores, components, next_offset, ranked = result_set.page(offset, page_size)
+    if ranked:
+        cache.update(result_id, result_set)
+    next_cursor = _encode(result_id, next_offset) if next_offset is not None else None
+    return result_set.corpus, rows, scores, components, next_cursor
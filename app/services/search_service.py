@@ -1,13 +1,37 @@
 import os
-import numpy as np
 import logging
-from sklearn.metrics.pairwise import cosine_similarity
 from app.services.titan_service import get_titan_embedding
-from app.services.similarity_service import load_embeddings
+from app.services.corpus_service import get_corpus
+from app.services.vector_search import fused_search, weight_sweep
+from app.services.metadata_index import FilterError, filter_mask
+from app.services.dedup_service import get_cluster_ids
+from app.services.thumbnail_service import thumbnail_url
+from app.services.image_index import image_available
 
 logger = logging.getLogger(__name__)
 
-def search_multimodal(query_text, query_image_path=None, top_k=10, image_weight=0.5):
+def _format_results(paths, indices, scores, text_scores, image_scores=None):
+    results = []
+    for rank, i in enumerate(indices):
+        result = {
+            'file_path': paths[i],
+            'image_url': f"/static/all_images/{os.path.basename(paths[i])}",
+            'thumbnail_url': thumbnail_url(paths[i]),
+            'image_available': image_available(paths[i]),
+            'combined_similarity': scores[rank],
+            'text_similarity': text_scores[rank]
+        }
+        
+        # Add image similarity if available
+        if image_scores is not None:
+            result['image_similarity'] = image_scores[rank]
+        
+        results.append(result)
+    return results
+
+def search_multimodal(query_text, query_image_path=None, top_k=10, image_weight=0.5,
+                      text_embedding=None, image_embedding=None, image_weights=None, filters=None,
+                      collapse_duplicates=False):
     """
     Search using text query and optionally an image query
     
@@ -16,83 +40,69 @@ def search_multimodal(query_text, query_image_path=None, top_k=10, image_weight=
         query_image_path: Path to query image (optional)
         top_k: Number of results to return
         image_weight: Weight for image similarity (ignored if no image provided)
+        text_embedding: Precomputed text embedding (skips the Titan call)
+        image_embedding: Precomputed image embedding (skips the Titan call)
+        image_weights: Optional list of image weights to sweep; the return
+            value is then [{'image_weight': w, 'results': [...]}, ...]
+        filters: Optional metadata filters (see metadata_index.MetadataIndex.mask)
+        collapse_duplicates: Return only the best image of each near-duplicate
+            cluster (needs scripts/find_duplicates.py to have run)
     """
     try:
         # Get text embedding
-        try:
-            text_result = get_titan_embedding(text=query_text)
-            text_embedding = text_result["embedding"]
-        except Exception as e:
-            logger.error(f"Failed to generate text embedding: {str(e)}")
-            return []
+        if text_embedding is None:
+            try:
+                text_result = get_titan_embedding(text=query_text)
+                text_embedding = text_result["embedding"]
+            except Exception as e:
+                logger.error(f"Failed to generate text embedding: {str(e)}")
+                return []
         
-        # Load embeddings data
-        embeddings_dict = load_embeddings()
-        if not embeddings_dict:
+        # Load embeddings data (cached, normalized)
+        corpus = get_corpus('titan')
+        if corpus is None:
             logger.error("Could not load embeddings data")
             return []
         
-        # Extract paths and embeddings from dictionary
-        paths = []
-        image_embeddings = []
-        
-        for image_id, data in embeddings_dict.items():
-            if isinstance(data, dict) and 'embedding' in data:
-                paths.append(data.get('path', image_id))
-                image_embeddings.append(data['embedding'])
-        
-        embeddings_array = np.array(image_embeddings)
-        query_text_array = np.array(text_embedding).reshape(1, -1)
-        
-        # Calculate text similarities
-        text_similarities = cosine_similarity(query_text_array, embeddings_array)[0]
+        # Metadata filters restrict the rows that are scored at all
+        mask = filter_mask(corpus, filters)
+        cluster_ids = get_cluster_ids(corpus) if collapse_duplicates else None
         
         # If image path is provided, include image similarity
-        image_embedding = None
-        image_similarities = None
-        
-        if query_image_path:
+        if (query_image_path or image_embedding is not None) and image_embedding is None:
             try:
                 image_result = get_titan_embedding(image_path=query_image_path)
                 image_embedding = image_result["embedding"]
-                query_image_array = np.array(image_embedding).reshape(1, -1)
-                image_similarities = cosine_similarity(query_image_array, embeddings_array)[0]
-                
-                # Combine similarities with weights
-                combined_similarities = (image_weight * image_similarities + 
-                                      (1 - image_weight) * text_similarities)
-                
-                logger.info(f"Using combined text and image search with weight {image_weight}")
             except Exception as e:
                 logger.warning(f"Failed to generate image embedding, using text-only search: {str(e)}")
-                combined_similarities = text_similarities
+        
+        if image_weights and image_embedding is not None:
+            logger.info(f"Sweeping combined text and image search over weights {image_weights}")
+            return [
+                {'image_weight': weight,
+                 'results': _format_results(corpus.paths, indices, scores, text_scores, image_scores)}
+                for weight, indices, scores, text_scores, image_scores
+                in weight_sweep(corpus, text_embedding, image_embedding, image_weights, top_k, mask, cluster_ids)
+            ]
+        
+        if image_embedding is not None:
+            logger.info(f"Using combined text and image search with weight {image_weight}")
+            queries = {'text': (text_embedding, 1 - image_weight), 'image': (image_embedding, image_weight)}
         else:
-            # Text-only search
-            combined_similarities = text_similarities
             logger.info("Using text-only search")
+            queries = {'text': (text_embedding, 1.0)}
         
-        # Get top-k indices
-        top_indices = np.argsort(combined_similarities)[::-1][:top_k]
-        
-        # Format results
-        results = []
-        for i in top_indices:
-            if i < len(paths):  # Ensure index is valid
-                result = {
-                    'file_path': paths[i],
-                    'image_url': f"/static/all_images/{os.path.basename(paths[i])}",
-                    'combined_similarity': float(combined_similarities[i]),
-                    'text_similarity': float(text_similarities[i])
-                }
-                
-                # Add image similarity if available
-                if image_similarities is not None:
-                    result['image_similarity'] = float(image_similarities[i])
-                
-                results.append(result)
+        # One pass over the corpus with the blended query
+        indices, scores, components = fused_search(corpus, queries, top_k, mask, cluster_ids)
+        results = _format_results(corpus.paths, indices, scores, components['text'], components.get('image'))
         
+        if image_weights:
+            # No image to weigh: every weight ranks the same
+            return [{'image_weight': weight, 'results': results} for weight in image_weights]
         return results
         
+    except FilterError:
+        raise
     except Exception as e:
         logger.error(f"Error in multimodal search: {str(e)}", exc_info=True)
-        return [] 
\ No newline at end of file
+        return []
@@ -0,0 +1,164 @@
+import os
+import time
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+from app.utils.serialization import encode_vector
+
+logger = logging.getLogger(__name__)
+
+# Coordinator: shard servers per corpus, in shard order, e.g.
+#   titan=http://10.0.0.1:9100,http://10.0.0.2:9100;cohere=http://10.0.0.3:9100
+# Shard i of n serves rows shard_bounds(rows, n, i) of the corpus
+SHARD_ENDPOINTS = {
+    name.strip(): [url.strip().rstrip('/') for url in urls.split(',') if url.strip()]
+    for name, _, urls in (entry.partition('=') for entry in os.environ.get('SHARD_ENDPOINTS', '').split(';'))
+    if name.strip() and urls.strip()
+}
+# Deadline (seconds) for gathering every shard's top-k; late shards are left out
+SHARD_TIMEOUT = float(os.environ.get('SHARD_TIMEOUT', 2.0))
+
+# Shard server: which partition this process serves (SHARD_COUNT 0 = not a shard server)
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 0))
+
+
+def shard_bounds(rows, count, index):
+    """(start, stop) rows of shard `index` of `count` contiguous, near-equal partitions"""
+    return rows * index // count, rows * (index + 1) // count
+
+
+def encode_mask(mask):
+    """Boolean row mask as base64 of its packed bits (one byte per 8 rows)"""
+    return base64.b64encode(np.packbits(mask)).decode('ascii')
+
+
+def decode_mask(value, rows):
+    return np.unpackbits(np.frombuffer(base64.b64decode(value), dtype=np.uint8), count=rows).astype(bool)
+
+
+def search_partition(corpus, query, top_k, mask=None, index=SHARD_INDEX, count=SHARD_COUNT):
+    """
+    Top-k of this shard's partition of a corpus (the shard server side)
+
+    The partition is a view of the corpus matrix, so with CORPUS_MMAP only
+    its own pages are ever read.
+
+    Returns:
+        (scores, rows): best first, rows numbered in the whole corpus
+    """
+    from app.services.vector_search import parallel_top_k
+
+    start, stop = shard_bounds(len(corpus), count, index)
+    scores, rows = parallel_top_k(corpus.matrix[start:stop], query, top_k, mask)
+    return scores, rows + start
+
+
+_session = None
+_pool = None
+_client_pid = None
+_client_lock = threading.Lock()
+_stats = {'searches': 0, 'shard_failures': 0, 'partial': 0, 'fallbacks': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def _client():
+    """Process-wide HTTP session and scatter pool (re-created in a forked worker)"""
+    global _session, _pool, _client_pid
+    if _client_pid != os.getpid():
+        with _client_lock:
+            if _client_pid != os.getpid():
+                import requests
+                _session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=64)
+                _session.mount('http://', adapter)
+                _session.mount('https://', adapter)
+                _pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix='shard')
+                _client_pid = os.getpid()
+    return _session, _pool
+
+
+def _search_shard(url, corpus_name, payload, deadline):
+    """One shard's top-k; the request gets whatever is left of the scatter deadline"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("deadline passed before the request was sent")
+    session, _ = _client()
+    response = session.post(f"{url}/shard/{corpus_name}/search", json=payload, timeout=remaining)
+    response.raise_for_status()
+    body = response.json()
+    return np.asarray(body['scores'], dtype=np.float32), np.asarray(body['rows'], dtype=np.int64)
+
+
+def scatter_search(corpus, query, top_k, mask=None):
+    """
+    Top-k of a corpus served by shard servers: scatter, gather under a deadline, merge
+
+    Every shard gets the query, top_k and its slice of the mask, and returns
+    its own top-k. Shards that fail or miss SHARD_TIMEOUT are left out (the
+    result is partial and logged). A running request cannot be cancelled, so
+    each one is sent with the time left until the deadline as its timeout and
+    a late shard's pool thread is freed soon after.
+
+    Args:
+        corpus: corpus_service.Corpus (keys and paths; its matrix is not scanned)
+
+    Returns:
+        (scores, rows) best first, or None if the corpus is not sharded or no
+        shard answered (the caller then scores locally)
+    """
+    endpoints = SHARD_ENDPOINTS.get(corpus.name)
+    if not endpoints:
+        return None
+    _, pool = _client()
+    query = np.asarray(query, dtype=np.float32)
+    deadline = time.monotonic() + SHARD_TIMEOUT
+    futures = {}
+    for index, url in enumerate(endpoints):
+        payload = {'query': encode_vector(query, 'float32'), 'top_k': int(top_k), 'rows': len(corpus)}
+        if mask is not None:
+            start, stop = shard_bounds(len(corpus), len(endpoints), index)
+            payload['mask'] = encode_mask(mask[start:stop])
+        futures[pool.submit(_search_shard, url, corpus.name, payload, deadline)] = url
+    done, late = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+    parts = []
+    for future in done:
+        try:
+            parts.append(future.result())
+        except Exception as e:
+            logger.warning(f"Shard {futures[future]} failed for '{corpus.name}': {str(e)}")
+    for future in late:
+        # Only drops requests still queued; running ones end at their own timeout
+        future.cancel()
+        logger.warning(f"Shard {futures[future]} missed the {SHARD_TIMEOUT}s deadline for '{corpus.name}'")
+
+    _count(searches=1, shard_failures=len(endpoints) - len(parts),
+           fallbacks=int(not parts), partial=int(0 < len(parts) < len(endpoints)))
+    if not parts:
+        return None
+
+    from app.services.vector_search import top_k_indices
+    scores = np.concatenate([part[0] for part in parts])
+    rows = np.concatenate([part[1] for part in parts])
+    order = top_k_indices(scores, top_k)
+    return scores[order], rows[order]
+
+
+def snapshot():
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        'endpoints': SHARD_ENDPOINTS,
+        'timeout': SHARD_TIMEOUT,
+        'server': {'index': SHARD_INDEX, 'count': SHARD_COUNT} if SHARD_COUNT else None,
+        **stats,
+    }
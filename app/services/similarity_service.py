@@ -1,36 +1,19 @@
 import os
 import logging
-import json
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import normalize
+from app.services.corpus_service import CORPUS_PATHS, get_corpus
+from app.services.metadata_index import FilterError, filter_mask
+from app.services.vector_search import COLLAPSE_OVERFETCH, collapsed_top_k, score_corpus, top_k_indices, unit_vector
+from app.services.result_cursor import paged_search, resume_search
+from app.services.thumbnail_service import thumbnail_url
+from app.services.image_index import image_available
+from app.services.dedup_service import get_cluster_ids
+from app.utils.logging_utils import debug_fields
 
 logger = logging.getLogger(__name__)
 
 # Configuration
-EMBEDDINGS_JSON_PATH = "static/json/titan.json"
-
-def load_embeddings():
-    """
-    Load embeddings from JSON file
-    
-    Returns:
-        dict: Dictionary with embeddings and file paths
-    """
-    try:
-        if not os.path.exists(EMBEDDINGS_JSON_PATH):
-            logger.error(f"Embeddings file not found: {EMBEDDINGS_JSON_PATH}")
-            return None
-            
-        with open(EMBEDDINGS_JSON_PATH, 'r') as f:
-            embeddings_data = json.load(f)
-            
-        logger.info(f"Loaded embeddings from JSON file: {len(embeddings_data)} entries")
-        return embeddings_data
-        
-    except Exception as e:
-        logger.error(f"Error loading embeddings from JSON: {str(e)}", exc_info=True)
-        return None
+EMBEDDINGS_JSON_PATH = CORPUS_PATHS['titan'][0]
 
 def get_image_url(file_path):
     """Convert a file path to a URL that can be accessed from the frontend"""
@@ -41,80 +24,64 @@ def get_image_url(file_path):
     # This assumes the images are directly in the static folder or a subfolder
     return f"/static/all_images/{filename}"
 
-def find_similar_images(query_embedding, top_n=10):
+def find_similar_images(query_embedding, top_n=10, filters=None, collapse_duplicates=False):
     """
     Find similar images based on cosine similarity
     
     Args:
         query_embedding: Embedding vector to compare against
         top_n: Number of top results to return
+        filters: Optional metadata filters (see metadata_index.MetadataIndex.mask)
+        collapse_duplicates: Return only the best image of each near-duplicate cluster
         
     Returns:
         list: List of dictionaries with similarity scores and file paths
     """
     try:
-        # Load embeddings data
-        embeddings_data = load_embeddings()
-        if not embeddings_data:
+        # Cached corpus: rows are already L2-normalized float32
+        corpus = get_corpus('titan')
+        if corpus is None:
             logger.error("Could not load embeddings data")
             return []
-            
-        # Extract embeddings and file paths
-        stored_embeddings = []
-        file_paths = []
         
-        # Debug the structure of the embeddings data
-        logger.info(f"Embeddings data type: {type(embeddings_data)}")
+        file_paths = corpus.paths
         
-        # Handle JSON structure - expect a dictionary with image IDs as keys
-        for image_id, data in embeddings_data.items():
-            if isinstance(data, dict) and 'embedding' in data:
-                file_paths.append(data.get('path', image_id))
-                stored_embeddings.append(data['embedding'])
-            else:
-                logger.warning(f"Skipping entry with unexpected format: {image_id}")
+        # Bad filters raise FilterError to the caller
+        mask = filter_mask(corpus, filters)
         
-        logger.info(f"Extracted {len(file_paths)} file paths and {len(stored_embeddings)} embeddings")
-        
-        if not stored_embeddings or not file_paths:
-            logger.error("Could not extract embeddings and file paths from the loaded data")
-            return []
-            
-        # Convert to numpy arrays for efficient computation
         try:
-            stored_embeddings_array = np.array(stored_embeddings, dtype=np.float32)
-            query_embedding_array = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
-            
-            logger.info(f"Stored embeddings shape: {stored_embeddings_array.shape}")
-            logger.info(f"Query embedding shape: {query_embedding_array.shape}")
-            
-            first_norm = np.linalg.norm(stored_embeddings_array[0])
-            logger.info(f"First embedding L2 norm: {first_norm}")
-            
-            if abs(first_norm - 1.0) > 0.01:  # If not already normalized
-                logger.info("Normalizing embeddings")
-                stored_embeddings_array = normalize(stored_embeddings_array)
-                query_embedding_array = normalize(query_embedding_array)
+            debug_fields(logger, "similarity_inputs",
+                         stored_shape=corpus.matrix.shape,
+                         query_shape=lambda: np.shape(query_embedding))
             
-            # Calculate cosine similarity
-            similarities = cosine_similarity(query_embedding_array, stored_embeddings_array)[0]
+            # Calculate cosine similarity (only over the filtered rows; two-stage if configured)
+            depth = top_n * COLLAPSE_OVERFETCH if collapse_duplicates else top_n
+            similarities, rows = score_corpus(corpus, unit_vector(query_embedding), mask, depth)
             
-            # Log some similarity values for debugging
-            logger.info(f"Similarity range: {np.min(similarities):.4f} to {np.max(similarities):.4f}")
-            logger.info(f"Top 5 similarities: {sorted(similarities, reverse=True)[:5]}")
+            # Diagnostics are computed only if debug logging is on for this request
+            debug_fields(logger, "similarity_scores",
+                         min=lambda: float(np.min(similarities)),
+                         max=lambda: float(np.max(similarities)),
+                         top5=lambda: np.sort(np.partition(similarities, -min(5, len(similarities)))[-5:])[::-1].tolist())
             
             # Get indices of top N similar items
-            top_indices = np.argsort(similarities)[::-1][:top_n]
+            cluster_ids = get_cluster_ids(corpus) if collapse_duplicates else None
+            if cluster_ids is None:
+                top_indices = top_k_indices(similarities, top_n)
+            else:
+                top_indices = collapsed_top_k(similarities, top_n, cluster_ids, rows)
             
             # Create result list
             results = []
             for idx in top_indices:
-                if idx < len(file_paths):  # Ensure index is valid
-                    results.append({
-                        'file_path': file_paths[idx],
-                        'image_url': get_image_url(file_paths[idx]),
-                        'similarity': float(similarities[idx])
-                    })
+                row = idx if rows is None else rows[idx]
+                results.append({
+                    'file_path': file_paths[row],
+                    'image_url': get_image_url(file_paths[row]),
+                    'thumbnail_url': thumbnail_url(file_paths[row]),
+                    'image_available': image_available(file_paths[row]),
+                    'similarity': similarities[idx]
+                })
                 
             logger.info(f"Found {len(results)} similar images")
             return results
@@ -122,6 +89,55 @@ def find_similar_images(query_embedding, top_n=10):
             logger.error(f"Error during similarity calculation: {str(e)}", exc_info=True)
             return []
         
+    except FilterError:
+        raise
     except Exception as e:
         logger.error(f"Error finding similar images: {str(e)}", exc_info=True)
-        return [] 
\ No newline at end of file
+        return []
+
+
+def _page_results(file_paths, rows, scores):
+    return [{
+        'file_path': file_paths[row],
+        'image_url': get_image_url(file_paths[row]),
+        'thumbnail_url': thumbnail_url(file_paths[row]),
+        'image_available': image_available(file_paths[row]),
+        'similarity': score
+    } for row, score in zip(rows, scores)]
+
+
+def find_similar_images_page(query_embedding, page_size=10, filters=None, collapse_duplicates=False):
+    """
+    First page of similar images, with a cursor for the following pages
+    
+    Args:
+        query_embedding: Embedding vector to compare against
+        page_size: Number of results per page
+        filters: Optional metadata filters (see metadata_index.MetadataIndex.mask)
+        collapse_duplicates: Page over the best image of each near-duplicate cluster only
+        
+    Returns:
+        tuple: (results, next_cursor); next_cursor is None on the last page
+    """
+    corpus = get_corpus('titan')
+    if corpus is None:
+        logger.error("Could not load embeddings data")
+        return [], None
+    
+    cluster_ids = get_cluster_ids(corpus) if collapse_duplicates else None
+    rows, scores, _, next_cursor = paged_search(
+        corpus, {'query': (query_embedding, 1.0)}, page_size, filter_mask(corpus, filters), cluster_ids)
+    results = _page_results(corpus.paths, rows, scores)
+    logger.info(f"Found {len(results)} similar images (more: {next_cursor is not None})")
+    return results, next_cursor
+
+
+def next_similar_images_page(cursor, page_size=10):
+    """
+    Page of similar images at a cursor from find_similar_images_page
+    
+    Raises:
+        CursorExpired: If the cursor is unknown, expired or the corpus was reloaded
+    """
+    corpus, rows, scores, _, next_cursor = resume_search(cursor, page_size, get_corpus('titan'))
+    return _page_results(corpus.paths, rows, scores), next_cursor
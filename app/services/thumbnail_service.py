@@ -0,0 +1,175 @@
+import os
+import hashlib
+import logging
+import threading
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from app.services.image_index import IMAGE_DIR, get_image_index, is_local_path
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail cache (originals are in image_index.IMAGE_DIR)
+THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR', os.path.join('instance', 'thumbnails'))
+
+
+def _parse_sizes(spec):
+    sizes = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, pixels = item.split('=', 1)
+            sizes[name.strip()] = int(pixels)
+    return sizes
+
+
+# Named sizes (longest edge in pixels), e.g. "small=160,medium=320,large=640"
+THUMBNAIL_SIZES = _parse_sizes(os.environ.get('THUMBNAIL_SIZES', 'small=160,medium=320,large=640'))
+THUMBNAIL_FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', 80))
+DEFAULT_THUMBNAIL_SIZE = os.environ.get('DEFAULT_THUMBNAIL_SIZE', 'medium')
+
+
+def thumbnail_path(filename, size, fmt):
+    """Cache file for one size/format of an original (by full file name, so a.jpg and a.png differ)"""
+    return os.path.join(THUMBNAIL_DIR, size, f"{os.path.basename(filename)}.{fmt}")
+
+
+def _write_atomic(image, path, pil_format):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique per process and thread: concurrent requests may render the same thumbnail
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    options = {'quality': THUMBNAIL_QUALITY}
+    if pil_format == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    else:
+        options.update(method=4)
+    try:
+        image.save(temp_path, pil_format, **options)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def generate_thumbnails(filename, sizes=None, formats=None, force=False):
+    """
+    Write every size/format of one original into THUMBNAIL_DIR
+
+    The original is decoded once and downscaled from the largest size to the
+    smallest. Existing thumbnails newer than the original are kept unless force.
+
+    Returns:
+        int: Number of thumbnail files written
+    """
+    source = os.path.join(IMAGE_DIR, os.path.basename(filename))
+    source_mtime = os.path.getmtime(source)
+    sizes = sizes or THUMBNAIL_SIZES
+    formats = formats or list(THUMBNAIL_FORMATS)
+
+    pending = []
+    for size in sorted(sizes, key=sizes.get, reverse=True):
+        for fmt in formats:
+            path = thumbnail_path(filename, size, fmt)
+            if force or not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+                pending.append((size, fmt, path))
+    if not pending:
+        return 0
+
+    with Image.open(source) as original:
+        image = original.convert('RGB')
+    for size, fmt, path in pending:
+        pixels = sizes[size]
+        image.thumbnail((pixels, pixels), Image.LANCZOS)
+        _write_atomic(image, path, THUMBNAIL_FORMATS[fmt][0])
+    return len(pending)
+
+
+def _generate_safely(filename, force=False):
+    try:
+        return filename, generate_thumbnails(filename, force=force), None
+    except Exception as e:
+        return filename, 0, str(e)
+
+
+def build_thumbnails(filenames=None, workers=None, force=False):
+    """
+    Pre-generate thumbnails for many originals in parallel (CPU-bound: process pool)
+
+    Args:
+        filenames: Originals to process (default: every image in IMAGE_DIR)
+        workers: Process count (default: CPU count)
+        force: Regenerate thumbnails that are already up to date
+
+    Returns:
+        dict: images, written, failed (name -> error)
+    """
+    if filenames is None:
+        filenames = sorted(name for name in os.listdir(IMAGE_DIR)
+                           if name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')))
+    written, failed = 0, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for filename, count, error in pool.map(functools.partial(_generate_safely, force=force), filenames, chunksize=16):
+            written += count
+            if error:
+                failed[filename] = error
+    logger.info(f"Thumbnails for {len(filenames)} images: {written} written, {len(failed)} failed")
+    return {'images': len(filenames), 'written': written, 'failed': failed}
+
+
+def ensure_thumbnail(filename, size, fmt):
+    """Thumbnail path for a request, generated on the spot if the build step missed it"""
+    path = thumbnail_path(filename, size, fmt)
+    source = os.path.join(IMAGE_DIR, os.path.basename(filename))
+    if not os.path.exists(source):
+        return None
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+        generate_thumbnails(filename, {size: THUMBNAIL_SIZES[size]}, [fmt])
+    return path
+
+
+_etags = {}
+_etags_lock = threading.Lock()
+
+
+def file_etag(path):
+    """Strong ETag (content hash) of a file, cached per (path, mtime, size)"""
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _etags_lock:
+        cached_key, etag = _etags.get(path, (None, None))
+    if cached_key != key:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+        etag = digest.hexdigest()[:32]
+        with _etags_lock:
+            _etags[path] = (key, etag)
+    return etag
+
+
+def source_version(filename):
+    """
+    Short version tag of an original (from its mtime and size), or None if missing
+
+    Thumbnail URLs carry it, so a changed original gets a new URL and the old
+    one can be cached as immutable. The stat comes from the image index, so
+    a result page costs no filesystem calls.
+    """
+    stat = get_image_index().stat(filename)
+    if stat is None:
+        return None
+    return hashlib.sha1(f"{stat[0]}:{stat[1]}".encode('utf-8')).hexdigest()[:12]
+
+
+def thumbnail_url(image_path, size=None):
+    """URL of a search result's thumbnail, or None if the original is not a local image"""
+    size = size or DEFAULT_THUMBNAIL_SIZE
+    if not is_local_path(image_path):
+        return None
+    name = os.path.basename(str(image_path))
+    version = source_version(name)
+    if version is None:
+        return None
+    return f"/thumbnails/{size}/{name}?v={version}"
@@ -8,6 +8,10 @@ from io import BytesIO
 from PIL import Image
 import boto3
 import requests
+from app.utils.fake_providers import get_stub_client
+from app.utils import rate_limiter
+from app.utils.circuit_breaker import circuit_breaker
+from app.utils.single_flight import single_flight
 
 logger = logging.getLogger(__name__)
 
@@ -69,17 +73,29 @@ def load_aws_credentials(csv_path):
         logger.error(f"Error reading AWS credentials CSV: {str(e)}")
         raise
 
-def initialize_bedrock_client():
-    """Initialize the AWS Bedrock client"""
+def initialize_bedrock_client(verify=True):
+    """
+    Initialize the AWS Bedrock client
+    
+    Args:
+        verify: Probe connectivity and list the available models first; the
+            post-fork reset skips this since the master already checked
+    """
     global bedrock_client
     
+    # Local stand-in when PROVIDER_BACKEND=stub
+    stub_client = get_stub_client('titan')
+    if stub_client is not None:
+        return stub_client
+    
     try:
         # Check internet connectivity first
-        try:
-            requests.get('https://www.google.com', timeout=5)
-        except requests.exceptions.RequestException:
-            logger.error("No internet connection available")
-            return None
+        if verify:
+            try:
+                requests.get('https://www.google.com', timeout=5)
+            except requests.exceptions.RequestException:
+                logger.error("No internet connection available")
+                return None
             
         # Try loading credentials
         try:
@@ -98,6 +114,9 @@ def initialize_bedrock_client():
             aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY")
         )
         
+        if not verify:
+            return client
+        
         # Also create a regular bedrock client to list available models
         bedrock_mgmt = boto3.client(
             service_name="bedrock",
@@ -131,6 +150,37 @@ def initialize_bedrock_client():
 # Initialize the client
 bedrock_client = initialize_bedrock_client()
 
+def reset_client():
+    """Re-create the Bedrock client, e.g. in a freshly forked worker"""
+    global bedrock_client
+    bedrock_client = initialize_bedrock_client(verify=False)
+
+@circuit_breaker('titan')
+def _invoke_titan(body):
+    """Embedding from the Titan Multimodal Embeddings model; the only part of a call the breaker sees"""
+    global bedrock_client
+    
+    # If client is not initialized, try to initialize it again
+    if bedrock_client is None:
+        logger.info("Bedrock client not initialized, attempting to initialize now")
+        bedrock_client = initialize_bedrock_client()
+        
+    if bedrock_client is None:
+        logger.error("Could not initialize AWS Bedrock client")
+        raise RuntimeError("AWS Bedrock service unavailable")
+    
+    # Throttled here, after the breaker admitted the call: an open circuit
+    # neither waits for nor spends a token (a refusal is not a failure)
+    rate_limiter.acquire('titan', os.environ.get("AWS_ACCESS_KEY_ID"))
+    response = bedrock_client.invoke_model(
+        body=json.dumps(body),
+        modelId="amazon.titan-embed-image-v1",
+        accept="application/json",
+        contentType="application/json"
+    )
+    return json.loads(response["body"].read())["embedding"]
+
+@single_flight('titan', 'amazon.titan-embed-image-v1', file_args=('image_path',))
 def get_titan_embedding(text=None, image_path=None):
     """
     Generate embeddings using Titan Multimodal Embeddings model
@@ -145,21 +195,10 @@ def get_titan_embedding(text=None, image_path=None):
         dict: Embedding results
     """
     try:
-        global bedrock_client
-        
         # Validate inputs
         if text is None and image_path is None:
             logger.error("Both text and image_path cannot be None")
             raise ValueError("Either text or image_path (or both) must be provided")
-        
-        # If client is not initialized, try to initialize it again
-        if bedrock_client is None:
-            logger.info("Bedrock client not initialized, attempting to initialize now")
-            bedrock_client = initialize_bedrock_client()
-            
-        if bedrock_client is None:
-            logger.error("Could not initialize AWS Bedrock client")
-            raise RuntimeError("AWS Bedrock service unavailable")
             
         # Determine embedding type for logging
         if text and image_path:
@@ -188,20 +227,13 @@ def get_titan_embedding(text=None, image_path=None):
             encoded_image = base64.b64encode(image_data).decode("utf-8")
             body["inputImage"] = encoded_image
         
-        # Invoke Titan Multimodal Embeddings model
-        response = bedrock_client.invoke_model(
-            body=json.dumps(body),
-            modelId="amazon.titan-embed-image-v1",
-            accept="application/json",
-            contentType="application/json"
-        )
-        
-        # Parse response
-        result = json.loads(response["body"].read())
+        # Invoke Titan Multimodal Embeddings model (input errors above are
+        # not counted against the circuit breaker)
+        embedding = _invoke_titan(body)
         
         logger.info(f"Successfully obtained {embedding_type} embeddings from Titan")
         return {
-            "embedding": result["embedding"],
+            "embedding": embedding,
             "embedding_type": embedding_type
         }
         
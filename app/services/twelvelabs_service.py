@@ -1,67 +1,89 @@
 import os
 import logging
 import time
-import numpy as np
 from twelvelabs import TwelveLabs
-from sklearn.metrics.pairwise import cosine_similarity
 import json
 from flask import current_app
+from app.services.corpus_service import CORPUS_PATHS, get_corpus
+from app.services.vector_search import fused_search, weight_sweep
+from app.services.metadata_index import filter_mask
+from app.services.dedup_service import get_cluster_ids
+from app.services.thumbnail_service import thumbnail_url
+from app.services.image_index import image_available
+from app.utils.fake_providers import get_stub_client
+from app.utils import rate_limiter
+from app.utils.circuit_breaker import circuit_breaker
+from app.utils.single_flight import single_flight
+from app.utils.logging_utils import debug_fields
 
 logger = logging.getLogger(__name__)
 
 # Configuration
 TWELVELABS_API_KEY = os.environ.get("TWELVELABS_API_KEY")
-TWELVELABS_EMBEDDINGS_JSON = "static/json/twelve_labs_embeddings.json"
+TWELVELABS_EMBEDDINGS_JSON = CORPUS_PATHS['twelve_labs'][0]
 
 # Initialize client
 client = None
 try:
-    client = TwelveLabs(api_key=TWELVELABS_API_KEY)
+    client = get_stub_client('twelve_labs') or TwelveLabs(api_key=TWELVELABS_API_KEY)
     logger.info("Twelve Labs client initialized successfully")
 except Exception as e:
     logger.error(f"Error initializing Twelve Labs client: {str(e)}")
 
+def reset_client():
+    """Re-create the Twelve Labs client, e.g. in a freshly forked worker"""
+    global client
+    try:
+        client = get_stub_client('twelve_labs') or TwelveLabs(api_key=TWELVELABS_API_KEY)
+    except Exception as e:
+        logger.error(f"Error initializing Twelve Labs client: {str(e)}")
+        client = None
+
+@circuit_breaker('twelve_labs')
+def _create_embedding(kind, **inputs):
+    """
+    Embedding of a text or an opened image file; the only part of a call the breaker sees
+    
+    Args:
+        kind: 'text' or 'image', the response field to read
+        inputs: text= or image_file= for client.embed.create
+    """
+    if client is None:
+        logger.error("Twelve Labs client not initialized")
+        raise RuntimeError("Twelve Labs client not initialized")
+    
+    # After the breaker admitted the call, so an open circuit spends no token
+    rate_limiter.acquire('twelve_labs', TWELVELABS_API_KEY)
+    response = client.embed.create(model_name="Marengo-retrieval-2.7", **inputs)
+    embedding = getattr(response, f"{kind}_embedding")
+    if embedding and embedding.segments:
+        return embedding.segments[0].embeddings_float
+    raise ValueError("No embedding found in response")
+
+@single_flight('twelve_labs', 'Marengo-retrieval-2.7')
 def get_embedding_for_text(text):
     """Generate embedding for text using Twelve Labs API."""
     try:
-        if client is None:
-            logger.error("Twelve Labs client not initialized")
-            raise RuntimeError("Twelve Labs client not initialized")
-            
         logger.info(f"Generating text embedding for: {text[:50]}...")
-        response = client.embed.create(text=text, model_name="Marengo-retrieval-2.7")
-        
-        if response.text_embedding and response.text_embedding.segments:
-            embedding = response.text_embedding.segments[0].embeddings_float
-            logger.info(f"Successfully generated text embedding of length {len(embedding)}")
-            return embedding
-        else:
-            logger.error(f"Could not find embedding in response for text: {text}")
-            raise ValueError("No embedding found in response")
+        embedding = _create_embedding('text', text=text)
+        logger.info(f"Successfully generated text embedding of length {len(embedding)}")
+        return embedding
             
     except Exception as e:
         logger.error(f"Error generating text embedding: {str(e)}", exc_info=True)
         raise
 
+@single_flight('twelve_labs', 'Marengo-retrieval-2.7', file_args=('image_path',))
 def get_embedding_for_image(image_path):
     """Generate embedding for an image using Twelve Labs API."""
     try:
-        if client is None:
-            logger.error("Twelve Labs client not initialized")
-            raise RuntimeError("Twelve Labs client not initialized")
-            
         logger.info(f"Generating image embedding for: {image_path}")
         
+        # A missing upload fails here, outside the circuit breaker
         with open(image_path, 'rb') as img_file:
-            response = client.embed.create(image_file=img_file, model_name="Marengo-retrieval-2.7")
-        
-        if response.image_embedding and response.image_embedding.segments:
-            embedding = response.image_embedding.segments[0].embeddings_float
-            logger.info(f"Successfully generated image embedding of length {len(embedding)}")
-            return embedding
-        else:
-            logger.error(f"Could not find embedding in response for {image_path}")
-            raise ValueError("No embedding found in response")
+            embedding = _create_embedding('image', image_file=img_file)
+        logger.info(f"Successfully generated image embedding of length {len(embedding)}")
+        return embedding
             
     except Exception as e:
         logger.error(f"Error generating image embedding: {str(e)}", exc_info=True)
@@ -84,7 +106,32 @@ def load_embeddings():
         logger.error(f"Error loading embeddings from JSON: {str(e)}", exc_info=True)
         return None
 
-def search_multimodal(query_text=None, query_image_path=None, top_k=7, image_weight=0.5):
+def _format_results(image_paths, indices, scores, components):
+    results = []
+    for rank, idx in enumerate(indices):
+        img_path = image_paths[idx]
+        
+        result = {
+            'file_path': img_path,
+            'image_url': f"/static/all_images/{img_path}",
+            'thumbnail_url': thumbnail_url(img_path),
+            'image_available': image_available(img_path),
+            'combined_similarity': scores[rank]
+        }
+        
+        # Add individual similarities if available
+        if 'text' in components:
+            result['text_similarity'] = components['text'][rank]
+            
+        if 'image' in components:
+            result['image_similarity'] = components['image'][rank]
+            
+        results.append(result)
+    return results
+
+def search_multimodal(query_text=None, query_image_path=None, top_k=7, image_weight=0.5,
+                      text_embedding=None, image_embedding=None, image_weights=None, filters=None,
+                      collapse_duplicates=False):
     """
     Search for similar images using text and/or image queries.
     
@@ -98,9 +145,15 @@ def search_multimodal(query_text=None, query_image_path=None, top_k=7, image_wei
         query_image_path: Path to query image (optional if text is provided)
         top_k: Number of top results to return
         image_weight: Weight for image similarity (0-1), text weight will be (1-image_weight)
+        text_embedding: Precomputed text embedding (skips the Twelve Labs call)
+        image_embedding: Precomputed image embedding (skips the Twelve Labs call)
+        image_weights: Optional list of image weights to sweep (text+image only)
+        filters: Optional metadata filters (see metadata_index.MetadataIndex.mask)
+        collapse_duplicates: Return only the best image of each near-duplicate cluster
         
     Returns:
-        List of dictionaries with image paths and similarity scores
+        List of dictionaries with image paths and similarity scores, or with
+        image_weights, a list of {'image_weight': w, 'results': [...]}
     """
     try:
         # Validate inputs
@@ -108,124 +161,65 @@ def search_multimodal(query_text=None, query_image_path=None, top_k=7, image_wei
             logger.error("Both query_text and query_image_path cannot be None")
             raise ValueError("Either query_text or query_image_path must be provided")
             
-        with open(TWELVELABS_EMBEDDINGS_JSON, 'r') as f:
-            embeddings_dict = json.load(f)
-            
-        if not embeddings_dict:
-            logger.error("Embeddings dictionary is empty")
+        # Cached corpus: rows are already L2-normalized float32
+        corpus = get_corpus('twelve_labs')
+        if corpus is None or len(corpus) == 0:
+            logger.error("Embeddings corpus is empty or missing")
             raise ValueError("No embeddings found in the embeddings file")
-            
-        # Extract image paths and embeddings
-        image_paths = list(embeddings_dict.keys())
-        embeddings = [embeddings_dict[img_path] for img_path in image_paths]
         
-        # Check if we have valid data
-        if not image_paths or not embeddings:
-            logger.error("No valid image paths or embeddings found")
-            raise ValueError("No valid image paths or embeddings found")
-            
-        logger.info(f"Loaded {len(image_paths)} embeddings from file")
-        
-        # Convert embeddings to numpy array
-        try:
-            embeddings_array = np.array(embeddings, dtype=np.float32)
-            logger.info(f"Embeddings array shape: {embeddings_array.shape}")
-        except Exception as e:
-            logger.error(f"Error converting embeddings to numpy array: {str(e)}")
-            
-            # Try to handle inhomogeneous arrays by filtering
-            valid_embeddings = []
-            valid_image_paths = []
-            embedding_length = None
-            
-            # Check embedding dimensions and filter out invalid ones
-            for idx, emb in enumerate(embeddings):
-                try:
-                    # Convert to numpy array to check shape
-                    emb_array = np.array(emb, dtype=np.float32)
-                    
-                    # Set expected length if not set
-                    if embedding_length is None:
-                        embedding_length = len(emb_array)
-                        
-                    # Only keep embeddings with the expected length
-                    if len(emb_array) == embedding_length:
-                        valid_embeddings.append(emb_array)
-                        valid_image_paths.append(image_paths[idx])
-                except Exception as inner_e:
-                    logger.warning(f"Skipping invalid embedding for {image_paths[idx]}: {str(inner_e)}")
-                    
-            if not valid_embeddings:
-                logger.error("No valid embeddings found after filtering")
-                raise ValueError("No valid embeddings found after filtering")
-                
-            embeddings_array = np.array(valid_embeddings, dtype=np.float32)
-            image_paths = valid_image_paths
-            logger.info(f"After filtering: {len(valid_image_paths)} valid embeddings with shape {embeddings_array.shape}")
+        logger.info(f"Loaded {len(corpus)} embeddings from file")
         
-        # Initialize similarity scores
-        text_similarities = None
-        image_similarities = None
+        # Metadata filters restrict the rows that are scored at all
+        mask = filter_mask(corpus, filters)
+        cluster_ids = get_cluster_ids(corpus) if collapse_duplicates else None
         
-        # Text-based search
+        # Text-based query
         if query_text:
             logger.info(f"Performing text search with query: {query_text}")
-            text_embedding = get_embedding_for_text(query_text)
-            text_embedding_array = np.array(text_embedding, dtype=np.float32).reshape(1, -1)
-            text_similarities = cosine_similarity(text_embedding_array, embeddings_array)[0]
-            logger.info(f"Text similarity range: {np.min(text_similarities):.4f} to {np.max(text_similarities):.4f}")
+            if text_embedding is None:
+                text_embedding = get_embedding_for_text(query_text)
+        else:
+            text_embedding = None
         
-        # Image-based search
+        # Image-based query
         if query_image_path:
             logger.info(f"Performing image search with image: {query_image_path}")
-            image_embedding = get_embedding_for_image(query_image_path)
-            image_embedding_array = np.array(image_embedding, dtype=np.float32).reshape(1, -1)
-            image_similarities = cosine_similarity(image_embedding_array, embeddings_array)[0]
-            logger.info(f"Image similarity range: {np.min(image_similarities):.4f} to {np.max(image_similarities):.4f}")
-        
-        # Combine similarities if both text and image queries are provided
-        if query_text and query_image_path:
+            if image_embedding is None:
+                image_embedding = get_embedding_for_image(query_image_path)
+        else:
+            image_embedding = None
+        
+        if image_weights and text_embedding is not None and image_embedding is not None:
+            logger.info(f"Sweeping text and image similarities over image_weights={image_weights}")
+            sweep = []
+            for weight, indices, scores, text_scores, image_scores in weight_sweep(
+                    corpus, text_embedding, image_embedding, image_weights, top_k, mask, cluster_ids):
+                components = {'text': text_scores, 'image': image_scores}
+                sweep.append({'image_weight': weight,
+                              'results': _format_results(corpus.paths, indices, scores, components)})
+            return sweep
+        
+        # Combine the queries before scoring so the corpus is scanned once
+        if text_embedding is not None and image_embedding is not None:
             logger.info(f"Combining text and image similarities with image_weight={image_weight}")
-            combined_similarities = (1 - image_weight) * text_similarities + image_weight * image_similarities
-        elif query_text:
-            combined_similarities = text_similarities
+            queries = {'text': (text_embedding, 1 - image_weight), 'image': (image_embedding, image_weight)}
+        elif text_embedding is not None:
+            queries = {'text': (text_embedding, 1.0)}
         else:
-            combined_similarities = image_similarities
-        
-        # Get top-k indices
-        top_indices = np.argsort(combined_similarities)[::-1][:top_k]
+            queries = {'image': (image_embedding, 1.0)}
         
-        # Create results
-        results = []
-        for idx in top_indices:
-            if idx >= len(image_paths):
-                continue
-                
-            img_path = image_paths[idx]
-            
-            result = {
-                'file_path': img_path,
-                'image_url': f"/static/all_images/{img_path}",
-                'combined_similarity': float(combined_similarities[idx])
-            }
-            
-            # Add individual similarities if available
-            if text_similarities is not None:
-                result['text_similarity'] = float(text_similarities[idx])
-                
-            if image_similarities is not None:
-                result['image_similarity'] = float(image_similarities[idx])
-                
-            results.append(result)
+        indices, scores, components = fused_search(corpus, queries, top_k, mask, cluster_ids)
+        debug_fields(logger, "combined_similarity_range",
+                     min=lambda: float(scores[-1]) if len(scores) else None,
+                     max=lambda: float(scores[0]) if len(scores) else None)
         
-        # Sort by combined similarity
-        results.sort(key=lambda x: x['combined_similarity'], reverse=True)
-        
-        # Return top-k results
-        top_results = results[:top_k]
+        top_results = _format_results(corpus.paths, indices, scores, components)
         logger.info(f"Found {len(top_results)} results for search")
+        if image_weights:
+            # Single-modality query: every weight ranks the same
+            return [{'image_weight': weight, 'results': top_results} for weight in image_weights]
         return top_results
         
     except Exception as e:
         logger.error(f"Error in multimodal search: {str(e)}", exc_info=True)
-        raise 
\ No newline at end of file
+        raise
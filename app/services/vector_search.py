@@ -0,0 +1,315 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from app.services.reduced_index import TWO_STAGE_SHORTLIST, get_reduced_index
+from app.services.shard_service import scatter_search
+
+logger = logging.getLogger(__name__)
+
+# Candidates ranked per result when collapsing duplicates (doubled until enough survive)
+COLLAPSE_OVERFETCH = 4
+# Rows per chunk when scanning a memory-mapped corpus (chunk_rows * dimension * 4 bytes resident)
+STREAM_CHUNK_ROWS = int(os.environ.get('STREAM_CHUNK_ROWS', 65536))
+# Intra-query parallelism: corpora of at least SCORING_MIN_SHARD_ROWS * 2 rows
+# are split into up to SCORING_THREADS shards scored concurrently
+SCORING_THREADS = int(os.environ.get('SCORING_THREADS', os.cpu_count() or 1))
+SCORING_MIN_SHARD_ROWS = int(os.environ.get('SCORING_MIN_SHARD_ROWS', 50000))
+
+
+def unit_vector(vector):
+    """Query vector as L2-normalized float32 (zero vectors stay zero)"""
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def top_k_indices(scores, top_k):
+    """Indices of the top_k highest scores, best first, without sorting the whole array"""
+    count = scores.shape[0]
+    if top_k <= 0 or count == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k >= count:
+        return np.argsort(scores)[::-1]
+    candidates = np.argpartition(scores, -top_k)[-top_k:]
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def first_per_cluster(rows, cluster_ids):
+    """Positions in `rows` (ranked best first) to keep: every row without a cluster and the best of each cluster"""
+    ids = cluster_ids[rows]
+    keep = ids < 0
+    _, first = np.unique(ids, return_index=True)
+    keep[first] = True
+    return np.flatnonzero(keep)
+
+
+def collapsed_top_k(scores, top_k, cluster_ids, rows=None):
+    """
+    Like top_k_indices, but with at most one row per duplicate cluster
+
+    Args:
+        scores: Scores of the candidate rows
+        top_k: Number of results
+        cluster_ids: Cluster id per corpus row (see dedup_service.get_cluster_ids)
+        rows: Corpus row of each score (None if scores cover every row)
+    """
+    count = scores.shape[0]
+    depth = min(count, top_k * COLLAPSE_OVERFETCH)
+    while True:
+        top = top_k_indices(scores, depth)
+        keep = first_per_cluster(top if rows is None else rows[top], cluster_ids)
+        if len(keep) >= top_k or depth >= count:
+            return top[keep[:top_k]]
+        depth = min(count, depth * 2)
+
+
+def score_rows(matrix, query, mask=None):
+    """
+    Score the rows allowed by `mask` (all rows if None)
+
+    A selective mask is applied as a pre-filter: only the matching rows are
+    gathered and scored. When most rows match, scoring everything and
+    dropping the rest afterwards is cheaper than the gather.
+
+    Returns:
+        (scores, rows): scores of the kept rows and their row numbers (None for all rows)
+    """
+    if mask is None:
+        return matrix @ query, None
+    rows = np.flatnonzero(mask)
+    if rows.size * 2 < mask.size:
+        return matrix[rows] @ query, rows
+    return (matrix @ query)[rows], rows
+
+
+def score_corpus(corpus, query, mask=None, depth=0):
+    """
+    score_rows over a corpus, in two stages when it has a reduced index
+
+    The reduced vectors (see reduced_index) pick a shortlist of
+    max(TWO_STAGE_SHORTLIST, 2 * depth) rows; only those are rescored at full
+    dimension. Without a reduced index every allowed row is scored exactly,
+    sharded across SCORING_THREADS for large corpora (see parallel_top_k).
+    Corpora listed in SHARD_ENDPOINTS are scored by their shard servers
+    (see shard_service.scatter_search), falling back to local scoring if
+    none answers.
+
+    Args:
+        corpus: corpus_service.Corpus
+        query: Normalized query vector
+        mask: Optional boolean row mask
+        depth: Number of results the caller will take
+
+    Returns:
+        (scores, rows) as for score_rows. Memory-mapped corpora are streamed
+        (see streaming_top_k) and return only their best `depth` rows.
+    """
+    if depth:
+        sharded = scatter_search(corpus, query, depth, mask)
+        if sharded is not None:
+            return sharded
+    reduced = get_reduced_index(corpus)
+    if reduced is None:
+        # A selective mask is cheaper as a gather (score_rows) than a full scan
+        selective = mask is not None and np.count_nonzero(mask) * 2 < mask.size
+        if depth and not selective and (corpus.streaming or shard_count(len(corpus)) > 1):
+            return parallel_top_k(corpus.matrix, query, depth, mask)
+        return score_rows(corpus.matrix, query, mask)
+    coarse, rows = score_rows(reduced.matrix, reduced.projection.query(query), mask)
+    shortlist = max(TWO_STAGE_SHORTLIST, 2 * depth)
+    if shortlist >= coarse.shape[0]:
+        return score_rows(corpus.matrix, query, mask)
+    candidates = np.argpartition(coarse, -shortlist)[-shortlist:]
+    if rows is not None:
+        candidates = rows[candidates]
+    # Ascending rows read a memory-mapped matrix front to back
+    candidates.sort()
+    return corpus.matrix[candidates] @ query, candidates
+
+
+def streaming_top_k(matrix, query, top_k, mask=None, chunk_rows=STREAM_CHUNK_ROWS, start=0, stop=None):
+    """
+    Top-k rows of a (memory-mapped) matrix, scanned in sequential chunks
+
+    Each chunk is scored, cut to its own top_k with argpartition and merged
+    into the running top_k, so memory is O(chunk_rows + top_k) whatever the
+    corpus size, and the pages are read front to back.
+
+    Args:
+        start, stop: Row range to scan (default: the whole matrix)
+
+    Returns:
+        (scores, rows): the top_k scores and their row numbers, best first
+    """
+    stop = matrix.shape[0] if stop is None else stop
+    best_scores = np.empty(0, dtype=np.float32)
+    best_rows = np.empty(0, dtype=np.int64)
+    for chunk_start in range(start, stop, chunk_rows):
+        chunk_stop = min(chunk_start + chunk_rows, stop)
+        scores = np.asarray(matrix[chunk_start:chunk_stop]) @ query
+        if mask is None:
+            rows = np.arange(chunk_start, chunk_stop)
+        else:
+            keep = np.flatnonzero(mask[chunk_start:chunk_stop])
+            scores, rows = scores[keep], keep + chunk_start
+        if scores.shape[0] > top_k:
+            keep = np.argpartition(scores, -top_k)[-top_k:]
+            scores, rows = scores[keep], rows[keep]
+        best_scores = np.concatenate([best_scores, scores])
+        best_rows = np.concatenate([best_rows, rows])
+        if best_scores.shape[0] > top_k:
+            keep = np.argpartition(best_scores, -top_k)[-top_k:]
+            best_scores, best_rows = best_scores[keep], best_rows[keep]
+    order = np.argsort(best_scores)[::-1]
+    return best_scores[order], best_rows[order]
+
+
+_scoring_pool = None
+_scoring_pool_pid = None
+_scoring_pool_lock = threading.Lock()
+
+
+def _get_scoring_pool():
+    """Process-wide shard-scoring pool (re-created in a forked worker, whose threads did not survive)"""
+    global _scoring_pool, _scoring_pool_pid
+    if _scoring_pool_pid != os.getpid():
+        with _scoring_pool_lock:
+            if _scoring_pool_pid != os.getpid():
+                _scoring_pool = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix='scoring')
+                _scoring_pool_pid = os.getpid()
+    return _scoring_pool
+
+
+def shard_count(rows):
+    """Shards to score `rows` rows in: one per SCORING_MIN_SHARD_ROWS, at most SCORING_THREADS"""
+    return max(1, min(SCORING_THREADS, rows // max(SCORING_MIN_SHARD_ROWS, 1)))
+
+
+def parallel_top_k(matrix, query, top_k, mask=None, shards=None):
+    """
+    Top-k rows, with the row range split into shards scored concurrently
+
+    Each shard runs streaming_top_k over its contiguous range on the
+    scoring pool (the matrix-vector products release the GIL), and the
+    partial top-k lists are merged. Small corpora are scored in one shard on
+    the calling thread.
+
+    Returns:
+        (scores, rows): the top_k scores and their row numbers, best first
+    """
+    count = matrix.shape[0]
+    shards = shards or shard_count(count)
+    if shards <= 1:
+        return streaming_top_k(matrix, query, top_k, mask)
+    bounds = np.linspace(0, count, shards + 1, dtype=np.int64)
+    futures = [_get_scoring_pool().submit(streaming_top_k, matrix, query, top_k, mask, STREAM_CHUNK_ROWS,
+                                          int(bounds[i]), int(bounds[i + 1]))
+               for i in range(shards)]
+    parts = [future.result() for future in futures]
+    scores = np.concatenate([part[0] for part in parts])
+    rows = np.concatenate([part[1] for part in parts])
+    order = top_k_indices(scores, top_k)
+    return scores[order], rows[order]
+
+
+def fuse_queries(weighted_queries):
+    """
+    Blend weighted queries into one vector
+
+    Cosine similarity is linear in the normalized query, so
+    corpus @ sum(w_i * q_i/|q_i|) equals sum(w_i * cosine(corpus, q_i)) and
+    the blend costs one corpus scan instead of one per query.
+
+    Args:
+        weighted_queries: dict name -> (embedding, weight); None embeddings are skipped
+    """
+    fused = None
+    for vector, weight in weighted_queries.values():
+        if vector is None or not weight:
+            continue
+        contribution = weight * unit_vector(vector)
+        fused = contribution if fused is None else fused + contribution
+    return fused
+
+
+def fused_search(corpus, weighted_queries, top_k, mask=None, cluster_ids=None):
+    """
+    Rank the corpus by a weighted blend of queries in a single pass
+
+    Args:
+        corpus: corpus_service.Corpus (rows L2-normalized)
+        weighted_queries: dict name -> (embedding, weight)
+        top_k: Number of results
+        mask: Optional boolean row mask (see metadata_index.filter_mask)
+        cluster_ids: Optional duplicate cluster column; only the best row
+            of each cluster is returned
+
+    Returns:
+        (indices, scores, components): top-k row indices best first, their
+        blended scores, and name -> per-query cosine for those rows only
+    """
+    fused = fuse_queries(weighted_queries)
+    if fused is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), {}
+
+    depth = top_k if cluster_ids is None else top_k * COLLAPSE_OVERFETCH
+    scores, rows = score_corpus(corpus, fused, mask, depth)
+    if cluster_ids is None:
+        top = top_k_indices(scores, top_k)
+    else:
+        top = collapsed_top_k(scores, top_k, cluster_ids, rows)
+    scores = scores[top]
+    indices = top if rows is None else rows[top]
+
+    # Per-query similarities are only needed for the rows being returned
+    selected = corpus.matrix[indices]
+    components = {
+        name: selected @ unit_vector(vector)
+        for name, (vector, weight) in weighted_queries.items()
+        if vector is not None
+    }
+    return indices, scores, components
+
+
+def weight_sweep(corpus, text_embedding, image_embedding, image_weights, top_k, mask=None, cluster_ids=None):
+    """
+    Rankings for several image weights from one corpus pass
+
+    The corpus is scored against the text and image queries together (one
+    matrix-matrix product), then every weight's blend is a second, tiny
+    product with the (2, len(image_weights)) weight matrix.
+
+    Returns:
+        list of (image_weight, indices, scores, text_scores, image_scores)
+    """
+    queries = np.stack([unit_vector(text_embedding), unit_vector(image_embedding)], axis=1)
+    similarities, rows = score_rows(corpus.matrix, queries, mask)
+
+    image_weights = [float(weight) for weight in image_weights]
+    blend = np.array([[1.0 - weight for weight in image_weights], image_weights], dtype=np.float32)
+    blended = similarities @ blend
+
+    sweep = []
+    for column, weight in enumerate(image_weights):
+        scores = blended[:, column]
+        if cluster_ids is None:
+            top = top_k_indices(scores, top_k)
+        else:
+            top = collapsed_top_k(scores, top_k, cluster_ids, rows)
+        indices = top if rows is None else rows[top]
+        sweep.append((weight, indices, scores[top], similarities[top, 0], similarities[top, 1]))
+    return sweep
+
+
+def parse_weights(value):
+    """Sweep weights from a JSON list or a comma-separated string; None if absent"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = [item for item in value.split(',') if item.strip()]
+    weights = [float(item) for item in value]
+    if any(weight < 0 or weight > 1 for weight in weights):
+        raise ValueError("image_weights must be between 0 and 1")
+    return weights
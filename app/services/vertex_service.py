@@ -5,6 +5,7 @@ import tempfile
 import time
 import requests
 import socket
+import numpy as np
 from io import BytesIO
 import PIL
 from PIL import Image
@@ -13,6 +14,10 @@ from vertexai.vision_models import MultiModalEmbeddingModel, Image as VertexImag
 from google.api_core import retry
 import dotenv
 from os import environ
+from app.utils.fake_providers import get_stub_client, stub_providers_enabled
+from app.utils import rate_limiter
+from app.utils.circuit_breaker import CircuitOpenError, circuit_breaker
+from app.utils.single_flight import single_flight
 
 logger = logging.getLogger(__name__)
 
@@ -48,21 +53,33 @@ def check_dns_resolution(hostname):
         return False
 
 # Initialize the model at module level
-def initialize_vertex_ai():
-    """Initialize Vertex AI and load the model"""
+def initialize_vertex_ai(verify=True):
+    """
+    Initialize Vertex AI and load the model
+    
+    Args:
+        verify: Probe connectivity and DNS first; the post-fork reset skips
+            this since the master already checked
+    """
     global model
     
+    # Local stand-in when PROVIDER_BACKEND=stub
+    stub_model = get_stub_client('vertex')
+    if stub_model is not None:
+        return stub_model
+    
     try:
         # Check internet connectivity first
-        try:
-            # Try to connect to Google to verify internet connectivity
-            requests.get('https://www.google.com', timeout=5)
-        except requests.exceptions.RequestException:
-            logger.error("No internet connection available")
-            return None
+        if verify:
+            try:
+                # Try to connect to Google to verify internet connectivity
+                requests.get('https://www.google.com', timeout=5)
+            except requests.exceptions.RequestException:
+                logger.error("No internet connection available")
+                return None
         
         # Check DNS resolution for Vertex AI endpoint
-        if not check_dns_resolution(VERTEX_ENDPOINT):
+        if verify and not check_dns_resolution(VERTEX_ENDPOINT):
             logger.error(f"DNS resolution failed for {VERTEX_ENDPOINT}")
             logger.info("Attempting to use alternative DNS servers...")
             
@@ -118,10 +135,33 @@ def initialize_vertex_ai():
 # Initialize the model
 model = initialize_vertex_ai()
 
+def reset_client():
+    """Re-create the Vertex AI model (and its gRPC channel), e.g. in a freshly forked worker"""
+    global model
+    model = initialize_vertex_ai(verify=False)
+
+def _as_float32(embedding):
+    """Vertex embedding values as a float32 array, or None if absent"""
+    return np.asarray(embedding.values, dtype=np.float32) if embedding else None
+
+def _failed_result(message):
+    """Failure result with the same shape as a successful one (message may be an exception)"""
+    return {
+        "error": str(message),
+        "text_embedding": [0.0] * 256,  # Dummy embeddings
+        "image_embedding": [0.0] * 256,
+        "multimodal_embedding": [0.0] * 256
+    }
+
+@single_flight('vertex', 'multimodalembedding@001', file_args=('image_path',))
 def get_vertex_embeddings(image_path, text):
     """
     Get embeddings from Vertex AI multimodal model
     
+    The image is loaded, a rate-limit refusal handled and failed requests
+    retried outside the circuit breaker: each attempt is one breaker outcome
+    with its own token, and an open circuit ends the call without waiting.
+    
     Args:
         image_path: Path to the image file
         text: Text to process alongside the image
@@ -130,80 +170,71 @@ def get_vertex_embeddings(image_path, text):
         dict: Embedding results
     """
     try:
-        global model
-        
-        # If model is not initialized, try to initialize it again
-        if model is None:
-            logger.info("Model not initialized, attempting to initialize now")
-            model = initialize_vertex_ai()
-            
-        if model is None:
-            # If still None, return a fallback response
-            logger.error("Could not initialize Vertex AI model - returning fallback response")
-            return {
-                "error": "Service unavailable - DNS resolution failed for Vertex AI endpoint",
-                "text_embedding": [0.0] * 256,  # Dummy embeddings
-                "image_embedding": [0.0] * 256,
-                "multimodal_embedding": [0.0] * 256
-            }
-            
-        logger.info(f"Processing with Vertex AI: image={image_path}, text={text}")
-        
-        # Check DNS resolution before attempting to use the model
-        if not check_dns_resolution(VERTEX_ENDPOINT):
-            logger.error(f"DNS resolution failed for {VERTEX_ENDPOINT}")
-            return {
-                "error": "Service unavailable - DNS resolution failed for Vertex AI endpoint",
-                "text_embedding": [0.0] * 256,  # Dummy embeddings
-                "image_embedding": [0.0] * 256,
-                "multimodal_embedding": [0.0] * 256
-            }
-        
         # Load image using vertexai's Image class, not PIL
         image = VertexImage.load_from_file(image_path)
+    except Exception as e:
+        logger.error(f"Could not load image {image_path} for Vertex AI: {str(e)}")
+        return _failed_result(str(e))
+    
+    # Get embeddings with retry
+    for attempt in range(3):
+        try:
+            return _request_embeddings(image, image_path, text)
+        except rate_limiter.RateLimitExceeded as e:
+            logger.error(f"Vertex AI embeddings not attempted: {str(e)}")
+            return _failed_result(e)
+        except CircuitOpenError as e:
+            logger.error(str(e))
+            return _failed_result(e)
+        except Exception as e:
+            last_error = e
+            logger.warning(f"Attempt {attempt+1} failed: {str(e)}")
+            if "DNS resolution failed" in str(e):
+                logger.error("DNS resolution issue detected during embedding generation.")
+                # Breaking early on DNS issues as retries are unlikely to help
+                break
+            if attempt < 2:  # Don't sleep on the last attempt
+                time.sleep(2 ** attempt)  # Exponential backoff
+    
+    # If all attempts fail, return a fallback response
+    logger.error("All embedding attempts failed")
+    return _failed_result(last_error)
+
+@circuit_breaker('vertex')
+def _request_embeddings(image, image_path, text):
+    """One Vertex AI request; the only part of a call the breaker sees"""
+    global model
+    
+    # If model is not initialized, try to initialize it again
+    if model is None:
+        logger.info("Model not initialized, attempting to initialize now")
+        model = initialize_vertex_ai()
         
-        # Get embeddings with retry
-        for attempt in range(3):
-            try:
-                embeddings = model.get_embeddings(
-                    image=image,
-                    contextual_text=text,
-                    dimension=256
-                )
-                
-                # Convert embeddings to serializable format
-                result = {
-                    "text_embedding": embeddings.text_embedding.values.tolist() if embeddings.text_embedding else None,
-                    "image_embedding": embeddings.image_embedding.values.tolist() if embeddings.image_embedding else None,
-                    "multimodal_embedding": embeddings.multimodal_embedding.values.tolist() if embeddings.multimodal_embedding else None,
-                }
-                
-                logger.info("Successfully obtained embeddings from Vertex AI")
-                return result
-            except Exception as e:
-                logger.warning(f"Attempt {attempt+1} failed: {str(e)}")
-                if "DNS resolution failed" in str(e):
-                    logger.error("DNS resolution issue detected during embedding generation.")
-                    # Breaking early on DNS issues as retries are unlikely to help
-                    break
-                if attempt < 2:  # Don't sleep on the last attempt
-                    time.sleep(2 ** attempt)  # Exponential backoff
-        
-        # If all attempts fail, return a fallback response
-        logger.error("All embedding attempts failed")
-        return {
-            "error": "Service unavailable after multiple attempts - DNS resolution issues",
-            "text_embedding": [0.0] * 256,  # Dummy embeddings
-            "image_embedding": [0.0] * 256,
-            "multimodal_embedding": [0.0] * 256
-        }
+    if model is None:
+        logger.error("Could not initialize Vertex AI model")
+        raise RuntimeError("Service unavailable - DNS resolution failed for Vertex AI endpoint")
         
-    except Exception as e:
-        logger.error(f"Error getting Vertex AI embeddings: {str(e)}", exc_info=True)
-        # Return fallback response instead of raising
-        return {
-            "error": str(e),
-            "text_embedding": [0.0] * 256,  # Dummy embeddings
-            "image_embedding": [0.0] * 256,
-            "multimodal_embedding": [0.0] * 256
-        } 
\ No newline at end of file
+    logger.info(f"Processing with Vertex AI: image={image_path}, text={text}")
+    
+    # Check DNS resolution before attempting to use the model
+    if not stub_providers_enabled() and not check_dns_resolution(VERTEX_ENDPOINT):
+        logger.error(f"DNS resolution failed for {VERTEX_ENDPOINT}")
+        raise RuntimeError("Service unavailable - DNS resolution failed for Vertex AI endpoint")
+    
+    # After the breaker admitted the call, so an open circuit spends no token
+    rate_limiter.acquire('vertex', VERTEX_PROJECT_ID)
+    embeddings = model.get_embeddings(
+        image=image,
+        contextual_text=text,
+        dimension=256
+    )
+    
+    # float32 arrays; json_response and encode_vector serialize them without a list copy
+    result = {
+        "text_embedding": _as_float32(embeddings.text_embedding),
+        "image_embedding": _as_float32(embeddings.image_embedding),
+        "multimodal_embedding": _as_float32(embeddings.multimodal_embedding),
+    }
+    
+    logger.info("Successfully obtained embeddings from Vertex AI")
+    return result
@@ -1,6 +1,7 @@
 import os
 import io
 import base64
+import logging
 import queue
 import threading
 from time import time, sleep
@@ -8,13 +9,25 @@ import numpy as np
 from PIL import Image
 import voyageai
 from dotenv import load_dotenv
+from app.utils.fake_providers import get_stub_client
+from app.utils import rate_limiter
+from app.utils.circuit_breaker import circuit_breaker
+from app.utils.single_flight import single_flight
+from app.utils.logging_utils import debug_fields
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Voyage AI client
 VOYAGE_API_KEY = os.getenv("VOYAGE_API_KEY")
-client = voyageai.Client(api_key=VOYAGE_API_KEY)
+client = get_stub_client('voyage') or voyageai.Client(api_key=VOYAGE_API_KEY)
+
+def reset_client():
+    """Re-create the Voyage AI client, e.g. in a freshly forked worker"""
+    global client
+    client = get_stub_client('voyage') or voyageai.Client(api_key=VOYAGE_API_KEY)
 
 def image_to_pil(file_path):
     """Convert image file path to PIL Image."""
@@ -25,7 +38,7 @@ def image_to_pil(file_path):
         img.thumbnail((256, 256))  # Resize to reasonable dimensions
         return img
     except Exception as e:
-        print(f"Error loading image {file_path}: {str(e)}")
+        logger.error(f"Error loading image {file_path}: {str(e)}")
         raise e
 
 def run_embedding_request(text=None, image=None, result_queue=None):
@@ -45,7 +58,9 @@ def run_embedding_request(text=None, image=None, result_queue=None):
             # Neither - shouldn't happen but handle it
             raise ValueError("Either text or image must be provided")
         
-        print(f"Input types: text={type(text) if text else None}, image={type(image) if image else None}")
+        debug_fields(logger, "voyage_request",
+                     text_type=lambda: type(text).__name__ if text else None,
+                     image_type=lambda: type(image).__name__ if image is not None else None)
         
         result = client.multimodal_embed(
             inputs=inputs,
@@ -53,21 +68,22 @@ def run_embedding_request(text=None, image=None, result_queue=None):
             input_type="query"
         )
         embedding = result.embeddings[0]
-        print(f"inputs: {inputs[0]}")
-        print(f"Embedding shape: {embedding}")
+        debug_fields(logger, "voyage_response", embedding_length=lambda: len(embedding))
         
         if result_queue:
             result_queue.put(("success", embedding))
         return embedding
     except Exception as e:
-        print(f"Voyage API error details: {str(e)}")
+        logger.warning(f"Voyage API error details: {str(e)}")
         if result_queue:
             result_queue.put(("error", str(e)))
         raise e
 
+@single_flight('voyage', 'voyage-multimodal-3')
 def get_voyage_embedding(text=None, img=None, max_retries=3, request_timeout=15):
     """Generate embedding with a manual timeout and retry."""
-    # At least one of text or image must be provided
+    # At least one of text or image must be provided (checked before the
+    # circuit breaker, so bad input is not counted as a Voyage failure)
     if not text and not img:
         raise ValueError("At least one of text or image_path must be provided")
     
@@ -75,10 +91,16 @@ def get_voyage_embedding(text=None, img=None, max_retries=3, request_timeout=15)
     if text is None:
         text = ""
     
+    return _request_embedding(text, img, max_retries, request_timeout)
+
+@circuit_breaker('voyage')
+def _request_embedding(text, img, max_retries, request_timeout):
+    """The Voyage request with its retries; the only part of a call the breaker sees"""
     for attempt in range(max_retries):
-        print(f"Attempting Voyage API call (Attempt {attempt + 1}/{max_retries})...")
-        print(f"Input: text='{text}' (type: {type(text)}), image={type(img)}")
+        logger.debug("Attempting Voyage API call (Attempt %d/%d)", attempt + 1, max_retries)
         
+        # Wait for a token before starting the timed request
+        rate_limiter.acquire('voyage', VOYAGE_API_KEY)
         result_queue = queue.Queue()
         thread = threading.Thread(target=run_embedding_request, args=(text, img, result_queue))
         
@@ -87,9 +109,9 @@ def get_voyage_embedding(text=None, img=None, max_retries=3, request_timeout=15)
         
         if thread.is_alive():
             # If thread is still running after timeout, assume timeout
-            print(f"Request took longer than {request_timeout} seconds.")
+            logger.warning(f"Voyage request took longer than {request_timeout} seconds")
             if attempt < max_retries - 1:
-                print(f"Retrying in 5 seconds... (Attempt {attempt + 1}/{max_retries})")
+                logger.info(f"Retrying in 5 seconds... (Attempt {attempt + 1}/{max_retries})")
                 sleep(5)
                 continue
             else:
@@ -98,14 +120,14 @@ def get_voyage_embedding(text=None, img=None, max_retries=3, request_timeout=15)
         # Thread finished within timeout, get the result
         status, result = result_queue.get()
         if status == "success":
-            print("Voyage API call succeeded.")
+            logger.debug("Voyage API call succeeded")
             return result
         else:
-            print(f"Voyage API error: {result}")
+            logger.warning(f"Voyage API error: {result}")
             if "rate limit" in str(result).lower() or "429" in str(result):
                 if attempt < max_retries - 1:
                     wait_time = 5 * (2 ** attempt)
-                    print(f"Rate Limit Error: Retrying in {wait_time} seconds... (Attempt {attempt + 1}/{max_retries})")
+                    logger.warning(f"Rate Limit Error: Retrying in {wait_time} seconds... (Attempt {attempt + 1}/{max_retries})")
                     sleep(wait_time)
                 else:
                     raise Exception(f"Failed after {max_retries} retries due to rate limit: {result}")
@@ -0,0 +1,217 @@
+import os
+import time
+import logging
+import functools
+import threading
+from app.utils.rate_limiter import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open"""
+
+    def __init__(self, provider, retry_in):
+        super().__init__(f"{provider} circuit is open; provider calls suspended for another {retry_in:.1f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+def _setting(provider, name, default, cast):
+    """CB_<PROVIDER>_<NAME>, falling back to CB_<NAME>, then the default"""
+    value = os.environ.get(f"CB_{provider.upper()}_{name}", os.environ.get(f"CB_{name}"))
+    return cast(value) if value not in (None, '') else default
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for one provider
+
+    closed     calls pass through; `failure_threshold` consecutive failures open it
+    open       calls fail immediately until `recovery_timeout` seconds have passed
+    half_open  up to `half_open_probes` calls are let through as probes;
+               `success_threshold` successes close it, any failure re-opens it
+
+    Settings come from the environment (per-provider override first):
+        CB_[<PROVIDER>_]FAILURE_THRESHOLD   default 5
+        CB_[<PROVIDER>_]RECOVERY_SECONDS    default 30
+        CB_[<PROVIDER>_]HALF_OPEN_PROBES    default 1
+        CB_[<PROVIDER>_]SUCCESS_THRESHOLD   default 1
+        CB_ENABLED                          'False' turns every breaker into a pass-through
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.enabled = os.environ.get('CB_ENABLED', 'True') == 'True'
+        self.failure_threshold = _setting(provider, 'FAILURE_THRESHOLD', 5, int)
+        self.recovery_timeout = _setting(provider, 'RECOVERY_SECONDS', 30.0, float)
+        self.half_open_probes = _setting(provider, 'HALF_OPEN_PROBES', 1, int)
+        self.success_threshold = _setting(provider, 'SUCCESS_THRESHOLD', 1, int)
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.half_open_successes = 0
+        self.probes_in_flight = 0
+        self.opened_at = None
+        self.last_error = None
+        self.counts = {'calls': 0, 'successes': 0, 'failures': 0, 'ignored': 0, 'rejected': 0, 'opened': 0}
+        self._lock = threading.Lock()
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.probes_in_flight = 0
+        self.half_open_successes = 0
+        self.counts['opened'] += 1
+        logger.warning(f"Circuit for {self.provider} opened after {self.consecutive_failures} consecutive failures: {self.last_error}")
+
+    def before_call(self):
+        """Admit the call or raise CircuitOpenError; returns True if the call is a half-open probe"""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                retry_in = self.opened_at + self.recovery_timeout - now
+                if retry_in > 0:
+                    self.counts['rejected'] += 1
+                    raise CircuitOpenError(self.provider, retry_in)
+                self.state = HALF_OPEN
+                logger.info(f"Circuit for {self.provider} half-open, probing")
+
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_probes:
+                    self.counts['rejected'] += 1
+                    raise CircuitOpenError(self.provider, 0.0)
+                self.probes_in_flight += 1
+                self.counts['calls'] += 1
+                return True
+
+            self.counts['calls'] += 1
+            return False
+
+    def record_success(self, probe=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counts['successes'] += 1
+            self.consecutive_failures = 0
+            if probe and self.state == HALF_OPEN:
+                self.probes_in_flight -= 1
+                self.half_open_successes += 1
+                if self.half_open_successes >= self.success_threshold:
+                    self.state = CLOSED
+                    self.opened_at = None
+                    self.half_open_successes = 0
+                    logger.info(f"Circuit for {self.provider} closed")
+
+    def record_failure(self, error, probe=False):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self.counts['failures'] += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:500]
+            if probe and self.state == HALF_OPEN:
+                self._open(now)
+            elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open(now)
+
+    def record_ignored(self, probe=False):
+        """A call that failed for reasons of its own (bad input, local throttling): frees its probe slot only"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counts['ignored'] += 1
+            if probe and self.state == HALF_OPEN:
+                self.probes_in_flight -= 1
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+            return {
+                'state': self.state if self.enabled else 'disabled',
+                'consecutive_failures': self.consecutive_failures,
+                'retry_in_seconds': retry_in,
+                'last_error': self.last_error,
+                'failure_threshold': self.failure_threshold,
+                'recovery_seconds': self.recovery_timeout,
+                'half_open_probes': self.half_open_probes,
+                'success_threshold': self.success_threshold,
+                **self.counts,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """Shared CircuitBreaker per provider (per process)"""
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+
+def breaker_states():
+    """Snapshot of every breaker created so far"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.provider: breaker.snapshot() for breaker in breakers}
+
+
+def circuit_breaker(provider, is_failure=None, fallback=None, ignore=(RateLimitExceeded,)):
+    """
+    Decorate a provider call with the provider's circuit breaker
+
+    Wrap only the provider request itself: validate and decode input before
+    calling the decorated function, so a bad upload is not counted against
+    the provider.
+
+    Args:
+        provider: Breaker name
+        is_failure: Optional predicate on the return value, for functions that
+            report failure by returning a sentinel instead of raising
+        fallback: Optional function of the CircuitOpenError whose result is
+            returned instead of raising while the circuit is open
+        ignore: Exception types that say nothing about the provider's health
+            (by default the local rate limiter giving up); they are re-raised
+            without counting as a failure
+
+    Other exceptions raised by the wrapped function count as failures and are re-raised.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            breaker = get_breaker(provider)
+            try:
+                probe = breaker.before_call()
+            except CircuitOpenError as e:
+                if fallback is not None:
+                    return fallback(e)
+                raise
+
+            try:
+                result = fn(*args, **kwargs)
+            except ignore:
+                breaker.record_ignored(probe)
+                raise
+            except Exception as e:
+                breaker.record_failure(e, probe)
+                raise
+
+            if is_failure is not None and is_failure(result):
+                breaker.record_failure(f"{fn.__name__} returned a failure result", probe)
+            else:
+                breaker.record_success(probe)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+import os
+import gzip
+import json
+import logging
+import numpy as np
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Optional: application/msgpack responses
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    # Optional: Content-Encoding br (falls back to gzip)
+    import brotli
+except ImportError:
+    brotli = None
+
+# Compress responses (br or gzip, per Accept-Encoding) of at least COMPRESS_MIN_BYTES
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', 'True') == 'True'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 5))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+VECTOR_TYPE = 'application/octet-stream'
+COMPRESSIBLE_TYPES = ('application/json',) + MSGPACK_TYPES
+
+
+def _msgpack_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not msgpack serializable")
+
+
+def _negotiate_format(response):
+    """
+    Re-encode a JSON response as msgpack or a raw float32 vector if the client asks for it
+
+    Responses built with serialization.json_response carry their payload
+    (and, for embedding endpoints, the vector), so nothing is re-parsed;
+    other JSON responses are decoded once for msgpack. Clients that do not
+    send such an Accept header get the JSON they always got.
+    """
+    offered = ['application/json', *MSGPACK_TYPES]
+    vector = getattr(response, 'vector', None)
+    if vector is not None:
+        offered.append(VECTOR_TYPE)
+    response.vary.add('Accept')
+    best = request.accept_mimetypes.best_match(offered, default='application/json')
+
+    if best == VECTOR_TYPE:
+        # Little-endian float32, dimension in a header; the JSON fields are left out
+        array = np.asarray(vector, dtype='<f4')
+        response.set_data(array.tobytes())
+        response.mimetype = VECTOR_TYPE
+        response.headers['X-Vector-Dimension'] = str(array.shape[-1])
+        response.headers['X-Vector-Dtype'] = 'float32'
+    elif best in MSGPACK_TYPES and msgpack is not None:
+        payload = getattr(response, 'payload', None)
+        if payload is None:
+            payload = json.loads(response.get_data())
+        response.set_data(msgpack.packb(payload, default=_msgpack_default, use_single_float=True))
+        response.mimetype = best
+
+
+def _compress(response):
+    """br or gzip the body if the client accepts it and it is large enough to be worth it"""
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return
+    encodings = request.accept_encodings
+    if brotli is not None and encodings['br']:
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif encodings['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+
+
+def negotiate_response(response):
+    """after_request hook: response format per Accept, then compression per Accept-Encoding"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+    try:
+        if response.mimetype == 'application/json' and 200 <= response.status_code < 300:
+            _negotiate_format(response)
+        if RESPONSE_COMPRESSION and response.mimetype in COMPRESSIBLE_TYPES:
+            _compress(response)
+    except Exception as e:
+        # Fall back to whatever has been built so far rather than failing the request
+        logger.error(f"Error negotiating response format: {str(e)}", exc_info=True)
+    return response
+
+
+def init_content_negotiation(app):
+    """Register negotiate_response on the app"""
+    app.after_request(negotiate_response)
+    compression = 'off'
+    if RESPONSE_COMPRESSION:
+        compression = f"{'br+gzip' if brotli is not None else 'gzip'} above {COMPRESS_MIN_BYTES} bytes"
+    logger.info(f"Content negotiation: msgpack={'on' if msgpack is not None else 'off'}, compression={compression}")
@@ -0,0 +1,353 @@
+import io
+import os
+import json
+import time
+import random
+import hashlib
+import importlib
+import logging
+import threading
+from types import SimpleNamespace
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Output dimensions of the real providers
+PROVIDER_DIMENSIONS = {
+    'titan': 256,
+    'vertex': 256,
+    'twelve_labs': 1024,
+    'azure': 1024,
+    'cohere': 1024,
+    'voyage': 1024,
+}
+
+
+# Provider names accepted by get_stub_client / STUB_<PROVIDER>_* settings
+STUB_PROVIDERS = ['titan', 'vertex', 'twelve_labs', 'azure', 'cohere', 'voyage', 's3']
+
+
+def stub_providers_enabled():
+    """True when PROVIDER_BACKEND=stub, i.e. no paid API should be called"""
+    return os.environ.get('PROVIDER_BACKEND', 'live').lower() == 'stub'
+
+
+class FakeProviderError(Exception):
+    """Error raised by a stub to simulate a provider failure"""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec into a sampler returning milliseconds
+
+    Supported forms:
+        "50"                 fixed 50ms
+        "fixed:50"           fixed 50ms
+        "uniform:20,80"      uniform between 20ms and 80ms
+        "normal:100,20"      normal(mean, std), clipped at 0
+        "lognormal:200,0.5"  lognormal with median 200ms and sigma 0.5
+        "exponential:100"    exponential with mean 100ms
+    """
+    if not spec:
+        return lambda rng: 0.0
+
+    kind, _, params = spec.partition(':')
+    if not params:
+        kind, params = 'fixed', kind
+    values = [float(v) for v in params.split(',') if v.strip()]
+    kind = kind.strip().lower()
+
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        mu = float(np.log(values[0]))
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    if kind == 'exponential':
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubBehavior:
+    """
+    Latency and failure injection for one stubbed provider
+
+    Settings are read from the environment, with per-provider overrides:
+        STUB_LATENCY_MS / STUB_<PROVIDER>_LATENCY_MS        latency distribution (see parse_latency)
+        STUB_ERROR_RATE / STUB_<PROVIDER>_ERROR_RATE        fraction of calls failing with a 500
+        STUB_THROTTLE_RATE / STUB_<PROVIDER>_THROTTLE_RATE  fraction of calls failing with a 429
+        STUB_SEED                                           seed for reproducible runs
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        prefix = f"STUB_{provider.upper()}_"
+        self.latency_spec = os.environ.get(prefix + 'LATENCY_MS', os.environ.get('STUB_LATENCY_MS', ''))
+        self.error_rate = float(os.environ.get(prefix + 'ERROR_RATE', os.environ.get('STUB_ERROR_RATE', 0)))
+        self.throttle_rate = float(os.environ.get(prefix + 'THROTTLE_RATE', os.environ.get('STUB_THROTTLE_RATE', 0)))
+        self._latency = parse_latency(self.latency_spec)
+        seed = os.environ.get('STUB_SEED')
+        self._rng = random.Random(f"{seed}:{provider}" if seed is not None else None)
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Sleep for a sampled latency, then maybe raise a simulated 429 or 500"""
+        with self._lock:
+            delay_ms = self._latency(self._rng)
+            roll = self._rng.random()
+
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+        if roll < self.throttle_rate:
+            raise FakeProviderError(f"{self.provider} stub: 429 rate limit exceeded", status_code=429)
+        if roll < self.throttle_rate + self.error_rate:
+            raise FakeProviderError(f"{self.provider} stub: 500 internal error", status_code=500)
+
+
+_behaviors = {}
+_behaviors_lock = threading.Lock()
+
+
+def get_stub_behavior(provider):
+    """Shared StubBehavior per provider"""
+    with _behaviors_lock:
+        if provider not in _behaviors:
+            _behaviors[provider] = StubBehavior(provider)
+        return _behaviors[provider]
+
+
+def _content_digest(*parts):
+    """Hash arbitrary text/bytes/PIL content into a stable digest"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            continue
+        if isinstance(part, bytes):
+            digest.update(part)
+        elif hasattr(part, 'tobytes'):
+            digest.update(part.tobytes())
+        elif hasattr(part, 'read'):
+            position = part.tell() if hasattr(part, 'tell') else None
+            digest.update(part.read())
+            if position is not None:
+                part.seek(position)
+        else:
+            digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.digest()
+
+
+def fake_embedding(*content, dimension=256):
+    """
+    Deterministic unit-length embedding for the given content
+
+    The same content always maps to the same vector, so benchmark and load
+    runs are reproducible without calling any external API.
+
+    Args:
+        content: Text, bytes, file objects or PIL images describing the input
+        dimension: Length of the returned vector
+
+    Returns:
+        list: Embedding as a list of floats
+    """
+    seed = int.from_bytes(_content_digest(*content)[:8], 'little')
+    rng = np.random.default_rng(seed)
+    vector = rng.standard_normal(dimension).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+
+class FakeBedrockClient:
+    """Stand-in for the boto3 bedrock-runtime client used by titan_service"""
+
+    def invoke_model(self, body, modelId, accept=None, contentType=None):
+        get_stub_behavior('titan').before_call()
+        payload = json.loads(body)
+        dimension = payload.get('embeddingConfig', {}).get('outputEmbeddingLength', PROVIDER_DIMENSIONS['titan'])
+        embedding = fake_embedding(modelId, payload.get('inputText'), payload.get('inputImage'), dimension=dimension)
+        return {'body': io.BytesIO(json.dumps({'embedding': embedding}).encode('utf-8'))}
+
+
+class _FakeTwelveLabsEmbed:
+    def create(self, model_name, text=None, image_file=None, **kwargs):
+        get_stub_behavior('twelve_labs').before_call()
+        dimension = PROVIDER_DIMENSIONS['twelve_labs']
+        text_embedding = None
+        image_embedding = None
+        if text is not None:
+            segment = SimpleNamespace(embeddings_float=fake_embedding(model_name, text, dimension=dimension))
+            text_embedding = SimpleNamespace(segments=[segment])
+        if image_file is not None:
+            segment = SimpleNamespace(embeddings_float=fake_embedding(model_name, image_file, dimension=dimension))
+            image_embedding = SimpleNamespace(segments=[segment])
+        return SimpleNamespace(text_embedding=text_embedding, image_embedding=image_embedding)
+
+
+class FakeTwelveLabsClient:
+    """Stand-in for twelvelabs.TwelveLabs"""
+
+    def __init__(self):
+        self.embed = _FakeTwelveLabsEmbed()
+
+
+class FakeCohereClient:
+    """Stand-in for cohere.ClientV2"""
+
+    def embed(self, model, input_type, embedding_types=None, texts=None, images=None, **kwargs):
+        get_stub_behavior('cohere').before_call()
+        dimension = PROVIDER_DIMENSIONS['cohere']
+        inputs = images if images else texts
+        vectors = [fake_embedding(model, input_type, item, dimension=dimension) for item in inputs or []]
+        return SimpleNamespace(embeddings=SimpleNamespace(float_=vectors))
+
+
+class FakeVoyageClient:
+    """Stand-in for voyageai.Client"""
+
+    def multimodal_embed(self, inputs, model, input_type=None, **kwargs):
+        get_stub_behavior('voyage').before_call()
+        dimension = PROVIDER_DIMENSIONS['voyage']
+        vectors = [fake_embedding(model, *parts, dimension=dimension) for parts in inputs]
+        return SimpleNamespace(embeddings=vectors)
+
+
+class _FakeVertexEmbedding:
+    def __init__(self, values):
+        self.values = np.array(values, dtype=np.float32)
+
+
+class FakeVertexModel:
+    """Stand-in for vertexai MultiModalEmbeddingModel"""
+
+    def get_embeddings(self, image=None, contextual_text=None, dimension=256, **kwargs):
+        get_stub_behavior('vertex').before_call()
+        image_bytes = getattr(image, '_image_bytes', None) if image is not None else None
+        return SimpleNamespace(
+            text_embedding=_FakeVertexEmbedding(fake_embedding('text', contextual_text, dimension=dimension)) if contextual_text else None,
+            image_embedding=_FakeVertexEmbedding(fake_embedding('image', image_bytes, dimension=dimension)) if image is not None else None,
+            multimodal_embedding=_FakeVertexEmbedding(fake_embedding('multimodal', image_bytes, contextual_text, dimension=dimension)),
+        )
+
+
+class _FakeHTTPResponse:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error: {self.text}", response=self)
+
+    def json(self):
+        return self._payload
+
+
+class FakeAzureHTTP:
+    """
+    Stand-in for the ``requests`` module as used by AzureService
+
+    Only ``post`` is faked; ``exceptions`` is forwarded to the real module so
+    the service's error handling keeps working.
+    """
+
+    def __init__(self):
+        import requests
+        self.exceptions = requests.exceptions
+
+    def post(self, url, headers=None, json=None, **kwargs):
+        try:
+            get_stub_behavior('azure').before_call()
+        except FakeProviderError as e:
+            return _FakeHTTPResponse({'error': {'message': str(e)}}, status_code=e.status_code)
+
+        dimension = PROVIDER_DIMENSIONS['azure']
+        content = (json or {}).get('text') or (json or {}).get('url')
+        kind = 'image' if 'vectorizeImage' in url else 'text'
+        return _FakeHTTPResponse({'vector': fake_embedding('azure', kind, content, dimension=dimension)})
+
+
+class FakeS3Client:
+    """Stand-in for the boto3 s3 client used by s3_helper (uploads go nowhere)"""
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        get_stub_behavior('s3').before_call()
+
+
+def fake_upload_file_to_s3(file_path, bucket_name=None, object_name=None):
+    """Stand-in for app.utils.s3_helper.upload_file_to_s3"""
+    bucket_name = bucket_name or 'fake-bucket'
+    object_name = object_name or f"image_uploads/{os.path.basename(file_path)}"
+    try:
+        FakeS3Client().upload_file(file_path, bucket_name, object_name)
+    except FakeProviderError as e:
+        logger.error(f"Error uploading file to S3: {str(e)}")
+        return None
+    return f"https://{bucket_name}.s3.local/{object_name}"
+
+
+def get_stub_client(provider):
+    """
+    Stub client for a provider when PROVIDER_BACKEND=stub, otherwise None
+
+    Services call this while creating their clients so the whole app can be
+    pointed at local stand-ins through configuration alone.
+    """
+    if not stub_providers_enabled():
+        return None
+
+    factories = {
+        'titan': FakeBedrockClient,
+        'vertex': FakeVertexModel,
+        'twelve_labs': FakeTwelveLabsClient,
+        'azure': FakeAzureHTTP,
+        'cohere': FakeCohereClient,
+        'voyage': FakeVoyageClient,
+        's3': FakeS3Client,
+    }
+    logger.info(f"Using stub client for {provider} (PROVIDER_BACKEND=stub)")
+    return factories[provider]()
+
+
+def install_fake_providers():
+    """
+    Swap every provider client in app.services for the deterministic fakes above
+
+    Only modules that import (i.e. whose SDK is installed) are patched; the
+    rest are logged and skipped. This is meant for benchmarks and local load
+    tests, never for production.
+    """
+    patches = [
+        ('app.services.titan_service', 'bedrock_client', FakeBedrockClient),
+        ('app.services.twelvelabs_service', 'client', FakeTwelveLabsClient),
+        ('app.services.cohere_service', 'co', FakeCohereClient),
+        ('app.services.voyage_service', 'client', FakeVoyageClient),
+        ('app.services.vertex_service', 'model', FakeVertexModel),
+        ('app.services.azure_service', 'requests', FakeAzureHTTP),
+        ('app.utils.s3_helper', 'upload_file_to_s3', lambda: fake_upload_file_to_s3),
+    ]
+    for module_name, attribute, factory in patches:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            logger.warning(f"Not patching {module_name}: {str(e)}")
+            continue
+        setattr(module, attribute, factory())
+
+    try:
+        from app.views import azure_routes
+        azure_routes.azure_service.http = FakeAzureHTTP()
+    except Exception as e:
+        logger.warning(f"Could not patch azure_routes: {str(e)}")
+
+    logger.info("Installed fake provider clients")
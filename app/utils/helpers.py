@@ -97,4 +97,24 @@ def get_file_url(file_path):
     url_path = url_path.replace("\\", "/")
     
     # Combine base URL with file path
-    return f"{base_url}/{url_path}" 
\ No newline at end of file
+    return f"{base_url}/{url_path}"
+
+
+def get_request_param(request, name, default=None):
+    """Value of a parameter from form data, falling back to the JSON body"""
+    if request.form and name in request.form:
+        return request.form.get(name)
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        return data.get(name, default)
+    return default
+
+
+def get_flag_param(request, name, default=False):
+    """Boolean parameter (true/1/yes, any case) from form data or the JSON body"""
+    value = get_request_param(request, name)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'yes')
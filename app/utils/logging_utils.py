@@ -0,0 +1,156 @@
+import os
+import json
+import random
+import logging
+import contextvars
+
+# Set per request by init_request_sampling; sampled requests log at SAMPLED_LEVEL
+_request_sampled = contextvars.ContextVar('log_request_sampled', default=False)
+SAMPLED_LEVEL = logging.DEBUG
+
+LOG_FORMAT_TEXT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_configured = False
+
+
+class LazyFields:
+    """
+    Structured log fields that are only computed when the record is formatted
+
+    Any callable value is called at render time, so expensive diagnostics
+    (sorting similarities, dumping headers) cost nothing when the record is
+    filtered out.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._resolved = None
+
+    def resolve(self):
+        if self._resolved is None:
+            resolved = {}
+            for key, value in self.fields.items():
+                try:
+                    resolved[key] = value() if callable(value) else value
+                except Exception as e:
+                    resolved[key] = f"<error: {e}>"
+            self._resolved = resolved
+        return self._resolved
+
+    def __str__(self):
+        return ' '.join(f"{key}={value}" for key, value in self.resolve().items())
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with structured fields flattened in"""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'logger': record.name,
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if isinstance(fields, LazyFields):
+            payload['event'] = getattr(record, 'event', None)
+            payload.update(fields.resolve())
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def is_enabled(logger, level):
+    """True if a record at `level` would be emitted, including sampled requests"""
+    return logger.isEnabledFor(level) or (level >= SAMPLED_LEVEL and _request_sampled.get())
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Emit a structured ``event key=value ...`` record
+
+    Nothing is evaluated unless the logger is enabled for `level` (or the
+    current request was sampled for debug logging). Callable field values are
+    evaluated lazily when the record is formatted.
+
+    Args:
+        logger: Logger to emit on
+        level: Logging level, e.g. logging.DEBUG
+        event: Short event name
+        fields: Structured values; callables are evaluated lazily
+    """
+    if not is_enabled(logger, level):
+        return
+    lazy_fields = LazyFields(fields)
+    # _log skips the logger's own level check so sampled requests get through
+    logger._log(level, '%s %s', (event, lazy_fields), extra={'event': event, 'fields': lazy_fields}, stacklevel=2)
+
+
+def debug_fields(logger, event, **fields):
+    """Shortcut for log_event(logger, logging.DEBUG, ...)"""
+    if is_enabled(logger, logging.DEBUG):
+        lazy_fields = LazyFields(fields)
+        logger._log(logging.DEBUG, '%s %s', (event, lazy_fields),
+                    extra={'event': event, 'fields': lazy_fields}, stacklevel=2)
+
+
+def _parse_levels(spec):
+    """Parse 'logger.name=LEVEL,other=LEVEL' into a dict"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(settings=None):
+    """
+    Configure the root handler, per-logger levels and output format
+
+    Settings (read from `settings`, falling back to the environment):
+        LOG_LEVEL       default level (INFO)
+        LOG_LEVELS      per-logger overrides, e.g. "app.services=DEBUG,werkzeug=WARNING"
+        LOG_DEBUG       'True' forces DEBUG everywhere
+        LOG_FORMAT      'text' (default) or 'json'
+    """
+    global _configured
+    settings = settings if settings is not None else os.environ
+
+    debug = str(settings.get('LOG_DEBUG', 'False')) == 'True'
+    level = 'DEBUG' if debug else str(settings.get('LOG_LEVEL', 'INFO')).upper()
+
+    root = logging.getLogger()
+    if not _configured:
+        handler = logging.StreamHandler()
+        if str(settings.get('LOG_FORMAT', 'text')).lower() == 'json':
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter(LOG_FORMAT_TEXT))
+        root.handlers = [handler]
+        _configured = True
+    root.setLevel(level)
+
+    if not debug:
+        for name, logger_level in _parse_levels(settings.get('LOG_LEVELS')).items():
+            logging.getLogger(name).setLevel(logger_level)
+
+
+def init_request_sampling(app):
+    """
+    Turn on debug logging for a random fraction of requests
+
+    LOG_SAMPLE_RATE is the fraction (0-1) of requests whose debug records are
+    emitted even when their loggers are at INFO.
+    """
+    sample_rate = float(app.config.get('LOG_SAMPLE_RATE', 0) or 0)
+    if sample_rate <= 0:
+        return
+
+    @app.before_request
+    def _sample_request():
+        _request_sampled.set(random.random() < sample_rate)
+
+    @app.teardown_request
+    def _clear_sample(exc=None):
+        _request_sampled.set(False)
@@ -0,0 +1,275 @@
+import os
+import io
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import threading
+import contextvars
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Header / query flag that turns profiling on for a single request
+PROFILE_HEADER = 'HTTP_X_PROFILE_TOKEN'
+PROFILE_QUERY_FLAG = '_profile'
+PROFILE_FORMAT_FLAG = '_profile_format'
+
+# Functions whose cumulative time is reported in the breakdown.
+# Each entry is (path fragment of the defining file, function name).
+PROFILE_GROUPS = {
+    'search_multimodal': [
+        ('services/search_service.py', 'search_multimodal'),
+        ('services/twelvelabs_service.py', 'search_multimodal'),
+    ],
+    'find_similar_images': [
+        ('services/similarity_service.py', 'find_similar_images'),
+        ('services/similarity_service.py', 'find_similar_images_page'),
+        ('services/similarity_service.py', 'next_similar_images_page'),
+        ('services/azure_service.py', 'find_similar_images'),
+    ],
+    'provider_clients': [
+        ('services/titan_service.py', 'get_titan_embedding'),
+        ('services/vertex_service.py', 'get_vertex_embeddings'),
+        ('services/twelvelabs_service.py', 'get_embedding_for_text'),
+        ('services/twelvelabs_service.py', 'get_embedding_for_image'),
+        ('services/cohere_service.py', 'get_text_embedding'),
+        ('services/cohere_service.py', 'get_cohere_embedding'),
+        ('services/voyage_service.py', 'get_voyage_embedding'),
+        ('services/azure_service.py', 'vectorize_text'),
+        ('services/azure_service.py', 'vectorize_image'),
+        ('utils/s3_helper.py', 'upload_file_to_s3'),
+    ],
+    'json_serialization': [
+        ('flask/json/__init__.py', 'jsonify'),
+        ('utils/serialization.py', 'dumps'),
+    ],
+}
+
+
+class ProfileSession:
+    """
+    Everything recorded for one profiled request outside the WSGI thread
+
+    cProfile only sees the thread that enabled it. Async views run on an
+    event loop in another thread and hand blocking work to the provider
+    executor, so those threads report here instead (see profile_call and
+    record_timing): a profile per executor task, plus wall-clock segments.
+    Code running directly on an async view's event loop is covered by the
+    wall-clock segments only.
+    """
+
+    def __init__(self):
+        self.profiles = []
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def add_profile(self, profiler):
+        with self._lock:
+            self.profiles.append(profiler)
+
+    def add_timing(self, name, seconds):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+_session = contextvars.ContextVar('profile_session', default=None)
+
+
+def current_session():
+    """The ProfileSession of the request being profiled in this context, or None"""
+    return _session.get()
+
+
+def record_timing(name, seconds):
+    """Add a wall-clock segment to the current request's Server-Timing (no-op when not profiling)"""
+    session = _session.get()
+    if session is not None:
+        session.add_timing(name, seconds)
+
+
+def profile_call(fn):
+    """
+    Run fn() in this thread, profiled into the current session if there is one
+
+    Meant for executor threads: the caller must run it in a copy of the
+    request's context (contextvars.copy_context().run) for the session to
+    be visible.
+    """
+    session = _session.get()
+    if session is None:
+        return fn()
+    name = getattr(getattr(fn, 'func', fn), '__name__', 'call')
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows a single active profiler per process
+        profiler = None
+    started = time.perf_counter()
+    try:
+        return fn()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            session.add_profile(profiler)
+        session.add_timing(f"blocking.{name}", time.perf_counter() - started)
+
+
+def summarize_profile(*profilers):
+    """
+    Break the cumulative time of one or more profiles down into the PROFILE_GROUPS buckets
+
+    Args:
+        profilers: cProfile.Profile objects that have finished running (the
+            request thread's and those of its executor tasks)
+
+    Returns:
+        dict: Group name -> cumulative seconds spent inside that group
+    """
+    stats = pstats.Stats(*profilers).stats
+    breakdown = {group: 0.0 for group in PROFILE_GROUPS}
+
+    for (filename, _, funcname), (_, _, _, cumulative, _) in stats.items():
+        normalized = filename.replace('\\', '/')
+        for group, targets in PROFILE_GROUPS.items():
+            if any(funcname == name and fragment in normalized for fragment, name in targets):
+                breakdown[group] += cumulative
+
+    return breakdown
+
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware that profiles a request only when it carries the profiling token
+
+    Requests opt in with either an ``X-Profile-Token`` header or a
+    ``_profile=<token>`` query argument. The pstats artifact is stored in
+    ``profile_dir`` and a per-group breakdown is returned in a
+    ``Server-Timing`` header. ``_profile_format=pstats`` returns the raw
+    artifact instead of the normal response body, ``_profile_format=text``
+    returns a readable pstats report.
+
+    Work that async views hand to the provider executor is profiled in the
+    executor thread and merged in; Server-Timing also gets the wall-clock
+    segments recorded through the request's ProfileSession.
+    """
+
+    def __init__(self, wsgi_app, token, profile_dir='profiles', sort_by='cumulative', restrictions=40):
+        self.wsgi_app = wsgi_app
+        self.token = token
+        self.profile_dir = profile_dir
+        self.sort_by = sort_by
+        self.restrictions = restrictions
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+    def _requested(self, environ):
+        """Return the requested output format, or None if the request is not being profiled"""
+        if environ.get(PROFILE_HEADER) == self.token:
+            query = parse_qs(environ.get('QUERY_STRING', ''))
+            return query.get(PROFILE_FORMAT_FLAG, ['headers'])[0]
+
+        query_string = environ.get('QUERY_STRING', '')
+        if PROFILE_QUERY_FLAG not in query_string:
+            return None
+
+        query = parse_qs(query_string)
+        if query.get(PROFILE_QUERY_FLAG, [None])[0] != self.token:
+            return None
+        return query.get(PROFILE_FORMAT_FLAG, ['headers'])[0]
+
+    def __call__(self, environ, start_response):
+        output_format = self._requested(environ)
+        if output_format is None:
+            return self.wsgi_app(environ, start_response)
+
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            return lambda data: None
+
+        session = ProfileSession()
+        session_token = _session.set(session)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            app_iter = self.wsgi_app(environ, capture_start_response)
+            try:
+                body = b''.join(app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+        finally:
+            profiler.disable()
+            _session.reset(session_token)
+        elapsed = time.perf_counter() - started
+        profilers = [profiler, *session.profiles]
+
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        profile_path = os.path.join(self.profile_dir, f"{profile_id}.prof")
+        pstats.Stats(*profilers).dump_stats(profile_path)
+
+        breakdown = summarize_profile(*profilers)
+        server_timing = ', '.join(
+            [f"{group};dur={seconds * 1000:.2f}" for group, seconds in breakdown.items()] +
+            [f"{name};dur={seconds * 1000:.2f}" for name, seconds in session.timings.items()] +
+            [f"total;dur={elapsed * 1000:.2f}"]
+        )
+        logger.info(f"Profiled {environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} "
+                    f"in {elapsed * 1000:.2f}ms, saved to {profile_path} ({server_timing})")
+
+        profile_headers = [
+            ('X-Profile-Id', profile_id),
+            ('Server-Timing', server_timing),
+        ]
+
+        if output_format == 'pstats':
+            with open(profile_path, 'rb') as f:
+                body = f.read()
+            headers = [
+                ('Content-Type', 'application/octet-stream'),
+                ('Content-Disposition', f'attachment; filename="{profile_id}.prof"'),
+            ]
+            start_response('200 OK', headers + [('Content-Length', str(len(body)))] + profile_headers)
+            return [body]
+
+        if output_format == 'text':
+            report = io.StringIO()
+            stats = pstats.Stats(*profilers, stream=report)
+            stats.sort_stats(self.sort_by).print_stats(self.restrictions)
+            body = report.getvalue().encode('utf-8')
+            headers = [('Content-Type', 'text/plain; charset=utf-8')]
+            start_response('200 OK', headers + [('Content-Length', str(len(body)))] + profile_headers)
+            return [body]
+
+        headers = [(k, v) for k, v in captured['headers'] if k.lower() != 'content-length']
+        headers.append(('Content-Length', str(len(body))))
+        start_response(captured['status'], headers + profile_headers, captured['exc_info'])
+        return [body]
+
+
+def init_profiling(app):
+    """
+    Install the profiling middleware if it is enabled in the app config
+
+    Nothing is wrapped when PROFILING_ENABLED is off, so there is no per-request cost.
+    """
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+
+    token = app.config.get('PROFILING_TOKEN')
+    if not token:
+        logger.warning("PROFILING_ENABLED is set but PROFILING_TOKEN is empty - profiling stays disabled")
+        return
+
+    app.wsgi_app = ProfilingMiddleware(
+        app.wsgi_app,
+        token=token,
+        profile_dir=app.config.get('PROFILE_DIR', 'profiles')
+    )
+    logger.info(f"Request profiling enabled, artifacts stored in {app.config.get('PROFILE_DIR', 'profiles')}")
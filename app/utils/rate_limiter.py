@@ -0,0 +1,267 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from app.utils.sqlite_store import LocalConnections
+
+logger = logging.getLogger(__name__)
+
+# Seconds per unit in PROVIDER_RATE_LIMITS specs
+RATE_UNITS = {'s': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to wait longer than RATE_LIMIT_MAX_WAIT for a token"""
+
+    def __init__(self, key, wait):
+        super().__init__(f"Rate limit for {key} would need a {wait:.2f}s wait")
+        self.key = key
+        self.wait = wait
+
+
+def parse_rate_limits(spec):
+    """
+    Parse PROVIDER_RATE_LIMITS into {provider: (rate_per_second, burst)}
+
+    Format: comma-separated ``provider=<count>/<unit>[:<burst>]`` entries,
+    unit one of s, m, h. Example: "cohere=100/m:5,azure=10/s,voyage=300/m".
+    Without an explicit burst the bucket holds one second's worth of tokens
+    (at least one), so calls are spread out instead of sent in a spike.
+    """
+    limits = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        provider, rule = item.split('=', 1)
+        rule, _, burst = rule.partition(':')
+        count, _, unit = rule.partition('/')
+        rate = float(count) / RATE_UNITS[(unit or 's').strip().lower()[0]]
+        burst = float(burst) if burst else max(1.0, rate)
+        limits[provider.strip()] = (rate, burst)
+    return limits
+
+
+class MemoryBackend:
+    """Token buckets shared by the threads of one process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key, rate, burst, tokens, now):
+        """Take `tokens` (going into debt if needed) and return the seconds to wait"""
+        with self._lock:
+            available, updated = self._buckets.get(key, (burst, now))
+            available = min(burst, available + (now - updated) * rate) - tokens
+            self._buckets[key] = (available, now)
+        return max(0.0, -available / rate)
+
+    def refund(self, key, tokens):
+        with self._lock:
+            if key in self._buckets:
+                available, updated = self._buckets[key]
+                self._buckets[key] = (available + tokens, updated)
+
+    def level(self, key):
+        with self._lock:
+            return self._buckets.get(key, (None, None))[0]
+
+
+class SQLiteBackend:
+    """
+    Token buckets in a local SQLite file, shared by every worker process on the host
+
+    Each reservation is a short ``BEGIN IMMEDIATE`` transaction, so concurrent
+    processes serialize on the database lock instead of over-admitting.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connections = LocalConnections(path)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return self._connections.get()
+
+    def reserve(self, key, rate, burst, tokens, now):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            available, updated = row if row else (burst, now)
+            available = min(burst, available + max(0.0, now - updated) * rate) - tokens
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, available, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return max(0.0, -available / rate)
+
+    def refund(self, key, tokens):
+        conn = self._connect()
+        conn.execute("UPDATE buckets SET tokens = tokens + ? WHERE key = ?", (tokens, key))
+
+    def level(self, key):
+        row = self._connect().execute("SELECT tokens FROM buckets WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+
+class BucketMetrics:
+    """Admission counters for one bucket key (per process)"""
+
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.delayed = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def to_dict(self):
+        return {
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'delayed': self.delayed,
+            'queue_depth': self.waiting,
+            'max_queue_depth': self.max_waiting,
+            'total_wait_seconds': round(self.total_wait, 3),
+            'mean_wait_seconds': round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            'max_wait_seconds': round(self.max_wait, 3),
+        }
+
+
+class RateLimiter:
+    """
+    Client-side token buckets keyed by provider and API key
+
+    Calls to a provider without a configured limit are admitted immediately.
+    Otherwise each call reserves a token and sleeps until it is due, which
+    spreads bursts out below the provider quota instead of triggering 429s.
+    """
+
+    def __init__(self, limits, backend, max_wait):
+        self.limits = limits
+        self.backend = backend
+        self.max_wait = max_wait
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+    @staticmethod
+    def bucket_key(provider, api_key=None):
+        # Never keep the raw key around (it shows up in metrics)
+        suffix = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12] if api_key else 'default'
+        return f"{provider}:{suffix}"
+
+    def _metrics_for(self, key):
+        with self._metrics_lock:
+            if key not in self._metrics:
+                self._metrics[key] = BucketMetrics()
+            return self._metrics[key]
+
+    def acquire(self, provider, api_key=None, tokens=1, max_wait=None):
+        """
+        Block until the call may proceed
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            RateLimitExceeded: If the wait would exceed max_wait
+        """
+        limit = self.limits.get(provider)
+        if limit is None:
+            return 0.0
+
+        rate, burst = limit
+        key = self.bucket_key(provider, api_key)
+        metrics = self._metrics_for(key)
+        max_wait = self.max_wait if max_wait is None else max_wait
+
+        wait = self.backend.reserve(key, rate, burst, tokens, time.time())
+        if wait > max_wait:
+            self.backend.refund(key, tokens)
+            with self._metrics_lock:
+                metrics.rejected += 1
+            logger.warning(f"Rate limit for {provider} exceeded: would wait {wait:.2f}s (max {max_wait}s)")
+            raise RateLimitExceeded(key, wait)
+
+        if wait > 0:
+            with self._metrics_lock:
+                metrics.waiting += 1
+                metrics.max_waiting = max(metrics.max_waiting, metrics.waiting)
+            try:
+                time.sleep(wait)
+            finally:
+                with self._metrics_lock:
+                    metrics.waiting -= 1
+
+        with self._metrics_lock:
+            metrics.admitted += 1
+            metrics.total_wait += wait
+            metrics.max_wait = max(metrics.max_wait, wait)
+            if wait > 0:
+                metrics.delayed += 1
+        return wait
+
+    def snapshot(self):
+        """Limits and per-key metrics of this process"""
+        with self._metrics_lock:
+            buckets = {key: metrics.to_dict() for key, metrics in self._metrics.items()}
+        for key, data in buckets.items():
+            try:
+                data['tokens_available'] = self.backend.level(key)
+            except Exception as e:
+                data['tokens_available'] = None
+                logger.debug("Could not read bucket level for %s: %s", key, e)
+        return {
+            'backend': type(self.backend).__name__,
+            'max_wait_seconds': self.max_wait,
+            'limits': {provider: {'rate_per_second': rate, 'burst': burst}
+                       for provider, (rate, burst) in self.limits.items()},
+            'buckets': buckets,
+            'pid': os.getpid(),
+        }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Process-wide limiter, configured from the environment on first use
+
+    Settings:
+        PROVIDER_RATE_LIMITS   per-provider limits, see parse_rate_limits
+        RATE_LIMIT_BACKEND     'memory' (per process, default) or 'sqlite' (shared across workers)
+        RATE_LIMIT_DB          SQLite file for the sqlite backend
+        RATE_LIMIT_MAX_WAIT    longest a call may queue for a token, in seconds (default 30)
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                limits = parse_rate_limits(os.environ.get('PROVIDER_RATE_LIMITS', ''))
+                backend_name = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()
+                if backend_name == 'sqlite':
+                    backend = SQLiteBackend(os.environ.get('RATE_LIMIT_DB', 'instance/rate_limits.sqlite3'))
+                else:
+                    backend = MemoryBackend()
+                _limiter = RateLimiter(limits, backend, float(os.environ.get('RATE_LIMIT_MAX_WAIT', 30)))
+                if limits:
+                    logger.info(f"Provider rate limits ({backend_name}): {os.environ.get('PROVIDER_RATE_LIMITS')}")
+    return _limiter
+
+
+def acquire(provider, api_key=None, tokens=1):
+    """Wait for a token from the provider's bucket (no-op without a configured limit)"""
+    return get_rate_limiter().acquire(provider, api_key=api_key, tokens=tokens)
@@ -3,6 +3,7 @@ import boto3
 import logging
 from botocore.exceptions import ClientError
 from uuid import uuid4
+from app.utils.fake_providers import stub_providers_enabled, fake_upload_file_to_s3
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +19,10 @@ def upload_file_to_s3(file_path, bucket_name=None, object_name=None):
     Returns:
         str: Public URL of the uploaded file or None if upload fails
     """
+    # Local stand-in when PROVIDER_BACKEND=stub
+    if stub_providers_enabled():
+        return fake_upload_file_to_s3(file_path, bucket_name, object_name)
+    
     # Get AWS credentials from environment variables
     aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
     aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
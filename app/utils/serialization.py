@@ -0,0 +1,96 @@
+import json
+import base64
+import logging
+import numpy as np
+from flask import Response
+from flask.json import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Optional: several times faster than json and serializes NumPy natively
+    import orjson
+except ImportError:
+    orjson = None
+
+# Encodings for embedding vectors in responses (?vector_encoding=):
+#   json     list of floats (default)
+#   float32  {"encoding": "float32", "dimension": n, "data": base64 of little-endian float32}
+#   float16  same with float16 (half the size, ~3 significant digits)
+VECTOR_ENCODINGS = ('json', 'float32', 'float16')
+
+
+def _numpy_default(value):
+    """NumPy scalars and arrays for encoders that do not handle them"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.floating):
+        # Shortest repr of the float32 value, not its widened float64 digits
+        return float(str(value))
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """JSON bytes of a payload that may hold NumPy arrays and scalars (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_numpy_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_numpy_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200, vector=None):
+    """
+    Response for a JSON payload, like jsonify without converting NumPy values first
+
+    Result similarities (np.float32) and embeddings (np.ndarray) can be put
+    in the payload as they are. The payload, and the embedding `vector` of
+    embedding endpoints, stay on the response so content negotiation can
+    re-encode them as msgpack or raw float32 without parsing the JSON.
+    """
+    response = Response(dumps(payload), status=status, mimetype='application/json')
+    response.payload = payload
+    response.vector = vector
+    return response
+
+
+class NumpyJSONEncoder(JSONEncoder):
+    """app.json_encoder: lets jsonify serialize NumPy values too"""
+
+    def default(self, o):
+        if isinstance(o, (np.ndarray, np.generic)):
+            return _numpy_default(o)
+        return super().default(o)
+
+
+def encode_vector(vector, encoding='json'):
+    """
+    An embedding in one of VECTOR_ENCODINGS
+
+    'json' returns the vector unchanged (lists stay lists, arrays are
+    serialized by dumps); the binary encodings return a small dict with the
+    base64 payload.
+    """
+    if vector is None or encoding == 'json':
+        return vector
+    array = np.asarray(vector, dtype='<f4' if encoding == 'float32' else '<f2')
+    return {'encoding': encoding, 'dimension': int(array.shape[-1]),
+            'data': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def decode_vector(value):
+    """float32 array from a list or an encode_vector dict"""
+    if isinstance(value, dict):
+        dtype = '<f4' if value.get('encoding') == 'float32' else '<f2'
+        return np.frombuffer(base64.b64decode(value['data']), dtype=dtype).astype(np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def get_vector_encoding(request, default='json'):
+    """?vector_encoding= (query string, form data or JSON body); ValueError if unknown"""
+    from app.utils.helpers import get_request_param
+    encoding = get_request_param(request, 'vector_encoding') or request.args.get('vector_encoding') or default
+    if encoding not in VECTOR_ENCODINGS:
+        raise ValueError(f"vector_encoding must be one of {', '.join(VECTOR_ENCODINGS)}")
+    return encoding
@@ -0,0 +1,250 @@
+import os
+import copy
+import time
+import pickle
+import hashlib
+import inspect
+import logging
+import functools
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; cross-process mode is then off
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'True') == 'True'
+# Directory for the cross-process mode (lock + result files); unset keeps
+# coalescing within each worker process
+SINGLE_FLIGHT_DIR = os.environ.get('SINGLE_FLIGHT_DIR')
+# How long a follower waits for the leader before calling the provider itself
+SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 60))
+# How long a cross-process result stays readable by followers
+SINGLE_FLIGHT_RESULT_TTL = float(os.environ.get('SINGLE_FLIGHT_RESULT_TTL', 5))
+
+
+def _file_digest(path, digest):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+
+def flight_key(provider, model, arguments, file_args=()):
+    """
+    sha256 over provider, model and the call's content
+
+    Arguments named in `file_args` that point at an existing file are hashed
+    by file content, so the same upload saved under different names still
+    coalesces. Bytes, numpy arrays and PIL images are hashed by their data.
+    """
+    digest = hashlib.sha256(f"{provider}\x00{model}\x00".encode('utf-8'))
+    for name, value in sorted(arguments.items()):
+        digest.update(name.encode('utf-8') + b'=')
+        if value is None:
+            digest.update(b'None')
+        elif name in file_args and isinstance(value, str) and os.path.isfile(value):
+            _file_digest(value, digest)
+        elif isinstance(value, bytes):
+            digest.update(value)
+        elif hasattr(value, 'tobytes'):
+            digest.update(getattr(value, 'mode', '').encode('utf-8') + str(getattr(value, 'size', '')).encode('utf-8'))
+            digest.update(value.tobytes())
+        else:
+            digest.update(repr(value).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class _Flight:
+    """One in-flight call that followers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one
+
+    The first caller for a key (the leader) makes the call; callers arriving
+    while it is in flight wait and receive a copy of the same result, or
+    the same exception. With SINGLE_FLIGHT_DIR set, the leader additionally
+    holds an fcntl lock on a per-key file and publishes its result there, so
+    identical calls in other worker processes on the host wait for it too.
+    """
+
+    def __init__(self, lock_dir=None, timeout=60.0, result_ttl=5.0):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if lock_dir and fcntl is None:
+            logger.warning("fcntl unavailable; single-flight coalescing is per process only")
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._leaders_since_prune = 0
+        self.stats = {}
+
+    def _count(self, provider, outcome):
+        with self._lock:
+            provider_stats = self.stats.setdefault(provider, {'leader': 0, 'coalesced': 0, 'coalesced_cross_process': 0, 'timed_out': 0})
+            provider_stats[outcome] += 1
+
+    def snapshot(self):
+        """Per-provider outcome counts, copied under the lock so they can be serialized safely"""
+        with self._lock:
+            providers = copy.deepcopy(self.stats)
+        return {'cross_process': bool(self.lock_dir), 'providers': providers}
+
+    def do(self, provider, key, fn):
+        """Run fn() once for all concurrent callers with the same key"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            if not flight.done.wait(self.timeout):
+                self._count(provider, 'timed_out')
+                logger.warning(f"Single-flight wait for {provider} timed out after {self.timeout}s; calling directly")
+                return fn()
+            self._count(provider, 'coalesced')
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            if self.lock_dir:
+                flight.result = self._do_cross_process(provider, key, fn)
+            else:
+                self._count(provider, 'leader')
+                flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _read_result(self, result_path):
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.result_ttl:
+                return False, None
+            with open(result_path, 'rb') as f:
+                return True, pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+
+    def _do_cross_process(self, provider, key, fn):
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        result_path = os.path.join(self.lock_dir, f"{key}.result")
+
+        with open(lock_path, 'a+b') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is the leader: wait for its lock, then read its result
+                deadline = time.monotonic() + self.timeout
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() > deadline:
+                            self._count(provider, 'timed_out')
+                            return fn()
+                        time.sleep(0.01)
+                found, result = self._read_result(result_path)
+                if found:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    self._count(provider, 'coalesced_cross_process')
+                    return result
+                # Leader failed or its result expired: this process makes the call
+
+            try:
+                self._count(provider, 'leader')
+                result = fn()
+                try:
+                    temp_path = f"{result_path}.{os.getpid()}.tmp"
+                    with open(temp_path, 'wb') as f:
+                        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(temp_path, result_path)
+                except Exception as e:
+                    logger.warning(f"Could not publish single-flight result for {provider}: {str(e)}")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        # Lock/result files are one per distinct call; sweep old ones now and then
+        self._leaders_since_prune += 1
+        if self._leaders_since_prune >= 256:
+            self._leaders_since_prune = 0
+            self.prune()
+        return result
+
+    def prune(self, max_age=None):
+        """Delete lock/result files older than max_age seconds (default: well past any wait or result TTL)"""
+        if not self.lock_dir:
+            return 0
+        if max_age is None:
+            max_age = max(self.result_ttl * 10, self.timeout * 2)
+        cutoff = time.time() - max_age
+        removed = 0
+        for entry in os.scandir(self.lock_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Process-wide SingleFlight (SINGLE_FLIGHT_DIR / _TIMEOUT / _RESULT_TTL)"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(SINGLE_FLIGHT_DIR, SINGLE_FLIGHT_TIMEOUT, SINGLE_FLIGHT_RESULT_TTL)
+    return _single_flight
+
+
+def single_flight(provider, model, file_args=()):
+    """
+    Coalesce concurrent identical calls to a provider function
+
+    The key is provider + model + a content hash of the call's arguments
+    (`self` excluded; arguments in `file_args` hashed by file content).
+    Place it above @circuit_breaker so followers never touch the breaker.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not SINGLE_FLIGHT_ENABLED:
+                return fn(*args, **kwargs)
+            try:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = {name: value for name, value in bound.arguments.items() if name != 'self'}
+                key = flight_key(provider, model, arguments, file_args)
+            except Exception as e:
+                logger.debug("Single-flight key failed for %s, calling directly: %s", fn.__name__, e)
+                return fn(*args, **kwargs)
+            return get_single_flight().do(provider, key, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,31 @@
+import os
+import sqlite3
+import threading
+
+
+class LocalConnections:
+    """
+    Connections to one SQLite file, one per thread and per process
+
+    sqlite3 connections must not be shared between threads or cross a fork,
+    so each thread opens its own, and opens it again in a forked worker.
+    Connections autocommit (isolation_level=None) in WAL mode; callers wrap
+    multi-statement writes in BEGIN IMMEDIATE ... COMMIT so concurrent
+    processes serialize on the database lock.
+    """
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def get(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
@@ -1,55 +1,17 @@
-import os
-import pickle
-import json
 import logging
-import numpy as np
 from flask import Blueprint, request
 from app.services.azure_service import AzureService
-from app.utils.helpers import save_uploaded_file, get_file_url, create_cors_response
-from app.utils.s3_helper import upload_file_to_s3
+from app.services.corpus_service import get_corpus
+from app.services.metadata_index import FilterError, filter_mask, parse_filters
+from app.services.dedup_service import get_cluster_ids
+from app.utils.helpers import save_uploaded_file, get_file_url, create_cors_response, get_flag_param, get_request_param
+from app.utils.serialization import json_response
+from app.services.async_providers import gather_named, azure_vectorize_text, azure_upload_and_vectorize_image
 
 logger = logging.getLogger(__name__)
 azure_bp = Blueprint('azure', __name__)
 azure_service = AzureService()
 
-# Define possible file paths for embeddings
-embeddings_paths = [
-    os.environ.get("AZURE_EMBEDDINGS_FILE", "static/json/azure_embeddings_s3_images.pkl"),
-    os.path.join('static', 'json', 'azure_embeddings_s3_images.pkl'),
-    os.path.join(os.getcwd(), 'static', 'json', 'azure_embeddings_s3_images.pkl'),
-    os.path.join('static', 'json', 'azure_embeddings_s3_images.pkl'),
-    os.path.join(os.getcwd(), 'static', 'json', 'azure_embeddings_s3_images.pkl'),
-]
-
-# Try to find and load the embeddings file
-precomputed_data = None
-for path in embeddings_paths:
-    try:
-        if os.path.exists(path):
-            logger.info(f"Found embeddings file at: {path}")
-            
-            # Load based on file extension
-            if path.endswith('.pkl'):
-                with open(path, 'rb') as f:
-                    precomputed_data = pickle.load(f)
-            elif path.endswith('.json'):
-                with open(path, 'r') as f:
-                    precomputed_data = json.load(f)
-            
-            # Verify the data structure
-            if precomputed_data and 'embeddings' in precomputed_data and 'image_urls' in precomputed_data:
-                logger.info(f"Successfully loaded embeddings for {len(precomputed_data['image_urls'])} images")
-                break
-            else:
-                logger.warning(f"File {path} doesn't have the expected structure")
-                precomputed_data = None
-    except Exception as e:
-        logger.error(f"Error loading embeddings from {path}: {str(e)}")
-        precomputed_data = None
-
-if precomputed_data is None:
-    logger.error(f"Failed to load embeddings from any of the attempted paths: {embeddings_paths}")
-
 @azure_bp.route('/process', methods=['POST', 'OPTIONS'])
 def process_image():
     """Process an image with Azure Vision API"""
@@ -79,53 +41,49 @@ def process_image():
             return create_cors_response({"error": "Failed to generate image embedding"}, 500)
             
         # Return the embedding
-        return create_cors_response({
+        # JSON shows a truncated embedding; Accept: application/octet-stream gets all of it
+        return create_cors_response(json_response({
             "success": True,
             "image_url": image_url,
             "embedding_size": len(image_embedding),
             "embedding": image_embedding[:10] + ["..."]  # Return truncated embedding for display
-        })
+        }, vector=image_embedding))
         
     except Exception as e:
         logger.exception(f"Error processing image with Azure: {str(e)}")
         return create_cors_response({"error": str(e)}, 500)
 
 @azure_bp.route('/search', methods=['POST', 'OPTIONS'])
-def search_images():
+async def search_images():
     """Search for similar images using Azure Vision API"""
     if request.method == 'OPTIONS':
         return create_cors_response()
         
     try:
-        if not precomputed_data:
+        corpus = get_corpus('azure')
+        if corpus is None:
             logger.error("Precomputed embeddings not available")
             return create_cors_response({"error": "Precomputed embeddings not available"}, 500)
             
+        # Metadata filters (e.g. an S3 prefix) are resolved before any provider call
+        try:
+            mask = filter_mask(corpus, parse_filters(get_request_param(request, 'filters')))
+        except FilterError as e:
+            return create_cors_response({"error": str(e)}, 400)
+        cluster_ids = get_cluster_ids(corpus) if get_flag_param(request, 'collapse_duplicates') else None
+            
         # Get parameters from form data or JSON
         image_url = None
         image_embedding = None
         
         # Check if we have form data with an image
+        file_path = None
         if 'image' in request.files and request.files['image'].filename:
             image_file = request.files['image']
             logger.info(f"Received image file: {image_file.filename}")
             
-            # Save the file locally first
+            # Save the file locally first; the S3 upload runs below alongside the text embedding
             file_path = save_uploaded_file(image_file)
-            
-            # Upload to S3 to get a publicly accessible URL
-            s3_url = upload_file_to_s3(file_path)
-            
-            if s3_url:
-                image_url = s3_url
-                logger.info(f"Image uploaded to S3: {image_url}")
-                
-                # Get image embedding using the S3 URL
-                image_embedding = azure_service.vectorize_image(image_url)
-                if image_embedding is None:
-                    logger.warning("Failed to generate image embedding from S3 URL")
-            else:
-                logger.error("Failed to upload image to S3")
         
         # Get text from form data or JSON
         query_text = ''
@@ -155,18 +113,40 @@ def search_images():
         
         logger.info(f"Search parameters: text='{query_text}', top_k={top_k}, image_weight={image_weight}, text_weight={text_weight}")
         
-        if not image_url and not query_text:
+        if not file_path and not query_text:
             logger.error("Neither image nor query text provided")
             return create_cors_response({"error": "Please provide either an image or query text"}, 400)
             
-        # Get text embedding if we have query text
-        text_embedding = None
+        # Upload + vectorize the image and vectorize the text concurrently
         if query_text:
             logger.info(f"Generating embedding for text: {query_text}")
-            text_embedding = azure_service.vectorize_text(query_text)
+        embeddings = await gather_named(
+            image=azure_upload_and_vectorize_image(azure_service, file_path) if file_path else None,
+            text=azure_vectorize_text(azure_service, query_text) if query_text else None,
+        )
+        
+        if 'image' in embeddings:
+            if isinstance(embeddings['image'], Exception):
+                logger.error(f"Error vectorizing query image: {str(embeddings['image'])}")
+            else:
+                image_url, image_embedding = embeddings['image']
+                if image_url and image_embedding is None:
+                    logger.warning("Failed to generate image embedding from S3 URL")
+        
+        text_embedding = None
+        if 'text' in embeddings:
+            if isinstance(embeddings['text'], Exception):
+                logger.error(f"Error vectorizing query text: {str(embeddings['text'])}")
+            else:
+                text_embedding = embeddings['text']
             if text_embedding is None:
                 logger.warning("Failed to generate text embedding")
                 
+        if not image_url and not query_text:
+            logger.error("Neither image nor query text provided")
+            return create_cors_response({"error": "Please provide either an image or query text"}, 400)
+            
+
         if image_embedding is None and text_embedding is None:
             logger.error("Failed to generate both image and text embeddings")
             return create_cors_response({"error": "Failed to generate embeddings"}, 500)
@@ -179,16 +159,14 @@ def search_images():
             text_weight
         )
         
-        # Convert precomputed embeddings to numpy arrays
-        reference_embeddings = [np.array(emb) for emb in precomputed_data['embeddings']]
-        reference_urls = precomputed_data['image_urls']
-        
-        # Find similar images
+        # Find similar images against the cached, normalized corpus
         result_urls, similarities = azure_service.find_similar_images(
             combined_embedding,
-            reference_embeddings,
-            reference_urls,
-            top_k
+            corpus.matrix,
+            corpus.paths,
+            top_k,
+            mask,
+            cluster_ids
         )
         
         # Format results for frontend
@@ -197,11 +175,11 @@ def search_images():
             similar_images.append({
                 "rank": i + 1,
                 "url": url,
-                "similarity": float(similarity)
+                "similarity": similarity
             })
             
         # Create response in the format expected by frontend
-        return create_cors_response({
+        return create_cors_response(json_response({
             "success": True,
             "message": f"Found {len(similar_images)} similar images using Azure Vision API",
             "similar_images": similar_images,
@@ -211,7 +189,7 @@ def search_images():
                 "image_weight": image_weight,
                 "text_weight": text_weight
             }
-        })
+        }))
         
     except Exception as e:
         logger.exception(f"Error searching images with Azure: {str(e)}")
@@ -239,12 +217,13 @@ def vectorize_text():
             logger.error("Failed to generate text embedding")
             return create_cors_response({"error": "Failed to generate text embedding"}, 500)
             
-        return create_cors_response({
+        # JSON shows a truncated embedding; Accept: application/octet-stream gets all of it
+        return create_cors_response(json_response({
             "success": True,
             "text": text,
             "embedding_size": len(embedding),
             "embedding": embedding[:10] + ["..."]  # Return truncated embedding for display
-        })
+        }, vector=embedding))
         
     except Exception as e:
         logger.exception(f"Error vectorizing text with Azure: {str(e)}")
@@ -1,12 +1,22 @@
 import os
 import json
-import numpy as np
+import logging
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
-from app.services.cohere_service import get_cohere_embedding, search_images, get_text_embedding, cosine_similarity
-from app.utils.helpers import allowed_file, create_cors_response, handle_options_request
-from PIL import Image
+from app.services.cohere_service import get_cohere_embedding, search_images, cosine_similarity, describe_image
+from app.utils.helpers import allowed_file, create_cors_response, handle_options_request, get_flag_param, get_request_param
+from app.utils.serialization import json_response
+from app.utils.logging_utils import debug_fields
+from app.services.corpus_service import CORPUS_PATHS, get_corpus
+from app.services.vector_search import weight_sweep, parse_weights
+from app.services.metadata_index import FilterError, filter_mask, parse_filters
+from app.services.dedup_service import get_cluster_ids
+from app.services.result_cursor import CursorExpired, paged_search, resume_search, parse_page_size
+from app.services.thumbnail_service import thumbnail_url
+from app.services.image_index import image_available
+from app.services.async_providers import gather_named, usable_results, cohere_text_embedding, cohere_image_embedding
 
+logger = logging.getLogger(__name__)
 cohere_bp = Blueprint('cohere', __name__)
 
 @cohere_bp.route('/api/cohere/embed', methods=['POST'])
@@ -57,7 +67,7 @@ def embed_image():
     return jsonify({'error': 'File type not allowed'}), 400
 
 @cohere_bp.route('/api/cohere/search', methods=['POST', 'OPTIONS'])
-def search():
+async def search():
     """Search for similar images using Cohere embeddings from a static JSON file."""
     # Handle preflight OPTIONS request
     if request.method == 'OPTIONS':
@@ -66,21 +76,27 @@ def search():
     query = None
     query_image_path = None
     image_weight = 0.5  # Default weight for image similarity
+    image_weights = None  # Optional sweep over several image weights
     
-    print(f"Request content type: {request.content_type}")
-    print(f"Request form: {request.form}")
-    print(f"Request files: {request.files}")
+    debug_fields(logger, "cohere_search_request",
+                 content_type=request.content_type,
+                 form_keys=lambda: list(request.form.keys()),
+                 files=lambda: list(request.files.keys()))
+    
+    # A cursor pages an earlier search: an image sent along with it is not saved
+    page_size = parse_page_size(get_request_param(request, 'page_size'))
+    cursor = get_request_param(request, 'cursor')
     
     # Check if the request contains form data or JSON
     if request.content_type and 'multipart/form-data' in request.content_type:
         # Handle form data
         query = request.form.get('text')
         query_image = request.files.get('image')
+        image_weights = request.form.get('image_weights')
         
         # If an image was uploaded, save it temporarily
-        if query_image and query_image.filename:
-            # Print image details for debugging
-            print(f"Received image: {query_image.filename}, content_type: {query_image.content_type}")
+        if query_image and query_image.filename and not cursor:
+            logger.info(f"Received image: {query_image.filename}")
             
             # Ensure the upload folder exists
             upload_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'temp')
@@ -91,181 +107,112 @@ def search():
             query_image_path = os.path.join(upload_folder, filename)
             query_image.save(query_image_path)
             
-            print(f"Saved image to: {query_image_path}")
-            
-            # Verify the saved file
-            try:
-                with Image.open(query_image_path) as img:
-                    print(f"Saved image details: format={img.format}, mode={img.mode}, size={img.size}")
-            except Exception as e:
-                print(f"Error verifying saved image: {str(e)}")
+            # Image details are only read back from disk when debug logging is on
+            debug_fields(logger, "cohere_saved_image", path=query_image_path,
+                         details=lambda: describe_image(query_image_path))
     else:
         # Handle JSON data
         data = request.json
         if data:
             query = data.get('query')
             query_image_path = data.get('query_image_path')
+            image_weights = data.get('image_weights')
     
-    # Ensure at least one of text or image is provided
-    if not query and not query_image_path:
+    # Ensure at least one of text or image (or a cursor) is provided
+    if not query and not query_image_path and not cursor:
         return jsonify({'error': 'No query text or image provided'}), 400
     
-    # Load pre-computed embeddings from static JSON file
-    embeddings_file = os.path.join(current_app.root_path, 'static', 'json', 'cohere_embeddings_selected_images.json')
-    
-    # Try alternative paths
-    alt_path1 = os.path.join('static', 'json', 'cohere_embeddings_selected_images.json')
-    alt_path2 = os.path.join(os.getcwd(), 'static', 'json', 'cohere_embeddings_selected_images.json')
-    alt_path3 = os.path.join(os.getcwd(), 'app', 'static', 'json', 'cohere_embeddings_selected_images.json')
+    # Pre-computed embeddings (cached across requests, reloaded when the file changes)
+    corpus = get_corpus('cohere')
+    if corpus is None:
+        return jsonify({'error': f"Embeddings file not found. Tried: {', '.join(CORPUS_PATHS['cohere'])}"}), 404
     
-    # Try to find the file in multiple locations
-    if os.path.exists(embeddings_file):
-        embeddings_path = embeddings_file
-    elif os.path.exists(alt_path1):
-        embeddings_path = alt_path1
-    elif os.path.exists(alt_path2):
-        embeddings_path = alt_path2
-    elif os.path.exists(alt_path3):
-        embeddings_path = alt_path3
-    else:
-        return jsonify({'error': f'Embeddings file not found. Tried: {embeddings_file}, {alt_path1}, {alt_path2}, {alt_path3}'}), 404
+    # Later pages resume the cached ranking: no embedding call, no corpus rescan
+    if cursor:
+        try:
+            _, indices, scores, _, next_cursor = resume_search(cursor, page_size, corpus)
+        except CursorExpired as e:
+            return jsonify({'error': str(e)}), 410
+        formatted_images = [{'url': corpus.paths[idx],
+                             'thumbnail_url': thumbnail_url(corpus.paths[idx]),
+                             'image_available': image_available(corpus.paths[idx]),
+                             'similarity': score}
+                            for idx, score in zip(indices, scores)]
+        return create_cors_response(json_response({
+            'success': True,
+            'formatted_images': formatted_images,
+            'similar_images': formatted_images,
+            'next_cursor': next_cursor
+        }))
     
     try:
-        with open(embeddings_path, 'r') as f:
-            stored_data = json.load(f)
-        
-        # Print structure for debugging
-        print(f"JSON structure: {type(stored_data)}")
-        if isinstance(stored_data, dict):
-            print(f"Keys: {stored_data.keys()}")
-        
-        # Generate text embedding for the query if text is provided
-        query_text_embedding = None
-        if query:
-            query_text_embedding = get_text_embedding(query)
-            print(f"Query text embedding shape: {np.array(query_text_embedding).shape}")
-        
-        # Generate image embedding for the query if image path is provided
-        query_image_embedding = None
-        if query_image_path and os.path.exists(query_image_path):
-            query_image_embedding = get_cohere_embedding(query_image_path)
-            print(f"Query image embedding shape: {np.array(query_image_embedding).shape}")
-        
-        # Compute similarities
-        results = []
-        
-        # Handle different JSON structures
-        embeddings = []
-        image_paths = []
-        
-        if isinstance(stored_data, dict) and 'embeddings' in stored_data and 'image_paths' in stored_data:
-            # Format: {"embeddings": [...], "image_paths": [...]}
-            embeddings = stored_data['embeddings']
-            image_paths = stored_data['image_paths']
-        elif isinstance(stored_data, list):
-            # Format: [{"embedding": [...], "image_path": "..."}, ...]
-            for item in stored_data:
-                if isinstance(item, dict) and 'embedding' in item and 'image_path' in item:
-                    embeddings.append(item['embedding'])
-                    image_paths.append(item['image_path'])
-        
-        if not embeddings or len(embeddings) == 0:
-            return jsonify({'error': 'No embeddings found in the file'}), 404
-        
-        print(f"First embedding shape: {np.array(embeddings[0]).shape}")
-        
-        for idx, embedding_item in enumerate(embeddings):
-            if idx >= len(image_paths):
-                break
-                
-            img_path = image_paths[idx]
-            
-            # Initialize similarities
-            text_similarity = 0.0
-            image_similarity = 0.0
-            combined_similarity = 0.0
-            
-            # Ensure embeddings are numpy arrays with the same shape
-            embedding_array = np.array(embedding_item, dtype=np.float32)
-            
-            # Compute text similarity if text query is provided
-            if query_text_embedding is not None:
-                query_text_array = np.array(query_text_embedding, dtype=np.float32)
-                
-                # Ensure dimensions match
-                if embedding_array.shape != query_text_array.shape:
-                    print(f"Warning: Shape mismatch - embedding: {embedding_array.shape}, query: {query_text_array.shape}")
-                    # Try to reshape if possible
-                    if embedding_array.size == query_text_array.size:
-                        embedding_array = embedding_array.reshape(query_text_array.shape)
-                
-                try:
-                    text_similarity = float(np.dot(query_text_array, embedding_array) / 
-                                          (np.linalg.norm(query_text_array) * np.linalg.norm(embedding_array)))
-                except Exception as e:
-                    print(f"Error computing text similarity: {e}")
-                    text_similarity = 0.0
-                
-                # If only text query, use text similarity as combined similarity
-                if query_image_embedding is None:
-                    combined_similarity = text_similarity
-            
-            # Compute image similarity if image query is provided
-            if query_image_embedding is not None:
-                query_image_array = np.array(query_image_embedding, dtype=np.float32)
-                
-                # Ensure dimensions match
-                if embedding_array.shape != query_image_array.shape:
-                    print(f"Warning: Shape mismatch - embedding: {embedding_array.shape}, query: {query_image_array.shape}")
-                    # Try to reshape if possible
-                    if embedding_array.size == query_image_array.size:
-                        embedding_array = embedding_array.reshape(query_image_array.shape)
-                
-                try:
-                    image_similarity = float(np.dot(query_image_array, embedding_array) / 
-                                           (np.linalg.norm(query_image_array) * np.linalg.norm(embedding_array)))
-                except Exception as e:
-                    print(f"Error computing image similarity: {e}")
-                    image_similarity = 0.0
-                
-                # If only image query, use image similarity as combined similarity
-                if query_text_embedding is None:
-                    combined_similarity = image_similarity
-            
-            # If both text and image queries are provided, compute weighted combination
-            if query_text_embedding is not None and query_image_embedding is not None:
-                combined_similarity = (image_weight * image_similarity) + ((1 - image_weight) * text_similarity)
-            
-            results.append({
-                'image_path': img_path,
-                'similarity': float(combined_similarity),
-                'image_similarity': float(image_similarity) if query_image_embedding is not None else None,
-                'text_similarity': float(text_similarity) if query_text_embedding is not None else None
-            })
-        
-        # Sort by combined similarity (descending) and get top 10
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        top_results = results[:10]
+        try:
+            image_weights = parse_weights(image_weights)
+        except ValueError as e:
+            return jsonify({'error': f"Invalid image_weights: {str(e)}"}), 400
         
-        # Format the response to match what the frontend expects
-        formatted_images = []
-        for result in top_results:
-            formatted_images.append({
-                'url': result['image_path'],
-                'similarity': result['similarity']
-            })
+        # Metadata filters become a row mask applied while scoring
+        try:
+            mask = filter_mask(corpus, parse_filters(get_request_param(request, 'filters')))
+        except FilterError as e:
+            return jsonify({'error': str(e)}), 400
+        # Only the best image of each near-duplicate cluster, if requested
+        cluster_ids = get_cluster_ids(corpus) if get_flag_param(request, 'collapse_duplicates') else None
+        
+        debug_fields(logger, "cohere_corpus", rows=len(corpus), dimension=corpus.dimension)
+        
+        # Generate the text and image query embeddings concurrently
+        # (a failed one is left out unless it was the only query, see usable_results)
+        query_embeddings = usable_results(await gather_named(
+            text=cohere_text_embedding(query) if query else None,
+            image=cohere_image_embedding(query_image_path) if query_image_path and os.path.exists(query_image_path) else None,
+        ))
+        
+        query_text_embedding = query_embeddings.get('text')
+        if query_text_embedding is not None:
+            debug_fields(logger, "cohere_text_embedding", length=lambda: len(query_text_embedding))
+        
+        query_image_embedding = query_embeddings.get('image')
+        if query_image_embedding is not None:
+            debug_fields(logger, "cohere_image_embedding", length=lambda: len(query_image_embedding))
+        
+        def format_images(indices, scores):
+            # Format the response to match what the frontend expects
+            return [{
+                'url': corpus.paths[idx],
+                'thumbnail_url': thumbnail_url(corpus.paths[idx]),
+                'image_available': image_available(corpus.paths[idx]),
+                'similarity': score
+            } for idx, score in zip(indices, scores)]
+        
+        # Weight sweep: rankings for several image weights from one corpus pass
+        if image_weights and query_text_embedding is not None and query_image_embedding is not None:
+            sweep = [{
+                'image_weight': weight,
+                'formatted_images': format_images(indices, scores)
+            } for weight, indices, scores, _, _ in weight_sweep(
+                corpus, query_text_embedding, query_image_embedding, image_weights, page_size, mask, cluster_ids)]
+            return create_cors_response(json_response({'success': True, 'sweep': sweep}))
+        
+        # Blend the queries first so the corpus is scored in a single pass; the
+        # ranking is cached so next_cursor pages need neither embeddings nor a rescan
+        indices, scores, _, next_cursor = paged_search(corpus, {
+            'text': (query_text_embedding, 1 - image_weight if query_image_embedding is not None else 1.0),
+            'image': (query_image_embedding, image_weight if query_text_embedding is not None else 1.0),
+        }, page_size, mask, cluster_ids)
+        formatted_images = format_images(indices, scores)
         
         result = {
             'success': True,
             'formatted_images': formatted_images,
-            'similar_images': formatted_images
+            'similar_images': formatted_images,
+            'next_cursor': next_cursor
         }
         
-        return create_cors_response(result)
+        return create_cors_response(json_response(result))
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Error in Cohere search: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
     finally:
         # Clean up temporary image file if it was created
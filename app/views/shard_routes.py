@@ -0,0 +1,54 @@
+import logging
+from flask import Blueprint, request, jsonify
+from app.services.corpus_service import get_corpus
+from app.services.shard_service import SHARD_INDEX, SHARD_COUNT, shard_bounds, decode_mask, search_partition
+from app.utils.serialization import json_response, decode_vector
+
+logger = logging.getLogger(__name__)
+
+# Shard server protocol (see create_shard_app and scripts/shard_server.py):
+# the coordinator posts a normalized query and gets this partition's top-k
+shard_bp = Blueprint('shard', __name__, url_prefix='/shard')
+
+
+@shard_bp.route('/<corpus_name>', methods=['GET'])
+def shard_info(corpus_name):
+    """Partition of a corpus served here"""
+    corpus = get_corpus(corpus_name)
+    if corpus is None:
+        return jsonify({'error': f"Corpus not available: {corpus_name}"}), 404
+    start, stop = shard_bounds(len(corpus), SHARD_COUNT, SHARD_INDEX)
+    return jsonify({'corpus': corpus_name, 'index': SHARD_INDEX, 'count': SHARD_COUNT, 'rows': len(corpus),
+                    'start': start, 'stop': stop, 'dimension': corpus.dimension, 'source_mtime': corpus.mtime})
+
+
+@shard_bp.route('/<corpus_name>/search', methods=['POST'])
+def shard_search(corpus_name):
+    """
+    Top-k of this partition
+
+    Body: {"query": <list, or serialization.encode_vector dict>, "top_k": 10,
+    "rows": <corpus rows the coordinator sees>, "mask": <optional base64
+    packed bits of this partition's rows>}
+    """
+    corpus = get_corpus(corpus_name)
+    if corpus is None:
+        return jsonify({'error': f"Corpus not available: {corpus_name}"}), 404
+    data = request.get_json(silent=True) or {}
+    if data.get('rows') != len(corpus):
+        # Coordinator and shard loaded different versions of the corpus
+        return jsonify({'error': f"Corpus has {len(corpus)} rows, coordinator expects {data.get('rows')}"}), 409
+    try:
+        query = decode_vector(data['query'])
+        top_k = int(data.get('top_k', 10))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'query (vector) and top_k are required'}), 400
+    if query.shape != (corpus.dimension,):
+        return jsonify({'error': f"Query has shape {query.shape}, corpus dimension is {corpus.dimension}"}), 400
+
+    mask = None
+    if data.get('mask') is not None:
+        start, stop = shard_bounds(len(corpus), SHARD_COUNT, SHARD_INDEX)
+        mask = decode_mask(data['mask'], stop - start)
+    scores, rows = search_partition(corpus, query, top_k, mask)
+    return json_response({'scores': scores, 'rows': rows})
@@ -0,0 +1,57 @@
+import os
+import logging
+from flask import Blueprint, request, jsonify
+from app.services.corpus_service import CORPUS_PATHS
+from app.services.neighbor_graph import get_neighbor_graph
+from app.services.image_index import image_available, is_local_path
+from app.services.thumbnail_service import thumbnail_url
+from app.services.similarity_service import get_image_url
+from app.utils.helpers import create_cors_response
+from app.utils.serialization import json_response
+
+logger = logging.getLogger(__name__)
+
+# "More like this" for items already in a corpus, answered from the
+# precomputed neighbour graph (scripts/build_neighbor_graph.py)
+similar_bp = Blueprint('similar', __name__, url_prefix='/similar')
+
+
+@similar_bp.route('/<path:image_id>', methods=['GET', 'OPTIONS'])
+def similar(image_id):
+    """Nearest neighbours of a corpus item by key, path or file name (?provider=titan&k=10)"""
+    if request.method == 'OPTIONS':
+        return create_cors_response()
+
+    provider = request.args.get('provider', 'titan')
+    if provider not in CORPUS_PATHS:
+        return create_cors_response(jsonify({'error': f"Unknown provider: {provider}"}), 400)
+    try:
+        k = max(1, int(request.args.get('k', 10)))
+    except ValueError:
+        return create_cors_response(jsonify({'error': 'k must be an integer'}), 400)
+
+    graph = get_neighbor_graph(provider)
+    if graph is None:
+        return create_cors_response(jsonify({'error': f"No neighbour graph built for {provider}"}), 404)
+    row = graph.find(image_id)
+    if row is None:
+        return create_cors_response(jsonify({'error': f"Image not in the {provider} corpus: {image_id}"}), 404)
+
+    keys, paths, scores = graph.neighbors(row, k)
+    similar_images = [{
+        'id': key,
+        'file_path': path,
+        'image_url': get_image_url(path) if is_local_path(path) else path,
+        'thumbnail_url': thumbnail_url(path),
+        'image_available': image_available(path),
+        'filename': os.path.basename(path),
+        'similarity': score
+    } for key, path, score in zip(keys, paths, scores)]
+
+    return create_cors_response(json_response({
+        'success': True,
+        'provider': provider,
+        'id': graph.keys[row],
+        'similar_images': similar_images,
+        'k_max': graph.k
+    }))
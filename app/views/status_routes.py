@@ -0,0 +1,64 @@
+from flask import Blueprint, request, jsonify
+from app.utils.helpers import create_cors_response
+from app.utils.rate_limiter import get_rate_limiter
+from app.utils.circuit_breaker import breaker_states
+from app.utils.single_flight import get_single_flight
+from app.services.image_index import get_image_index
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Operational metrics for the provider clients (per worker process)
+status_bp = Blueprint('status', __name__, url_prefix='/status')
+
+@status_bp.route('/rate-limits', methods=['GET', 'OPTIONS'])
+def rate_limits():
+    """Client-side rate limiter configuration, queue depth and wait times"""
+    if request.method == 'OPTIONS':
+        return create_cors_response()
+    return create_cors_response(jsonify(get_rate_limiter().snapshot()))
+
+@status_bp.route('/circuit-breakers', methods=['GET', 'OPTIONS'])
+def circuit_breakers():
+    """State of each provider's circuit breaker (closed/open/half_open) and call counts"""
+    if request.method == 'OPTIONS':
+        return create_cors_response()
+    return create_cors_response(jsonify(breaker_states()))
+
+@status_bp.route('/single-flight', methods=['GET', 'OPTIONS'])
+def single_flight_stats():
+    """How many provider calls were made (leader) versus shared with an identical in-flight call"""
+    if request.method == 'OPTIONS':
+        return create_cors_response()
+    return create_cors_response(jsonify(get_single_flight().snapshot()))
+
+@status_bp.route('/image-index', methods=['GET', 'OPTIONS'])
+def image_index():
+    """Size, generation and watcher of the image-availability index"""
+    if request.method == 'OPTIONS':
+        return create_cors_response()
+    return create_cors_response(jsonify(get_image_index().snapshot()))
+
+@status_bp.route('/phash-index', methods=['GET', 'OPTIONS'])
+def phash_index():
+    """Size of the perceptual hash index and how many query images it answered"""
+    if request.method == 'OPTIONS':
+        return create_cors_response()
+    from app.services import phash_index as index
+    return create_cors_response(jsonify(index.snapshot()))
+
+@status_bp.route('/corpora', methods=['GET', 'OPTIONS'])
+def corpora():
+    """Corpora loaded in this worker and whether they are private, memory-mapped or shared"""
+    if request.method == 'OPTIONS':
+        return create_cors_response()
+    from app.services.corpus_service import corpora_snapshot
+    return create_cors_response(jsonify(corpora_snapshot()))
+
+@status_bp.route('/shards', methods=['GET', 'OPTIONS'])
+def shards():
+    """Shard endpoints per corpus and scatter-gather failures, partial results and fallbacks"""
+    if request.method == 'OPTIONS':
+        return create_cors_response()
+    from app.services import shard_service
+    return create_cors_response(jsonify(shard_service.snapshot()))
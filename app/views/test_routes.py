@@ -30,110 +30,44 @@ def test_images():
 
 @test_bp.route('/check-images')
 def check_images():
-    """Check where images are located in the static folder"""
-    static_folder = app.static_folder
-    
-    # Check various possible image directories
-    image_dirs = [
-        'images',
-        'selected_images',
-        '.'  # Root of static folder
-    ]
-    
-    results = {}
-    
-    for dir_name in image_dirs:
-        dir_path = os.path.join(static_folder, dir_name)
-        if os.path.exists(dir_path) and os.path.isdir(dir_path):
-            files = os.listdir(dir_path)
-            image_files = [f for f in files if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))]
-            results[dir_name] = {
-                'path': dir_path,
-                'exists': True,
-                'image_count': len(image_files),
-                'sample_images': image_files[:5] if image_files else []
-            }
-        else:
-            results[dir_name] = {
-                'path': dir_path,
-                'exists': False
-            }
-    
-    # Also check the pickle file to see what paths it contains
-    try:
-        from app.services.similarity_service import EMBEDDINGS_PICKLE_PATH, load_embeddings
-        
-        if os.path.exists(EMBEDDINGS_PICKLE_PATH):
-            embeddings_data = load_embeddings()
-            
-            # Extract some sample file paths
-            sample_paths = []
-            if isinstance(embeddings_data, dict):
-                if 'file_paths' in embeddings_data:
-                    sample_paths = embeddings_data['file_paths'][:5]
-                else:
-                    sample_paths = list(embeddings_data.keys())[:5]
-            elif isinstance(embeddings_data, list):
-                if all(isinstance(item, tuple) and len(item) == 2 for item in embeddings_data[:5]):
-                    sample_paths = [item[0] for item in embeddings_data[:5]]
-                elif all(isinstance(item, dict) and 'file_path' in item for item in embeddings_data[:5] if isinstance(item, dict)):
-                    sample_paths = [item['file_path'] for item in embeddings_data[:5]]
-            
-            results['pickle_file'] = {
-                'path': EMBEDDINGS_PICKLE_PATH,
-                'exists': True,
-                'sample_paths': sample_paths
-            }
-        else:
-            results['pickle_file'] = {
-                'path': EMBEDDINGS_PICKLE_PATH,
-                'exists': False
-            }
-    except Exception as e:
-        results['pickle_file'] = {
-            'path': EMBEDDINGS_PICKLE_PATH if 'EMBEDDINGS_PICKLE_PATH' in locals() else 'unknown',
-            'error': str(e)
+    """Image index status and how many rows of each loaded corpus have their image file"""
+    from app.services.image_index import get_image_index
+    from app.services.corpus_service import CORPUS_PATHS, get_corpus
+    
+    index = get_image_index()
+    results = index.snapshot()
+    results['corpora'] = {}
+    for name in CORPUS_PATHS:
+        corpus = get_corpus(name)
+        if corpus is None:
+            results['corpora'][name] = {'loaded': False}
+            continue
+        available = index.availability(corpus)
+        results['corpora'][name] = {
+            'loaded': True,
+            'rows': len(corpus),
+            'sample_paths': corpus.paths[:5],
+            'available': int(available.sum()) if available is not None else None
         }
     
     return jsonify(results)
 
 @test_bp.route('/check-all-images')
 def check_all_images():
-    """Check all image directories and list files"""
-    import os
-    from flask import current_app, jsonify
-    
-    static_folder = current_app.static_folder
-    all_images_dir = os.path.join(static_folder, 'all_images')
-    
-    # Create the directory if it doesn't exist
-    os.makedirs(all_images_dir, exist_ok=True)
-    
-    # Check if directory exists
-    if not os.path.exists(all_images_dir):
-        return jsonify({
-            'error': f'Directory not found: {all_images_dir}',
-            'static_folder': static_folder
-        })
-    
-    # List all files in the directory
-    files = os.listdir(all_images_dir)
-    image_files = [f for f in files if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))]
-    
-    # Check for specific files mentioned in the logs
-    missing_files = ['image_579.jpg', 'image_524.jpg', 'image_999.jpg', 'image_250.jpg']
-    file_status = {}
-    for file in missing_files:
-        file_status[file] = file in files
-    
-    return jsonify({
-        'directory': all_images_dir,
-        'exists': True,
-        'total_files': len(files),
-        'image_files': len(image_files),
-        'sample_files': files[:10] if files else [],
-        'specific_files_exist': file_status
-    })
+    """Consistency report: missing images per corpus, orphaned files and (with ?verify=1) corrupt files"""
+    from flask import request
+    from app.services.image_index import consistency_report
+    from app.services.corpus_service import CORPUS_PATHS, get_corpus
+    
+    corpora = [corpus for corpus in (get_corpus(name) for name in CORPUS_PATHS) if corpus is not None]
+    verify = request.args.get('verify') in ('1', 'true', 'True')
+    # Clamped like parse_page_size: a bad value falls back to the default
+    try:
+        workers = int(request.args.get('workers', 8))
+    except (TypeError, ValueError):
+        workers = 8
+    workers = min(max(workers, 1), (os.cpu_count() or 1) * 4)
+    return jsonify(consistency_report(corpora, workers=workers, verify=verify))
 
 @test_bp.route('/serve-image/<filename>')
 def serve_image_direct(filename):
@@ -150,7 +84,9 @@ def serve_image_direct(filename):
     # Check if file exists
     full_path = os.path.join(all_images_dir, filename)
     if os.path.exists(full_path):
-        return send_from_directory(all_images_dir, filename)
+        # Originals are served with validators (ETag/Last-Modified) and a day's max-age;
+        # result grids should use the versioned /thumbnails URLs instead
+        return send_from_directory(all_images_dir, filename, conditional=True, max_age=86400)
     else:
         return f"Image not found: {full_path}", 404 
 
@@ -205,56 +141,29 @@ def image_test_page():
 
 @test_bp.route('/check-pickle')
 def check_pickle():
-    """Check the contents of the embeddings pickle file"""
-    from app.services.similarity_service import EMBEDDINGS_PICKLE_PATH, load_embeddings
-    import os
+    """Check the contents of the Titan embeddings corpus"""
+    from app.services.corpus_service import get_corpus
     
-    if not os.path.exists(EMBEDDINGS_PICKLE_PATH):
+    corpus = get_corpus('titan')
+    if corpus is None:
         return jsonify({
-            'error': f'Pickle file not found: {EMBEDDINGS_PICKLE_PATH}'
+            'error': 'Titan embeddings corpus not found'
         })
     
-    embeddings_data = load_embeddings()
-    
-    # Extract sample file paths
-    sample_paths = []
-    if isinstance(embeddings_data, dict):
-        if 'file_paths' in embeddings_data:
-            sample_paths = embeddings_data['file_paths'][:10]
-        else:
-            sample_paths = list(embeddings_data.keys())[:10]
-    elif isinstance(embeddings_data, list):
-        if all(isinstance(item, tuple) and len(item) == 2 for item in embeddings_data[:10]):
-            sample_paths = [item[0] for item in embeddings_data[:10]]
-        elif all(isinstance(item, dict) and 'file_path' in item for item in embeddings_data[:10] if isinstance(item, dict)):
-            sample_paths = [item['file_path'] for item in embeddings_data[:10]]
-    
     return jsonify({
-        'pickle_file': EMBEDDINGS_PICKLE_PATH,
+        'pickle_file': corpus.source_path,
         'exists': True,
-        'sample_paths': sample_paths,
-        'data_type': str(type(embeddings_data))
+        'sample_paths': corpus.paths[:10],
+        'data_type': str(type(corpus.matrix))
     })
 
 @test_bp.route('/embedding-images')
 def embedding_images():
     """Display images from the embeddings file"""
-    from app.services.similarity_service import load_embeddings
+    from app.services.corpus_service import get_corpus
     
-    embeddings_data = load_embeddings()
-    
-    # Extract file paths
-    file_paths = []
-    if isinstance(embeddings_data, dict):
-        if 'file_paths' in embeddings_data:
-            file_paths = embeddings_data['file_paths'][:20]
-        else:
-            file_paths = list(embeddings_data.keys())[:20]
-    elif isinstance(embeddings_data, list):
-        if all(isinstance(item, tuple) and len(item) == 2 for item in embeddings_data[:20]):
-            file_paths = [item[0] for item in embeddings_data[:20]]
-        elif all(isinstance(item, dict) and 'file_path' in item for item in embeddings_data[:20] if isinstance(item, dict)):
-            file_paths = [item['file_path'] for item in embeddings_data[:20]]
+    corpus = get_corpus('titan')
+    file_paths = corpus.paths[:20] if corpus is not None else []
     
     # Generate HTML
     html = """
@@ -294,42 +203,16 @@ def embedding_images():
 @test_bp.route('/compare-embeddings')
 def compare_embeddings():
     """Compare two embeddings to test cosine similarity"""
-    from app.services.similarity_service import load_embeddings
+    from app.services.corpus_service import get_corpus
     import numpy as np
     from sklearn.metrics.pairwise import cosine_similarity
     
-    embeddings_data = load_embeddings()
-    
-    # Extract embeddings
-    stored_embeddings = []
-    file_paths = []
-    
-    if isinstance(embeddings_data, dict):
-        if 'embeddings' in embeddings_data and 'file_paths' in embeddings_data:
-            stored_embeddings = embeddings_data['embeddings']
-            file_paths = embeddings_data['file_paths']
-        else:
-            file_paths = list(embeddings_data.keys())
-            stored_embeddings = list(embeddings_data.values())
-    elif isinstance(embeddings_data, list):
-        if all(isinstance(item, tuple) and len(item) == 2 for item in embeddings_data):
-            file_paths = [item[0] for item in embeddings_data]
-            stored_embeddings = [item[1] for item in embeddings_data]
-        elif all(isinstance(item, dict) and 'embedding' in item and 'file_path' in item 
-                for item in embeddings_data if isinstance(item, dict)):
-            file_paths = [item['file_path'] for item in embeddings_data]
-            stored_embeddings = [item['embedding'] for item in embeddings_data]
-    
-    # Process embeddings if they are dictionaries
-    processed_embeddings = []
-    for emb in stored_embeddings:
-        if isinstance(emb, dict) and 'embedding' in emb:
-            processed_embeddings.append(emb['embedding'])
-        elif isinstance(emb, list) or isinstance(emb, np.ndarray):
-            processed_embeddings.append(emb)
-    
-    if len(processed_embeddings) < 2:
+    # Corpus rows are stored L2-normalized
+    corpus = get_corpus('titan')
+    if corpus is None or len(corpus) < 2:
         return jsonify({'error': 'Not enough embeddings to compare'})
+    file_paths = corpus.paths
+    processed_embeddings = corpus.matrix[:2].tolist()
     
     # Compare first two embeddings
     emb1 = np.array(processed_embeddings[0], dtype=np.float32).reshape(1, -1)
@@ -0,0 +1,48 @@
+import logging
+from flask import Blueprint, request, send_file, jsonify, redirect, url_for
+from app.services import thumbnail_service
+from app.utils.helpers import create_cors_response
+
+logger = logging.getLogger(__name__)
+
+thumbnail_bp = Blueprint('thumbnails', __name__, url_prefix='/thumbnails')
+
+# Versioned URLs (?v=<source version>) never change content
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+UNVERSIONED_CACHE_CONTROL = 'public, max-age=3600'
+
+
+@thumbnail_bp.route('/<size>/<filename>', methods=['GET', 'HEAD'])
+def serve_thumbnail(size, filename):
+    """Serve a thumbnail as WebP or JPEG (per Accept) with a strong ETag and range support"""
+    if size not in thumbnail_service.THUMBNAIL_SIZES:
+        return create_cors_response(jsonify({'error': f"Unknown thumbnail size: {size}"}), 404)
+
+    # Only the current version of the original may be cached as immutable;
+    # a stale ?v= is sent on to the current versioned URL
+    requested_version = request.args.get('v')
+    version = thumbnail_service.source_version(filename) if requested_version else None
+    if requested_version and version is not None and requested_version != version:
+        current_url = url_for('thumbnails.serve_thumbnail', size=size, filename=filename, v=version)
+        return create_cors_response(redirect(current_url), 302)
+
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    try:
+        path = thumbnail_service.ensure_thumbnail(filename, size, fmt)
+    except Exception as e:
+        logger.error(f"Error generating thumbnail {size}/{filename}: {str(e)}", exc_info=True)
+        return create_cors_response(jsonify({'error': 'Thumbnail could not be generated'}), 500)
+    if path is None:
+        return create_cors_response(jsonify({'error': f"Image not found: {filename}"}), 404)
+
+    # conditional=True answers If-None-Match with 304 and Range with 206
+    response = send_file(
+        path,
+        mimetype=thumbnail_service.THUMBNAIL_FORMATS[fmt][1],
+        conditional=True,
+        etag=thumbnail_service.file_etag(path),
+    )
+    response.headers['Cache-Control'] = (IMMUTABLE_CACHE_CONTROL if requested_version and requested_version == version
+                                         else UNVERSIONED_CACHE_CONTROL)
+    response.headers['Vary'] = 'Accept'
+    return response
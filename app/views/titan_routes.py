@@ -1,8 +1,12 @@
 from flask import Blueprint, request, jsonify
-from app.services.titan_service import get_titan_embedding, get_titan_text_embedding
-from app.utils.helpers import create_cors_response
+from app.utils.helpers import create_cors_response, get_flag_param, get_request_param
 from app.services.file_service import save_uploaded_file
-from app.services.similarity_service import find_similar_images
+from app.services.similarity_service import find_similar_images_page, next_similar_images_page
+from app.services.result_cursor import CursorExpired, parse_page_size
+from app.services.metadata_index import FilterError, parse_filters
+from app.utils.logging_utils import debug_fields
+from app.services.async_providers import titan_embedding, titan_text_embedding
+from app.utils.serialization import json_response, encode_vector, get_vector_encoding
 import logging
 import os
 import json
@@ -16,22 +20,55 @@ logger = logging.getLogger(__name__)
 # Create a Blueprint for Titan routes with a prefix
 titan_bp = Blueprint('titan', __name__, url_prefix='/titan')
 
+def _format_images(similar_images):
+    formatted_images = []
+    for img in similar_images:
+        formatted_images.append({
+            'url': img['image_url'],
+            'thumbnail_url': img.get('thumbnail_url'),
+            'image_available': img.get('image_available'),
+            'similarity': round(img['similarity'] * 100, 2),
+            'filename': os.path.basename(img['file_path'])
+        })
+    return formatted_images
+
 @titan_bp.route('/embedding', methods=['POST', 'OPTIONS'])
-def embedding():
+async def embedding():
     """Route for Titan embedding endpoint"""
     if request.method == 'OPTIONS':
         return create_cors_response()
     
     try:
-        # Log EVERYTHING for debugging
-        logger.info("==== DETAILED REQUEST INFO ====")
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Request content type: {request.content_type}")
-        logger.info(f"Request has files: {bool(request.files)}")
-        logger.info(f"Request is JSON: {request.is_json}")
-        logger.info(f"Form data keys: {list(request.form.keys())}")
-        logger.info(f"Form data values: {dict(request.form)}")
-        logger.info(f"Files: {list(request.files.keys())}")
+        # Request details are only collected when debug logging is on for this request
+        debug_fields(logger, "titan_embedding_request",
+                     method=request.method,
+                     content_type=request.content_type,
+                     is_json=request.is_json,
+                     form=lambda: dict(request.form),
+                     files=lambda: list(request.files.keys()))
+        
+        # Optional metadata filters (JSON object), applied while scoring
+        filters = parse_filters(get_request_param(request, 'filters'))
+        page_size = parse_page_size(get_request_param(request, 'page_size'))
+        # Show only the best image of each near-duplicate cluster
+        collapse_duplicates = get_flag_param(request, 'collapse_duplicates')
+        # json (default), or compact base64 float32 / float16 for the embedding
+        try:
+            vector_encoding = get_vector_encoding(request)
+        except ValueError as e:
+            return create_cors_response(jsonify({'error': str(e)}), 400)
+        
+        # Later pages resume the cached ranking: no embedding call, no corpus rescan
+        cursor = get_request_param(request, 'cursor')
+        if cursor:
+            similar_images, next_cursor = next_similar_images_page(cursor, page_size)
+            return create_cors_response(json_response({
+                'success': True,
+                'similar_images': similar_images,
+                'formatted_images': _format_images(similar_images),
+                'next_cursor': next_cursor,
+                'static_url': "/static/all_images/"
+            }))
         
         # Check for image in request
         if 'image' in request.files:
@@ -41,7 +78,7 @@ def embedding():
             logger.info(f"Saved image to: {file_path}")
             
             # Get image embedding
-            result = get_titan_embedding(image_path=file_path)
+            result = await titan_embedding(image_path=file_path)
             embedding_type = "image"
             
         # Check for file in request (alternative name)
@@ -52,16 +89,16 @@ def embedding():
             logger.info(f"Saved file to: {file_path}")
             
             # Get image embedding
-            result = get_titan_embedding(image_path=file_path)
+            result = await titan_embedding(image_path=file_path)
             embedding_type = "image"
             
         # Check for text in request
         elif 'text' in request.form and request.form.get('text').strip():
             text = request.form.get('text').strip()
-            logger.info(f"Found text: {text}")
+            logger.debug("Found text: %s", text)
             
             # Get text embedding
-            result = get_titan_text_embedding(text)
+            result = await titan_text_embedding(text)
             embedding_type = "text"
             
         # If we have neither valid image nor text, return error
@@ -78,24 +115,19 @@ def embedding():
             }), 400)
         
         # Find similar images
-        similar_images = find_similar_images(result["embedding"])
+        similar_images, next_cursor = find_similar_images_page(result["embedding"], page_size, filters, collapse_duplicates)
         
         # Format response
-        formatted_images = []
-        for img in similar_images:
-            formatted_images.append({
-                'url': img['image_url'],
-                'similarity': round(img['similarity'] * 100, 2),
-                'filename': os.path.basename(img['file_path'])
-            })
+        formatted_images = _format_images(similar_images)
         
         # Create response
         response_data = {
             'success': True,
-            'embedding': result['embedding'],
+            'embedding': encode_vector(result['embedding'], vector_encoding),
             'embedding_type': embedding_type,
             'similar_images': similar_images,
             'formatted_images': formatted_images,
+            'next_cursor': next_cursor,
             'static_url': "/static/all_images/"
         }
         
@@ -106,8 +138,12 @@ def embedding():
         elif embedding_type == "text":
             response_data['text'] = request.form.get('text')
         
-        return create_cors_response(jsonify(response_data))
+        return create_cors_response(json_response(response_data, vector=result['embedding']))
         
+    except FilterError as e:
+        return create_cors_response(jsonify({'error': str(e)}), 400)
+    except CursorExpired as e:
+        return create_cors_response(jsonify({'error': str(e)}), 410)
     except Exception as e:
         logger.error(f"Error in Titan embedding endpoint: {str(e)}", exc_info=True)
         return create_cors_response(jsonify({'error': str(e), 'traceback': str(traceback.format_exc())}), 500) 
\ No newline at end of file
@@ -1,8 +1,12 @@
 from flask import Blueprint, request, jsonify
 from app.controllers.twelvelabs_controller import handle_twelvelabs_search, handle_twelvelabs_embedding
-from app.utils.helpers import handle_options_request, create_cors_response
-from app.services.twelvelabs_service import search_multimodal
+from app.utils.helpers import handle_options_request, create_cors_response, get_flag_param, get_request_param
+from app.utils.serialization import json_response
+from app.services.async_providers import twelvelabs_search_multimodal
 from app.services.file_service import save_uploaded_file
+from app.services.vector_search import parse_weights
+from app.services.metadata_index import FilterError, parse_filters
+from app.utils.logging_utils import debug_fields
 import logging
 import os
 import traceback
@@ -13,23 +17,33 @@ logger = logging.getLogger(__name__)
 
 twelvelabs_bp = Blueprint('twelvelabs', __name__, url_prefix='/twelvelabs')
 
+def _format_for_frontend(results):
+    formatted_results = []
+    for img in results:
+        formatted_results.append({
+            'url': img['image_url'],
+            'thumbnail_url': img.get('thumbnail_url'),
+            'image_available': img.get('image_available'),
+            'similarity': round(img['combined_similarity'] * 100, 2) if 'combined_similarity' in img else round(img['text_similarity'] * 100, 2),
+            'filename': os.path.basename(img['file_path'])
+        })
+    return formatted_results
+
 @twelvelabs_bp.route('/search', methods=['POST', 'OPTIONS'])
-def search():
+async def search():
     """Route for multimodal search using Twelve Labs"""
     # Handle preflight OPTIONS request
     if request.method == 'OPTIONS':
         return create_cors_response()
         
     try:
-        # Log EVERYTHING for debugging
-        logger.info("==== DETAILED TWELVE LABS REQUEST INFO ====")
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Request content type: {request.content_type}")
-        logger.info(f"Request has files: {bool(request.files)}")
-        logger.info(f"Request is JSON: {request.is_json}")
-        logger.info(f"Form data keys: {list(request.form.keys())}")
-        logger.info(f"Form data values: {dict(request.form)}")
-        logger.info(f"Files: {list(request.files.keys())}")
+        # Request details are only collected when debug logging is on for this request
+        debug_fields(logger, "twelvelabs_search_request",
+                     method=request.method,
+                     content_type=request.content_type,
+                     is_json=request.is_json,
+                     form=lambda: dict(request.form),
+                     files=lambda: list(request.files.keys()))
         
         # Initialize variables
         query_text = None
@@ -52,7 +66,7 @@ def search():
         # Get text from form data or JSON
         if request.form and 'text' in request.form:
             query_text = request.form.get('text').strip()
-            logger.info(f"Found text in form: {query_text}")
+            logger.debug("Found text in form: %s", query_text)
         elif request.is_json:
             try:
                 data = request.get_json()
@@ -60,19 +74,32 @@ def search():
                     query_text = data.get('query_text') or data.get('text')
                     if not query_image_path:
                         query_image_path = data.get('query_image_path') or data.get('image_path')
-                    logger.info(f"Found text in JSON: {query_text}")
-                    logger.info(f"Found image path in JSON: {query_image_path}")
+                    debug_fields(logger, "twelvelabs_json_query", text=query_text, image_path=query_image_path)
             except Exception as e:
                 logger.error(f"Error parsing JSON: {str(e)}")
         
         # Get parameters
         top_k = 7
         image_weight = 0.5
+        image_weights = None
+        filters = parse_filters(get_request_param(request, 'filters'))
+        collapse_duplicates = get_flag_param(request, 'collapse_duplicates')
         
         if request.is_json:
             data = request.get_json() or {}
             top_k = int(data.get('top_k', top_k))
             image_weight = float(data.get('image_weight', image_weight))
+            image_weights = data.get('image_weights')
+        else:
+            image_weights = request.form.get('image_weights')
+        try:
+            image_weights = parse_weights(image_weights)
+        except ValueError as e:
+            return create_cors_response(jsonify({
+                'success': False,
+                'message': f"Invalid image_weights: {str(e)}",
+                'error': f"Invalid image_weights: {str(e)}"
+            }), 400)
         
         logger.info(f"Search parameters: query_text={query_text}, query_image_path={query_image_path}, top_k={top_k}, image_weight={image_weight}")
         
@@ -85,24 +112,31 @@ def search():
                 'error': 'Please provide either text or an image for search'
             }), 400)
             
-        # Perform search
-        results = search_multimodal(
+        # Perform search (text and image embeddings are requested concurrently)
+        results = await twelvelabs_search_multimodal(
             query_text=query_text,
             query_image_path=query_image_path,
             top_k=top_k,
-            image_weight=image_weight
+            image_weight=image_weight,
+            image_weights=image_weights,
+            filters=filters,
+            collapse_duplicates=collapse_duplicates
         )
         
+        if image_weights:
+            # Weight sweep: one ranking per image weight, all from one corpus pass
+            for entry in results:
+                entry['formatted_results'] = _format_for_frontend(entry['results'])
+            return create_cors_response(json_response({
+                'success': True,
+                'message': f"Ranked {len(results)} image weights",
+                'sweep': results
+            }))
+        
         logger.info(f"Search returned {len(results)} results")
         
         # Format the results for the frontend
-        formatted_results = []
-        for img in results:
-            formatted_results.append({
-                'url': img['image_url'],
-                'similarity': round(img['combined_similarity'] * 100, 2) if 'combined_similarity' in img else round(img['text_similarity'] * 100, 2),
-                'filename': os.path.basename(img['file_path'])
-            })
+        formatted_results = _format_for_frontend(results)
         
         # Create response matching what the frontend expects
         response_data = {
@@ -112,8 +146,14 @@ def search():
             'formatted_results': formatted_results
         }
         
-        return create_cors_response(jsonify(response_data))
+        return create_cors_response(json_response(response_data))
         
+    except FilterError as e:
+        return create_cors_response(jsonify({
+            'success': False,
+            'message': str(e),
+            'error': str(e)
+        }), 400)
     except Exception as e:
         logger.error(f"Error in Twelve Labs search endpoint: {str(e)}", exc_info=True)
         return create_cors_response(jsonify({
@@ -1,16 +1,25 @@
 import os
 import json
-import numpy as np
+import logging
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
-from app.services.voyage_service import get_voyage_embedding
-from app.utils.helpers import allowed_file, create_cors_response, handle_options_request
+from app.services.async_providers import voyage_embedding
+from app.utils.helpers import allowed_file, create_cors_response, handle_options_request, get_flag_param, get_request_param
+from app.utils.serialization import json_response
+from app.utils.logging_utils import debug_fields
+from app.services.corpus_service import CORPUS_PATHS, get_corpus
+from app.services.metadata_index import FilterError, filter_mask, parse_filters
+from app.services.dedup_service import get_cluster_ids
+from app.services.result_cursor import CursorExpired, paged_search, resume_search, parse_page_size
+from app.services.thumbnail_service import thumbnail_url
+from app.services.image_index import image_available
 from PIL import Image
 
+logger = logging.getLogger(__name__)
 voyage_bp = Blueprint('voyage', __name__)
 
 @voyage_bp.route('/api/voyage/search', methods=['POST', 'OPTIONS'])
-def search():
+async def search():
     """Search for similar images using Voyage embeddings from a static pickle file."""
     # Handle preflight OPTIONS request
     if request.method == 'OPTIONS':
@@ -20,8 +29,11 @@ def search():
     query_image_path = None
     image_weight = 0.4  # Default weight for image similarity
     img = None 
-    # Debug the incoming request
-    print(f"Request content type: {request.content_type}")
+    debug_fields(logger, "voyage_search_request", content_type=request.content_type)
+    
+    # A cursor pages an earlier search: an image sent along with it is not saved
+    page_size = parse_page_size(get_request_param(request, 'page_size'))
+    cursor = get_request_param(request, 'cursor')
     
     # Check if the request contains form data or JSON
     if request.content_type and 'multipart/form-data' in request.content_type:
@@ -37,26 +49,26 @@ def search():
         except:
             pass
             
-        print(f"Form data - text: {query_text}, image: {query_image}, image_weight: {image_weight}")
+        debug_fields(logger, "voyage_form", text=query_text,
+                     image=lambda: query_image.filename if query_image else None, image_weight=image_weight)
         
         # If an image was uploaded, save it temporarily
-        if query_image and query_image.filename:
-            # Print image details for debugging
-            print(f"Received image: {query_image.filename}, content_type: {query_image.content_type}")
+        if query_image and query_image.filename and not cursor:
+            logger.info(f"Received image: {query_image.filename}")
             
             filename = secure_filename(query_image.filename)
             upload_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'temp')
             os.makedirs(upload_folder, exist_ok=True)
             query_image_path = os.path.join(upload_folder, filename)
             query_image.save(query_image_path)
-            print(f"Saved image to: {query_image_path}")
             
-            # Verify the saved file
+            # Open the saved file for the Voyage multimodal input
             try:
                 img = Image.open(query_image_path)
-                print(f"Image details: format={img.format}, mode={img.mode}, size={img.size}")
+                debug_fields(logger, "voyage_saved_image", path=query_image_path,
+                             format=img.format, mode=img.mode, size=img.size)
             except Exception as e:
-                print(f"Error verifying saved image: {str(e)}")
+                logger.error(f"Error verifying saved image: {str(e)}")
     else:
         # Handle JSON data
         data = request.json
@@ -71,109 +83,74 @@ def search():
                 except:
                     pass
                     
-            print(f"JSON data - query: {query_text}, image_path: {query_image_path}, image_weight: {image_weight}")
+            debug_fields(logger, "voyage_json", query=query_text, image_path=query_image_path, image_weight=image_weight)
     
-    # Ensure at least one of text or image is provided
-    if not query_text and not query_image_path:
+    # Ensure at least one of text or image (or a cursor) is provided
+    if not query_text and not query_image_path and not cursor:
         return jsonify({'error': 'No query text or image provided'}), 400
     
-    # Load pre-computed embeddings from static pickle file
-    import pickle
-    embeddings_file = os.path.join(current_app.root_path, 'static', 'json', 'emb_selected_images.pkl')
-    
-    # Try alternative paths if the file is not found
-    alt_path1 = os.path.join('static', 'json', 'emb_selected_images.pkl')
-    alt_path2 = os.path.join(os.getcwd(), 'static', 'json', 'emb_selected_images.pkl')
-    alt_path3 = os.path.join(os.getcwd(), 'app', 'static', 'json', 'emb_selected_images.pkl')
+    # Pre-computed embeddings (cached across requests, reloaded when the file changes)
+    corpus = get_corpus('voyage')
+    if corpus is None:
+        return jsonify({'error': f"Embeddings file not found. Tried: {', '.join(CORPUS_PATHS['voyage'])}"}), 404
     
-    # Try to find the file in multiple locations
-    if os.path.exists(embeddings_file):
-        embeddings_path = embeddings_file
-    elif os.path.exists(alt_path1):
-        embeddings_path = alt_path1
-    elif os.path.exists(alt_path2):
-        embeddings_path = alt_path2
-    elif os.path.exists(alt_path3):
-        embeddings_path = alt_path3
-    else:
-        return jsonify({'error': f'Embeddings file not found. Tried: {embeddings_file}, {alt_path1}, {alt_path2}, {alt_path3}'}), 404
+    # Later pages resume the cached ranking: no embedding call, no corpus rescan
+    if cursor:
+        try:
+            _, top_indices, similarities, _, next_cursor = resume_search(cursor, page_size, corpus)
+        except CursorExpired as e:
+            return jsonify({'error': str(e)}), 410
+        formatted_images = [{'url': os.path.basename(corpus.paths[idx]),
+                             'thumbnail_url': thumbnail_url(corpus.paths[idx]),
+                             'image_available': image_available(corpus.paths[idx]),
+                             'similarity': similarity}
+                            for idx, similarity in zip(top_indices, similarities)]
+        return create_cors_response(json_response({
+            'success': True,
+            'formatted_images': formatted_images,
+            'similar_images': formatted_images,
+            'next_cursor': next_cursor
+        }))
     
     try:
-        # Load pickle file
-        with open(embeddings_path, 'rb') as f:
-            stored_data = pickle.load(f)
+        # Metadata filters become a row mask applied while scoring
+        try:
+            mask = filter_mask(corpus, parse_filters(get_request_param(request, 'filters')))
+        except FilterError as e:
+            return jsonify({'error': str(e)}), 400
+        # Only the best image of each near-duplicate cluster, if requested
+        cluster_ids = get_cluster_ids(corpus) if get_flag_param(request, 'collapse_duplicates') else None
         
-        # Print structure for debugging
-        print(f"Pickle structure: {type(stored_data)}")
-        if isinstance(stored_data, dict):
-            print(f"Keys: {stored_data.keys()}")
+        debug_fields(logger, "voyage_corpus", rows=len(corpus), dimension=corpus.dimension)
         
         # Generate embedding for the query
         query_embedding = None
         if query_text and query_image_path:
             # Both text and image
-            query_embedding = get_voyage_embedding(text=query_text, img=img)
+            query_embedding = await voyage_embedding(text=query_text, img=img)
         elif query_image_path:
             # Only image
-            query_embedding = get_voyage_embedding(img=img)
+            query_embedding = await voyage_embedding(img=img)
         elif query_text:
             # Only text
-            query_embedding = get_voyage_embedding(text=query_text)
-        
-        # Compute similarities
-        results = []
-        
-        # Handle different data structures
-        embeddings = []
-        image_paths = []
-        
-        if isinstance(stored_data, dict):
-            if 'embeddings' in stored_data and 'image_paths' in stored_data:
-                # Format: {"embeddings": [...], "image_paths": [...]}
-                embeddings = stored_data['embeddings']
-                image_paths = stored_data['image_paths']
-            elif 'emb' in stored_data and 'paths' in stored_data:
-                # Alternative format
-                embeddings = stored_data['emb']
-                image_paths = stored_data['paths']
-        
-        # Compute similarity for each embedding
-        for idx, embedding_item in enumerate(embeddings):
-            if idx >= len(image_paths):
-                break
-                
-            img_path = image_paths[idx]
-            
-            # Ensure embeddings are numpy arrays
-            embedding_array = np.array(embedding_item, dtype=np.float32)
-            query_array = np.array(query_embedding, dtype=np.float32)
-            
-            # Compute similarity
-            try:
-                similarity = float(np.dot(query_array, embedding_array) / 
-                                 (np.linalg.norm(query_array) * np.linalg.norm(embedding_array)))
-            except Exception as e:
-                print(f"Error computing similarity: {e}")
-                similarity = 0.0
-            
-            # Extract just the filename from the path
-            filename = os.path.basename(img_path)
-            
-            results.append({
-                'image_path': filename,  # Just the filename
-                'full_path': img_path,   # Keep the full path for debugging
-                'similarity': similarity
-            })
+            query_embedding = await voyage_embedding(text=query_text)
         
-        # Sort by similarity (descending) and get top 10
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        top_results = results[:10]
+        # Score the (filtered) stored embeddings at once and get the first page;
+        # the ranking is cached for the pages behind next_cursor
+        top_indices, similarities, _, next_cursor = paged_search(corpus, {'query': (query_embedding, 1.0)}, page_size, mask, cluster_ids)
+        top_results = [{
+            'image_path': os.path.basename(corpus.paths[idx]),  # Just the filename
+            'full_path': corpus.paths[idx],   # Keep the full path for debugging
+            'similarity': similarity
+        } for idx, similarity in zip(top_indices, similarities)]
         
         # Format the response to match what the frontend expects
         formatted_images = []
         for result in top_results:
             formatted_images.append({
                 'url': result['image_path'],  # Just the filename
+                'thumbnail_url': thumbnail_url(result['full_path']),
+                'image_available': image_available(result['full_path']),
                 'similarity': result['similarity']
             })
         
@@ -181,14 +158,14 @@ def search():
             'success': True,
             'formatted_images': formatted_images,
             'similar_images': formatted_images,
-            'image_weight': image_weight
+            'image_weight': image_weight,
+            'next_cursor': next_cursor
         }
         
-        return create_cors_response(result)
+        return create_cors_response(json_response(result))
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Error in Voyage search: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
     finally:
         # Clean up temporary image file if it was created
@@ -0,0 +1,23 @@
+"""
+ASGI entry point
+
+The search routes are Flask async views that fan their provider calls out
+concurrently (see app/services/async_providers.py). Serve them with:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+ASGI_THREADS bounds the threads serving requests and ASYNC_PROVIDER_THREADS
+the shared pool used for provider calls. The provider SDKs are blocking, so
+ASYNC_PROVIDER_THREADS is also the most provider calls one process has in
+flight at a time.
+"""
+import os
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+from app.services.corpus_service import preload_corpora
+
+flask_app = create_app()
+app = WsgiToAsgi(flask_app)
+
+if os.environ.get('PRELOAD_CORPORA', 'True') == 'True':
+    preload_corpora()
@@ -0,0 +1,67 @@
+"""
+gunicorn configuration for the search API
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings (environment):
+    GUNICORN_BIND           bind address (default 0.0.0.0:$PORT or 0.0.0.0:8000)
+    GUNICORN_WORKER_CLASS   sync | gthread | gevent (default gthread)
+    GUNICORN_WORKERS        worker processes (default: CPU count)
+    GUNICORN_THREADS        threads per gthread worker (default 16)
+    GUNICORN_CONNECTIONS    concurrent requests per gevent worker (default 200)
+    GUNICORN_TIMEOUT        worker timeout in seconds (default 120)
+    GUNICORN_PRELOAD        'False' to import the app in each worker instead
+
+Provider calls take 0.5-15 s and mostly wait on the network, so workers are
+sized for concurrency rather than CPU: one process per core, each serving
+many requests on threads (gthread) or greenlets (gevent). Use sync only to
+reproduce one-request-per-process behaviour.
+
+With CORPUS_SHARED=True every worker maps the same shared-memory copy of
+each corpus (see app/services/corpus_service.py), so memory stays flat as
+workers are added and corpus reloads are not duplicated per worker.
+"""
+import gc
+import os
+import multiprocessing
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread').lower()
+
+if worker_class == 'gevent':
+    # Must run before the app (and its SDKs) are imported by preload_app
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+if worker_class == 'gthread':
+    threads = int(os.environ.get('GUNICORN_THREADS', 16))
+elif worker_class == 'gevent':
+    worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 200))
+
+# Load the app and corpora once in the master so workers share their pages
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's view, so GC passes
+    # in the workers do not write to (and un-share) the preloaded objects
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Master ready: {workers} {worker_class} workers, preload_app={preload_app}")
+
+
+def post_fork(server, worker):
+    # SDK clients created in the master hold sockets, gRPC channels and
+    # thread pools that must not be shared between processes
+    if preload_app:
+        from app.services import reset_provider_clients
+        reset_provider_clients()
+    server.log.info(f"Worker {worker.pid} ready")
@@ -0,0 +1,303 @@
+"""
+Search-path benchmark suite
+
+Generates synthetic corpora in each provider's on-disk format, swaps every
+provider client for the deterministic fakes in app.utils.fake_providers and
+measures latency/throughput of each search path. Results are written as JSON
+so runs from different commits can be diffed.
+
+Vertex is not benchmarked: /vertex/chat only embeds the request, and no
+route searches the vertex corpus (see corpus_service.SERVED_CORPORA).
+
+Usage:
+    python scripts/benchmark_search.py --sizes 1000 10000 --iterations 50 --output bench.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import pickle
+import shutil
+import zlib
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# provider -> (dimension, corpus format, file written under static/json)
+CORPUS_SPECS = {
+    'titan': (256, 'id_dict_json', 'titan.json'),
+    'twelve_labs': (1024, 'path_dict_json', 'twelve_labs_embeddings.json'),
+    'cohere': (1024, 'columns_json', 'cohere_embeddings_selected_images.json'),
+    'voyage': (1024, 'columns_pickle', 'emb_selected_images.pkl'),
+    'azure': (1024, 'url_columns_pickle', 'azure_embeddings_s3_images.pkl'),
+}
+
+# benchmark name -> provider whose corpus it searches
+SEARCH_PATHS = {
+    'similarity_service.find_similar_images': 'titan',
+    'search_service.search_multimodal': 'titan',
+    'twelvelabs_service.search_multimodal': 'twelve_labs',
+    'route:/api/cohere/search': 'cohere',
+    'route:/api/voyage/search': 'voyage',
+    'route:/azure/search': 'azure',
+}
+
+# Placeholder credentials so the service modules import without real keys
+FAKE_ENVIRONMENT = {
+    'AZURE_VISION_KEY': 'benchmark',
+    'AZURE_VISION_ENDPOINT': 'http://azure.invalid',
+    'COHERE_API_KEY': 'benchmark',
+    'VOYAGE_API_KEY': 'benchmark',
+    'TWELVELABS_API_KEY': 'benchmark',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+}
+
+
+def synthetic_matrix(size, dimension, seed):
+    """Unit-length float32 vectors drawn from a fixed seed"""
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((size, dimension), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def write_corpus(provider, size, json_dir):
+    """Write a synthetic corpus for a provider in that provider's file format"""
+    dimension, corpus_format, filename = CORPUS_SPECS[provider]
+    matrix = synthetic_matrix(size, dimension, seed=zlib.crc32(f"{provider}:{size}".encode('utf-8')))
+    paths = [f"all_images/synthetic_{i}.jpg" for i in range(size)]
+    output_path = os.path.join(json_dir, filename)
+
+    if corpus_format == 'id_dict_json':
+        # {"image_0": {"path": ..., "embedding": [...]}, ...}
+        with open(output_path, 'w') as f:
+            f.write('{')
+            for i, row in enumerate(matrix):
+                if i:
+                    f.write(',')
+                f.write(json.dumps(f"image_{i}"))
+                f.write(':')
+                f.write(json.dumps({'path': paths[i], 'embedding': row.tolist()}))
+            f.write('}')
+    elif corpus_format == 'path_dict_json':
+        # {"<path>": [...], ...}
+        with open(output_path, 'w') as f:
+            f.write('{')
+            for i, row in enumerate(matrix):
+                if i:
+                    f.write(',')
+                f.write(json.dumps(paths[i]))
+                f.write(':')
+                f.write(json.dumps(row.tolist()))
+            f.write('}')
+    elif corpus_format == 'columns_json':
+        with open(output_path, 'w') as f:
+            json.dump({'embeddings': matrix.tolist(), 'image_paths': paths}, f)
+    elif corpus_format == 'columns_pickle':
+        with open(output_path, 'wb') as f:
+            pickle.dump({'embeddings': list(matrix), 'image_paths': paths}, f)
+    elif corpus_format == 'url_columns_pickle':
+        urls = [f"https://benchmark.s3.local/{path}" for path in paths]
+        with open(output_path, 'wb') as f:
+            pickle.dump({'embeddings': list(matrix), 'image_urls': urls}, f)
+    else:
+        raise ValueError(f"Unknown corpus format: {corpus_format}")
+
+    return output_path
+
+
+def write_query_image(path):
+    """Small JPEG used as the image half of multimodal queries"""
+    from PIL import Image
+    Image.new('RGB', (64, 64), color=(120, 30, 200)).save(path, 'JPEG')
+    return path
+
+
+def percentile(values, q):
+    return float(np.percentile(np.array(values, dtype=np.float64), q)) if values else None
+
+
+def measure(fn, iterations, warmup):
+    """Run fn repeatedly and return latency percentiles and throughput"""
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        try:
+            ok = fn()
+            if ok is False:
+                errors += 1
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': float(np.mean(latencies)) if latencies else None,
+        'throughput_rps': iterations / elapsed if elapsed > 0 else None,
+    }
+
+
+def build_app(upload_folder):
+    """Minimal Flask app with only the blueprints under test"""
+    from flask import Flask
+    from app.views.cohere_routes import cohere_bp
+    from app.views.voyage_routes import voyage_bp
+    from app.views.azure_routes import azure_bp
+
+    app = Flask('benchmark')
+    app.config['UPLOAD_FOLDER'] = upload_folder
+    app.register_blueprint(cohere_bp)
+    app.register_blueprint(voyage_bp)
+    app.register_blueprint(azure_bp, url_prefix='/azure')
+    return app
+
+
+def build_benchmarks(app, query_image_path):
+    """Map benchmark name -> zero-arg callable returning False on failure"""
+    from app.services import similarity_service, search_service, twelvelabs_service
+    from app.utils.fake_providers import fake_embedding, PROVIDER_DIMENSIONS
+
+    client = app.test_client()
+    titan_query = fake_embedding('benchmark query', dimension=PROVIDER_DIMENSIONS['titan'])
+
+    def image_upload():
+        with open(query_image_path, 'rb') as f:
+            return (io.BytesIO(f.read()), 'query.jpg')
+
+    return {
+        'similarity_service.find_similar_images': lambda: bool(similarity_service.find_similar_images(titan_query)),
+        'search_service.search_multimodal': lambda: bool(search_service.search_multimodal(
+            'red running shoes', query_image_path=query_image_path)),
+        'twelvelabs_service.search_multimodal': lambda: bool(twelvelabs_service.search_multimodal(
+            query_text='red running shoes', query_image_path=query_image_path)),
+        'route:/api/cohere/search': lambda: client.post(
+            '/api/cohere/search', json={'query': 'red running shoes'}).status_code == 200,
+        'route:/api/voyage/search': lambda: client.post(
+            '/api/voyage/search', json={'query': 'red running shoes'}).status_code == 200,
+        'route:/azure/search': lambda: client.post(
+            '/azure/search', data={'text': 'red running shoes', 'image': image_upload()},
+            content_type='multipart/form-data').status_code == 200,
+    }
+
+
+def reload_corpora(provider, json_dir):
+    """Point the corpus cache at a freshly written corpus and load it before timing"""
+    from app.services import corpus_service
+
+    corpus_service.CORPUS_PATHS[provider] = [os.path.join(json_dir, CORPUS_SPECS[provider][2])]
+    corpus_service.clear_corpora()
+    corpus_service.get_corpus(provider)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Corpus sizes to generate (the 1M JSON tiers need tens of GB of RAM)')
+    parser.add_argument('--paths', nargs='+', default=list(SEARCH_PATHS), choices=list(SEARCH_PATHS),
+                        help='Search paths to benchmark')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', default=None, help='Write JSON results here (default: stdout)')
+    parser.add_argument('--keep-corpora', action='store_true', help='Do not delete the generated corpora')
+    args = parser.parse_args()
+
+    os.environ.update({k: v for k, v in FAKE_ENVIRONMENT.items() if not os.environ.get(k)})
+
+    workdir = tempfile.mkdtemp(prefix='muse-bench-')
+    json_dir = os.path.join(workdir, 'static', 'json')
+    os.makedirs(json_dir)
+    query_image_path = write_query_image(os.path.join(workdir, 'query.jpg'))
+
+    # The routes resolve corpora relative to the working directory
+    os.chdir(workdir)
+
+    from app.utils.fake_providers import install_fake_providers
+    install_fake_providers()
+    app = build_app(os.path.join(workdir, 'uploads'))
+    benchmarks = build_benchmarks(app, query_image_path)
+
+    results = []
+    try:
+        for size in args.sizes:
+            for provider in sorted({SEARCH_PATHS[name] for name in args.paths}):
+                dimension, corpus_format, _ = CORPUS_SPECS[provider]
+                started = time.perf_counter()
+                corpus_path = write_corpus(provider, size, json_dir)
+                build_seconds = time.perf_counter() - started
+                started = time.perf_counter()
+                reload_corpora(provider, json_dir)
+                load_seconds = time.perf_counter() - started
+
+                for name in args.paths:
+                    if SEARCH_PATHS[name] != provider:
+                        continue
+                    stats = measure(benchmarks[name], args.iterations, args.warmup)
+                    stats.update({
+                        'path': name,
+                        'provider': provider,
+                        'size': size,
+                        'dimension': dimension,
+                        'corpus_format': corpus_format,
+                        'corpus_bytes': os.path.getsize(corpus_path),
+                        'corpus_build_seconds': build_seconds,
+                        'corpus_load_seconds': load_seconds,
+                    })
+                    results.append(stats)
+                    print(f"{name} n={size} d={dimension}: p50={stats['p50_ms']:.2f}ms "
+                          f"p99={stats['p99_ms']:.2f}ms {stats['throughput_rps']:.1f} req/s",
+                          file=sys.stderr)
+    finally:
+        os.chdir(REPO_ROOT)
+        if not args.keep_corpora:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'git_revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Build or refresh the "more like this" neighbour graph of provider corpora
+
+For each corpus, stores every row's NEIGHBOR_GRAPH_K nearest neighbours in
+NEIGHBOR_GRAPH_DIR/<corpus>_neighbors.npz, which /similar/<image_id>
+answers from without a provider call or a corpus scan. Scoring is blocked
+(tile_rows x tile_rows) and runs on a thread pool.
+
+An existing graph is refreshed incrementally: only rows that are new,
+changed, or lost a neighbour are recomputed; the rest are compared with
+the changed rows only. Run it after every corpus rebuild (e.g. from cron);
+the web workers pick up the new file on their next request.
+
+Usage:
+    python scripts/build_neighbor_graph.py --corpora titan,cohere
+    python scripts/build_neighbor_graph.py --corpora voyage --k 100 --full
+    OPENBLAS_NUM_THREADS=1 python scripts/build_neighbor_graph.py --workers 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def main():
+    from app.services import neighbor_graph
+    from app.services.corpus_service import CORPUS_PATHS, get_corpus
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpora', default=','.join(CORPUS_PATHS), help='Comma-separated corpus names (default: all)')
+    parser.add_argument('--k', type=int, default=neighbor_graph.NEIGHBOR_GRAPH_K, help='Neighbours per image')
+    parser.add_argument('--tile-rows', type=int, default=neighbor_graph.NEIGHBOR_TILE_ROWS, help='Rows per tile side')
+    parser.add_argument('--workers', type=int, default=None, help='Tile threads (default: CPU count)')
+    parser.add_argument('--full', action='store_true', help='Rebuild from scratch instead of refreshing')
+    args = parser.parse_args()
+
+    os.makedirs(neighbor_graph.NEIGHBOR_GRAPH_DIR, exist_ok=True)
+    report = {}
+    for name in [name.strip() for name in args.corpora.split(',') if name.strip()]:
+        corpus = get_corpus(name)
+        if corpus is None:
+            report[name] = {'error': 'corpus not found'}
+            continue
+
+        path = neighbor_graph.graph_path(name)
+        graph = None
+        if not args.full and os.path.exists(path):
+            graph = neighbor_graph.NeighborGraph.load(path)
+
+        started = time.perf_counter()
+        graph, stats = neighbor_graph.refresh_graph(graph, corpus, args.k, args.tile_rows, args.workers)
+        graph.save(path)
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        stats['k'] = graph.k
+        stats['file'] = path
+        report[name] = stats
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
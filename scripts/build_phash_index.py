@@ -0,0 +1,50 @@
+"""
+Build the perceptual hash index of the catalog images
+
+Hashes every image in IMAGE_DIR (64-bit dHash) with a process pool and
+writes PHASH_INDEX_FILE. Query uploads that match a catalog image within
+PHASH_MAX_DISTANCE bits then reuse the stored corpus embedding instead of
+calling the provider (and, for Azure, uploading to S3). Re-runs only hash
+files that are new or changed; the web workers reload the file on change.
+
+Usage:
+    python scripts/build_phash_index.py --workers 8
+    python scripts/build_phash_index.py --image-dir app/static/all_images --full
+"""
+import os
+import sys
+import json
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image-dir', default=None, help='Catalog directory (default: IMAGE_DIR)')
+    parser.add_argument('--output', default=None, help='Index file (default: PHASH_INDEX_FILE)')
+    parser.add_argument('--workers', type=int, default=None, help='Processes (default: CPU count)')
+    parser.add_argument('--full', action='store_true', help='Rehash every image')
+    args = parser.parse_args()
+
+    # Settings are read at import
+    if args.image_dir:
+        os.environ['IMAGE_DIR'] = args.image_dir
+    if args.output:
+        os.environ['PHASH_INDEX_FILE'] = args.output
+
+    from app.services import phash_index
+
+    previous = None
+    if not args.full and os.path.exists(phash_index.PHASH_INDEX_FILE):
+        previous = phash_index.PerceptualHashIndex.load(phash_index.PHASH_INDEX_FILE)
+    index, report = phash_index.build_index(phash_index.IMAGE_DIR, previous, args.workers)
+    index.save(phash_index.PHASH_INDEX_FILE)
+    report['file'] = phash_index.PHASH_INDEX_FILE
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Pre-generate search-result thumbnails
+
+Writes every configured size (THUMBNAIL_SIZES) as WebP and JPEG for each
+original in IMAGE_DIR into THUMBNAIL_DIR, using a process pool. Run it
+after adding images or rebuilding a corpus; thumbnails newer than their
+original are skipped, so re-runs only process what changed. The
+/thumbnails route generates anything missing on first request.
+
+Usage:
+    python scripts/build_thumbnails.py --workers 8
+    python scripts/build_thumbnails.py --image-dir app/static/all_images --force
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image-dir', default=None, help='Originals directory (default: IMAGE_DIR)')
+    parser.add_argument('--thumbnail-dir', default=None, help='Output directory (default: THUMBNAIL_DIR)')
+    parser.add_argument('--workers', type=int, default=None, help='Processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Regenerate thumbnails that are up to date')
+    args = parser.parse_args()
+
+    # Settings are read at import; the worker processes inherit them
+    if args.image_dir:
+        os.environ['IMAGE_DIR'] = args.image_dir
+    if args.thumbnail_dir:
+        os.environ['THUMBNAIL_DIR'] = args.thumbnail_dir
+
+    from app.services import thumbnail_service
+
+    started = time.perf_counter()
+    report = thumbnail_service.build_thumbnails(workers=args.workers, force=args.force)
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    report['sizes'] = thumbnail_service.THUMBNAIL_SIZES
+    print(json.dumps(report, indent=2))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
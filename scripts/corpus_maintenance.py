@@ -0,0 +1,428 @@
+"""
+Check and repair the embedding corpora against the image directory
+
+`scan` reads every provider corpus (CORPUS_PATHS) and IMAGE_DIR in parallel
+with a process pool and reports, per corpus:
+    missing     rows whose image file is not in IMAGE_DIR
+    dimension   rows whose vector length differs from the corpus' usual one
+    invalid     rows whose vector is non-numeric, non-finite or all zeros
+and, across corpora:
+    orphaned    files in IMAGE_DIR that no corpus references
+    corrupt     files that do not decode (with --verify-images)
+
+`repair` applies fixes in bulk; each is opt-in:
+    --quarantine    move orphaned and corrupt files to IMAGE_DIR/_quarantine
+                    (rows pointing at a quarantined file become missing);
+                    orphans are only moved when every corpus could be read
+    --placeholders  draw a placeholder image for every missing local file
+    --reembed       recompute dimension/invalid rows with the provider
+                    (app/services/embedding_builder.py)
+    --prune         drop rows that are still broken after the above
+
+Orphans are always computed against every corpus in CORPUS_PATHS, not just
+the ones selected with --corpora, so an image used by another corpus is
+never treated as unreferenced.
+
+Corpus files are rewritten atomically, keeping the previous file as
+<file>.bak. --dry-run prints the plan without touching anything.
+
+Usage:
+    python scripts/corpus_maintenance.py scan --verify-images --output report.json
+    python scripts/corpus_maintenance.py repair --placeholders --prune
+    python scripts/corpus_maintenance.py repair --corpora titan,cohere --reembed --prune --dry-run
+"""
+import os
+import sys
+import json
+import pickle
+import shutil
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+QUARANTINE_DIR = '_quarantine'
+PLACEHOLDER_SIZE = (300, 300)
+SAMPLE = 20
+
+
+class RawCorpus:
+    """
+    A corpus file as stored, with row-level edits
+
+    Rows are addressed by locators (list index or dict key) so repairs keep
+    the file's own layout (see corpus_service._extract_rows).
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        if path.endswith('.pkl'):
+            with open(path, 'rb') as f:
+                self.data = pickle.load(f)
+        else:
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+        self.columns = self._columns()
+
+    def _columns(self):
+        """(paths key, embeddings key) for column layouts, else None"""
+        data = self.data
+        if isinstance(data, dict):
+            if 'embeddings' in data and ('image_paths' in data or 'image_urls' in data):
+                return ('image_paths' if 'image_paths' in data else 'image_urls'), 'embeddings'
+            if 'emb' in data and 'paths' in data:
+                return 'paths', 'emb'
+        return None
+
+    def rows(self):
+        """(locator, image path or URL, embedding) per row"""
+        data = self.data
+        if self.columns:
+            paths_key, emb_key = self.columns
+            return [(i, path, emb) for i, (path, emb) in enumerate(zip(data[paths_key], data[emb_key]))]
+        if isinstance(data, list):
+            return [(i, item.get('image_path'), item.get('embedding'))
+                    for i, item in enumerate(data) if isinstance(item, dict)]
+        rows = []
+        for key, value in data.items():
+            if isinstance(value, dict):
+                rows.append((key, value.get('path', key), value.get('embedding')))
+            else:
+                rows.append((key, key, value))
+        return rows
+
+    def set_embedding(self, locator, embedding):
+        data = self.data
+        if self.columns:
+            # Keep the column's own type (list, tuple or ndarray): the loaders read it as stored
+            emb_key = self.columns[1]
+            column = data[emb_key]
+            if isinstance(column, tuple):
+                column = list(column)
+                column[locator] = embedding
+                data[emb_key] = tuple(column)
+            elif isinstance(column, np.ndarray) and column.dtype != object:
+                column[locator] = np.asarray(embedding, dtype=column.dtype)
+            else:
+                column[locator] = embedding
+        elif isinstance(data, list):
+            data[locator]['embedding'] = embedding
+        elif isinstance(data[locator], dict):
+            data[locator]['embedding'] = embedding
+        else:
+            data[locator] = embedding
+
+    def delete(self, locators):
+        data = self.data
+        if self.columns or isinstance(data, list):
+            drop = set(locators)
+            if self.columns:
+                for key in self.columns:
+                    data[key] = _drop_rows(data[key], drop)
+            else:
+                self.data = [item for i, item in enumerate(data) if i not in drop]
+        else:
+            for key in locators:
+                data.pop(key, None)
+
+    def save(self):
+        """Write atomically, keeping the previous file as <path>.bak"""
+        tmp_path = f"{self.path}.tmp"
+        if self.path.endswith('.pkl'):
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self.data, f)
+        else:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f)
+        shutil.copy2(self.path, f"{self.path}.bak")
+        os.replace(tmp_path, self.path)
+
+
+def _drop_rows(column, drop):
+    """A column without the rows in `drop`, of the same type as the column"""
+    if isinstance(column, np.ndarray):
+        return np.delete(column, sorted(drop), axis=0)
+    kept = [value for i, value in enumerate(column) if i not in drop]
+    return tuple(kept) if isinstance(column, tuple) else kept
+
+
+def is_local(path):
+    return bool(path) and '://' not in str(path)
+
+
+def _vector_problem(embedding):
+    """(length, None) for a usable vector, else (None, reason)"""
+    try:
+        vector = np.asarray(embedding, dtype=np.float64).reshape(-1)
+    except (TypeError, ValueError):
+        return None, 'non-numeric'
+    if vector.size == 0:
+        return None, 'empty'
+    if not np.isfinite(vector).all():
+        return None, 'non-finite'
+    if not vector.any():
+        return None, 'zero vector'
+    return vector.size, None
+
+
+def scan_corpus(name, path, image_names):
+    """
+    Scan one corpus file (runs in a worker process)
+
+    Returns:
+        dict with the corpus' row count, usual dimension, referenced file
+        names and issues as (locator, image path, kind, detail) tuples
+    """
+    corpus = RawCorpus(name, path)
+    rows = corpus.rows()
+    issues, lengths, referenced = [], {}, set()
+    for locator, image_path, embedding in rows:
+        if is_local(image_path):
+            file_name = os.path.basename(str(image_path))
+            referenced.add(file_name)
+            if file_name not in image_names:
+                issues.append((locator, image_path, 'missing', file_name))
+        length, problem = _vector_problem(embedding)
+        if problem:
+            issues.append((locator, image_path, 'invalid', problem))
+        else:
+            lengths[locator] = (image_path, length)
+
+    counts = Counter(length for _, length in lengths.values()).most_common(1)
+    dimension = counts[0][0] if counts else None
+    for locator, (image_path, length) in lengths.items():
+        if length != dimension:
+            issues.append((locator, image_path, 'dimension', f"{length} != {dimension}"))
+
+    return {'path': path, 'rows': len(rows), 'dimension': dimension, 'referenced': referenced, 'issues': issues}
+
+
+def scan(corpora, image_dir, workers, verify_images):
+    """
+    Scan corpora and the image directory with a process pool
+
+    Every corpus in CORPUS_PATHS is read to find the referenced files, so
+    orphans are right whatever `corpora` selects; only the selected ones
+    are reported (and repaired). `unreadable` lists corpora whose file
+    exists but could not be read: their references are unknown.
+    """
+    from app.services.corpus_service import CORPUS_PATHS, _resolve_path
+    from app.services.image_index import IMAGE_EXTENSIONS, _verify_chunk
+
+    try:
+        with os.scandir(image_dir) as entries:
+            image_names = {entry.name for entry in entries
+                           if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)}
+    except FileNotFoundError:
+        image_names = set()
+
+    results, corrupt = {}, []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for name in dict.fromkeys([*CORPUS_PATHS, *(corpora or [])]):
+            path = _resolve_path(name)
+            if path is None:
+                results[name] = {'error': 'corpus file not found', 'tried': CORPUS_PATHS.get(name)}
+                continue
+            futures[name] = pool.submit(scan_corpus, name, path, image_names)
+
+        verify_futures = []
+        if verify_images:
+            names = sorted(image_names)
+            chunk = max(1, len(names) // ((workers or os.cpu_count() or 1) * 4) + 1)
+            verify_futures = [pool.submit(_verify_chunk, image_dir, names[i:i + chunk])
+                              for i in range(0, len(names), chunk)]
+
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = {'error': str(e)}
+        for future in verify_futures:
+            corrupt.extend(future.result())
+
+    referenced = set()
+    for result in results.values():
+        referenced |= result.get('referenced', set())
+    unreadable = sorted(name for name, result in results.items() if 'error' in result and 'tried' not in result)
+    return {
+        'image_dir': image_dir,
+        'files': len(image_names),
+        'corpora': {name: result for name, result in results.items() if corpora is None or name in corpora},
+        'unreadable': unreadable,
+        'orphaned': sorted(image_names - referenced),
+        'corrupt': sorted(corrupt) if verify_images else None,
+    }
+
+
+def summarize(report):
+    """JSON-friendly report with counts and samples instead of full lists"""
+    corpora = {}
+    for name, result in report['corpora'].items():
+        if 'error' in result:
+            corpora[name] = result
+            continue
+        by_kind = {}
+        for _, image_path, kind, detail in result['issues']:
+            by_kind.setdefault(kind, []).append(f"{image_path} ({detail})" if kind != 'missing' else str(image_path))
+        corpora[name] = {
+            'path': result['path'],
+            'rows': result['rows'],
+            'dimension': result['dimension'],
+            **{kind: {'count': len(items), 'sample': items[:SAMPLE]} for kind, items in by_kind.items()},
+        }
+    summary = {
+        'image_dir': report['image_dir'],
+        'files': report['files'],
+        'corpora': corpora,
+        'orphaned': {'count': len(report['orphaned']), 'sample': report['orphaned'][:SAMPLE]},
+    }
+    if report['unreadable']:
+        summary['unreadable'] = report['unreadable']
+    if report['corrupt'] is not None:
+        summary['corrupt'] = {'count': len(report['corrupt']), 'sample': report['corrupt'][:SAMPLE]}
+    return summary
+
+
+def create_placeholder(path, size=PLACEHOLDER_SIZE):
+    """Draw a white image with the file's name on it, as a stand-in for a missing original"""
+    from PIL import Image, ImageDraw, ImageFont
+    image = Image.new('RGB', size, color=(255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    text = os.path.splitext(os.path.basename(path))[0]
+    text_width, text_height = 150, 30  # Approximate size
+    position = ((size[0] - text_width) // 2, (size[1] - text_height) // 2)
+    draw.text(position, text, fill=(0, 0, 0), font=ImageFont.load_default())
+    draw.rectangle([(0, 0), (size[0] - 1, size[1] - 1)], outline=(200, 200, 200), width=2)
+    tmp_path = f"{path}.tmp"
+    image.save(tmp_path, format=Image.registered_extensions().get(os.path.splitext(path)[1].lower(), 'JPEG'))
+    os.replace(tmp_path, path)
+
+
+def repair(report, args):
+    """Apply the requested fixes; returns a dict of what was (or would be) done"""
+    image_dir = report['image_dir']
+    done = {'quarantined': [], 'placeholders': [], 'reembedded': {}, 'pruned': {}, 'failed': {}}
+
+    if args.quarantine:
+        target = os.path.join(image_dir, QUARANTINE_DIR)
+        orphaned = set(report['orphaned'])
+        if report['unreadable']:
+            # An unreadable corpus may reference any of these files: moving them could break it
+            done['orphans_kept'] = f"corpora could not be read: {', '.join(report['unreadable'])}"
+            orphaned = set()
+        for name in sorted(orphaned | set(report['corrupt'] or [])):
+            done['quarantined'].append(name)
+            if not args.dry_run:
+                os.makedirs(target, exist_ok=True)
+                os.replace(os.path.join(image_dir, name), os.path.join(target, name))
+    # Rows pointing at a quarantined corrupt file are now missing their image
+    quarantined_corrupt = set(report['corrupt'] or []) if args.quarantine else set()
+
+    if args.placeholders:
+        names = set()
+        for result in report['corpora'].values():
+            for _, image_path, kind, _ in result.get('issues', []):
+                if kind == 'missing':
+                    names.add(os.path.basename(str(image_path)))
+        names |= quarantined_corrupt
+        for name in sorted(names):
+            done['placeholders'].append(name)
+            if not args.dry_run:
+                create_placeholder(os.path.join(image_dir, name))
+
+    for corpus_name, result in report['corpora'].items():
+        if 'error' in result:
+            continue
+        corpus = RawCorpus(corpus_name, result['path'])
+        broken = {}  # locator -> (image path, kind)
+        for locator, image_path, kind, _ in result['issues']:
+            if kind == 'missing' and args.placeholders:
+                continue
+            broken.setdefault(locator, (image_path, kind))
+        if quarantined_corrupt and not args.placeholders:
+            for locator, image_path, _ in corpus.rows():
+                if is_local(image_path) and os.path.basename(str(image_path)) in quarantined_corrupt:
+                    broken.setdefault(locator, (image_path, 'missing'))
+        if not broken:
+            continue
+
+        fixed = set()
+        if args.reembed:
+            # Missing rows have no image to embed; URLs (azure) are embedded remotely
+            targets = {}
+            for locator, (image_path, kind) in broken.items():
+                if kind != 'missing':
+                    source = image_path if not is_local(image_path) else os.path.join(image_dir, os.path.basename(str(image_path)))
+                    targets.setdefault(source, []).append(locator)
+            if targets and args.dry_run:
+                fixed.update(locator for locators in targets.values() for locator in locators)
+            elif targets:
+                from app.services.embedding_builder import embed_images
+                embeddings, failures = embed_images(corpus_name, list(targets), workers=args.embed_workers)
+                for source, embedding in embeddings.items():
+                    if result['dimension'] and len(embedding) != result['dimension']:
+                        failures[source] = f"provider returned dimension {len(embedding)}"
+                        continue
+                    for locator in targets[source]:
+                        corpus.set_embedding(locator, embedding)
+                        fixed.add(locator)
+                if failures:
+                    done['failed'][corpus_name] = dict(list(failures.items())[:SAMPLE])
+            done['reembedded'][corpus_name] = len(fixed)
+
+        changed = bool(fixed)
+        if args.prune:
+            prune = [locator for locator in broken if locator not in fixed]
+            if prune:
+                done['pruned'][corpus_name] = len(prune)
+                corpus.delete(prune)
+                changed = True
+
+        if changed and not args.dry_run:
+            corpus.save()
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['scan', 'repair'])
+    parser.add_argument('--corpora', default=None, help='Comma-separated corpus names (default: all in CORPUS_PATHS)')
+    parser.add_argument('--image-dir', default=None, help='Image directory (default: IMAGE_DIR)')
+    parser.add_argument('--workers', type=int, default=None, help='Scan processes (default: CPU count)')
+    parser.add_argument('--verify-images', action='store_true', help='Decode every image to find corrupt files')
+    parser.add_argument('--quarantine', action='store_true', help='Move orphaned and corrupt files aside')
+    parser.add_argument('--placeholders', action='store_true', help='Create placeholder images for missing files')
+    parser.add_argument('--reembed', action='store_true', help='Recompute dimension-mismatched and invalid rows')
+    parser.add_argument('--embed-workers', type=int, default=4, help='Concurrent provider requests for --reembed')
+    parser.add_argument('--prune', action='store_true', help='Drop rows that are still broken')
+    parser.add_argument('--dry-run', action='store_true', help='Report the repairs without applying them')
+    parser.add_argument('--output', default=None, help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    if args.image_dir:
+        os.environ['IMAGE_DIR'] = args.image_dir
+    from app.services.image_index import IMAGE_DIR
+
+    corpora = [name.strip() for name in args.corpora.split(',')] if args.corpora else None
+    report = scan(corpora, IMAGE_DIR, args.workers, args.verify_images)
+    output = {'scan': summarize(report)}
+    if args.command == 'repair':
+        output['repair'] = repair(report, args)
+        output['repair']['dry_run'] = args.dry_run
+
+    text = json.dumps(output, indent=2, default=str)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Export corpora for memory-mapped, streaming search
+
+Parses each corpus source file once and writes CORPUS_MMAP_DIR/<name>.npy
+(normalized float32 rows) and <name>.keys.json. With CORPUS_MMAP=True the
+web workers map these files instead of loading the corpus into RAM, and
+searches scan them in STREAM_CHUNK_ROWS chunks with a running top-k, so a
+worker's memory no longer grows with the catalog.
+
+Run it on a machine that can hold the source once, then ship the two files
+to the serving nodes (which need no source file at all).
+
+Usage:
+    python scripts/export_corpus_mmap.py --corpora titan,cohere
+    python scripts/export_corpus_mmap.py --output-dir /data/corpora
+"""
+import os
+import sys
+import json
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpora', default=None, help='Comma-separated corpus names (default: served corpora)')
+    parser.add_argument('--output-dir', default=None, help='Export directory (default: CORPUS_MMAP_DIR)')
+    args = parser.parse_args()
+
+    # Settings are read at import
+    os.environ['CORPUS_MMAP'] = 'True'
+    if args.output_dir:
+        os.environ['CORPUS_MMAP_DIR'] = args.output_dir
+
+    from app.services import corpus_service
+
+    names = [name.strip() for name in args.corpora.split(',')] if args.corpora else corpus_service.SERVED_CORPORA
+    report = {}
+    for name in names:
+        corpus = corpus_service.load_corpus(name)
+        if corpus is None:
+            report[name] = {'error': 'corpus not found'}
+            continue
+        matrix_path = corpus_service._mmap_paths(name)[0]
+        report[name] = {'rows': len(corpus), 'dimension': corpus.dimension, 'file': matrix_path,
+                        'bytes': os.path.getsize(matrix_path)}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Find near-duplicate images in provider corpora
+
+Computes all-pairs cosine similarity of each corpus in bounded
+(tile_rows x tile_rows) blocks on a thread pool, groups pairs at or above
+the threshold into clusters, and writes them to
+DUPLICATE_CLUSTERS_DIR/<corpus>_duplicates.json. Searches called with
+collapse_duplicates=true then return only the best image of each cluster.
+
+Re-run after rebuilding a corpus; rows added since the last run are
+simply treated as having no duplicates.
+
+Usage:
+    python scripts/find_duplicates.py --corpora titan,cohere --threshold 0.97
+    OPENBLAS_NUM_THREADS=1 python scripts/find_duplicates.py --workers 8 --tile-rows 4096
+    python scripts/find_duplicates.py --corpora voyage --dry-run
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+SAMPLE = 10
+
+
+def main():
+    from app.services import dedup_service
+    from app.services.corpus_service import CORPUS_PATHS, get_corpus
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpora', default=','.join(CORPUS_PATHS), help='Comma-separated corpus names (default: all)')
+    parser.add_argument('--threshold', type=float, default=dedup_service.DUPLICATE_THRESHOLD,
+                        help='Cosine similarity that counts as a duplicate')
+    parser.add_argument('--tile-rows', type=int, default=dedup_service.DUPLICATE_TILE_ROWS,
+                        help='Rows per tile side (memory per worker: tile_rows^2 * 4 bytes)')
+    parser.add_argument('--workers', type=int, default=None, help='Tile threads (default: CPU count)')
+    parser.add_argument('--output-dir', default=None, help='Clusters directory (default: DUPLICATE_CLUSTERS_DIR)')
+    parser.add_argument('--dry-run', action='store_true', help='Report clusters without writing files')
+    args = parser.parse_args()
+    if not 0 < args.threshold <= 1:
+        parser.error('--threshold must be in (0, 1]')
+
+    report = {}
+    for name in [name.strip() for name in args.corpora.split(',') if name.strip()]:
+        corpus = get_corpus(name)
+        if corpus is None:
+            report[name] = {'error': 'corpus not found'}
+            continue
+
+        started = time.perf_counter()
+        cluster_ids, pair_count = dedup_service.find_duplicate_clusters(
+            corpus, args.threshold, args.tile_rows, args.workers)
+        clustered = cluster_ids[cluster_ids != dedup_service.NO_CLUSTER]
+        clusters = {}
+        for row, cluster_id in enumerate(cluster_ids.tolist()):
+            if cluster_id != dedup_service.NO_CLUSTER:
+                clusters.setdefault(cluster_id, []).append(corpus.paths[row])
+
+        entry = {
+            'rows': len(corpus),
+            'pairs': pair_count,
+            'clusters': len(clusters),
+            'duplicate_rows': int(clustered.size),
+            'collapsible_rows': int(clustered.size - len(clusters)),
+            'seconds': round(time.perf_counter() - started, 2),
+            'largest': sorted(clusters.values(), key=len, reverse=True)[:SAMPLE],
+        }
+        if not args.dry_run:
+            path = os.path.join(args.output_dir, f"{name}_duplicates.json") if args.output_dir else None
+            entry['file'] = dedup_service.save_clusters(corpus, cluster_ids, args.threshold, path)
+        report[name] = entry
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
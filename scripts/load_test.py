@@ -0,0 +1,265 @@
+"""
+Load-generation harness for the search API
+
+Drives the real WSGI server (gunicorn) with closed-loop concurrency sweeps
+and open-loop Poisson arrival rates, and reports throughput, tail latency
+and error rate per endpoint as JSON. Pair it with PROVIDER_BACKEND=stub
+(see app/utils/fake_providers.py) to load test without calling paid APIs.
+
+Usage:
+    # spawn gunicorn with stub providers and sweep concurrency
+    python scripts/load_test.py --spawn --concurrency 1 8 32 --duration 20
+
+    # open-loop against an already running server
+    python scripts/load_test.py --base-url http://127.0.0.1:8000 --rates 10 50 100
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = ['red running shoes', 'white sneakers', 'leather boots', 'summer dress', 'denim jacket']
+
+
+def _query_image():
+    """Small in-memory JPEG for multipart image uploads"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color=(40, 120, 200)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def build_endpoints(image_bytes):
+    """Endpoint name -> function(session, base_url) returning the HTTP response"""
+    def titan_embedding(session, base_url):
+        return session.post(f"{base_url}/titan/embedding", data={'text': random.choice(QUERIES)})
+
+    def twelvelabs_search(session, base_url):
+        return session.post(f"{base_url}/twelvelabs/search", json={'query_text': random.choice(QUERIES)})
+
+    def cohere_search(session, base_url):
+        return session.post(f"{base_url}/api/cohere/search", json={'query': random.choice(QUERIES)})
+
+    def voyage_search(session, base_url):
+        return session.post(f"{base_url}/api/voyage/search", json={'query': random.choice(QUERIES)})
+
+    def azure_search(session, base_url):
+        return session.post(
+            f"{base_url}/azure/search",
+            data={'text': random.choice(QUERIES)},
+            files={'image': ('query.jpg', image_bytes, 'image/jpeg')}
+        )
+
+    def azure_vectorize_text(session, base_url):
+        return session.post(f"{base_url}/azure/vectorize_text", json={'text': random.choice(QUERIES)})
+
+    return {
+        'titan_embedding': titan_embedding,
+        'twelvelabs_search': twelvelabs_search,
+        'cohere_search': cohere_search,
+        'voyage_search': voyage_search,
+        'azure_search': azure_search,
+        'azure_vectorize_text': azure_vectorize_text,
+    }
+
+
+class Recorder:
+    """Thread-safe collection of (latency, status) samples"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms, status):
+        with self._lock:
+            self.latencies.append(latency_ms)
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors += 1
+
+    def summary(self, elapsed):
+        latencies = np.array(self.latencies, dtype=np.float64)
+        count = len(latencies)
+        return {
+            'requests': count,
+            'throughput_rps': count / elapsed if elapsed > 0 else None,
+            'error_rate': self.errors / count if count else None,
+            'status_counts': self.statuses,
+            'p50_ms': float(np.percentile(latencies, 50)) if count else None,
+            'p90_ms': float(np.percentile(latencies, 90)) if count else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if count else None,
+            'max_ms': float(latencies.max()) if count else None,
+        }
+
+
+_sessions = threading.local()
+
+
+def _session():
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def _issue(call, base_url, recorder, scheduled_at=None):
+    """Send one request; latency is measured from scheduled_at when given (open loop)"""
+    started = scheduled_at if scheduled_at is not None else time.perf_counter()
+    try:
+        status = call(_session(), base_url).status_code
+    except requests.RequestException as e:
+        status = type(e).__name__
+    recorder.record((time.perf_counter() - started) * 1000, status)
+
+
+def run_closed_loop(call, base_url, concurrency, duration):
+    """`concurrency` users each sending back-to-back requests for `duration` seconds"""
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+
+    def user():
+        while time.perf_counter() < deadline:
+            _issue(call, base_url, recorder)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.perf_counter() - started)
+
+
+def run_open_loop(call, base_url, rate, duration, max_in_flight):
+    """
+    Poisson arrivals at `rate` requests/second for `duration` seconds
+
+    Latency is measured from each request's scheduled arrival time, so queueing
+    inside the harness shows up in the tail instead of being hidden.
+    """
+    recorder = Recorder()
+    started = time.perf_counter()
+    next_arrival = started
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        while next_arrival < started + duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_issue, call, base_url, recorder, next_arrival)
+            next_arrival += random.expovariate(rate)
+    return recorder.summary(time.perf_counter() - started)
+
+
+def wait_until_ready(base_url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/test", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def spawn_server(port, workers, threads, worker_class):
+    """Start gunicorn with the production config (gunicorn.conf.py) and stub providers"""
+    env = dict(os.environ)
+    env.setdefault('PROVIDER_BACKEND', 'stub')
+    env.setdefault('FLASK_DEBUG', 'False')
+    env.update({
+        'GUNICORN_BIND': f"127.0.0.1:{port}",
+        'GUNICORN_WORKERS': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'GUNICORN_WORKER_CLASS': worker_class,
+    })
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--spawn', action='store_true', help='Start gunicorn with PROVIDER_BACKEND=stub')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--worker-class', default='gthread', choices=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--endpoints', nargs='+', default=None, help='Subset of endpoints to load')
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 4, 16, 64],
+                        help='Closed-loop concurrency levels to sweep')
+    parser.add_argument('--rates', type=float, nargs='*', default=[],
+                        help='Open-loop arrival rates (req/s) to sweep')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per level')
+    parser.add_argument('--max-in-flight', type=int, default=512, help='Open-loop client concurrency cap')
+    parser.add_argument('--output', default=None, help='Write JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    endpoints = build_endpoints(_query_image())
+    selected = args.endpoints or list(endpoints)
+
+    server = None
+    base_url = args.base_url
+    if args.spawn:
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = spawn_server(args.port, args.workers, args.threads, args.worker_class)
+        if not wait_until_ready(base_url):
+            server.terminate()
+            sys.exit("Server did not become ready")
+
+    results = []
+    try:
+        for name in selected:
+            call = endpoints[name]
+            for concurrency in args.concurrency:
+                stats = run_closed_loop(call, base_url, concurrency, args.duration)
+                stats.update({'endpoint': name, 'mode': 'closed_loop', 'concurrency': concurrency})
+                results.append(stats)
+                print(f"{name} closed c={concurrency}: {stats['throughput_rps']:.1f} req/s "
+                      f"p99={stats['p99_ms']}ms errors={stats['error_rate']}", file=sys.stderr)
+            for rate in args.rates:
+                stats = run_open_loop(call, base_url, rate, args.duration, args.max_in_flight)
+                stats.update({'endpoint': name, 'mode': 'open_loop', 'arrival_rate': rate})
+                results.append(stats)
+                print(f"{name} open rate={rate}: {stats['throughput_rps']:.1f} req/s "
+                      f"p99={stats['p99_ms']}ms errors={stats['error_rate']}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        'meta': {
+            'base_url': base_url,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'duration_per_level': args.duration,
+            'provider_backend': os.environ.get('PROVIDER_BACKEND', 'stub' if args.spawn else None),
+            'stub_latency_ms': os.environ.get('STUB_LATENCY_MS'),
+            'stub_error_rate': os.environ.get('STUB_ERROR_RATE'),
+            'stub_throttle_rate': os.environ.get('STUB_THROTTLE_RATE'),
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Run shard servers for scatter-gather search
+
+One shard server serves partition --index of --count of each corpus it is
+asked about (contiguous row ranges, see shard_service.shard_bounds) over
+the /shard HTTP protocol. Corpora are memory-mapped (CORPUS_MMAP=True)
+unless --no-mmap is given, so a shard only reads the pages of its own rows.
+
+--local N starts N shard servers as separate processes on consecutive
+ports for testing, and prints the SHARD_ENDPOINTS value that points the
+search API (the coordinator) at them. Stop them with Ctrl-C.
+
+In production run one per node with gunicorn instead:
+    SHARD_INDEX=0 SHARD_COUNT=4 gunicorn -b 0.0.0.0:9100 'app:create_shard_app()'
+
+Usage:
+    python scripts/shard_server.py --index 0 --count 4 --port 9100
+    python scripts/shard_server.py --local 4 --base-port 9100 --corpora titan,cohere
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def run_local(args):
+    """Start args.local shard servers as child processes and wait for them"""
+    processes = []
+    for index in range(args.local):
+        command = [sys.executable, os.path.abspath(__file__), '--index', str(index), '--count', str(args.local),
+                   '--host', args.host, '--port', str(args.base_port + index)]
+        if args.no_mmap:
+            command.append('--no-mmap')
+        processes.append(subprocess.Popen(command, cwd=os.getcwd()))
+
+    urls = ','.join(f"http://{args.host}:{args.base_port + index}" for index in range(args.local))
+    names = [name.strip() for name in args.corpora.split(',') if name.strip()]
+    print(f"SHARD_ENDPOINTS='{';'.join(f'{name}={urls}' for name in names)}'", flush=True)
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', type=int, default=0, help='Partition served by this process')
+    parser.add_argument('--count', type=int, default=1, help='Number of partitions')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--local', type=int, default=0, help='Start this many shard servers locally')
+    parser.add_argument('--base-port', type=int, default=9100, help='Port of the first local shard server')
+    parser.add_argument('--corpora', default='titan', help='Corpora to list in the printed SHARD_ENDPOINTS')
+    parser.add_argument('--no-mmap', action='store_true', help='Load corpora into RAM instead of mapping them')
+    args = parser.parse_args()
+
+    if args.local:
+        return run_local(args)
+    if not 0 <= args.index < args.count:
+        parser.error('--index must be in [0, --count)')
+
+    # Settings are read at import
+    os.environ['SHARD_INDEX'] = str(args.index)
+    os.environ['SHARD_COUNT'] = str(args.count)
+    if not args.no_mmap:
+        os.environ.setdefault('CORPUS_MMAP', 'True')
+
+    from app import create_shard_app
+    app = create_shard_app()
+    app.run(host=args.host, port=args.port, threaded=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Train and evaluate reduced vectors for two-stage (coarse-to-fine) search
+
+`train` fits a projection per corpus and writes it to
+REDUCED_INDEX_DIR/<corpus>_reduced.npz:
+    --method pca        PCA basis fitted on (a sample of) the corpus
+    --method truncate   leading dimensions only (Matryoshka-style models)
+
+`evaluate` measures, for each shortlist size, recall@k of the two-stage
+ranking against the exhaustive full-dimension baseline, plus the latency of
+both. Queries are corpus rows with Gaussian noise added, so they are near,
+but not identical to, their best match. Without --dimension it evaluates
+the saved projection.
+
+Searches use two stages for the corpora listed in TWO_STAGE_CORPORA, with
+TWO_STAGE_SHORTLIST candidates rescored at full dimension.
+
+Usage:
+    python scripts/two_stage_search.py train --corpora titan,cohere --dimension 64
+    python scripts/two_stage_search.py evaluate --corpora titan --shortlists 100 250 500 1000
+    python scripts/two_stage_search.py evaluate --corpora voyage --method truncate --dimension 256
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def make_projection(reduced_index, corpus, method, dimension):
+    if method == 'truncate':
+        return reduced_index.Projection('truncate', min(dimension, corpus.dimension))
+    return reduced_index.train_pca(corpus.matrix, dimension)
+
+
+def evaluate(corpus, projection, queries, top_k, shortlists):
+    """Recall@top_k and per-query latency of two-stage search at each shortlist size"""
+    from app.services.vector_search import top_k_indices
+
+    reduced = projection.rows(corpus.matrix)
+    exact_ms, exact_top = [], []
+    for query in queries:
+        started = time.perf_counter()
+        exact_top.append(top_k_indices(corpus.matrix @ query, top_k))
+        exact_ms.append((time.perf_counter() - started) * 1000)
+
+    results = {'exhaustive_ms_p50': round(float(np.median(exact_ms)), 3), 'shortlists': {}}
+    for shortlist in shortlists:
+        shortlist = min(shortlist, len(corpus))
+        recalls, latencies = [], []
+        for query, expected in zip(queries, exact_top):
+            started = time.perf_counter()
+            coarse = reduced @ projection.query(query)
+            candidates = np.argpartition(coarse, -shortlist)[-shortlist:]
+            found = candidates[top_k_indices(corpus.matrix[candidates] @ query, top_k)]
+            latencies.append((time.perf_counter() - started) * 1000)
+            recalls.append(len(np.intersect1d(found, expected)) / len(expected))
+        results['shortlists'][shortlist] = {
+            'recall': round(float(np.mean(recalls)), 4),
+            'recall_min': round(float(np.min(recalls)), 4),
+            'ms_p50': round(float(np.median(latencies)), 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['train', 'evaluate'])
+    parser.add_argument('--corpora', default='titan', help='Comma-separated corpus names')
+    parser.add_argument('--method', choices=['pca', 'truncate'], default='pca')
+    parser.add_argument('--dimension', type=int, default=None, help='Reduced dimension (train default: 64)')
+    parser.add_argument('--queries', type=int, default=200, help='Evaluation queries per corpus')
+    parser.add_argument('--noise', type=float, default=0.05, help='Noise added to the sampled query rows')
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--shortlists', type=int, nargs='+', default=[100, 250, 500, 1000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    from app.services import reduced_index
+    from app.services.corpus_service import get_corpus
+
+    rng = np.random.default_rng(args.seed)
+    report = {}
+    for name in [name.strip() for name in args.corpora.split(',') if name.strip()]:
+        corpus = get_corpus(name)
+        if corpus is None:
+            report[name] = {'error': 'corpus not found'}
+            continue
+
+        if args.command == 'train':
+            started = time.perf_counter()
+            projection = make_projection(reduced_index, corpus, args.method, args.dimension or 64)
+            path = reduced_index.projection_path(name)
+            projection.save(path)
+            report[name] = {'method': projection.method, 'dimension': projection.dimension,
+                            'full_dimension': corpus.dimension, 'file': path,
+                            'seconds': round(time.perf_counter() - started, 2)}
+            continue
+
+        if args.dimension:
+            projection = make_projection(reduced_index, corpus, args.method, args.dimension)
+        else:
+            path = reduced_index.projection_path(name)
+            if not os.path.exists(path):
+                report[name] = {'error': f"no projection at {path}; run train or pass --dimension"}
+                continue
+            projection = reduced_index.Projection.load(path)
+
+        rows = rng.choice(len(corpus), min(args.queries, len(corpus)), replace=False)
+        queries = corpus.matrix[rows] + rng.normal(0, args.noise, (len(rows), corpus.dimension)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        report[name] = {'method': projection.method, 'dimension': projection.dimension,
+                        'full_dimension': corpus.dimension, 'rows': len(corpus), 'top_k': args.top_k,
+                        **evaluate(corpus, projection, queries, args.top_k, args.shortlists)}
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
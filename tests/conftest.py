@@ -0,0 +1,38 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def make_corpus(rows=2000, dimension=32, seed=0, name='test'):
+    """Corpus of random unit rows (no two rows score a query the same)"""
+    from app.services.corpus_service import Corpus
+
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((rows, dimension)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    paths = [f"images/{row}.jpg" for row in range(rows)]
+    return Corpus(name, f"{name}.json", 1.0, list(paths), paths, matrix)
+
+
+def exact_top_k(matrix, query, top_k, mask=None):
+    """Reference ranking: every allowed row scored with score_rows, fully sorted"""
+    from app.services.vector_search import score_rows
+
+    scores, rows = score_rows(matrix, query, mask)
+    order = np.argsort(scores)[::-1][:top_k]
+    return scores[order], (order if rows is None else rows[order])
+
+
+@pytest.fixture
+def corpus():
+    return make_corpus()
+
+
+@pytest.fixture
+def query():
+    vector = np.random.default_rng(1).standard_normal(32).astype(np.float32)
+    return vector / np.linalg.norm(vector)
@@ -0,0 +1,51 @@
+import asyncio
+import time
+import pytest
+from app.services import async_providers
+from app.services.async_providers import gather_named, run_blocking
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Install a provider pool of the given size for one test"""
+    def install(threads):
+        monkeypatch.setattr(async_providers, 'ASYNC_PROVIDER_THREADS', threads)
+        monkeypatch.setattr(async_providers, '_executor', async_providers._executor)
+        async_providers.reset_executor()
+    yield install
+    async_providers._executor.shutdown(wait=True)
+
+
+def fan_out(calls, delay):
+    """Wall-clock time of `calls` blocking provider calls gathered in one request"""
+    async def request():
+        return await gather_named(**{f"call{index}": run_blocking(time.sleep, delay) for index in range(calls)})
+    started = time.perf_counter()
+    results = asyncio.run(request())
+    assert len(results) == calls and all(result is None for result in results.values())
+    return time.perf_counter() - started
+
+
+def test_fan_out_overlaps(pool):
+    pool(8)
+    assert fan_out(4, 0.2) < 0.5
+
+
+def test_pool_size_is_the_concurrency_ceiling(pool):
+    # Two threads for four calls: they run in two waves
+    pool(2)
+    assert 0.4 <= fan_out(4, 0.2) < 0.7
+
+
+def test_failure_does_not_cancel_the_others(pool):
+    pool(4)
+
+    def fail():
+        raise RuntimeError('provider down')
+
+    async def request():
+        return await gather_named(ok=run_blocking(lambda: 'vector'), failed=run_blocking(fail), skipped=None)
+    results = asyncio.run(request())
+    assert results['ok'] == 'vector'
+    assert isinstance(results['failed'], RuntimeError)
+    assert 'skipped' not in results
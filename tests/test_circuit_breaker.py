@@ -0,0 +1,190 @@
+import pytest
+from app.utils import circuit_breaker
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN, get_breaker
+from app.utils.rate_limiter import MemoryBackend, RateLimiter, RateLimitExceeded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    monkeypatch.setenv('CB_TEST_FAILURE_THRESHOLD', '3')
+    monkeypatch.setenv('CB_TEST_RECOVERY_SECONDS', '10')
+    monkeypatch.setenv('CB_TEST_HALF_OPEN_PROBES', '1')
+    monkeypatch.setenv('CB_TEST_SUCCESS_THRESHOLD', '1')
+    return CircuitBreaker('test')
+
+
+@pytest.fixture
+def provider(monkeypatch, breaker):
+    # The decorator looks the breaker up by name
+    monkeypatch.setitem(circuit_breaker._breakers, 'test', breaker)
+    return breaker
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(ValueError('boom'), breaker.before_call())
+
+
+def test_settings_fall_back_to_global_then_default(monkeypatch):
+    monkeypatch.setenv('CB_FAILURE_THRESHOLD', '7')
+    monkeypatch.setenv('CB_OTHER_FAILURE_THRESHOLD', '2')
+    assert CircuitBreaker('other').failure_threshold == 2
+    assert CircuitBreaker('another').failure_threshold == 7
+    assert CircuitBreaker('another').recovery_timeout == 30.0
+
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.record_failure(ValueError('boom'), breaker.before_call())
+    breaker.record_failure(ValueError('boom'), breaker.before_call())
+    breaker.record_success(breaker.before_call())
+    # A success resets the streak
+    breaker.record_failure(ValueError('boom'), breaker.before_call())
+    breaker.record_failure(ValueError('boom'), breaker.before_call())
+    assert breaker.state == CLOSED
+
+    breaker.record_failure(ValueError('boom'), breaker.before_call())
+    assert breaker.state == OPEN
+    assert breaker.snapshot()['opened'] == 1
+
+
+def test_rejects_while_open(breaker, clock):
+    trip(breaker)
+    clock.now += 4
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_in == pytest.approx(6.0)
+    assert breaker.snapshot()['rejected'] == 1
+    assert breaker.snapshot()['retry_in_seconds'] == pytest.approx(6.0)
+
+
+def test_half_open_admits_limited_probes(breaker, clock):
+    trip(breaker)
+    clock.now += 10
+    assert breaker.before_call() is True
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_success_closes(breaker, clock):
+    trip(breaker)
+    clock.now += 10
+    breaker.record_success(breaker.before_call())
+    assert breaker.state == CLOSED
+    assert breaker.before_call() is False
+
+
+def test_probe_failure_reopens(breaker, clock):
+    trip(breaker)
+    clock.now += 10
+    breaker.record_failure(ValueError('still down'), breaker.before_call())
+    assert breaker.state == OPEN
+    assert breaker.opened_at == clock.now
+    assert breaker.last_error == 'still down'
+
+
+def test_success_threshold(monkeypatch, clock):
+    monkeypatch.setenv('CB_TEST_FAILURE_THRESHOLD', '1')
+    monkeypatch.setenv('CB_TEST_HALF_OPEN_PROBES', '2')
+    monkeypatch.setenv('CB_TEST_SUCCESS_THRESHOLD', '2')
+    breaker = CircuitBreaker('test')
+    trip(breaker)
+    clock.now += 30
+    first, second = breaker.before_call(), breaker.before_call()
+    breaker.record_success(first)
+    assert breaker.state == HALF_OPEN
+    breaker.record_success(second)
+    assert breaker.state == CLOSED
+
+
+def test_disabled_breaker_passes_through(monkeypatch):
+    monkeypatch.setenv('CB_ENABLED', 'False')
+    breaker = CircuitBreaker('test')
+    for _ in range(10):
+        breaker.record_failure(ValueError('boom'), breaker.before_call())
+    assert breaker.before_call() is False
+    assert breaker.snapshot()['state'] == 'disabled'
+
+
+def test_decorator_counts_exceptions(provider):
+    @circuit_breaker.circuit_breaker('test')
+    def call():
+        raise ValueError('boom')
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            call()
+    with pytest.raises(CircuitOpenError):
+        call()
+    assert get_breaker('test') is provider
+    assert provider.snapshot()['failures'] == 3
+
+
+def test_decorator_ignores_rate_limit_refusals(provider, clock):
+    @circuit_breaker.circuit_breaker('test')
+    def call():
+        raise RateLimitExceeded('test:default', 5.0)
+
+    for _ in range(5):
+        with pytest.raises(RateLimitExceeded):
+            call()
+    assert provider.state == CLOSED
+    assert provider.snapshot()['ignored'] == 5
+
+    # An ignored half-open probe gives its slot back instead of wedging the breaker
+    trip(provider)
+    clock.now += 10
+    with pytest.raises(RateLimitExceeded):
+        call()
+    assert provider.state == HALF_OPEN
+    assert provider.probes_in_flight == 0
+    assert provider.before_call() is True
+
+
+def test_decorator_failure_result_and_fallback(provider):
+    @circuit_breaker.circuit_breaker('test', is_failure=lambda result: result is None,
+                                     fallback=lambda error: 'fallback')
+    def call(value):
+        return value
+
+    assert call('ok') == 'ok'
+    for _ in range(3):
+        assert call(None) is None
+    assert provider.state == OPEN
+    assert call('ok') == 'fallback'
+
+
+def test_open_circuit_spends_no_token(provider):
+    # The provider services acquire their token inside the wrapped call
+    limiter = RateLimiter({'test': (1.0, 5.0)}, MemoryBackend(), max_wait=30)
+    key = limiter.bucket_key('test')
+
+    @circuit_breaker.circuit_breaker('test')
+    def call():
+        limiter.acquire('test')
+        raise ValueError('boom')
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            call()
+    assert provider.state == OPEN
+    level = limiter.backend.level(key)
+    with pytest.raises(CircuitOpenError):
+        call()
+    assert limiter.backend.level(key) == level
+    assert limiter.snapshot()['buckets'][key]['admitted'] == 3
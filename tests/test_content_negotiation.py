@@ -0,0 +1,140 @@
+import gzip
+import json
+import numpy as np
+import pytest
+from flask import Flask, Response, jsonify
+from app.utils import content_negotiation
+from app.utils.content_negotiation import init_content_negotiation
+from app.utils.serialization import json_response
+
+msgpack = content_negotiation.msgpack
+needs_msgpack = pytest.mark.skipif(msgpack is None, reason='msgpack is not installed')
+
+VECTOR = np.random.default_rng(0).standard_normal(256).astype(np.float32)
+RESULTS = {'results': [{'path': f"images/{row}.jpg", 'similarity': np.float32(1 / (row + 1))} for row in range(50)]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Minimal app with the negotiation hook and one route per kind of response"""
+    monkeypatch.setattr(content_negotiation, 'RESPONSE_COMPRESSION', True)
+    monkeypatch.setattr(content_negotiation, 'COMPRESS_MIN_BYTES', 256)
+    app = Flask(__name__)
+
+    @app.route('/embedding')
+    def embedding():
+        return json_response({'embedding': VECTOR, 'dimension': 256}, vector=VECTOR)
+
+    @app.route('/search')
+    def search():
+        return json_response(RESULTS)
+
+    @app.route('/plain')
+    def plain():
+        return jsonify({'message': 'x' * 1000})
+
+    @app.route('/small')
+    def small():
+        return json_response({'ok': True})
+
+    @app.route('/encoded')
+    def encoded():
+        response = Response(gzip.compress(b'{"ok": true}' * 100), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    @app.route('/streamed')
+    def streamed():
+        return Response((b'{"ok": true}' for _ in range(1)), mimetype='application/json')
+
+    init_content_negotiation(app)
+    return app.test_client()
+
+
+def test_json_is_the_default(client):
+    response = client.get('/embedding')
+    assert response.mimetype == 'application/json'
+    assert np.array_equal(np.asarray(response.get_json()['embedding'], dtype=np.float32), VECTOR)
+    assert 'Accept' in response.vary and 'Accept-Encoding' in response.vary
+
+
+@needs_msgpack
+@pytest.mark.parametrize('mimetype', ['application/msgpack', 'application/x-msgpack'])
+def test_msgpack(client, mimetype):
+    response = client.get('/search', headers={'Accept': mimetype})
+    assert response.mimetype == mimetype
+    decoded = msgpack.unpackb(response.get_data())
+    assert [result['path'] for result in decoded['results']] == [result['path'] for result in RESULTS['results']]
+    # use_single_float: similarities are packed as float32
+    assert [np.float32(result['similarity']) for result in decoded['results']] == \
+        [result['similarity'] for result in RESULTS['results']]
+
+
+@needs_msgpack
+def test_msgpack_from_a_plain_json_response(client):
+    response = client.get('/plain', headers={'Accept': 'application/msgpack'})
+    assert response.mimetype == 'application/msgpack'
+    assert msgpack.unpackb(response.get_data()) == {'message': 'x' * 1000}
+
+
+def test_raw_float32_vector(client):
+    response = client.get('/embedding', headers={'Accept': 'application/octet-stream'})
+    assert response.mimetype == 'application/octet-stream'
+    assert response.headers['X-Vector-Dimension'] == '256' and response.headers['X-Vector-Dtype'] == 'float32'
+    assert np.array_equal(np.frombuffer(response.get_data(), dtype='<f4'), VECTOR)
+    # Not compressed: octet-stream is not a compressible type
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_octet_stream_needs_a_vector(client):
+    response = client.get('/search', headers={'Accept': 'application/octet-stream'})
+    assert response.mimetype == 'application/json'
+
+
+def test_gzip(client):
+    response = client.get('/search', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert json.loads(gzip.decompress(response.get_data()))['results'][0]['path'] == 'images/0.jpg'
+
+
+@needs_msgpack
+def test_gzip_msgpack(client):
+    response = client.get('/search', headers={'Accept': 'application/msgpack', 'Accept-Encoding': 'gzip'})
+    assert response.mimetype == 'application/msgpack' and response.headers['Content-Encoding'] == 'gzip'
+    assert len(msgpack.unpackb(gzip.decompress(response.get_data()))['results']) == 50
+    assert {'Accept', 'Accept-Encoding'} <= set(response.vary)
+
+
+def test_brotli_preferred(client):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/search', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.get_data()))['results'][0]['path'] == 'images/0.jpg'
+
+
+def test_gzip_without_brotli(client, monkeypatch):
+    monkeypatch.setattr(content_negotiation, 'brotli', None)
+    assert client.get('/search', headers={'Accept-Encoding': 'gzip, br'}).headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in client.get('/search', headers={'Accept-Encoding': 'br'}).headers
+
+
+def test_small_and_disabled_are_not_compressed(client, monkeypatch):
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+    monkeypatch.setattr(content_negotiation, 'RESPONSE_COMPRESSION', False)
+    assert 'Content-Encoding' not in client.get('/search', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_already_encoded_response_is_left_alone(client):
+    response = client.get('/encoded', headers={'Accept': 'application/msgpack', 'Accept-Encoding': 'gzip, br'})
+    assert response.mimetype == 'application/json' and response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == b'{"ok": true}' * 100
+    assert 'Accept' not in response.vary
+
+
+def test_streamed_response_is_left_alone(client):
+    response = client.get('/streamed', headers={'Accept': 'application/msgpack', 'Accept-Encoding': 'gzip'})
+    assert response.mimetype == 'application/json' and 'Content-Encoding' not in response.headers
+    assert response.get_data() == b'{"ok": true}'
@@ -0,0 +1,95 @@
+import os
+import json
+import glob
+import numpy as np
+import pytest
+from app.services import corpus_service
+from app.services.corpus_service import corpora_snapshot, get_corpus
+
+
+def write_source(path, seed, rows=50, dimension=16, mtime=None):
+    """Cohere-layout corpus file of random vectors; returns them L2-normalized"""
+    embeddings = np.random.default_rng(seed).standard_normal((rows, dimension)).astype(np.float32)
+    with open(path, 'w') as f:
+        json.dump({'embeddings': embeddings.tolist(), 'image_paths': [f"images/{row}.jpg" for row in range(rows)]}, f)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def shared(monkeypatch, tmp_path):
+    """CORPUS_SHARED on, segments in tmp_path; returns (source file, publish calls)"""
+    source = str(tmp_path / 'shared_test.json')
+    monkeypatch.setitem(corpus_service.CORPUS_PATHS, 'shared_test', [source])
+    monkeypatch.setattr(corpus_service, 'CORPUS_SHARED', True)
+    monkeypatch.setattr(corpus_service, 'CORPUS_SHARED_DIR', str(tmp_path / 'shm'))
+    monkeypatch.setattr(corpus_service, '_corpora', {})
+    published = []
+    publish = corpus_service.publish_shared
+
+    def counting_publish(corpus):
+        published.append(corpus.mtime)
+        return publish(corpus)
+    monkeypatch.setattr(corpus_service, 'publish_shared', counting_publish)
+    return source, published
+
+
+def new_worker(monkeypatch):
+    """Forget this process' corpora, as a freshly started worker would"""
+    monkeypatch.setattr(corpus_service, '_corpora', {})
+
+
+def segments(directory):
+    return glob.glob(os.path.join(directory, 'shared_test-*.npy'))
+
+
+def test_publish_then_attach(monkeypatch, shared):
+    source, published = shared
+    expected = write_source(source, seed=0, mtime=1000.0)
+
+    first = get_corpus('shared_test')
+    assert published == [1000.0]
+    assert isinstance(first.matrix, np.memmap)
+    assert segments(corpus_service.CORPUS_SHARED_DIR) == [first.matrix.filename]
+    np.testing.assert_allclose(first.matrix, expected, rtol=1e-6)
+    assert corpora_snapshot()['corpora']['shared_test']['storage'] == 'shared'
+
+    # Another worker maps the same segment instead of parsing the source again
+    new_worker(monkeypatch)
+    second = get_corpus('shared_test')
+    assert published == [1000.0]
+    assert second is not first
+    assert second.matrix.filename == first.matrix.filename
+    assert np.array_equal(second.matrix, first.matrix)
+    assert second.paths == first.paths
+
+
+def test_rebuild_is_picked_up(monkeypatch, shared):
+    source, published = shared
+    write_source(source, seed=0, mtime=1000.0)
+    old = get_corpus('shared_test')
+    old_segment = old.matrix.filename
+
+    updated = write_source(source, seed=1, rows=60, mtime=2000.0)
+    current = get_corpus('shared_test')
+    assert published == [1000.0, 2000.0]
+    assert current.mtime == 2000.0 and len(current) == 60
+    np.testing.assert_allclose(current.matrix, updated, rtol=1e-6)
+    # The superseded segment is unlinked; the old mapping stays readable
+    assert segments(corpus_service.CORPUS_SHARED_DIR) == [current.matrix.filename]
+    assert not os.path.exists(old_segment)
+    assert old.matrix.shape == (50, 16)
+
+    new_worker(monkeypatch)
+    attached = get_corpus('shared_test')
+    assert published == [1000.0, 2000.0]
+    assert attached.matrix.filename == current.matrix.filename
+
+
+def test_stale_manifest_is_not_attached(shared):
+    source, _ = shared
+    write_source(source, seed=0, mtime=1000.0)
+    get_corpus('shared_test')
+    assert corpus_service._attach_shared('shared_test', source, 999.0) is None
+    assert corpus_service._attach_shared('shared_test', source, 1000.0) is not None
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from app.services import dedup_service
+from app.services.dedup_service import NO_CLUSTER, cluster_pairs, duplicate_pairs, get_cluster_ids, save_clusters
+from conftest import make_corpus
+
+
+def with_duplicates(rows=300, copies=40, seed=0):
+    """Random corpus whose last `copies` rows are slightly perturbed copies of earlier rows"""
+    corpus = make_corpus(rows=rows, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    originals = rng.choice(rows - copies, copies, replace=False)
+    noisy = corpus.matrix[originals] + 0.05 * rng.standard_normal((copies, corpus.dimension)).astype(np.float32)
+    corpus.matrix[rows - copies:] = noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+    return corpus
+
+
+def brute_force_pairs(matrix, threshold):
+    similarities = matrix @ matrix.T
+    a, b = np.nonzero(np.triu(similarities >= threshold, k=1))
+    return set(zip(a.tolist(), b.tolist()))
+
+
+@pytest.mark.parametrize('tile_rows', [32, 100, 1000])
+def test_duplicate_pairs_match_brute_force(tile_rows):
+    corpus = with_duplicates()
+    a, b = duplicate_pairs(corpus.matrix, 0.9, tile_rows=tile_rows, workers=4)
+    pairs = list(zip(a.tolist(), b.tolist()))
+    assert len(pairs) == len(set(pairs))
+    assert all(first < second for first, second in pairs)
+    assert set(pairs) == brute_force_pairs(corpus.matrix, 0.9)
+    assert len(pairs) >= 40
+
+
+def test_threshold_one_never_pairs_a_row_with_itself():
+    corpus = make_corpus(rows=50)
+    a, b = duplicate_pairs(corpus.matrix, 1.0, tile_rows=16)
+    assert a.size == 0 and b.size == 0
+
+
+@pytest.mark.parametrize('threshold', [0, -0.5, 1.5])
+def test_threshold_out_of_range(threshold):
+    with pytest.raises(ValueError):
+        duplicate_pairs(make_corpus(rows=10).matrix, threshold)
+
+
+def test_cluster_pairs_connected_components():
+    # 1-4-7 is a chain (1 and 7 are only connected through 4); 5-2 is a pair
+    a = np.array([4, 2, 4], dtype=np.int64)
+    b = np.array([7, 5, 1], dtype=np.int64)
+    cluster_ids = cluster_pairs(9, a, b)
+    assert cluster_ids.tolist() == [NO_CLUSTER, 1, 2, NO_CLUSTER, 1, 2, NO_CLUSTER, 1, NO_CLUSTER]
+    assert cluster_pairs(3, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)).tolist() == [NO_CLUSTER] * 3
+
+
+def test_saved_clusters_load_by_key(monkeypatch, tmp_path):
+    monkeypatch.setattr(dedup_service, 'DUPLICATE_CLUSTERS_DIR', str(tmp_path))
+    monkeypatch.setattr(dedup_service, '_cluster_ids', {})
+    corpus = with_duplicates()
+    cluster_ids, _ = dedup_service.find_duplicate_clusters(corpus, 0.9, tile_rows=64)
+    save_clusters(corpus, cluster_ids, 0.9)
+
+    loaded = get_cluster_ids(corpus)
+    # Cluster numbering differs, membership does not
+    assert np.array_equal(loaded == NO_CLUSTER, cluster_ids == NO_CLUSTER)
+    renumbering = {}
+    for row in np.flatnonzero(cluster_ids != NO_CLUSTER):
+        assert renumbering.setdefault(cluster_ids[row], loaded[row]) == loaded[row]
+    assert len(set(renumbering.values())) == len(renumbering)
+    assert get_cluster_ids(corpus) is loaded
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+import pytest
+from app.utils import fake_providers
+from app.utils.fake_providers import STUB_PROVIDERS, fake_embedding, fake_upload_file_to_s3, get_stub_client
+
+
+@pytest.fixture
+def stub_backend(monkeypatch):
+    monkeypatch.setenv('PROVIDER_BACKEND', 'stub')
+    monkeypatch.setenv('STUB_LATENCY_MS', '0')
+    monkeypatch.setattr(fake_providers, '_behaviors', {})
+
+
+def test_every_stub_provider_has_a_client(stub_backend):
+    for provider in STUB_PROVIDERS:
+        assert get_stub_client(provider) is not None
+
+
+def test_live_backend_has_no_stub_client(monkeypatch):
+    monkeypatch.delenv('PROVIDER_BACKEND', raising=False)
+    assert get_stub_client('s3') is None
+
+
+def test_fake_upload(stub_backend, monkeypatch):
+    assert fake_upload_file_to_s3('/tmp/query.jpg') == 'https://fake-bucket.s3.local/image_uploads/query.jpg'
+    monkeypatch.setenv('STUB_S3_ERROR_RATE', '1')
+    monkeypatch.setattr(fake_providers, '_behaviors', {})
+    assert fake_upload_file_to_s3('/tmp/query.jpg') is None
+
+
+def test_fake_embedding_is_deterministic_unit_length():
+    vector = fake_embedding('text', 'a red chair', dimension=64)
+    assert vector == fake_embedding('text', 'a red chair', dimension=64)
+    assert vector != fake_embedding('text', 'a blue chair', dimension=64)
+    assert sum(value * value for value in vector) == pytest.approx(1.0, rel=1e-5)
+
+
+def test_install_skips_modules_that_do_not_import(monkeypatch):
+    titan_service = SimpleNamespace(bedrock_client=None)
+
+    def import_module(name):
+        if name == 'app.services.titan_service':
+            return titan_service
+        raise ImportError(f"No module named {name}")
+    monkeypatch.setattr(fake_providers.importlib, 'import_module', import_module)
+    fake_providers.install_fake_providers()
+    assert isinstance(titan_service.bedrock_client, fake_providers.FakeBedrockClient)
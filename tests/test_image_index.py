@@ -0,0 +1,127 @@
+import os
+import time
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from PIL import Image
+from app.services import image_index, metadata_index
+from app.services.image_index import ImageIndex, availability_mask, consistency_report, is_local_path
+from conftest import make_corpus
+
+
+def event(path, dest_path=None):
+    return SimpleNamespace(is_directory=False, src_path=str(path), dest_path=str(dest_path))
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    """Directory with images/0.jpg .. 4.jpg (corpus rows 0-4) and an unreferenced extra.png"""
+    directory = tmp_path / 'images'
+    directory.mkdir()
+    for name in ['0.jpg', '1.jpg', '2.jpg', '3.jpg', '4.jpg', 'extra.png']:
+        Image.new('RGB', (8, 8)).save(directory / name)
+    (directory / 'notes.txt').write_text('not an image')
+    return directory
+
+
+@pytest.fixture
+def index(monkeypatch, image_dir):
+    index = ImageIndex(str(image_dir))
+    monkeypatch.setattr(image_index, 'IMAGE_INDEX_WATCH', False)
+    monkeypatch.setattr(image_index, '_index', index)
+    return index
+
+
+def test_is_local_path():
+    assert is_local_path('images/1.jpg')
+    assert not is_local_path('https://bucket.s3.amazonaws.com/1.jpg')
+    assert not is_local_path('') and not is_local_path(None)
+
+
+def test_scan(index):
+    assert sorted(index.files) == ['0.jpg', '1.jpg', '2.jpg', '3.jpg', '4.jpg', 'extra.png']
+    assert index.exists('anywhere/2.jpg') is True
+    assert index.exists('images/9.jpg') is False
+    assert index.exists('https://example.com/2.jpg') is None
+    assert index.stat('2.jpg')[1] == os.path.getsize(index.image_dir + '/2.jpg')
+
+
+def test_watcher_events(index, image_dir):
+    handler = image_index._WatchdogHandler(index)
+    generation = index.generation
+
+    Image.new('RGB', (8, 8)).save(image_dir / '9.jpg')
+    handler.on_created(event(image_dir / '9.jpg'))
+    assert index.exists('9.jpg') and index.generation == generation + 1
+
+    os.remove(image_dir / '0.jpg')
+    handler.on_deleted(event(image_dir / '0.jpg'))
+    assert not index.exists('0.jpg') and index.generation == generation + 2
+
+    os.replace(image_dir / '1.jpg', image_dir / 'renamed.jpg')
+    handler.on_moved(event(image_dir / '1.jpg', image_dir / 'renamed.jpg'))
+    assert not index.exists('1.jpg') and index.exists('renamed.jpg')
+
+    # Events that change nothing, or are not images, leave the generation alone
+    generation = index.generation
+    handler.on_modified(event(image_dir / 'notes.txt'))
+    handler.on_deleted(event(image_dir / 'never-existed.jpg'))
+    assert index.generation == generation
+
+
+def test_availability_follows_the_index(index, image_dir):
+    corpus = make_corpus(rows=8)
+    available = index.availability(corpus)
+    assert available.tolist() == [True] * 5 + [False] * 3
+    assert index.availability(corpus) is available
+
+    os.remove(image_dir / '3.jpg')
+    index.update(str(image_dir / '3.jpg'))
+    assert index.availability(corpus).tolist() == [True, True, True, False, True, False, False, False]
+
+    remote = make_corpus(rows=3)
+    remote.paths = [f"https://example.com/{row}.jpg" for row in range(3)]
+    remote.name = 'remote'
+    assert index.availability(remote) is None
+
+
+def test_poller_picks_up_new_files(monkeypatch, index, image_dir):
+    monkeypatch.setattr(image_index, 'Observer', None)
+    monkeypatch.setattr(image_index, 'IMAGE_INDEX_POLL_SECONDS', 0.02)
+    index.start_watcher()
+    assert index.snapshot()['watcher'] == 'poll'
+
+    Image.new('RGB', (8, 8)).save(image_dir / 'late.jpg')
+    deadline = time.monotonic() + 5
+    while not index.exists('late.jpg') and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert index.exists('late.jpg')
+
+
+@pytest.mark.parametrize('mode', ['flag', 'skip'])
+def test_missing_mode(monkeypatch, index, mode):
+    monkeypatch.setattr(image_index, 'IMAGE_INDEX_MISSING', mode)
+    monkeypatch.setattr(metadata_index, '_indexes', {})
+    corpus = make_corpus(rows=8)
+    if mode == 'flag':
+        assert availability_mask(corpus) is None
+        assert metadata_index.filter_mask(corpus, None) is None
+        return
+    assert np.flatnonzero(availability_mask(corpus)).tolist() == [0, 1, 2, 3, 4]
+    # Missing rows are also dropped from filtered searches
+    assert np.flatnonzero(metadata_index.filter_mask(corpus, {'extension': 'jpg'})).tolist() == [0, 1, 2, 3, 4]
+    assert np.flatnonzero(metadata_index.filter_mask(corpus, None)).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_consistency_report(index, image_dir):
+    (image_dir / '4.jpg').write_bytes(b'not really a jpeg')
+    index.refresh()
+    remote = make_corpus(rows=2, name='remote')
+    remote.paths = ['https://example.com/0.jpg', 'https://example.com/1.jpg']
+
+    report = consistency_report([make_corpus(rows=7), remote], workers=2, verify=True)
+    assert report['files'] == 6
+    assert report['corpora']['test'] == {'rows': 7, 'missing': 2, 'missing_sample': ['5.jpg', '6.jpg']}
+    assert report['corpora']['remote'] == {'rows': 2, 'remote': True}
+    assert (report['orphaned'], report['orphaned_sample']) == (1, ['extra.png'])
+    assert (report['corrupt'], report['corrupt_sample']) == (1, ['4.jpg'])
@@ -0,0 +1,128 @@
+import os
+import json
+import datetime
+import numpy as np
+import pytest
+from app.services import image_index, metadata_index
+from app.services.corpus_service import Corpus
+from app.services.metadata_index import FilterError, MetadataIndex, filter_mask, parse_filters
+
+PATHS = [
+    'photos/cats/1.jpg',
+    'photos/cats/2.png',
+    'photos/dogs/3.jpg',
+    'https://bucket.s3.amazonaws.com/archive/dogs/4.JPG',
+    'https://bucket.s3.amazonaws.com/archive/birds/5.webp',
+]
+ATTRIBUTES = {
+    'photos/cats/1.jpg': {'tags': ['indoor', 'Sleeping'], 'date': '2024-05-01'},
+    '2.png': {'tags': 'outdoor', 'date': '2023-12-31T10:00:00'},
+    'photos/dogs/3.jpg': {'tags': ['outdoor'], 'photographer': 'ana', 'date': 'not a date'},
+    PATHS[3]: {'tags': ['indoor'], 'date': '2024-01-15'},
+}
+
+
+@pytest.fixture(autouse=True)
+def images(monkeypatch, tmp_path):
+    """Empty image directory standing in for IMAGE_DIR (dates fall back to its files' mtimes)"""
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    monkeypatch.setattr(image_index, 'IMAGE_INDEX_WATCH', False)
+    monkeypatch.setattr(image_index, '_index', image_index.ImageIndex(str(image_dir)))
+    return image_dir
+
+
+@pytest.fixture
+def small_corpus():
+    matrix = np.eye(len(PATHS), dtype=np.float32)
+    return Corpus('meta', 'meta.json', 1.0, list(PATHS), list(PATHS), matrix)
+
+
+@pytest.fixture
+def index(small_corpus):
+    return MetadataIndex(small_corpus, ATTRIBUTES)
+
+
+def rows(mask):
+    return np.flatnonzero(mask).tolist()
+
+
+def test_columns(index):
+    columns = index.columns()
+    assert columns['folder'] == 4
+    assert columns['extension'] == 3
+    assert columns['host'] == 1
+    assert columns['tags'] == 3
+    assert 'date' not in columns
+
+
+def test_or_within_a_key_and_across_keys(index):
+    assert rows(index.mask({'tags': 'indoor'})) == [0, 3]
+    # Values are case-insensitive; a list ORs them
+    assert rows(index.mask({'tags': ['SLEEPING', 'outdoor']})) == [0, 1, 2]
+    assert rows(index.mask({'tags': 'outdoor', 'extension': 'jpg'})) == [2]
+    assert rows(index.mask({'folder': 'archive/dogs'})) == [3]
+    assert rows(index.mask({'tags': 'no such tag'})) == []
+
+
+def test_prefix_matches_paths_and_object_keys(index):
+    assert rows(index.mask({'prefix': 'photos/cats/'})) == [0, 1]
+    assert rows(index.mask({'prefix': ['archive/', 'photos/dogs']})) == [2, 3, 4]
+    assert rows(index.mask({'prefix': 'https://bucket'})) == [3, 4]
+
+
+def test_date_range(index):
+    # Rows without a usable date never match a date filter
+    assert rows(index.mask({'date_from': '2024-01-01'})) == [0, 3]
+    assert rows(index.mask({'date_to': '2024-01-15'})) == [1, 3]
+    assert rows(index.mask({'date_from': '2024-01-01', 'date_to': '2024-02-01', 'tags': 'indoor'})) == [3]
+
+
+def test_date_falls_back_to_the_image_file(images, small_corpus):
+    # 3.jpg has no usable sidecar date; its file in the image directory dates it
+    image = images / '3.jpg'
+    image.write_bytes(b'jpeg')
+    timestamp = datetime.datetime(2022, 7, 4, 12).timestamp()
+    os.utime(image, (timestamp, timestamp))
+    image_index.get_image_index().refresh()
+
+    index = MetadataIndex(small_corpus, ATTRIBUTES)
+    assert index.dates.tolist() == [20240501, 20231231, 20220704, 20240115, -1]
+    assert rows(index.mask({'date_from': '2022-07-04', 'date_to': '2022-07-04'})) == [2]
+
+
+def test_invalid_filters(index):
+    assert index.mask({}) is None
+    with pytest.raises(FilterError):
+        index.mask({'colour': 'red'})
+    with pytest.raises(FilterError):
+        index.mask({'date_from': 'yesterday'})
+    for prefix in (3, ['photos/', None], {'a': 1}):
+        with pytest.raises(FilterError):
+            index.mask({'prefix': prefix})
+
+
+def test_filter_mask_reads_sidecars(monkeypatch, tmp_path, small_corpus):
+    shared = tmp_path / 'image_metadata.json'
+    shared.write_text(json.dumps({'1.jpg': {'tags': 'shared'}, '5.webp': {'tags': 'shared'}}))
+    # Per-corpus entries override the shared ones
+    (tmp_path / 'meta_metadata.json').write_text(json.dumps({'1.jpg': {'tags': 'own'}}))
+    monkeypatch.setattr(metadata_index, 'IMAGE_METADATA_FILE', str(shared))
+    monkeypatch.setattr(metadata_index, '_indexes', {})
+    monkeypatch.setattr(image_index, 'IMAGE_INDEX_MISSING', 'flag')
+
+    assert rows(filter_mask(small_corpus, {'tags': 'shared'})) == [4]
+    assert rows(filter_mask(small_corpus, {'tags': 'own'})) == [0]
+    assert filter_mask(small_corpus, None) is None
+
+
+def test_parse_filters():
+    assert parse_filters(None) is None
+    assert parse_filters('') is None
+    assert parse_filters('{}') is None
+    assert parse_filters('{"tags": ["cat"]}') == {'tags': ['cat']}
+    assert parse_filters({'folder': 'a'}) == {'folder': 'a'}
+    with pytest.raises(FilterError):
+        parse_filters('{tags')
+    with pytest.raises(FilterError):
+        parse_filters('["cat"]')
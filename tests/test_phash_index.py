@@ -0,0 +1,86 @@
+import sys
+import asyncio
+from types import ModuleType
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from app.services import async_providers, corpus_service, phash_index
+from app.services.phash_index import build_index, hash_file, lookup_embedding
+from conftest import make_corpus
+
+
+def draw(path, seed):
+    """Random rectangles, so every image hashes differently"""
+    rng = np.random.default_rng(seed)
+    image = Image.new('RGB', (128, 128), 'white')
+    canvas = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.integers(0, 100, 2).tolist()
+        canvas.rectangle([x, y, x + 28, y + 28], fill=tuple(rng.integers(0, 255, 3).tolist()))
+    image.save(path)
+
+
+@pytest.fixture
+def catalog(monkeypatch, tmp_path):
+    """Hash index over images/0.jpg .. 4.jpg, the first rows of a 'cohere' corpus"""
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    for row in range(5):
+        draw(image_dir / f"{row}.jpg", row)
+    index, _ = build_index(str(image_dir), workers=1)
+    index_file = str(tmp_path / 'phash_index.npz')
+    index.save(index_file)
+
+    corpus = make_corpus(rows=20, name='cohere')
+    monkeypatch.setattr(phash_index, 'PHASH_ENABLED', True)
+    monkeypatch.setattr(phash_index, 'PHASH_INDEX_FILE', index_file)
+    monkeypatch.setattr(phash_index, '_index', None)
+    monkeypatch.setattr(phash_index, '_rows_by_name', {})
+    monkeypatch.setattr(corpus_service, 'get_corpus', lambda name: corpus if name == 'cohere' else None)
+    return image_dir, corpus
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Stand-in cohere_service recording every provider call"""
+    calls = []
+    module = ModuleType('app.services.cohere_service')
+    module.get_cohere_embedding = lambda image_path: calls.append(image_path) or [0.5] * 32
+    monkeypatch.setitem(sys.modules, 'app.services.cohere_service', module)
+    return calls
+
+
+def test_reencoded_catalog_image_matches(monkeypatch, catalog, tmp_path):
+    image_dir, corpus = catalog
+    upload = tmp_path / 'upload.png'
+    with Image.open(image_dir / '3.jpg') as image:
+        image.resize((200, 200)).save(upload)
+    monkeypatch.setattr(phash_index, '_lookups', {'hits': 0, 'misses': 0})
+    embedding, path = lookup_embedding('cohere', str(upload))
+    assert path == corpus.paths[3]
+    np.testing.assert_array_equal(embedding, corpus.matrix[3])
+
+    other = tmp_path / 'other.jpg'
+    draw(other, 99)
+    assert hash_file(str(other)) is not None
+    assert lookup_embedding('cohere', str(other)) is None
+    assert (phash_index.snapshot()['hits'], phash_index.snapshot()['misses']) == (1, 1)
+
+
+def test_catalog_image_skips_the_provider(catalog, provider, tmp_path):
+    image_dir, corpus = catalog
+    embedding = asyncio.run(async_providers.cohere_image_embedding(str(image_dir / '2.jpg')))
+    np.testing.assert_array_equal(embedding, corpus.matrix[2])
+    assert provider == []
+
+    other = tmp_path / 'other.jpg'
+    draw(other, 99)
+    assert asyncio.run(async_providers.cohere_image_embedding(str(other))) == [0.5] * 32
+    assert provider == [str(other)]
+
+
+def test_disabled_index_calls_the_provider(monkeypatch, catalog, provider):
+    image_dir, _ = catalog
+    monkeypatch.setattr(phash_index, 'PHASH_ENABLED', False)
+    asyncio.run(async_providers.cohere_image_embedding(str(image_dir / '2.jpg')))
+    assert provider == [str(image_dir / '2.jpg')]
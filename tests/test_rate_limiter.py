@@ -0,0 +1,98 @@
+import pytest
+from app.utils import rate_limiter
+from app.utils.rate_limiter import MemoryBackend, SQLiteBackend, RateLimiter, RateLimitExceeded, parse_rate_limits
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteBackend(str(tmp_path / 'rate_limits.sqlite3'))
+    return MemoryBackend()
+
+
+def test_parse_rate_limits():
+    limits = parse_rate_limits("cohere=100/m:5, azure=10/s,voyage=7200/h,bad")
+    assert limits['cohere'] == pytest.approx((100 / 60, 5.0))
+    # Default burst is one second's worth of tokens, at least one
+    assert limits['azure'] == (10.0, 10.0)
+    assert limits['voyage'] == (2.0, 2.0)
+    assert parse_rate_limits("titan=30/m")['titan'] == (0.5, 1.0)
+    assert parse_rate_limits('') == {}
+
+
+def test_bucket_drains_then_refills(backend):
+    # rate 2/s, burst 3: three calls are free, the fourth waits half a second
+    for _ in range(3):
+        assert backend.reserve('p:default', 2.0, 3.0, 1, now=100.0) == 0.0
+    assert backend.reserve('p:default', 2.0, 3.0, 1, now=100.0) == pytest.approx(0.5)
+    assert backend.level('p:default') == pytest.approx(-1.0)
+
+    # One second later two tokens have come back (one pays off the debt)
+    assert backend.reserve('p:default', 2.0, 3.0, 1, now=101.0) == 0.0
+    assert backend.level('p:default') == pytest.approx(0.0)
+
+
+def test_bucket_never_exceeds_burst(backend):
+    backend.reserve('p:default', 2.0, 3.0, 1, now=0.0)
+    backend.reserve('p:default', 2.0, 3.0, 1, now=1000.0)
+    assert backend.level('p:default') == pytest.approx(2.0)
+
+
+def test_refund(backend):
+    backend.reserve('p:default', 1.0, 1.0, 1, now=0.0)
+    backend.refund('p:default', 1)
+    assert backend.level('p:default') == pytest.approx(1.0)
+    # Refunding an unknown key is a no-op
+    backend.refund('other:default', 1)
+    assert backend.level('other:default') is None
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    path = str(tmp_path / 'rate_limits.sqlite3')
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    first.reserve('p:default', 1.0, 1.0, 1, now=10.0)
+    assert second.reserve('p:default', 1.0, 1.0, 1, now=10.0) == pytest.approx(1.0)
+
+
+def test_unlimited_provider_is_admitted():
+    limiter = RateLimiter({}, MemoryBackend(), max_wait=0)
+    assert limiter.acquire('azure') == 0.0
+    assert limiter.snapshot()['buckets'] == {}
+
+
+def test_acquire_waits_for_a_token(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, 'time', lambda: 50.0)
+    monkeypatch.setattr(rate_limiter.time, 'sleep', sleeps.append)
+    limiter = RateLimiter({'cohere': (4.0, 1.0)}, MemoryBackend(), max_wait=1.0)
+
+    assert limiter.acquire('cohere', api_key='secret') == 0.0
+    assert limiter.acquire('cohere', api_key='secret') == pytest.approx(0.25)
+    assert sleeps == [pytest.approx(0.25)]
+
+    key = RateLimiter.bucket_key('cohere', 'secret')
+    assert 'secret' not in key
+    metrics = limiter.snapshot()['buckets'][key]
+    assert metrics['admitted'] == 2
+    assert metrics['delayed'] == 1
+    assert metrics['queue_depth'] == 0
+
+
+def test_acquire_rejects_and_refunds(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, 'time', lambda: 50.0)
+    monkeypatch.setattr(rate_limiter.time, 'sleep', lambda seconds: None)
+    backend = MemoryBackend()
+    limiter = RateLimiter({'cohere': (1.0, 1.0)}, backend, max_wait=0.5)
+    key = RateLimiter.bucket_key('cohere')
+
+    limiter.acquire('cohere')
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.acquire('cohere')
+    assert excinfo.value.key == key
+    assert excinfo.value.wait == pytest.approx(1.0)
+    # The refused token went back, so the bucket is as the admitted call left it
+    assert backend.level(key) == pytest.approx(0.0)
+    assert limiter.snapshot()['buckets'][key]['rejected'] == 1
+
+    # A caller willing to wait longer is admitted
+    assert limiter.acquire('cohere', max_wait=2.0) == pytest.approx(1.0)
@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+from app.services import result_cursor
+from app.services.result_cursor import (
+    CursorCache, CursorExpired, SQLiteCursorCache, paged_search, parse_page_size, resume_search,
+)
+from conftest import make_corpus
+
+DEPTH = 16
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, monkeypatch, tmp_path):
+    if request.param == 'sqlite':
+        cache = SQLiteCursorCache(str(tmp_path / 'search_cursors.sqlite3'))
+    else:
+        cache = CursorCache()
+    monkeypatch.setattr(result_cursor, '_cursor_cache', cache)
+    # A shallow first ranking, so paging crosses the re-rank boundary early
+    monkeypatch.setattr(result_cursor, 'SEARCH_CURSOR_DEPTH', DEPTH)
+    return cache
+
+
+def page_through(corpus, queries, page_size, mask=None, cluster_ids=None):
+    rows, scores, _, cursor = paged_search(corpus, queries, page_size, mask, cluster_ids)
+    pages = [rows]
+    all_scores = [scores]
+    while cursor is not None:
+        _, rows, scores, _, cursor = resume_search(cursor, page_size, corpus)
+        pages.append(rows)
+        all_scores.append(scores)
+    return np.concatenate(pages), np.concatenate(all_scores), pages
+
+
+def test_pages_match_the_exhaustive_ranking(cache, query):
+    corpus = make_corpus(rows=300)
+    mask = np.random.default_rng(7).random(len(corpus)) < 0.4
+    rows, scores, pages = page_through(corpus, {'image': (query, 1.0)}, 7, mask)
+
+    expected = np.flatnonzero(mask)[np.argsort(corpus.matrix[mask] @ query)[::-1]]
+    assert np.array_equal(rows, expected)
+    np.testing.assert_allclose(scores, corpus.matrix[expected] @ query, rtol=1e-5, atol=1e-6)
+    assert all(len(page) == 7 for page in pages[:-1])
+    assert len(rows) == len(set(rows.tolist()))
+
+
+def test_deeper_ranking_is_saved(cache, query):
+    corpus = make_corpus(rows=300)
+    _, _, _, cursor = paged_search(corpus, {'image': (query, 1.0)}, 10)
+    result_id = cursor.rpartition('.')[0]
+    resume_search(f"{result_id}.{DEPTH}", 10, corpus)
+    # Later pages (from any worker, for the sqlite backend) start from the deeper ranking
+    assert len(cache.get(result_id, corpus).rows) == 2 * DEPTH
+
+
+def test_components_for_each_page(cache, query):
+    corpus = make_corpus(rows=100)
+    other = np.random.default_rng(8).standard_normal(32).astype(np.float32)
+    _, _, _, cursor = paged_search(corpus, {'image': (query, 0.5), 'text': (other, 0.5)}, 5)
+    _, rows, _, components, _ = resume_search(cursor, 5, corpus)
+    np.testing.assert_allclose(components['text'], corpus.matrix[rows] @ (other / np.linalg.norm(other)),
+                               rtol=1e-5, atol=1e-6)
+
+
+def test_last_page_has_no_cursor(cache, query):
+    corpus = make_corpus(rows=10)
+    rows, _, _, cursor = paged_search(corpus, {'image': (query, 1.0)}, 10)
+    assert len(rows) == 10 and cursor is None
+
+
+def test_only_searches_with_more_pages_store_a_cursor(cache, query):
+    corpus = make_corpus(rows=300)
+    mask = np.zeros(len(corpus), dtype=bool)
+    mask[:8] = True
+    # Everything fits on the first page: nothing is written to the cache
+    for page_corpus, page_mask in ((make_corpus(rows=10), None), (corpus, mask)):
+        _, _, _, cursor = paged_search(page_corpus, {'image': (query, 1.0)}, 10, page_mask)
+        assert cursor is None
+    assert len(cache) == 0
+
+    _, _, _, cursor = paged_search(corpus, {'image': (query, 1.0)}, 10)
+    assert cursor is not None and len(cache) == 1
+
+
+def test_reloaded_corpus_rejects_cursor(cache, query):
+    corpus = make_corpus(rows=100)
+    _, _, _, cursor = paged_search(corpus, {'image': (query, 1.0)}, 5)
+    reloaded = make_corpus(rows=100)
+    reloaded.mtime = corpus.mtime + 1
+    with pytest.raises(CursorExpired):
+        resume_search(cursor, 5, reloaded)
+
+
+def test_unknown_and_malformed_cursors(cache):
+    corpus = make_corpus(rows=10)
+    with pytest.raises(CursorExpired):
+        resume_search('nosuchid.5', 5, corpus)
+    with pytest.raises(CursorExpired):
+        resume_search('nosuchid.five', 5, corpus)
+
+
+def test_expired_cursor(cache, query):
+    corpus = make_corpus(rows=100)
+    _, _, _, cursor = paged_search(corpus, {'image': (query, 1.0)}, 5)
+    cache.ttl = -1
+    with pytest.raises(CursorExpired):
+        resume_search(cursor, 5, corpus)
+
+
+def test_collapsed_pages_keep_one_row_per_cluster(monkeypatch, query):
+    monkeypatch.setattr(result_cursor, '_cursor_cache', CursorCache())
+    monkeypatch.setattr(result_cursor, 'SEARCH_CURSOR_DEPTH', DEPTH)
+    corpus = make_corpus(rows=200)
+    # Rows 2i and 2i + 1 are duplicates for i < 50; the rest are singletons
+    cluster_ids = np.full(len(corpus), -1, dtype=np.int64)
+    cluster_ids[:100] = np.arange(100) // 2 * 2
+    rows, _, _ = page_through(corpus, {'image': (query, 1.0)}, 6, cluster_ids=cluster_ids)
+
+    ranked = np.argsort(corpus.matrix @ query)[::-1]
+    seen, expected = set(), []
+    for row in ranked:
+        cluster = cluster_ids[row]
+        if cluster < 0 or cluster not in seen:
+            expected.append(row)
+            seen.add(cluster)
+    assert rows.tolist() == expected
+    assert len(rows) == 150
+
+
+def test_result_set_round_trip(query):
+    corpus = make_corpus(rows=50)
+    mask = np.arange(len(corpus)) % 3 == 0
+    result_set = result_cursor.ResultSet(corpus, {'image': (query, 1.0)}, mask, 8)
+    restored = result_cursor.ResultSet.from_bytes(corpus, result_set.to_bytes(), result_set.created)
+    assert np.array_equal(restored.mask, mask)
+    assert np.array_equal(restored.rows, result_set.rows)
+    assert (restored.total, restored.exhausted) == (result_set.total, result_set.exhausted)
+    assert restored.page(0, 17)[0].tolist() == result_set.page(0, 17)[0].tolist()
+
+
+def test_parse_page_size(monkeypatch):
+    monkeypatch.setattr(result_cursor, 'SEARCH_MAX_PAGE_SIZE', 50)
+    assert parse_page_size(None) == 10
+    assert parse_page_size('25') == 25
+    assert parse_page_size('abc', default=5) == 5
+    assert parse_page_size(0) == 1
+    assert parse_page_size(1000) == 50
@@ -0,0 +1,83 @@
+import json
+import numpy as np
+import pytest
+from flask import Flask, jsonify
+from app.utils import serialization
+from app.utils.serialization import NumpyJSONEncoder, decode_vector, dumps, encode_vector, json_response
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    """Run with orjson when installed, and with the json fallback"""
+    if request.param == 'orjson' and serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+    if request.param == 'json':
+        monkeypatch.setattr(serialization, 'orjson', None)
+    return request.param
+
+
+def test_ndarray_round_trip(encoder):
+    vector = np.random.default_rng(0).standard_normal(256).astype(np.float32)
+    decoded = json.loads(dumps({'embedding': vector}))['embedding']
+    assert np.array_equal(np.asarray(decoded, dtype=np.float32), vector)
+
+
+def test_float32_keeps_its_shortest_repr(encoder):
+    similarity = np.float32(0.1)
+    assert json.loads(dumps({'similarity': similarity}))['similarity'] == 0.1
+    assert b'0.10000000149' not in dumps([similarity])
+
+
+def test_nested_results_round_trip(encoder):
+    rng = np.random.default_rng(1)
+    results = {
+        'results': [{'path': f"images/{row}.jpg", 'similarity': np.float32(score), 'row': np.int64(row),
+                     'components': {'image': np.float32(score / 2)}}
+                    for row, score in enumerate(rng.random(3))],
+        'query_embedding': rng.standard_normal(8).astype(np.float32),
+        'total': np.int64(3),
+        'exhausted': np.bool_(True),
+    }
+    decoded = json.loads(dumps(results))
+    assert decoded['total'] == 3 and decoded['exhausted'] is True
+    assert [result['row'] for result in decoded['results']] == [0, 1, 2]
+    for result, original in zip(decoded['results'], results['results']):
+        assert np.float32(result['similarity']) == original['similarity']
+        assert np.float32(result['components']['image']) == original['components']['image']
+    assert np.array_equal(np.asarray(decoded['query_embedding'], dtype=np.float32), results['query_embedding'])
+
+
+def test_json_response_keeps_the_payload(encoder):
+    vector = np.arange(4, dtype=np.float32)
+    payload = {'embedding': vector, 'similarity': np.float32(0.5)}
+    with Flask(__name__).app_context():
+        response = json_response(payload, status=201, vector=vector)
+    assert response.status_code == 201 and response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == {'embedding': [0.0, 1.0, 2.0, 3.0], 'similarity': 0.5}
+    assert response.payload is payload and response.vector is vector
+
+
+def test_jsonify_with_numpy_encoder():
+    app = Flask(__name__)
+    app.json_encoder = NumpyJSONEncoder
+    with app.app_context():
+        response = jsonify({'embedding': np.ones(2, dtype=np.float32), 'similarity': np.float32(0.1)})
+    assert json.loads(response.get_data()) == {'embedding': [1.0, 1.0], 'similarity': 0.1}
+
+
+@pytest.mark.parametrize('encoding, atol', [('float32', 0), ('float16', 1e-3)])
+@pytest.mark.parametrize('as_array', [False, True])
+def test_encode_vector_round_trip(encoding, atol, as_array):
+    vector = np.random.default_rng(2).uniform(-1, 1, 256).astype(np.float32)
+    encoded = encode_vector(vector if as_array else vector.tolist(), encoding)
+    assert encoded['encoding'] == encoding and encoded['dimension'] == 256
+    decoded = decode_vector(json.loads(dumps(encoded)))
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vector, rtol=0, atol=atol)
+
+
+def test_json_encoding_passes_vectors_through():
+    vector = np.ones(3, dtype=np.float32)
+    assert encode_vector(vector) is vector
+    assert encode_vector(None, 'float32') is None
+    assert np.array_equal(decode_vector([1, 1, 1]), vector)
@@ -0,0 +1,152 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from app.services import shard_service
+from app.services.shard_service import decode_mask, encode_mask, scatter_search, search_partition, shard_bounds
+from app.services.vector_search import score_corpus
+from app.utils.serialization import decode_vector
+from conftest import exact_top_k
+
+URLS = ['http://shard-0:9100', 'http://shard-1:9100', 'http://shard-2:9100']
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeShards:
+    """Stands in for the shard servers' HTTP session: answers /shard/<corpus>/search with search_partition"""
+
+    def __init__(self, corpus, failing=(), slow=(), delay=1.0):
+        self.corpus = corpus
+        self.failing = failing
+        self.slow = slow
+        self.delay = delay
+        self.timeouts = []
+
+    def post(self, url, json, timeout):
+        index = next(i for i, base in enumerate(URLS) if url == f"{base}/shard/{self.corpus.name}/search")
+        self.timeouts.append(timeout)
+        if index in self.failing:
+            raise ConnectionError(f"shard {index} is down")
+        if index in self.slow:
+            time.sleep(self.delay)
+        assert json['rows'] == len(self.corpus)
+        mask = None
+        if json.get('mask') is not None:
+            start, stop = shard_bounds(len(self.corpus), len(URLS), index)
+            mask = decode_mask(json['mask'], stop - start)
+        scores, rows = search_partition(self.corpus, decode_vector(json['query']), json['top_k'], mask,
+                                        index, len(URLS))
+        return FakeResponse({'scores': scores.tolist(), 'rows': rows.tolist()})
+
+
+@pytest.fixture
+def shards(monkeypatch, corpus):
+    """Route the test corpus to three fake shard servers; returns a function installing them"""
+    monkeypatch.setitem(shard_service.SHARD_ENDPOINTS, corpus.name, URLS)
+    monkeypatch.setattr(shard_service, '_stats', dict.fromkeys(shard_service._stats, 0))
+    pool = ThreadPoolExecutor(max_workers=len(URLS))
+    monkeypatch.setattr(shard_service, '_pool', pool)
+    monkeypatch.setattr(shard_service, '_client_pid', os.getpid())
+
+    def install(**options):
+        session = FakeShards(corpus, **options)
+        monkeypatch.setattr(shard_service, '_session', session)
+        return session
+    yield install
+    pool.shutdown(wait=True)
+
+
+@pytest.mark.parametrize('rows', [0, 1, 5, 1000, 1003])
+@pytest.mark.parametrize('count', [1, 3, 7])
+def test_shard_bounds_cover_every_row_once(rows, count):
+    bounds = [shard_bounds(rows, count, index) for index in range(count)]
+    assert bounds[0][0] == 0 and bounds[-1][1] == rows
+    assert all(previous[1] == following[0] for previous, following in zip(bounds, bounds[1:]))
+    sizes = [stop - start for start, stop in bounds]
+    assert max(sizes) - min(sizes) <= 1
+
+
+@pytest.mark.parametrize('rows', [1, 8, 13, 1000])
+def test_mask_round_trip(rows):
+    mask = np.random.default_rng(rows).random(rows) < 0.5
+    assert np.array_equal(decode_mask(encode_mask(mask), rows), mask)
+
+
+def test_search_partition_numbers_rows_in_the_whole_corpus(corpus, query):
+    start, stop = shard_bounds(len(corpus), 3, 1)
+    _, rows = search_partition(corpus, query, 10, None, index=1, count=3)
+    _, expected = exact_top_k(corpus.matrix[start:stop], query, 10)
+    assert np.array_equal(rows, expected + start)
+
+
+@pytest.mark.parametrize('use_mask', [False, True])
+def test_scatter_search_matches_exact(shards, corpus, query, use_mask):
+    session = shards()
+    mask = np.random.default_rng(14).random(len(corpus)) < 0.3 if use_mask else None
+    scores, rows = scatter_search(corpus, query, 20, mask)
+    expected_scores, expected_rows = exact_top_k(corpus.matrix, query, 20, mask)
+    assert np.array_equal(rows, expected_rows)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+    # Every request is bounded by what is left of the scatter deadline
+    assert len(session.timeouts) == 3
+    assert all(0 < timeout <= shard_service.SHARD_TIMEOUT for timeout in session.timeouts)
+    assert shard_service.snapshot()['searches'] == 1
+
+
+def test_score_corpus_uses_the_shards(shards, corpus, query):
+    shards()
+    _, rows = score_corpus(corpus, query, None, depth=10)
+    _, expected_rows = exact_top_k(corpus.matrix, query, 10)
+    assert np.array_equal(rows, expected_rows)
+
+
+def test_failed_shard_gives_a_partial_result(shards, corpus, query):
+    shards(failing=(1,))
+    _, rows = scatter_search(corpus, query, 20)
+    start, stop = shard_bounds(len(corpus), 3, 1)
+    mask = np.ones(len(corpus), dtype=bool)
+    mask[start:stop] = False
+    _, expected_rows = exact_top_k(corpus.matrix, query, 20, mask)
+    assert np.array_equal(rows, expected_rows)
+    stats = shard_service.snapshot()
+    assert (stats['shard_failures'], stats['partial'], stats['fallbacks']) == (1, 1, 0)
+
+
+def test_late_shard_is_left_out(monkeypatch, shards, corpus, query):
+    monkeypatch.setattr(shard_service, 'SHARD_TIMEOUT', 0.2)
+    shards(slow=(0,), delay=1.0)
+    started = time.monotonic()
+    _, rows = scatter_search(corpus, query, 20)
+    assert time.monotonic() - started < 0.8
+    assert rows.min() >= shard_bounds(len(corpus), 3, 0)[1]
+    assert shard_service.snapshot()['partial'] == 1
+
+
+def test_no_shard_answers_falls_back_to_local_scoring(shards, corpus, query):
+    shards(failing=(0, 1, 2))
+    assert scatter_search(corpus, query, 10) is None
+    scores, rows = score_corpus(corpus, query, None, depth=10)
+    assert rows is None
+    assert scores.shape == (len(corpus),)
+    assert shard_service.snapshot()['fallbacks'] == 2
+
+
+def test_unsharded_corpus(corpus, query):
+    assert corpus.name not in shard_service.SHARD_ENDPOINTS
+    assert scatter_search(corpus, query, 10) is None
+
+
+def test_deadline_already_passed():
+    with pytest.raises(TimeoutError):
+        shard_service._search_shard(URLS[0], 'test', {}, time.monotonic() - 1)
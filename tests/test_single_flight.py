@@ -0,0 +1,150 @@
+import threading
+import numpy as np
+import pytest
+from app.utils import single_flight as single_flight_module
+from app.utils.single_flight import SingleFlight, flight_key, single_flight
+
+
+class WaitCountingEvent(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self.waiters = 0
+
+    def wait(self, timeout=None):
+        self.waiters += 1
+        return super().wait(timeout)
+
+
+class CountedFlight(single_flight_module._Flight):
+    def __init__(self):
+        super().__init__()
+        self.done = WaitCountingEvent()
+
+
+class Blocking:
+    """A provider call that blocks until released, counting its invocations"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.entered.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+@pytest.fixture(autouse=True)
+def counted_flights(monkeypatch):
+    monkeypatch.setattr(single_flight_module, '_Flight', CountedFlight)
+
+
+def run_concurrently(flights, key, fn, callers=5):
+    """The first caller leads; the others arrive while it is in flight. Returns (results, errors)"""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flights.do('test', key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    threads[0].start()
+    assert fn.entered.wait(5)
+    flight = flights._flights[key]
+    for thread in threads[1:]:
+        thread.start()
+    while flight.done.waiters < callers - 1:
+        threading.Event().wait(0.001)
+    fn.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    fn = Blocking(result={'embedding': [0.1, 0.2]})
+    results, errors = run_concurrently(flights, 'key', fn)
+
+    assert fn.calls == 1
+    assert errors == []
+    assert results == [{'embedding': [0.1, 0.2]}] * 5
+    # Followers get copies, so one caller mutating its result cannot affect another
+    assert len({id(result) for result in results}) == 5
+    assert flights.stats['test'] == {'leader': 1, 'coalesced': 4, 'coalesced_cross_process': 0, 'timed_out': 0}
+    assert flights._flights == {}
+
+
+def test_followers_get_the_leaders_exception():
+    flights = SingleFlight()
+    fn = Blocking(error=RuntimeError('provider down'))
+    results, errors = run_concurrently(flights, 'key', fn, callers=3)
+
+    assert fn.calls == 1
+    assert results == []
+    assert [str(error) for error in errors] == ['provider down'] * 3
+
+
+def test_sequential_calls_are_not_coalesced():
+    flights = SingleFlight()
+    calls = []
+    for _ in range(2):
+        flights.do('test', 'key', lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_snapshot_is_a_copy(tmp_path):
+    flights = SingleFlight()
+    flights.do('test', 'key', lambda: None)
+    snapshot = flights.snapshot()
+    assert snapshot == {'cross_process': False, 'providers': {'test': {
+        'leader': 1, 'coalesced': 0, 'coalesced_cross_process': 0, 'timed_out': 0}}}
+    # Later calls do not change a snapshot being serialized
+    flights.do('test', 'key', lambda: None)
+    flights.do('other', 'key', lambda: None)
+    assert snapshot['providers']['test']['leader'] == 1 and 'other' not in snapshot['providers']
+    assert SingleFlight(str(tmp_path)).snapshot()['cross_process'] is True
+
+
+def test_cross_process_result_file(tmp_path):
+    # Two SingleFlight instances stand in for two worker processes
+    leader, follower = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    assert leader.do('test', 'key', lambda: [1, 2, 3]) == [1, 2, 3]
+    assert follower._read_result(str(tmp_path / 'key.result')) == (True, [1, 2, 3])
+
+
+def test_flight_key_hashes_content(tmp_path):
+    first, second = tmp_path / 'a.png', tmp_path / 'b.png'
+    first.write_bytes(b'same image')
+    second.write_bytes(b'same image')
+    key = flight_key('titan', 'model', {'image_path': str(first)}, file_args=('image_path',))
+    assert key == flight_key('titan', 'model', {'image_path': str(second)}, file_args=('image_path',))
+    # Without file_args the path itself is the content
+    assert (flight_key('titan', 'model', {'image_path': str(first)})
+            != flight_key('titan', 'model', {'image_path': str(second)}))
+    assert flight_key('titan', 'model', {'text': 'cat'}) != flight_key('cohere', 'model', {'text': 'cat'})
+    assert (flight_key('titan', 'model', {'vector': np.ones(3, dtype=np.float32)})
+            == flight_key('titan', 'model', {'vector': np.ones(3, dtype=np.float32)}))
+
+
+def test_decorator_keys_on_bound_arguments(monkeypatch):
+    monkeypatch.setattr(single_flight_module, '_single_flight', SingleFlight())
+    seen = []
+
+    @single_flight('test', 'model')
+    def embed(text, dimension=8):
+        seen.append(dimension)
+        return text
+
+    assert embed('cat') == 'cat'
+    assert embed('cat', dimension=16) == 'cat'
+    assert seen == [8, 16]
+    assert single_flight_module._single_flight.stats['test']['leader'] == 2
@@ -0,0 +1,23 @@
+import threading
+from app.utils.sqlite_store import LocalConnections
+
+
+def test_one_connection_per_thread(tmp_path):
+    connections = LocalConnections(str(tmp_path / 'nested' / 'store.sqlite3'))
+    conn = connections.get()
+    assert connections.get() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+    others = []
+    thread = threading.Thread(target=lambda: others.append(connections.get()))
+    thread.start()
+    thread.join()
+    assert others[0] is not conn
+
+
+def test_reopens_after_fork(monkeypatch, tmp_path):
+    connections = LocalConnections(str(tmp_path / 'store.sqlite3'))
+    conn = connections.get()
+    # A forked worker sees another pid and must not reuse the parent's connection
+    monkeypatch.setattr(connections._local, 'pid', -1)
+    assert connections.get() is not conn
@@ -0,0 +1,109 @@
+import os
+import threading
+import pytest
+from flask import Flask
+from PIL import Image
+from app.services import image_index, thumbnail_service
+from app.services.thumbnail_service import ensure_thumbnail, generate_thumbnails, thumbnail_path
+from app.views.thumbnail_routes import thumbnail_bp
+
+
+@pytest.fixture
+def images(monkeypatch, tmp_path):
+    """Image and thumbnail directories in tmp_path, with a red a.jpg and a blue a.png"""
+    image_dir, thumbnail_dir = tmp_path / 'images', tmp_path / 'thumbnails'
+    image_dir.mkdir()
+    Image.new('RGB', (400, 300), (255, 0, 0)).save(image_dir / 'a.jpg')
+    Image.new('RGB', (400, 300), (0, 0, 255)).save(image_dir / 'a.png')
+    monkeypatch.setattr(thumbnail_service, 'IMAGE_DIR', str(image_dir))
+    monkeypatch.setattr(thumbnail_service, 'THUMBNAIL_DIR', str(thumbnail_dir))
+    monkeypatch.setattr(image_index, 'IMAGE_INDEX_WATCH', False)
+    monkeypatch.setattr(image_index, '_index', image_index.ImageIndex(str(image_dir)))
+    return image_dir
+
+
+@pytest.fixture
+def client(images):
+    app = Flask(__name__)
+    app.register_blueprint(thumbnail_bp)
+    return app.test_client()
+
+
+def test_same_stem_different_extension(images):
+    assert thumbnail_path('a.jpg', 'small', 'jpeg') != thumbnail_path('a.png', 'small', 'jpeg')
+    red, blue = ensure_thumbnail('a.jpg', 'small', 'jpeg'), ensure_thumbnail('a.png', 'small', 'jpeg')
+    with Image.open(red) as thumbnail:
+        assert thumbnail.getpixel((10, 10))[0] > 200
+    with Image.open(blue) as thumbnail:
+        assert thumbnail.getpixel((10, 10))[2] > 200
+        assert max(thumbnail.size) == thumbnail_service.THUMBNAIL_SIZES['small']
+
+
+def test_concurrent_writes_leave_one_complete_file(images):
+    errors = []
+
+    def render():
+        try:
+            generate_thumbnails('a.jpg', force=True)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=render) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    directory = os.path.dirname(thumbnail_path('a.jpg', 'small', 'webp'))
+    assert sorted(os.listdir(directory)) == ['a.jpg.jpeg', 'a.jpg.webp']
+    with Image.open(thumbnail_path('a.jpg', 'small', 'webp')) as thumbnail:
+        thumbnail.verify()
+
+
+def test_failed_write_keeps_the_old_thumbnail(monkeypatch, images):
+    path = ensure_thumbnail('a.jpg', 'small', 'jpeg')
+    with open(path, 'rb') as f:
+        before = f.read()
+
+    def fail(self, fp, *args, **kwargs):
+        with open(fp, 'wb') as f:
+            f.write(b'partial')
+        raise OSError('disk full')
+    monkeypatch.setattr(Image.Image, 'save', fail)
+    with pytest.raises(OSError):
+        generate_thumbnails('a.jpg', {'small': 160}, ['jpeg'], force=True)
+    with open(path, 'rb') as f:
+        assert f.read() == before
+    assert os.listdir(os.path.dirname(path)) == ['a.jpg.jpeg']
+
+
+def test_etag_and_not_modified(client):
+    response = client.get('/thumbnails/small/a.jpg', headers={'Accept': 'image/webp'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert response.headers['Vary'] == 'Accept'
+    etag = response.headers['ETag']
+
+    response = client.get('/thumbnails/small/a.jpg', headers={'Accept': 'image/webp', 'If-None-Match': etag})
+    assert response.status_code == 304
+    # The JPEG rendition is another representation with its own ETag
+    response = client.get('/thumbnails/small/a.jpg', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert response.headers['ETag'] != etag
+
+
+def test_versioned_urls(client, images):
+    url = thumbnail_service.thumbnail_url('images/a.png', 'small')
+    version = url.rpartition('=')[2]
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+
+    response = client.get('/thumbnails/small/a.png?v=stale')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f"/thumbnails/small/a.png?v={version}")
+
+
+def test_unknown_size_and_image(client):
+    assert client.get('/thumbnails/huge/a.jpg').status_code == 404
+    assert client.get('/thumbnails/small/missing.jpg').status_code == 404
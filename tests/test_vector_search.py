@@ -0,0 +1,251 @@
+import numpy as np
+import pytest
+from app.services import reduced_index, vector_search
+from app.services.vector_search import (
+    unit_vector, top_k_indices, first_per_cluster, collapsed_top_k, score_rows, score_corpus, fuse_queries,
+    fused_search, weight_sweep, parse_weights,
+)
+from conftest import exact_top_k
+
+
+def random_query(seed, dimension=32):
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+
+
+def test_top_k_indices_matches_full_sort():
+    scores = np.random.default_rng(0).standard_normal(1000).astype(np.float32)
+    assert np.array_equal(top_k_indices(scores, 10), np.argsort(scores)[::-1][:10])
+    assert np.array_equal(top_k_indices(scores, 5000), np.argsort(scores)[::-1])
+    assert top_k_indices(scores, 0).size == 0
+
+
+@pytest.mark.parametrize('selectivity', [0.1, 0.9])
+def test_score_rows_mask(corpus, query, selectivity):
+    mask = np.random.default_rng(2).random(len(corpus)) < selectivity
+    scores, rows = score_rows(corpus.matrix, query, mask)
+    assert np.array_equal(rows, np.flatnonzero(mask))
+    np.testing.assert_allclose(scores, (corpus.matrix @ query)[mask], rtol=1e-5)
+
+
+def test_fuse_queries_is_the_blend_of_cosines(corpus):
+    text, image = random_query(3), random_query(4)
+    fused = fuse_queries({'text': (text, 0.3), 'image': (image, 0.7), 'missing': (None, 1.0)})
+    expected = 0.3 * (corpus.matrix @ unit_vector(text)) + 0.7 * (corpus.matrix @ unit_vector(image))
+    np.testing.assert_allclose(corpus.matrix @ fused, expected, rtol=1e-5, atol=1e-6)
+    assert fuse_queries({'text': (None, 1.0), 'image': (image, 0)}) is None
+
+
+@pytest.mark.parametrize('use_mask', [False, True])
+def test_fused_search_matches_per_query_ranking(corpus, use_mask):
+    text, image = random_query(3), random_query(4)
+    mask = np.random.default_rng(5).random(len(corpus)) < 0.3 if use_mask else None
+    indices, scores, components = fused_search(corpus, {'text': (text, 0.4), 'image': (image, 0.6)}, 20, mask)
+
+    blended = 0.4 * (corpus.matrix @ unit_vector(text)) + 0.6 * (corpus.matrix @ unit_vector(image))
+    if mask is not None:
+        blended[~mask] = -np.inf
+    expected = np.argsort(blended)[::-1][:20]
+    assert np.array_equal(indices, expected)
+    np.testing.assert_allclose(scores, blended[expected], rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(components['text'], corpus.matrix[expected] @ unit_vector(text), rtol=1e-5, atol=1e-6)
+
+
+def test_fused_search_without_queries(corpus):
+    indices, scores, components = fused_search(corpus, {'text': (None, 1.0)}, 10)
+    assert indices.size == 0 and scores.size == 0 and components == {}
+
+
+def test_weight_sweep_matches_fused_search(corpus):
+    text, image = random_query(3), random_query(4)
+    mask = np.random.default_rng(6).random(len(corpus)) < 0.5
+    sweep = weight_sweep(corpus, text, image, [0.0, 0.25, 1.0], 15, mask)
+    for weight, indices, scores, text_scores, image_scores in sweep:
+        expected, expected_scores, components = fused_search(
+            corpus, {'text': (text, 1.0 - weight), 'image': (image, weight)}, 15, mask)
+        assert np.array_equal(indices, expected)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(image_scores, components['image'], rtol=1e-5, atol=1e-6)
+
+
+def test_parse_weights():
+    assert parse_weights(None) is None
+    assert parse_weights('0, 0.5,1') == [0.0, 0.5, 1.0]
+    assert parse_weights([0.2]) == [0.2]
+    with pytest.raises(ValueError):
+        parse_weights('0.5,1.5')
+
+
+def brute_force_collapsed(scores, top_k, cluster_ids):
+    kept, seen = [], set()
+    for row in np.argsort(scores)[::-1]:
+        cluster = cluster_ids[row]
+        if cluster < 0 or cluster not in seen:
+            kept.append(row)
+            seen.add(cluster)
+    return kept[:top_k]
+
+
+def test_first_per_cluster():
+    cluster_ids = np.array([-1, 5, 5, -1, 7, 7, 7], dtype=np.int64)
+    ranked = np.array([6, 2, 0, 4, 1, 3, 5])
+    assert first_per_cluster(ranked, cluster_ids).tolist() == [0, 1, 2, 5]
+
+
+@pytest.mark.parametrize('use_rows', [False, True])
+def test_collapsed_top_k_matches_brute_force(use_rows):
+    rng = np.random.default_rng(9)
+    scores = rng.standard_normal(500).astype(np.float32)
+    # A few large clusters force the over-fetch to double
+    cluster_ids = np.where(rng.random(500) < 0.7, rng.integers(0, 5, 500), -1)
+    if use_rows:
+        rows = np.sort(rng.choice(2000, 500, replace=False))
+        column = np.full(2000, -1, dtype=np.int64)
+        column[rows] = cluster_ids
+        top = collapsed_top_k(scores, 20, column, rows)
+    else:
+        top = collapsed_top_k(scores, 20, cluster_ids)
+    assert top.tolist() == brute_force_collapsed(scores, 20, cluster_ids)
+
+
+def test_fused_search_collapses_duplicates(corpus, query):
+    cluster_ids = np.arange(len(corpus)) // 4
+    indices, _, _ = fused_search(corpus, {'image': (query, 1.0)}, 10, cluster_ids=cluster_ids)
+    assert indices.tolist() == brute_force_collapsed(corpus.matrix @ query, 10, cluster_ids)
+
+
+def ranked(scores, rows, top_k):
+    top = top_k_indices(scores, top_k)
+    return scores[top], (top if rows is None else rows[top])
+
+
+@pytest.fixture
+def two_stage(monkeypatch, tmp_path, corpus):
+    """Enable two-stage search for the test corpus; returns a function saving its projection"""
+    monkeypatch.setattr(reduced_index, 'TWO_STAGE_CORPORA', [corpus.name])
+    monkeypatch.setattr(reduced_index, 'REDUCED_INDEX_DIR', str(tmp_path))
+    monkeypatch.setattr(reduced_index, '_indexes', {})
+    monkeypatch.setattr(vector_search, 'TWO_STAGE_SHORTLIST', 100)
+
+    def save(projection):
+        projection.save(reduced_index.projection_path(corpus.name))
+        index = reduced_index.get_reduced_index(corpus)
+        assert index is not None and index.projection.method == projection.method
+        return index
+    return save
+
+
+@pytest.mark.parametrize('use_mask', [False, True])
+def test_two_stage_lossless_projection_matches_exact(two_stage, corpus, query, use_mask):
+    # A full-rank PCA only shifts every score by q.mean, so the shortlist holds the exact top rows
+    two_stage(reduced_index.train_pca(corpus.matrix, corpus.dimension))
+    mask = np.random.default_rng(10).random(len(corpus)) < 0.6 if use_mask else None
+    scores, rows = score_corpus(corpus, query, mask, depth=20)
+    assert len(rows) == 100
+    top_scores, top_rows = ranked(scores, rows, 20)
+    expected_scores, expected_rows = exact_top_k(corpus.matrix, query, 20, mask)
+    assert np.array_equal(top_rows, expected_rows)
+    np.testing.assert_allclose(top_scores, expected_scores, rtol=1e-5, atol=1e-6)
+
+
+def test_two_stage_rescores_the_shortlist_exactly(two_stage, corpus, query):
+    two_stage(reduced_index.Projection('truncate', 8))
+    mask = np.arange(len(corpus)) % 2 == 0
+    scores, rows = score_corpus(corpus, query, mask, depth=10)
+    assert len(rows) == 100 and mask[rows].all()
+    assert np.all(np.diff(rows) > 0)
+    np.testing.assert_allclose(scores, corpus.matrix[rows] @ query, rtol=1e-5, atol=1e-6)
+
+
+def test_two_stage_deep_requests_fall_back_to_exact(two_stage, corpus, query):
+    two_stage(reduced_index.Projection('truncate', 8))
+    # A shortlist of 2 * depth covers every row: plain exact scoring
+    scores, rows = score_corpus(corpus, query, None, depth=1000)
+    assert rows is None
+    np.testing.assert_allclose(scores, corpus.matrix @ query, rtol=1e-5, atol=1e-6)
+
+
+def test_projection_round_trip(tmp_path, corpus):
+    projection = reduced_index.train_pca(corpus.matrix, 8)
+    path = str(tmp_path / 'test_reduced.npz')
+    projection.save(path)
+    loaded = reduced_index.Projection.load(path)
+    np.testing.assert_allclose(loaded.rows(corpus.matrix, chunk_rows=300), projection.rows(corpus.matrix))
+    truncated = reduced_index.Projection('truncate', 8).rows(corpus.matrix)
+    np.testing.assert_allclose(np.linalg.norm(truncated, axis=1), 1.0, rtol=1e-5)
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 7, 256, 5000])
+@pytest.mark.parametrize('selectivity', [None, 0.05, 0.8])
+def test_streaming_top_k_matches_exact(corpus, query, chunk_rows, selectivity):
+    mask = None if selectivity is None else np.random.default_rng(11).random(len(corpus)) < selectivity
+    scores, rows = vector_search.streaming_top_k(corpus.matrix, query, 25, mask, chunk_rows=chunk_rows)
+    expected_scores, expected_rows = exact_top_k(corpus.matrix, query, 25, mask)
+    assert np.array_equal(rows, expected_rows)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+
+
+def test_streaming_top_k_row_range(corpus, query):
+    scores, rows = vector_search.streaming_top_k(corpus.matrix, query, 10, chunk_rows=64, start=500, stop=1200)
+    _, expected = exact_top_k(corpus.matrix[500:1200], query, 10)
+    assert np.array_equal(rows, expected + 500)
+
+
+def test_streaming_top_k_fewer_rows_than_k(corpus, query):
+    mask = np.zeros(len(corpus), dtype=bool)
+    mask[[3, 1500, 40]] = True
+    _, rows = vector_search.streaming_top_k(corpus.matrix, query, 10, mask, chunk_rows=100)
+    assert sorted(rows.tolist()) == [3, 40, 1500]
+
+
+def test_memory_mapped_corpus_is_streamed(tmp_path, corpus, query):
+    path = tmp_path / 'matrix.f32'
+    corpus.matrix.tofile(path)
+    corpus.matrix = np.memmap(path, dtype=np.float32, mode='r', shape=corpus.matrix.shape)
+    assert corpus.streaming
+    scores, rows = score_corpus(corpus, query, None, depth=15)
+    assert len(rows) == 15
+    expected_scores, expected_rows = exact_top_k(np.asarray(corpus.matrix), query, 15)
+    assert np.array_equal(rows, expected_rows)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('shards', [2, 3, 8])
+@pytest.mark.parametrize('use_mask', [False, True])
+def test_parallel_top_k_matches_exact(corpus, query, shards, use_mask):
+    mask = np.random.default_rng(12).random(len(corpus)) < 0.7 if use_mask else None
+    scores, rows = vector_search.parallel_top_k(corpus.matrix, query, 30, mask, shards=shards)
+    expected_scores, expected_rows = exact_top_k(corpus.matrix, query, 30, mask)
+    assert np.array_equal(rows, expected_rows)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+
+
+def test_parallel_top_k_best_rows_in_one_shard(corpus, query):
+    # Every one of the top rows lies in the last shard
+    corpus.matrix[-40:] = query + 0.01 * np.random.default_rng(13).standard_normal((40, 32)).astype(np.float32)
+    _, rows = vector_search.parallel_top_k(corpus.matrix, query, 30, shards=4)
+    _, expected_rows = exact_top_k(corpus.matrix, query, 30)
+    assert np.array_equal(rows, expected_rows)
+    assert rows.min() >= len(corpus) - 40
+
+
+def test_shard_count(monkeypatch):
+    monkeypatch.setattr(vector_search, 'SCORING_THREADS', 4)
+    monkeypatch.setattr(vector_search, 'SCORING_MIN_SHARD_ROWS', 100)
+    assert vector_search.shard_count(150) == 1
+    assert vector_search.shard_count(250) == 2
+    assert vector_search.shard_count(10 ** 6) == 4
+
+
+def test_large_corpus_is_scored_in_parallel(monkeypatch, corpus, query):
+    monkeypatch.setattr(vector_search, 'SCORING_THREADS', 4)
+    monkeypatch.setattr(vector_search, 'SCORING_MIN_SHARD_ROWS', 300)
+    scores, rows = score_corpus(corpus, query, None, depth=12)
+    assert len(rows) == 12
+    expected_scores, expected_rows = exact_top_k(corpus.matrix, query, 12)
+    assert np.array_equal(rows, expected_rows)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+
+    # A selective mask is still gathered and scored in one go
+    mask = np.arange(len(corpus)) < 100
+    _, rows = score_corpus(corpus, query, mask, depth=12)
+    assert np.array_equal(rows, np.arange(100))
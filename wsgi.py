@@ -0,0 +1,17 @@
+"""
+Production WSGI entry point
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app (see gunicorn.conf.py) this module is imported once in the
+gunicorn master: the SDK imports, provider initialization and corpus
+matrices are then shared copy-on-write by every forked worker.
+"""
+import os
+from app import create_app
+from app.services.corpus_service import preload_corpora
+
+app = create_app()
+
+if os.environ.get('PRELOAD_CORPORA', 'True') == 'True':
+    preload_corpora()